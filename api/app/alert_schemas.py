@@ -0,0 +1,64 @@
+"""Pydantic schemas for price alert rules and triggered alerts."""
+
+from __future__ import annotations
+
+from datetime import datetime
+from typing import Literal, Optional
+
+from pydantic import BaseModel, ConfigDict, Field, field_validator
+
+AlertScope = Literal["upc", "tag", "style"]
+AlertKind = Literal["above", "below", "change_pct"]
+
+
+class PriceAlertRuleCreate(BaseModel):
+    scope: AlertScope = "upc"
+    target: str = Field(min_length=1, description="UPC, tag name or style, depending on scope")
+    kind: AlertKind
+    threshold: float = Field(gt=0, description="Price for above/below; percent for change_pct")
+    enabled: bool = True
+    notes: Optional[str] = Field(default=None, max_length=500)
+
+    @field_validator("target")
+    @classmethod
+    def _strip_target(cls, value: str) -> str:
+        v = value.strip()
+        if not v:
+            raise ValueError("target cannot be blank")
+        return v
+
+
+class PriceAlertRuleUpdate(BaseModel):
+    threshold: Optional[float] = Field(default=None, gt=0)
+    enabled: Optional[bool] = None
+    notes: Optional[str] = Field(default=None, max_length=500)
+
+
+class PriceAlertRuleOut(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    rule_id: int
+    scope: AlertScope
+    target: str
+    kind: AlertKind
+    threshold: float
+    enabled: bool
+    notes: Optional[str]
+    created_by: Optional[str]
+    created_at: datetime
+
+
+class PriceAlertOut(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    alert_id: int
+    rule_id: int
+    barcode_upc: str
+    price_id: Optional[int]
+    price: float
+    previous_price: Optional[float]
+    currency: str
+    change_pct: Optional[float]
+    triggered_at: datetime
+    acknowledged_at: Optional[datetime]
+    acknowledged_by: Optional[str]
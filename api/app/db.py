@@ -1,6 +1,9 @@
 import os
 from sqlmodel import SQLModel, create_engine, Session
 
+from . import query_stats, server_timing
+from .services import data_versions  # noqa: F401  (session hooks that bump data versions on commit)
+
 # Align default with docker-compose's volume path; still overridden by .env if set
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:////data/whiskey.db")
 WINE_DATABASE_URL = os.getenv("WINE_DATABASE_URL", "sqlite:////data/wine.db")
@@ -19,11 +22,15 @@ wine_engine = create_engine(
     pool_pre_ping=True,
 )
 
+query_stats.instrument(engine)
+query_stats.instrument(wine_engine)
+
 _wine_initialized = False
 
 def init_db():
     # Import models module so SQLModel metadata includes every table
     from . import models  # noqa: F401
+    from .services.market_prices import backfill_latest_prices
 
     SQLModel.metadata.create_all(engine)
 
@@ -39,8 +46,19 @@ def init_db():
             if "is_rare" not in cols:
                 conn.exec_driver_sql("ALTER TABLE bottle ADD COLUMN is_rare INTEGER DEFAULT 0 NOT NULL")
 
+            conn.exec_driver_sql(
+                "CREATE INDEX IF NOT EXISTS ix_market_price_upc_as_of ON market_price (barcode_upc, as_of)"
+            )
+
+            job_cols = {row[1] for row in conn.exec_driver_sql("PRAGMA table_info('image_job');")}
+            if "kind" not in job_cols:
+                conn.exec_driver_sql("ALTER TABLE image_job ADD COLUMN kind VARCHAR DEFAULT 'upload' NOT NULL")
+
             _migrate_users_table(conn)
 
+    with Session(engine) as session:
+        backfill_latest_prices(session)
+
 def init_wine_db():
     global _wine_initialized
     if _wine_initialized:
@@ -51,6 +69,10 @@ def init_wine_db():
 
 def get_session():
     with Session(engine) as session:
+        if server_timing.active():
+            # Check out the connection up front so its wait (and pre-ping) shows as its own phase.
+            with server_timing.phase("db-checkout"):
+                session.connection()
         yield session
 
 
@@ -1,18 +1,25 @@
 from fastapi import Depends, HTTPException, Request, status
-import ipaddress
 import logging
 import os
+import time
 from collections import Counter
 from threading import Lock
 from typing import Optional
 
 from .settings import settings
-from .security import decode_token
+from .security import decode_token_cached
+from .ip_classification import client_ip, is_private_ip
+from .log_sampling import QueueLogging, SampledLog
+from . import server_timing
 
 
 # --- module instrumentation -------------------------------------------------
 
 logger = logging.getLogger("uvicorn.error")
+# Child of uvicorn's logger: same level and handlers, but written through a queue while the app runs.
+decision_logger = logger.getChild("access")
+decision_log_queue = QueueLogging(decision_logger)
+decision_log = SampledLog(decision_logger, "lan_guest_decision", per_window=settings.AUTH_DECISION_LOG_PER_MINUTE)
 
 _LAN_DECISION_METRICS: Counter = Counter()
 _LAN_DECISION_LOCK = Lock()
@@ -34,7 +41,8 @@ def _record_lan_guest_metric(reason: str) -> None:
 def lan_guest_metrics_snapshot() -> dict[str, int]:
     """
     Shallow copy of the LAN guest decision counters.
-    Useful when attaching to a running container for troubleshooting.
+    Published as ``whiskey_lan_guest_decisions_total`` at /metrics; these are exact,
+    while the decision log only samples the first few per reason per minute.
     """
     with _LAN_DECISION_LOCK:
         return dict(_LAN_DECISION_METRICS)
@@ -55,37 +63,6 @@ def _to_bool(v) -> bool:
     return s in {"1", "true", "yes", "y", "on"}
 
 
-def _trusted_nets():
-    """
-    Build list of trusted proxy networks from TRUSTED_PROXIES.
-    Accepts CIDRs or plain IPs.
-    """
-    nets = []
-    for cidr in (settings.TRUSTED_PROXIES or "").split(","):
-        cidr = cidr.strip()
-        if not cidr:
-            continue
-        try:
-            nets.append(ipaddress.ip_network(cidr, strict=False))
-            continue
-        except Exception:
-            pass
-        # try plain IP -> convert to /32 or /128
-        try:
-            ip = ipaddress.ip_address(cidr)
-            if ip.version == 4:
-                nets.append(ipaddress.ip_network(f"{ip.exploded}/32", strict=False))
-            else:
-                nets.append(ipaddress.ip_network(f"{ip.exploded}/128", strict=False))
-        except Exception:
-            # ignore invalid entry
-            pass
-    return nets
-
-
-_TRUSTED_NETS = _trusted_nets()
-
-
 _LAN_GUEST_HOSTS_RAW = os.getenv("LAN_GUEST_HOSTS")
 
 
@@ -103,35 +80,12 @@ _LAN_GUEST_HOSTS = _lan_guest_hosts()
 _LAN_GUEST_HOSTS_IS_DEFAULT = _LAN_GUEST_HOSTS_RAW is None
 
 
-def _is_from_trusted(ip_str: str) -> bool:
-    try:
-        ip_obj = ipaddress.ip_address(ip_str)
-    except Exception:
-        return False
-    return any(ip_obj in net for net in _TRUSTED_NETS)
-
-
 def _ip_from_request(request: Request) -> str:
     """
-    Determine the real client IP:
-    - If the direct peer is in TRUSTED_PROXIES, trust X-Forwarded-For/CF headers.
-    - Prefer the leftmost (original) address from XFF.
-    - Otherwise, fall back to the direct peer.
+    Determine the real client IP (forwarding headers are trusted only from
+    TRUSTED_PROXIES; see ip_classification.client_ip).
     """
-    peer = (request.client.host if request.client else "127.0.0.1").strip()
-
-    # Only trust forwarding headers if peer is a trusted proxy
-    if _TRUSTED_NETS and _is_from_trusted(peer):
-        # Order of preference for typical reverse proxies/CDNs
-        for key in ("cf-connecting-ip", "x-forwarded-for", "true-client-ip"):
-            raw = request.headers.get(key)
-            if not raw:
-                continue
-            # XFF can be a list; leftmost is original client
-            first = raw.split(",")[0].strip()
-            if first:
-                return first
-    return peer
+    return client_ip(request)
 
 
 def _is_cloudflare_request(request: Request) -> bool:
@@ -139,7 +93,7 @@ def _is_cloudflare_request(request: Request) -> bool:
     if hdr.get("x-whiskey-via", "").lower() == "cloudflare":
         return True
     cf_ip = hdr.get("cf-connecting-ip")
-    if cf_ip and not _is_private_ip(cf_ip.split(",", 1)[0].strip()):
+    if cf_ip and not is_private_ip(cf_ip.split(",", 1)[0].strip()):
         return True
     return any(hdr.get(name) for name in ("cf-ray", "cf-visitor", "cf-ew-via"))
 
@@ -151,23 +105,14 @@ def _host_allows_lan(host: str) -> bool:
     if _LAN_GUEST_HOSTS_IS_DEFAULT:
         return True
     # When custom hosts are configured, still allow literal private/loopback IPs.
-    if _is_private_ip(host_only):
+    if is_private_ip(host_only):
         return True
     return any(host_only == allowed or host_only.endswith(f".{allowed.lstrip('.')}") for allowed in _LAN_GUEST_HOSTS)
 
 
-def _is_private_ip(s: str) -> bool:
-    try:
-        ip = ipaddress.ip_address(s)
-        return (
-            ip.is_private
-            or ip.is_loopback
-            or ip in ipaddress.ip_network("10.0.0.0/8")
-            or ip in ipaddress.ip_network("172.16.0.0/12")
-            or ip in ipaddress.ip_network("192.168.0.0/16")
-        )
-    except Exception:
-        return False
+def is_lan_request(user: dict) -> bool:
+    """Whether the request behind ``user`` (from ``get_current_user_role``) passes the LAN guest network checks."""
+    return is_private_ip(user["ip"]) and not user["via_cloudflare"] and _host_allows_lan(user["host"])
 
 
 # --- public deps -----------------------------------------------------------
@@ -186,7 +131,15 @@ async def get_current_user_role(request: Request):
     - 'guest' when ALLOW_LAN_GUEST=true and client IP is private.
     - 'user'/'admin' when JWT cookie is valid and carries a role.
     - 'anonymous' otherwise.
+
+    Evaluated once per request: the decision is kept on ``request.state`` and
+    reused by every other dependency (router-level and route-level) that asks.
     """
+    cached = getattr(request.state, "auth_user", None)
+    if cached is not None:
+        return cached
+
+    started = time.perf_counter()
     ip = _ip_from_request(request)
     via_cloudflare = _is_cloudflare_request(request)
     forwarded_host = request.headers.get("x-whiskey-host")
@@ -204,7 +157,7 @@ async def get_current_user_role(request: Request):
 
     if token:
         try:
-            payload = decode_token(token)
+            payload = decode_token_cached(token)
             # honor role from token if present; default to "user" if token exists but no role
             role = payload.get("role") or "user"
             username = payload.get("sub") or payload.get("username")
@@ -221,13 +174,13 @@ async def get_current_user_role(request: Request):
     if role in ("anonymous",):
         if not allow_lan_guest:
             decision_reason = "lan_guest_disabled"
-        elif not _is_private_ip(ip):
+        elif not is_private_ip(ip):
             decision_reason = "ip_not_private"
         elif via_cloudflare:
             decision_reason = "cloudflare_forced_auth"
         elif forwarded_host and not _host_allows_lan(request_host):
             decision_reason = "host_not_allowed"
-        elif allow_lan_guest and _is_private_ip(ip) and not via_cloudflare and _host_allows_lan(request_host):
+        elif allow_lan_guest and is_private_ip(ip) and not via_cloudflare and _host_allows_lan(request_host):
             role = "guest"
             lan_guest = True
             decision_reason = "lan_guest_granted"
@@ -236,19 +189,18 @@ async def get_current_user_role(request: Request):
 
     _record_lan_guest_metric(decision_reason)
     if decision_reason in _LOGGABLE_REASONS:
-        logger.info(
-            "lan_guest_decision reason=%s role=%s lan_guest=%s ip=%s host=%s via_cloudflare=%s allow_lan_flag=%s token_present=%s",
+        decision_log.log(
             decision_reason,
-            role,
-            lan_guest,
-            ip,
-            request_host or "<empty>",
-            via_cloudflare,
-            allow_lan_guest,
-            bool(token),
+            role=role,
+            lan_guest=lan_guest,
+            ip=ip,
+            host=request_host or "<empty>",
+            via_cloudflare=via_cloudflare,
+            allow_lan_flag=allow_lan_guest,
+            token_present=bool(token),
         )
 
-    return {
+    user = {
         "role": role,
         "username": username,
         "email": email,
@@ -258,6 +210,9 @@ async def get_current_user_role(request: Request):
         "host": request_host,
         "decision_reason": decision_reason,
     }
+    request.state.auth_user = user
+    server_timing.record("auth", time.perf_counter() - started)
+    return user
 
 
 async def require_admin(user=Depends(get_current_user_role)):
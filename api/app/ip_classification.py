@@ -0,0 +1,151 @@
+"""
+Client IP classification shared by the auth dependencies and the auth router.
+
+Every API request asks the same questions about its peer: is it one of our
+trusted proxies (so forwarding headers may be believed), and is the client on a
+private network (LAN guest access)? Network lists are compiled once into sorted,
+merged integer ranges per IP version, so a lookup is one ``bisect`` instead of a
+walk over ``ip_network`` objects, and the verdict for recently seen addresses is
+kept in an LRU, so the steady state does not even parse the address.
+"""
+
+from __future__ import annotations
+
+import ipaddress
+from bisect import bisect_right
+from functools import lru_cache
+from typing import Iterable, NamedTuple, Optional
+
+from fastapi import Request
+
+from .settings import settings
+
+_CACHE_SIZE = 4096
+
+# Special-purpose ranges that ipaddress reports as is_private (loopback included),
+# spelled out so the answer does not depend on the Python patch release.
+PRIVATE_NETWORKS = (
+    "0.0.0.0/8", "10.0.0.0/8", "127.0.0.0/8", "169.254.0.0/16", "172.16.0.0/12",
+    "192.0.0.0/29", "192.0.0.170/31", "192.0.2.0/24", "192.168.0.0/16", "198.18.0.0/15",
+    "198.51.100.0/24", "203.0.113.0/24", "240.0.0.0/4", "255.255.255.255/32",
+    "::1/128", "::/128", "100::/64", "2001::/23", "2001:2::/48", "2001:db8::/32",
+    "2001:10::/28", "fc00::/7", "fe80::/10",
+)
+
+# Reachable but not public Internet hosts: never valid targets for outbound fetches.
+# Carrier-grade NAT, multicast, NAT64 prefixes (which embed an IPv4 address) and
+# the deprecated site-local range, on top of everything in PRIVATE_NETWORKS.
+NON_ROUTABLE_NETWORKS = PRIVATE_NETWORKS + (
+    "100.64.0.0/10", "224.0.0.0/4",
+    "64:ff9b::/96", "64:ff9b:1::/48", "fec0::/10", "ff00::/8",
+)
+
+
+class NetworkSet:
+    """A set of networks answering membership with a binary search over merged integer ranges."""
+
+    def __init__(self, networks: Iterable[ipaddress.IPv4Network | ipaddress.IPv6Network]):
+        self._starts: dict[int, list[int]] = {4: [], 6: []}
+        self._ends: dict[int, list[int]] = {4: [], 6: []}
+        by_version: dict[int, list] = {4: [], 6: []}
+        for net in networks:
+            by_version[net.version].append(net)
+        for version, nets in by_version.items():
+            for net in ipaddress.collapse_addresses(nets):   # sorted, overlaps merged
+                self._starts[version].append(int(net.network_address))
+                self._ends[version].append(int(net.broadcast_address))
+        self.size = sum(len(starts) for starts in self._starts.values())
+
+    def __bool__(self) -> bool:
+        return self.size > 0
+
+    def __contains__(self, ip: ipaddress.IPv4Address | ipaddress.IPv6Address) -> bool:
+        value = int(ip)
+        starts = self._starts[ip.version]
+        i = bisect_right(starts, value) - 1
+        return i >= 0 and value <= self._ends[ip.version][i]
+
+
+def parse_networks(spec: Optional[str]) -> list[ipaddress.IPv4Network | ipaddress.IPv6Network]:
+    """Comma-separated CIDRs or plain addresses (as /32 or /128); invalid entries are ignored."""
+    nets = []
+    for entry in (spec or "").split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        try:
+            nets.append(ipaddress.ip_network(entry, strict=False))
+        except ValueError:
+            pass
+    return nets
+
+
+class IpInfo(NamedTuple):
+    valid: bool
+    private: bool          # private / loopback / link-local etc.; LAN guest candidates
+    trusted_proxy: bool    # listed in TRUSTED_PROXIES
+
+
+_PRIVATE = NetworkSet(parse_networks(",".join(PRIVATE_NETWORKS)))
+_NON_ROUTABLE = NetworkSet(parse_networks(",".join(NON_ROUTABLE_NETWORKS)))
+_trusted = NetworkSet(parse_networks(settings.TRUSTED_PROXIES))
+_INVALID = IpInfo(valid=False, private=False, trusted_proxy=False)
+
+
+def configure_trusted_proxies(spec: Optional[str]) -> None:
+    """Replace the trusted proxy list (and forget cached verdicts)."""
+    global _trusted
+    _trusted = NetworkSet(parse_networks(spec))
+    classify.cache_clear()
+
+
+@lru_cache(maxsize=_CACHE_SIZE)
+def classify(ip: str) -> IpInfo:
+    try:
+        addr = ipaddress.ip_address(ip)
+    except ValueError:
+        return _INVALID
+    mapped = getattr(addr, "ipv4_mapped", None)
+    # ::ffff:a.b.c.d is the IPv4 client on a dual-stack socket; judge it as IPv4.
+    checked = mapped or addr
+    return IpInfo(valid=True, private=checked in _PRIVATE, trusted_proxy=addr in _trusted or checked in _trusted)
+
+
+def is_private_ip(ip: str) -> bool:
+    return classify(ip).private
+
+
+def is_publicly_routable(ip: str) -> bool:
+    """A valid address outside NON_ROUTABLE_NETWORKS (IPv4-mapped addresses judged as IPv4)."""
+    try:
+        addr = ipaddress.ip_address(ip)
+    except ValueError:
+        return False
+    return (getattr(addr, "ipv4_mapped", None) or addr) not in _NON_ROUTABLE
+
+
+def is_trusted_proxy(ip: str) -> bool:
+    return classify(ip).trusted_proxy
+
+
+def client_ip(request: Request, *, default_peer: str = "127.0.0.1") -> str:
+    """
+    The real client IP: forwarding headers (CF-Connecting-IP, then the leftmost
+    X-Forwarded-For entry, then True-Client-IP) are only honoured when the direct
+    peer is a trusted proxy; otherwise the peer itself.
+    """
+    peer = (request.client.host if request.client else default_peer).strip()
+    if _trusted and classify(peer).trusted_proxy:
+        headers = request.headers
+        for key in ("cf-connecting-ip", "x-forwarded-for", "true-client-ip"):
+            raw = headers.get(key)
+            if not raw:
+                continue
+            first = raw.split(",")[0].strip()
+            if first:
+                return first
+    return peer
+
+
+def cache_info():
+    return classify.cache_info()
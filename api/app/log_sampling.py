@@ -0,0 +1,143 @@
+"""
+Rate-limited structured logging, and moving log I/O off the request path.
+
+Access decisions are made on every request; logging each one means one
+synchronous write per request into a pipe that ``ops/logging/log_writer.sh``
+drains line by line. ``SampledLog`` writes the first few events per key in each
+window as ``key=value`` lines and folds the rest into one summary line per
+window, while exact totals stay in in-memory counters. ``QueueLogging`` hands
+records to a ``QueueHandler`` so the caller only pays for a queue put; a
+``QueueListener`` thread writes them through the handlers uvicorn configured.
+"""
+
+from __future__ import annotations
+
+import logging
+import queue
+import time
+from collections import Counter
+from logging.handlers import QueueHandler, QueueListener
+from threading import Lock
+from typing import Any, Callable, Optional
+
+
+def _format_value(value: Any) -> str:
+    if value is None or value == "":
+        return '""'
+    text = str(value)
+    if any(ch.isspace() or ch in '"=' for ch in text):
+        return '"' + text.replace("\\", "\\\\").replace('"', '\\"') + '"'
+    return text
+
+
+def logfmt(**fields: Any) -> str:
+    """``key=value`` pairs in the given order; values with spaces, quotes or ``=`` are quoted."""
+    return " ".join(f"{key}={_format_value(value)}" for key, value in fields.items())
+
+
+class SampledLog:
+    """
+    At most ``per_window`` lines per key in each ``window`` seconds; once a window
+    is over, the next call (or ``flush``) logs one summary line with the totals
+    for keys that were suppressed. ``per_window=0`` logs summaries only.
+    """
+
+    def __init__(
+        self,
+        logger: logging.Logger,
+        event: str,
+        *,
+        per_window: int,
+        window: float = 60.0,
+        level: int = logging.INFO,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.logger = logger
+        self.event = event
+        self.per_window = max(0, per_window)
+        self.window = window
+        self.level = level
+        self._clock = clock
+        self._lock = Lock()
+        self._window_start = clock()
+        self._seen: Counter = Counter()
+        self._logged: Counter = Counter()
+
+    def log(self, key: str, **fields: Any) -> bool:
+        """Count one event for ``key``; True when it was written out."""
+        if not self.logger.isEnabledFor(self.level):
+            return False
+        now = self._clock()
+        with self._lock:
+            summary = self._roll(now)
+            self._seen[key] += 1
+            emit = self._logged[key] < self.per_window
+            if emit:
+                self._logged[key] += 1
+        if summary:
+            self.logger.log(self.level, summary)
+        if emit:
+            self.logger.log(self.level, logfmt(event=self.event, reason=key, **fields))
+        return emit
+
+    def flush(self) -> None:
+        """Write the summary for the current window now (e.g. at shutdown)."""
+        with self._lock:
+            summary = self._roll(self._clock(), force=True)
+        if summary:
+            self.logger.log(self.level, summary)
+
+    def _roll(self, now: float, force: bool = False) -> Optional[str]:
+        if not force and now - self._window_start < self.window:
+            return None
+        suppressed = {key: seen - self._logged[key] for key, seen in self._seen.items() if seen > self._logged[key]}
+        summary = None
+        if suppressed:
+            summary = logfmt(
+                event=f"{self.event}_summary",
+                window_s=round(now - self._window_start),
+                total=sum(self._seen.values()),
+                **{f"suppressed.{key}": count for key, count in sorted(suppressed.items())},
+            )
+        self._window_start = now
+        self._seen.clear()
+        self._logged.clear()
+        return summary
+
+
+class QueueLogging:
+    """
+    Route ``logger`` through a queue while started. The listener writes to the
+    handlers of ``target`` (uvicorn's, by default), or to stderr when it has none;
+    while stopped, records propagate as usual.
+    """
+
+    def __init__(self, logger: logging.Logger, target: str = "uvicorn.error"):
+        self.logger = logger
+        self.target = target
+        self._handler: Optional[QueueHandler] = None
+        self._listener: Optional[QueueListener] = None
+
+    @property
+    def running(self) -> bool:
+        return self._listener is not None
+
+    def start(self) -> None:
+        if self._listener is not None:
+            return
+        handlers = list(logging.getLogger(self.target).handlers) or [logging.StreamHandler()]
+        records: queue.SimpleQueue = queue.SimpleQueue()
+        self._handler = QueueHandler(records)
+        self._listener = QueueListener(records, *handlers, respect_handler_level=True)
+        self._listener.start()
+        self.logger.addHandler(self._handler)
+        self.logger.propagate = False
+
+    def stop(self) -> None:
+        """Detach the queue and write out whatever is still in it."""
+        if self._listener is None:
+            return
+        self.logger.removeHandler(self._handler)
+        self.logger.propagate = True
+        self._listener.stop()
+        self._handler = self._listener = None
@@ -6,18 +6,43 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 
 from .db import init_db
+from .deps import decision_log, decision_log_queue
+from .metrics import MetricsMiddleware, snapshot_writer
+from .query_stats import QueryStatsMiddleware, log_queue as query_log_queue, n_plus_one_log
+from .server_timing import ServerTimingMiddleware, instrument_routes
 from .routers import auth, bottles, purchases, notes, retailers, valuation, modules, wine
+from .routers.admin_analytics import router as admin_analytics_router
+from .routers.admin_fx import router as admin_fx_router
 from .routers.admin_prices import router as admin_prices_router
+from .routers.admin_queries import router as admin_queries_router
+from .routers.alerts import router as alerts_router
 from .routers.admin_users import router as admin_users_router
-from .routers.uploads import router as uploads_router, UPLOAD_DIR
+from .routers.metrics import router as metrics_router
+from .routers.uploads import router as uploads_router, image_jobs, upload_files, UPLOAD_DIR
+from .services import scheduler
+from .services.image_pool import image_pool
 from .settings import settings
 from .version import resolve_version_display
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    decision_log_queue.start()
+    query_log_queue.start()
+    if settings.METRICS_ENABLED:
+        snapshot_writer.start()
     init_db()
+    scheduler.start(UPLOAD_DIR)
+    await image_jobs.start()
     yield
+    await image_jobs.stop()
+    scheduler.shutdown()
+    image_pool.shutdown()
+    decision_log.flush()
+    decision_log_queue.stop()
+    n_plus_one_log.flush()
+    query_log_queue.stop()
+    snapshot_writer.stop()
 
 
 app = FastAPI(title="Whiskey DB API", lifespan=lifespan)
@@ -36,6 +61,15 @@ app.add_middleware(
     max_age=3600,
 )
 
+# Middleware added last runs outermost.
+# Per-request SQL stats (query count, slowest statements, N+1 suspects); see app/query_stats.py.
+app.add_middleware(QueryStatsMiddleware)
+# Opt-in Server-Timing header (SERVER_TIMING_ENABLED, or an admin sending X-Server-Timing: 1).
+app.add_middleware(ServerTimingMiddleware)
+# Outermost, so the timings include CORS handling and the other middlewares; labelled by route template.
+if settings.METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
 @app.get("/health")
 def health():
     return {"status": "ok"}
@@ -49,14 +83,20 @@ def version():
 app.include_router(auth.router)
 app.include_router(admin_users_router)
 app.include_router(admin_prices_router)
+app.include_router(admin_analytics_router)
+app.include_router(admin_fx_router)
+app.include_router(admin_queries_router)
 app.include_router(bottles.router)
 app.include_router(purchases.router)
 app.include_router(notes.router)
 app.include_router(retailers.router)
 app.include_router(uploads_router)   # <-- must come before the /uploads static mount
 app.include_router(valuation.router)
+app.include_router(alerts_router)
 app.include_router(modules.router)
 app.include_router(wine.router)
+app.include_router(metrics_router)
+instrument_routes(app.routes)
 
 # --- Static mounts (mount AFTER the routers so POST /uploads/image is not shadowed) ---
 _API_ROOT = Path(__file__).resolve().parents[1]
@@ -64,5 +104,5 @@ _STATIC_DIR = _API_ROOT / "static"
 if _STATIC_DIR.exists():
     app.mount("/static", StaticFiles(directory=_STATIC_DIR), name="static")
 
-# Serve uploads directly from /uploads using the resolved directory from uploads router.
-app.mount("/uploads", StaticFiles(directory=UPLOAD_DIR), name="uploads")
+# Serve uploads directly from /uploads (resolved directory, immutable caching) from the uploads router.
+app.mount("/uploads", upload_files, name="uploads")
@@ -0,0 +1,156 @@
+"""Pydantic schemas for market price administration and ingestion."""
+
+from __future__ import annotations
+
+from datetime import date, datetime
+from typing import Literal, Optional
+
+from pydantic import BaseModel, ConfigDict, Field, field_validator
+
+
+class MarketPriceBase(BaseModel):
+    barcode_upc: str = Field(min_length=3, description="UPC or barcode identifier")
+    price: Optional[float] = Field(default=None, ge=0)
+    currency: Optional[str] = Field(default="USD", min_length=3, max_length=6)
+    source: Optional[str] = Field(default=None, description="Human-readable source label")
+    provider: Optional[str] = Field(default=None, description="System/provider identifier")
+    as_of: Optional[datetime] = Field(default=None, description="ISO timestamp for the price")
+    notes: Optional[str] = Field(default=None, max_length=500)
+
+    @field_validator("barcode_upc")
+    @classmethod
+    def _normalize_upc(cls, value: str) -> str:
+        v = value.strip()
+        if not v:
+            raise ValueError("UPC cannot be blank")
+        return v
+
+    @field_validator("currency")
+    @classmethod
+    def _normalize_currency(cls, value: Optional[str]) -> Optional[str]:
+        if value is None:
+            return None
+        return value.strip().upper() or None
+
+
+class MarketPriceCreate(MarketPriceBase):
+    ingest_type: Literal["manual", "csv", "provider"] = "manual"
+
+
+class MarketPriceUpdate(BaseModel):
+    price: Optional[float] = Field(default=None, ge=0)
+    currency: Optional[str] = Field(default=None, min_length=3, max_length=6)
+    source: Optional[str] = Field(default=None, description="Human-readable source label")
+    provider: Optional[str] = Field(default=None, description="System/provider identifier")
+    as_of: Optional[datetime] = Field(default=None, description="ISO timestamp for the price")
+    notes: Optional[str] = Field(default=None, max_length=500)
+
+    @field_validator("currency")
+    @classmethod
+    def _normalize_currency(cls, value: Optional[str]) -> Optional[str]:
+        if value is None:
+            return None
+        return value.strip().upper() or None
+
+
+class MarketPriceOut(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    price_id: int
+    barcode_upc: str
+    price: Optional[float]
+    currency: Optional[str]
+    source: Optional[str]
+    provider: Optional[str]
+    as_of: Optional[datetime]
+    fetched_at: datetime
+    ingest_type: str
+    created_by: Optional[str]
+    notes: Optional[str]
+
+
+class MarketPriceSyncRequest(BaseModel):
+    barcode_upc: str = Field(min_length=3)
+    notes: Optional[str] = Field(default=None, max_length=500)
+
+    @field_validator("barcode_upc")
+    @classmethod
+    def _normalize_upc(cls, value: str) -> str:
+        v = value.strip()
+        if not v:
+            raise ValueError("UPC cannot be blank")
+        return v
+
+
+class MarketPriceImportError(BaseModel):
+    line: int
+    detail: str
+
+
+class MarketPriceImportResult(BaseModel):
+    rows: int = 0
+    inserted: int = 0
+    quarantined: int = 0    # held for review by anomaly screening
+    duplicates: int = 0
+    invalid: int = 0
+    errors: list[MarketPriceImportError] = Field(default_factory=list)
+
+
+class MarketPriceReviewOut(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    review_id: int
+    barcode_upc: str
+    price: Optional[float]
+    currency: Optional[str]
+    source: Optional[str]
+    provider: Optional[str]
+    as_of: Optional[datetime]
+    fetched_at: datetime
+    ingest_type: str
+    created_by: Optional[str]
+    notes: Optional[str]
+    reason: str
+    baseline_price: Optional[float]
+    score: Optional[float]
+    status: str
+    reviewed_by: Optional[str]
+    reviewed_at: Optional[datetime]
+    price_id: Optional[int]
+
+
+class FxRateIn(BaseModel):
+    currency: str = Field(min_length=3, max_length=3, description="ISO 4217 code")
+    rate_date: date
+    rate: float = Field(gt=0, description="Units of currency per one USD")
+    source: Optional[str] = None
+
+    @field_validator("currency")
+    @classmethod
+    def _normalize_currency(cls, value: str) -> str:
+        v = value.strip().upper()
+        if not v.isalpha():
+            raise ValueError("currency must be a 3-letter code")
+        return v
+
+
+class FxRateOut(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    rate_id: int
+    currency: str
+    rate_date: date
+    rate: float
+    source: Optional[str]
+    fetched_at: datetime
+
+
+class FxRateImportResult(BaseModel):
+    rows: int = 0
+    stored: int = 0
+    invalid: int = 0
+    errors: list[MarketPriceImportError] = Field(default_factory=list)
+
+
+class FxRateSyncRequest(BaseModel):
+    rate_date: Optional[date] = Field(default=None, description="Day to fetch (default: today)")
@@ -0,0 +1,390 @@
+"""
+Prometheus-compatible runtime metrics (text exposition format 0.0.4).
+
+Each API process keeps its counters, gauges and histograms in memory, so
+recording a request costs a lock and a few dict updates. With several uvicorn
+workers a scrape lands on one arbitrary worker, so every process also writes a
+JSON snapshot of its values to ``METRICS_DIR/<parent pid>/<pid>.json`` every
+METRICS_FLUSH_SECONDS; ``render`` adds the other workers' latest snapshots to
+its own live values. Counters and histograms of exited workers keep counting
+(totals must not go backwards); gauges only count processes that are still
+alive. Snapshots of earlier runs (whose parent is gone) are removed at startup.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Iterable, Optional
+
+from .settings import settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0)
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+UNMATCHED_ROUTE = "<unmatched>"
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: dict[tuple, object] = {}
+
+    def _key(self, labels: tuple) -> tuple:
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}")
+        return tuple(str(v) for v in labels)
+
+    def snapshot(self) -> list:
+        with self._lock:
+            return [[list(labels), value] for labels, value in self._values.items()]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount: float = 1.0) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def set_totals(self, totals: dict) -> None:
+        """Replace the values with totals kept elsewhere (single-label counters, e.g. by reason)."""
+        with self._lock:
+            self._values = {(str(label),): float(value) for label, value in totals.items()}
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def inc(self, *labels, amount: float = 1.0) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, *labels, amount: float = 1.0) -> None:
+        self.inc(*labels, amount=-amount)
+
+    def set(self, value: float, *labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *labels) -> None:
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)   # == len(buckets) for the +Inf bucket
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # per-bucket (non-cumulative) counts, then sum
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][index] += 1
+            state[1] += value
+
+    def snapshot(self) -> list:
+        with self._lock:
+            return [[list(labels), [list(counts), total]] for labels, (counts, total) in self._values.items()]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: dict[str, _Metric] = {}
+        self._collectors: list[Callable[[], None]] = []
+
+    def _add(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self._add(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Gauge:
+        return self._add(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Iterable[str] = (), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, documentation, labelnames, buckets))
+
+    def on_collect(self, collector: Callable[[], None]) -> None:
+        """Run ``collector`` before every snapshot, to copy values kept elsewhere into metrics."""
+        self._collectors.append(collector)
+
+    def snapshot(self) -> dict:
+        for collector in self._collectors:
+            try:
+                collector()
+            except Exception:
+                logger.exception("Metrics collector failed")
+        return {name: metric.snapshot() for name, metric in self._metrics.items()}
+
+    def render(self, others: Iterable[tuple[dict, bool]] = (), extra: str = "") -> str:
+        """
+        Text exposition of this process's values plus ``others`` (snapshot, process
+        alive) from other workers; ``extra`` is appended as is.
+        """
+        merged: dict[str, dict[tuple, object]] = {name: {} for name in self._metrics}
+        for snapshot, alive in [(self.snapshot(), True), *others]:
+            for name, samples in snapshot.items():
+                metric = self._metrics.get(name)
+                if metric is None or (metric.kind == "gauge" and not alive):
+                    continue
+                values = merged[name]
+                for labels, value in samples:
+                    key = tuple(labels)
+                    if metric.kind == "histogram":
+                        counts, total = value
+                        if len(counts) != len(metric.buckets) + 1:
+                            continue   # written by a process with different buckets
+                        current = values.setdefault(key, [[0] * len(counts), 0.0])
+                        current[0] = [a + b for a, b in zip(current[0], counts)]
+                        current[1] += total
+                    else:
+                        values[key] = values.get(key, 0.0) + value
+
+        lines: list[str] = []
+        for name, metric in self._metrics.items():
+            lines.append(f"# HELP {name} {metric.documentation}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            for key, value in sorted(merged[name].items()):
+                labels = dict(zip(metric.labelnames, key))
+                if metric.kind != "histogram":
+                    lines.append(f"{name}{_labels(labels)} {_number(value)}")
+                    continue
+                counts, total = value
+                running = 0
+                for bound, count in zip((*metric.buckets, float("inf")), counts):
+                    running += count
+                    lines.append(f"{name}_bucket{_labels({**labels, 'le': _number(bound)})} {running}")
+                lines.append(f"{name}_sum{_labels(labels)} {_number(total)}")
+                lines.append(f"{name}_count{_labels(labels)} {running}")
+        return "\n".join(lines) + "\n" + extra
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(str(value))}"' for key, value in labels.items()) + "}"
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+def gauge_lines(name: str, documentation: str, samples: dict[tuple[tuple[str, str], ...], float]) -> str:
+    """Exposition of a gauge computed at scrape time (e.g. from the database), not kept per process."""
+    lines = [f"# HELP {name} {documentation}", f"# TYPE {name} gauge"]
+    lines += [f"{name}{_labels(dict(labels))} {_number(value)}" for labels, value in sorted(samples.items())]
+    return "\n".join(lines) + "\n"
+
+
+# ---- snapshots shared between worker processes ----
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    except OSError:
+        return False
+    return True
+
+
+class SnapshotStore:
+    def __init__(self, root: str):
+        self.root = root
+
+    @property
+    def run_dir(self) -> str:
+        # Workers of one server share a parent (uvicorn's supervisor, or the shell for one worker).
+        return os.path.join(self.root, str(os.getppid()))
+
+    def write(self, snapshot: dict) -> None:
+        os.makedirs(self.run_dir, exist_ok=True)
+        path = os.path.join(self.run_dir, f"{os.getpid()}.json")
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as out:
+            json.dump(snapshot, out, separators=(",", ":"))
+        os.replace(tmp, path)
+
+    def others(self) -> list[tuple[dict, bool]]:
+        """Latest snapshots of the other processes of this run, with whether each is alive."""
+        result = []
+        own = os.getpid()
+        try:
+            names = os.listdir(self.run_dir)
+        except FileNotFoundError:
+            return result
+        for name in names:
+            stem, ext = os.path.splitext(name)
+            if ext != ".json" or not stem.isdigit() or int(stem) == own:
+                continue
+            try:
+                with open(os.path.join(self.run_dir, name), encoding="utf-8") as fh:
+                    result.append((json.load(fh), _pid_alive(int(stem))))
+            except (OSError, ValueError):
+                continue   # being replaced right now, or truncated; the next scrape sees it
+        return result
+
+    def prune(self) -> None:
+        """Remove the snapshots of earlier runs."""
+        try:
+            names = os.listdir(self.root)
+        except FileNotFoundError:
+            return
+        for name in names:
+            if name.isdigit() and not _pid_alive(int(name)):
+                run = os.path.join(self.root, name)
+                for leftover in os.listdir(run):
+                    try:
+                        os.remove(os.path.join(run, leftover))
+                    except OSError:
+                        pass
+                try:
+                    os.rmdir(run)
+                except OSError:
+                    pass
+
+
+class SnapshotWriter:
+    """Background thread writing this process's snapshot every ``interval`` seconds."""
+
+    def __init__(self, registry: Registry, store: SnapshotStore, interval: float):
+        self.registry = registry
+        self.store = store
+        self.interval = max(0.5, interval)
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self.store.prune()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="metrics-snapshot", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        self._stop.set()
+        thread.join(timeout=5)
+        self.flush()
+
+    def flush(self) -> None:
+        try:
+            self.store.write(self.registry.snapshot())
+        except OSError as exc:
+            logger.warning("Could not write metrics snapshot: %s", exc)
+
+    def _run(self) -> None:
+        while True:
+            self.flush()
+            if self._stop.wait(self.interval):
+                return
+
+
+# ---- the API's metrics ----
+
+registry = Registry()
+
+http_requests = registry.counter(
+    "whiskey_http_requests_total", "HTTP requests by route template and status.", ("method", "route", "status")
+)
+http_duration = registry.histogram(
+    "whiskey_http_request_duration_seconds", "Time to the end of the response body, per route template.", ("method", "route")
+)
+http_in_flight = registry.gauge("whiskey_http_requests_in_flight", "Requests being handled right now.", ("method",))
+db_duration = registry.histogram(
+    "whiskey_db_query_duration_seconds", "SQL statement execution time.", ("database", "operation"), buckets=DB_BUCKETS
+)
+provider_duration = registry.histogram(
+    "whiskey_provider_request_duration_seconds", "External price / FX provider call latency.", ("provider",)
+)
+provider_errors = registry.counter(
+    "whiskey_provider_errors_total", "External provider calls that failed, by error type.", ("provider", "error")
+)
+lan_decisions = registry.counter(
+    "whiskey_lan_guest_decisions_total", "Access decisions by reason (see X-Whiskey-Lan-Decision).", ("reason",)
+)
+db_queries_per_request = registry.histogram(
+    "whiskey_db_queries_per_request", "SQL statements executed per HTTP request.", ("route",),
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500),
+)
+image_pool_in_flight = registry.gauge(
+    "whiskey_image_pool_jobs", "Image conversions in the process pool by state.", ("state",)
+)
+
+store = SnapshotStore(settings.METRICS_DIR or os.path.join(tempfile.gettempdir(), "whiskey-metrics"))
+snapshot_writer = SnapshotWriter(registry, store, settings.METRICS_FLUSH_SECONDS)
+
+
+def render(extra: str = "") -> str:
+    return registry.render(store.others(), extra)
+
+
+class MetricsMiddleware:
+    """
+    Plain ASGI middleware (no per-request task or body buffering) timing each
+    HTTP request to the end of its response. Requests are labelled with the
+    route template (``/bottles/{bottle_id}``), never the raw path, so label
+    cardinality stays bounded.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        method = scope["method"]
+        status = 500
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        http_in_flight.inc(method)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            http_in_flight.dec(method)
+            route = scope.get("route")
+            template = getattr(route, "path_format", None) or getattr(route, "path", None) or UNMATCHED_ROUTE
+            http_requests.inc(method, template, status)
+            http_duration.observe(elapsed, method, template)
+
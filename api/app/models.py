@@ -1,6 +1,6 @@
 from datetime import datetime, date, timezone
 from typing import Optional, List
-from sqlalchemy import CheckConstraint, UniqueConstraint
+from sqlalchemy import CheckConstraint, Index, UniqueConstraint
 from sqlmodel import SQLModel, Field, Relationship
 
 
@@ -148,6 +148,7 @@ class MarketPrice(SQLModel, table=True):
     __tablename__ = "market_price"
     __table_args__ = (
         CheckConstraint("ingest_type IN ('manual','provider','csv')"),
+        Index("ix_market_price_upc_as_of", "barcode_upc", "as_of"),
     )
 
     price_id: Optional[int] = Field(default=None, primary_key=True)
@@ -161,3 +162,162 @@ class MarketPrice(SQLModel, table=True):
     notes: Optional[str] = None
     ingest_type: str = Field(default="manual")
     created_by: Optional[str] = None
+
+
+class MarketPriceLatest(SQLModel, table=True):
+    """Denormalized latest price per UPC, rebuilt whenever market_price rows change."""
+    __tablename__ = "market_price_latest"
+
+    barcode_upc: str = Field(primary_key=True)
+    price_id: int = Field(foreign_key="market_price.price_id")
+    price: Optional[float] = None
+    currency: str = Field(default="USD")
+    source: Optional[str] = None
+    provider: Optional[str] = None
+    as_of: Optional[datetime] = None
+    fetched_at: datetime = Field(default_factory=_utcnow)
+
+
+
+class MarketPriceReview(SQLModel, table=True):
+    """Incoming price held back by anomaly screening until an admin approves or rejects it."""
+    __tablename__ = "market_price_review"
+    __table_args__ = (
+        CheckConstraint("status IN ('pending','approved','rejected')"),
+        CheckConstraint("ingest_type IN ('manual','provider','csv')"),
+    )
+
+    review_id: Optional[int] = Field(default=None, primary_key=True)
+    barcode_upc: str = Field(index=True)
+    price: Optional[float] = None
+    currency: str = Field(default="USD")
+    source: Optional[str] = None
+    provider: Optional[str] = None
+    as_of: Optional[datetime] = None
+    fetched_at: datetime = Field(default_factory=_utcnow)
+    notes: Optional[str] = None
+    ingest_type: str = Field(default="provider")
+    created_by: Optional[str] = None
+
+    reason: str                               # why screening flagged it
+    baseline_price: Optional[float] = None    # median of the recent history it was compared to
+    score: Optional[float] = None             # robust z-score against that history
+    status: str = Field(default="pending", index=True)
+    reviewed_by: Optional[str] = None
+    reviewed_at: Optional[datetime] = None
+    price_id: Optional[int] = Field(default=None, foreign_key="market_price.price_id")  # set once approved
+
+class FxRate(SQLModel, table=True):
+    """Daily exchange rate, quoted as units of ``currency`` per one USD."""
+    __tablename__ = "fx_rate"
+    __table_args__ = (UniqueConstraint("currency", "rate_date"),)
+
+    rate_id: Optional[int] = Field(default=None, primary_key=True)
+    currency: str
+    rate_date: date
+    rate: float
+    source: Optional[str] = None
+    fetched_at: datetime = Field(default_factory=_utcnow)
+
+
+
+class PriceAlertRule(SQLModel, table=True):
+    """Alert when a bottle's latest market price crosses a threshold or moves by more than a percentage."""
+    __tablename__ = "price_alert_rule"
+    __table_args__ = (
+        CheckConstraint("scope IN ('upc','tag','style')"),
+        CheckConstraint("kind IN ('above','below','change_pct')"),
+        Index("ix_price_alert_rule_scope_target", "scope", "target"),
+    )
+
+    rule_id: Optional[int] = Field(default=None, primary_key=True)
+    scope: str                       # upc / tag / style
+    target: str                      # the UPC, tag name or style the rule applies to
+    kind: str                        # above / below: price crosses threshold; change_pct: |move| >= threshold %
+    threshold: float
+    enabled: bool = Field(default=True)
+    notes: Optional[str] = None
+    created_by: Optional[str] = None
+    created_at: datetime = Field(default_factory=_utcnow)
+
+
+class PriceAlert(SQLModel, table=True):
+    """A rule firing for one latest-price change."""
+    __tablename__ = "price_alert"
+
+    alert_id: Optional[int] = Field(default=None, primary_key=True)
+    rule_id: int = Field(foreign_key="price_alert_rule.rule_id", index=True)
+    barcode_upc: str = Field(index=True)
+    price_id: Optional[int] = Field(default=None, foreign_key="market_price.price_id")
+    price: float
+    previous_price: Optional[float] = None
+    currency: str = Field(default="USD")
+    change_pct: Optional[float] = None
+    triggered_at: datetime = Field(default_factory=_utcnow, index=True)
+    acknowledged_at: Optional[datetime] = None
+    acknowledged_by: Optional[str] = None
+
+
+class DataVersion(SQLModel, table=True):
+    """Change counter for a group of tables, bumped in the committing transaction; keys cached rollups."""
+    __tablename__ = "data_version"
+
+    name: str = Field(primary_key=True)   # prices / collection / fx / alert_rules
+    version: int = Field(default=0)
+
+
+class StoredImage(SQLModel, table=True):
+    """An upload in the content-addressed store, kept at ``ab/cd/<sha256><ext>`` under UPLOAD_DIR."""
+    __tablename__ = "stored_image"
+
+    sha256: str = Field(primary_key=True)
+    path: str                        # relative to UPLOAD_DIR
+    size_bytes: int
+    ref_count: int = Field(default=0)  # Bottle / WineBottle image_url values pointing at it
+    created_at: datetime = Field(default_factory=_utcnow)
+
+
+class LegacyUpload(SQLModel, table=True):
+    """Flat ``/uploads/<name>`` URL from before the store, mapped to where the file lives now."""
+    __tablename__ = "legacy_upload"
+
+    name: str = Field(primary_key=True)
+    path: str                        # relative to UPLOAD_DIR (the original or one of its variants)
+    sha256: str = Field(foreign_key="stored_image.sha256", index=True)
+
+
+
+class ImageHash(SQLModel, table=True):
+    """64-bit dHash of a stored image, for similar-photo lookup and duplicate reports."""
+    __tablename__ = "image_hash"
+
+    hash_id: Optional[int] = Field(default=None, primary_key=True)   # lets each process load only new rows
+    sha256: str = Field(foreign_key="stored_image.sha256", unique=True)
+    dhash: int                       # unsigned 64-bit value stored as signed (SQLite INTEGER)
+    created_at: datetime = Field(default_factory=_utcnow)
+
+
+class ImageJob(SQLModel, table=True):
+    """A queued upload conversion; the source waits under ``UPLOAD_DIR/.jobs`` until it succeeds."""
+    __tablename__ = "image_job"
+
+    job_id: str = Field(primary_key=True)
+    kind: str = Field(default="upload")                 # "upload", or "url_import" (source is the item list)
+    status: str = Field(default="queued", index=True)   # queued / running / succeeded / failed
+    stage: str = Field(default="queued")
+    progress: int = Field(default=0)                     # 0-100
+    filename: str
+    source_path: str                 # relative to UPLOAD_DIR
+    source_sha256: str
+    target_kind: Optional[str] = None  # "bottle" or "wine": its image_url is set on success
+    target_id: Optional[int] = None
+    attempts: int = Field(default=0)
+    max_attempts: int = Field(default=5)
+    next_attempt_at: datetime = Field(default_factory=_utcnow, index=True)
+    lease_expires_at: Optional[datetime] = None          # a running job past its lease is picked up again
+    result_json: Optional[str] = None
+    error: Optional[str] = None
+    created_by: Optional[str] = None
+    created_at: datetime = Field(default_factory=_utcnow)
+    updated_at: datetime = Field(default_factory=_utcnow)
+    finished_at: Optional[datetime] = None
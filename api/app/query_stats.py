@@ -0,0 +1,304 @@
+"""
+SQL statement instrumentation: per-request query stats, N+1 detection, slow-query log.
+
+``instrument(engine)`` (called for both engines in ``db.py``) times every
+cursor execution. Each statement is reduced to its shape (whitespace collapsed,
+expanded ``IN (?, ?, ...)`` lists folded) and added to:
+
+* the process-wide table of statement shapes (calls, total and max time),
+  shown by ``GET /admin/queries``;
+* the current request's ``RequestQueries`` (set by ``QueryStatsMiddleware``):
+  query count, SQL time, slowest statements, and how often each shape ran.
+  At the end of the request, a shape run N_PLUS_ONE_THRESHOLD times or more is
+  logged as a likely N+1 (sampled per route, see ``log_sampling``);
+* the slow-query log, for statements over SLOW_QUERY_MS, with the SQLite
+  ``EXPLAIN QUERY PLAN`` of the statement taken on the same connection.
+
+It also feeds the Server-Timing ``sql`` phase and the query duration histogram.
+"""
+
+from __future__ import annotations
+
+import heapq
+import logging
+import os
+import re
+import time
+from collections import Counter, deque
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from functools import lru_cache
+from threading import Lock
+from typing import Any, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from . import server_timing
+from .log_sampling import QueueLogging, SampledLog, logfmt
+from .metrics import UNMATCHED_ROUTE, db_duration, db_queries_per_request
+from .settings import settings
+
+logger = logging.getLogger("uvicorn.error").getChild("sql")
+log_queue = QueueLogging(logger)
+n_plus_one_log = SampledLog(logger, "n_plus_one", per_window=3, level=logging.WARNING)
+
+_SLOWEST_PER_REQUEST = 5
+_RECENT = 50
+_SHAPE_CHARS = 2000
+_SPACES = re.compile(r"\s+")
+_IN_LIST = re.compile(r"\(\s*(\?|:\w+|%s)(\s*,\s*(\?|:\w+|%s))+\s*\)")
+_OPERATION = re.compile(r"\s*(\w+)")
+_STARTED = "query_stats_started"
+OTHER_STATEMENTS = "<other statements>"
+
+_current: ContextVar[Optional["RequestQueries"]] = ContextVar("request_queries", default=None)
+
+
+def _utcnow() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+@lru_cache(maxsize=2048)
+def statement_shape(statement: str) -> str:
+    """The statement with whitespace collapsed and bound-parameter lists folded to ``(?, ...)``."""
+    shape = _IN_LIST.sub(r"(\1, ...)", _SPACES.sub(" ", statement).strip())
+    return shape[:_SHAPE_CHARS]
+
+
+class QueryStats:
+    """Process-wide totals per statement shape, plus the most recent slow queries and flagged requests."""
+
+    def __init__(self, max_statements: int):
+        self.max_statements = max(1, max_statements)
+        self._lock = Lock()
+        self._statements: dict[str, list] = {}   # shape -> [database, calls, total, max]
+        self._slow: deque = deque(maxlen=_RECENT)
+        self._flagged: deque = deque(maxlen=_RECENT)
+        self.since = _utcnow()
+
+    def observe(self, database: str, shape: str, elapsed: float) -> None:
+        with self._lock:
+            entry = self._statements.get(shape)
+            if entry is None:
+                if len(self._statements) >= self.max_statements:
+                    # Bounded: once full, new shapes are only counted in aggregate.
+                    shape, database = OTHER_STATEMENTS, "*"
+                    entry = self._statements.get(shape)
+                if entry is None:
+                    entry = self._statements[shape] = [database, 0, 0.0, 0.0]
+            entry[1] += 1
+            entry[2] += elapsed
+            if elapsed > entry[3]:
+                entry[3] = elapsed
+
+    def add_slow(self, entry: dict[str, Any]) -> None:
+        with self._lock:
+            self._slow.append(entry)
+
+    def add_flagged(self, entry: dict[str, Any]) -> None:
+        with self._lock:
+            self._flagged.append(entry)
+
+    def recent(self) -> tuple[list, list]:
+        """Recent slow queries and flagged requests, newest first."""
+        with self._lock:
+            return list(reversed(self._slow)), list(reversed(self._flagged))
+
+    def top(self, limit: int = 20, order: str = "total") -> list[dict[str, Any]]:
+        with self._lock:
+            rows = [(shape, *entry) for shape, entry in self._statements.items()]
+        key = {
+            "total": lambda r: r[3],
+            "calls": lambda r: r[2],
+            "mean": lambda r: r[3] / r[2],
+            "max": lambda r: r[4],
+        }[order]
+        return [
+            {
+                "statement": shape,
+                "database": database,
+                "calls": calls,
+                "total_ms": round(total * 1000, 3),
+                "mean_ms": round(total * 1000 / calls, 3),
+                "max_ms": round(longest * 1000, 3),
+            }
+            for shape, database, calls, total, longest in heapq.nlargest(limit, rows, key=key)
+        ]
+
+    def summary(self) -> dict[str, Any]:
+        with self._lock:
+            calls = sum(entry[1] for entry in self._statements.values())
+            total = sum(entry[2] for entry in self._statements.values())
+            return {
+                "since": self.since,
+                "statements": len(self._statements),
+                "calls": calls,
+                "total_ms": round(total * 1000, 3),
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._statements.clear()
+            self._slow.clear()
+            self._flagged.clear()
+            self.since = _utcnow()
+
+
+stats = QueryStats(settings.QUERY_STATS_MAX_STATEMENTS)
+
+
+class RequestQueries:
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.shapes: Counter = Counter()
+        self.slowest: list[tuple[float, str]] = []   # min-heap of the slowest statements
+
+    def add(self, shape: str, elapsed: float) -> None:
+        self.count += 1
+        self.total += elapsed
+        self.shapes[shape] += 1
+        if len(self.slowest) < _SLOWEST_PER_REQUEST:
+            heapq.heappush(self.slowest, (elapsed, shape))
+        elif elapsed > self.slowest[0][0]:
+            heapq.heapreplace(self.slowest, (elapsed, shape))
+
+    def repeated(self, threshold: int) -> list[tuple[str, int]]:
+        """Shapes run at least ``threshold`` times in this request, most repeated first."""
+        if threshold <= 0:
+            return []
+        return [(shape, n) for shape, n in self.shapes.most_common() if n >= threshold]
+
+    def describe(self) -> dict[str, Any]:
+        return {
+            "queries": self.count,
+            "sql_ms": round(self.total * 1000, 3),
+            "slowest": [
+                {"statement": shape, "ms": round(elapsed * 1000, 3)}
+                for elapsed, shape in sorted(self.slowest, reverse=True)
+            ],
+        }
+
+
+def current() -> Optional[RequestQueries]:
+    return _current.get()
+
+
+# ---- listeners ----
+
+def _database_name(engine: Engine) -> str:
+    database = engine.url.database
+    if not database or database == ":memory:":
+        return "memory"
+    return os.path.splitext(os.path.basename(database))[0]
+
+
+def _explain(conn, statement: str, parameters) -> Optional[list[str]]:
+    """SQLite's plan for ``statement``, read through a raw cursor so it does not re-enter these hooks."""
+    if conn.dialect.name != "sqlite":
+        return None
+    try:
+        cursor = conn.connection.dbapi_connection.cursor()
+        try:
+            cursor.execute(f"EXPLAIN QUERY PLAN {statement}", parameters or ())
+            return [row[-1] for row in cursor.fetchall()]
+        finally:
+            cursor.close()
+    except Exception as exc:
+        return [f"unavailable: {exc}"]
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault(_STARTED, []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get(_STARTED)
+    if not started:
+        return
+    elapsed = time.perf_counter() - started.pop()
+    server_timing.record("sql", elapsed)
+    database = _database_name(conn.engine)
+    shape = statement_shape(statement)
+    stats.observe(database, shape, elapsed)
+    request = _current.get()
+    if request is not None:
+        request.add(shape, elapsed)
+    if settings.METRICS_ENABLED:
+        match = _OPERATION.match(statement)
+        db_duration.observe(elapsed, database, match.group(1).upper() if match else "OTHER")
+
+    slow_ms = settings.SLOW_QUERY_MS
+    if slow_ms > 0 and elapsed * 1000 >= slow_ms:
+        plan = None if executemany else _explain(conn, statement, parameters)
+        stats.add_slow({
+            "at": _utcnow(),
+            "database": database,
+            "ms": round(elapsed * 1000, 3),
+            "statement": shape,
+            "plan": plan,
+        })
+        logger.warning(logfmt(
+            event="slow_query", database=database, ms=round(elapsed * 1000, 1), statement=shape,
+            plan=" | ".join(plan or ()),
+        ))
+
+
+def _handle_error(context) -> None:
+    # A failed statement never reaches after_cursor_execute; drop its start time.
+    started = context.connection.info.get(_STARTED) if context.connection is not None else None
+    if started:
+        started.pop()
+
+
+def instrument(engine: Engine) -> None:
+    """Attach the statement hooks to ``engine`` (idempotent)."""
+    if event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        return
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
+
+
+# ---- per-request tracking ----
+
+def finish_request(request: RequestQueries, method: str, route: str) -> None:
+    if settings.METRICS_ENABLED:
+        db_queries_per_request.observe(request.count, route)
+    repeated = request.repeated(settings.N_PLUS_ONE_THRESHOLD)
+    if not repeated:
+        return
+    shape, times = repeated[0]
+    stats.add_flagged({
+        "at": _utcnow(),
+        "method": method,
+        "route": route,
+        "repeated": [{"statement": s, "times": n} for s, n in repeated[:5]],
+        **request.describe(),
+    })
+    n_plus_one_log.log(
+        route, method=method, times=times, queries=request.count,
+        sql_ms=round(request.total * 1000, 1), statement=shape[:300],
+    )
+
+
+class QueryStatsMiddleware:
+    """Plain ASGI middleware giving each HTTP request its own ``RequestQueries``."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        request = RequestQueries()
+        token = _current.set(request)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _current.reset(token)
+            route = scope.get("route")
+            template = getattr(route, "path_format", None) or getattr(route, "path", None) or UNMATCHED_ROUTE
+            finish_request(request, scope["method"], template)
@@ -0,0 +1,61 @@
+"""Admin endpoint for collection performance analytics."""
+
+from __future__ import annotations
+
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Query
+from pydantic import BaseModel
+from sqlmodel import Session
+
+from ..db import get_session
+from ..deps import require_admin
+from ..services.analytics import compute_analytics
+
+router = APIRouter(
+    prefix="/admin/analytics",
+    tags=["admin"],
+)
+
+
+class CollectionAnalytics(BaseModel):
+    bottles: int
+    cost_basis: Optional[float] = None
+    market_value: Optional[float] = None
+    total_return: Optional[float] = None   # fraction, e.g. 0.25 == +25%
+    cagr: Optional[float] = None
+    volatility: Optional[float] = None     # annualized, from month-end collection returns
+    max_drawdown: Optional[float] = None   # fraction of the running peak
+    months: int
+
+
+class BottleAnalytics(BaseModel):
+    bottle_id: int
+    brand: Optional[str] = None
+    expression: Optional[str] = None
+    barcode_upc: Optional[str] = None
+    quantity: int
+    cost_basis: Optional[float] = None
+    market_value: Optional[float] = None
+    latest_price: Optional[float] = None
+    latest_price_date: Optional[str] = None
+    total_return: Optional[float] = None
+    cagr: Optional[float] = None
+    volatility: Optional[float] = None     # annualized, from price history since purchase
+    max_drawdown: Optional[float] = None
+    observations: int
+
+
+class AnalyticsResponse(BaseModel):
+    as_of: str
+    collection: CollectionAnalytics
+    bottles: list[BottleAnalytics]
+
+
+@router.get("", response_model=AnalyticsResponse)
+def get_analytics(
+    limit: int = Query(default=100, ge=1, le=5000, description="Max bottles to return, by market value"),
+    session: Session = Depends(get_session),
+    _admin=Depends(require_admin),
+):
+    return compute_analytics(session, limit=limit)
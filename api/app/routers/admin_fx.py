@@ -0,0 +1,70 @@
+"""Admin endpoints for the FX rate table used in currency conversion."""
+
+from __future__ import annotations
+
+from typing import Optional
+
+from fastapi import APIRouter, Depends, File, HTTPException, Query, UploadFile, status
+from sqlalchemy import desc
+from sqlmodel import Session, select
+
+from ..db import get_session
+from ..deps import require_admin
+from ..market_price_schemas import FxRateImportResult, FxRateOut, FxRateSyncRequest
+from ..models import FxRate
+from ..services.fx import fetch_external_rates, import_fx_csv, store_rates
+
+router = APIRouter(
+    prefix="/admin/fx",
+    tags=["admin"],
+)
+
+
+@router.get("", response_model=list[FxRateOut])
+def list_rates(
+    currency: Optional[str] = Query(default=None, min_length=3, max_length=3),
+    limit: int = Query(default=100, ge=1, le=1000),
+    session: Session = Depends(get_session),
+    _admin=Depends(require_admin),
+):
+    stmt = select(FxRate).order_by(desc(FxRate.rate_date), FxRate.currency).limit(limit)
+    if currency:
+        stmt = stmt.where(FxRate.currency == currency.strip().upper())
+    return session.exec(stmt).all()
+
+
+@router.post("/import", response_model=FxRateImportResult)
+def import_rates_csv(
+    file: UploadFile = File(...),
+    session: Session = Depends(get_session),
+    _admin=Depends(require_admin),
+):
+    """
+    Load daily rates from a CSV with a header row.
+    Columns: currency, rate_date (or date), rate (units per one USD), source.
+    """
+    try:
+        return import_fx_csv(session, file.file)
+    except UnicodeDecodeError as exc:
+        raise HTTPException(status_code=400, detail="CSV must be UTF-8 encoded") from exc
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+
+
+@router.post("/sync", response_model=list[FxRateOut], status_code=status.HTTP_201_CREATED)
+def sync_rates_from_provider(
+    payload: FxRateSyncRequest,
+    session: Session = Depends(get_session),
+    _admin=Depends(require_admin),
+):
+    rates = fetch_external_rates(payload.rate_date)
+    if not rates:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="FX provider is not configured or returned no rates",
+        )
+
+    store_rates(session, rates)
+    session.commit()
+    day = rates[0]["rate_date"]
+    return session.exec(select(FxRate).where(FxRate.rate_date == day).order_by(FxRate.currency)).all()
@@ -2,20 +2,31 @@
 
 from __future__ import annotations
 
-import os
 from datetime import datetime, timezone
 from typing import Literal, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, Query, status
-from pydantic import BaseModel, ConfigDict, Field, field_validator
+from fastapi import APIRouter, Depends, File, HTTPException, Query, UploadFile, status
 from sqlalchemy import desc, nulls_last
 from sqlmodel import Session, select
 
 from ..db import get_session
 from ..deps import require_admin
-from ..models import MarketPrice
-from ..services.market_prices import fetch_external_quote, persist_quote
-from zoneinfo import ZoneInfo
+from ..market_price_schemas import (
+    MarketPriceCreate,
+    MarketPriceImportResult,
+    MarketPriceOut,
+    MarketPriceReviewOut,
+    MarketPriceSyncRequest,
+    MarketPriceUpdate,
+)
+from ..models import MarketPrice, MarketPriceReview
+from ..services.market_prices import (
+    QuoteQuarantined,
+    ensure_timezone,
+    fetch_external_quote,
+    persist_quote,
+)
+from ..services.price_import import import_price_csv
 
 router = APIRouter(
     prefix="/admin/prices",
@@ -23,80 +34,6 @@ router = APIRouter(
 )
 
 
-class MarketPriceBase(BaseModel):
-    barcode_upc: str = Field(min_length=3, description="UPC or barcode identifier")
-    price: Optional[float] = Field(default=None, ge=0)
-    currency: Optional[str] = Field(default="USD", min_length=3, max_length=6)
-    source: Optional[str] = Field(default=None, description="Human-readable source label")
-    provider: Optional[str] = Field(default=None, description="System/provider identifier")
-    as_of: Optional[datetime] = Field(default=None, description="ISO timestamp for the price")
-    notes: Optional[str] = Field(default=None, max_length=500)
-
-    @field_validator("barcode_upc")
-    @classmethod
-    def _normalize_upc(cls, value: str) -> str:
-        v = value.strip()
-        if not v:
-            raise ValueError("UPC cannot be blank")
-        return v
-
-    @field_validator("currency")
-    @classmethod
-    def _normalize_currency(cls, value: Optional[str]) -> Optional[str]:
-        if value is None:
-            return None
-        return value.strip().upper() or None
-
-
-class MarketPriceCreate(MarketPriceBase):
-    ingest_type: Literal["manual", "csv", "provider"] = "manual"
-
-
-class MarketPriceUpdate(BaseModel):
-    price: Optional[float] = Field(default=None, ge=0)
-    currency: Optional[str] = Field(default=None, min_length=3, max_length=6)
-    source: Optional[str] = Field(default=None, description="Human-readable source label")
-    provider: Optional[str] = Field(default=None, description="System/provider identifier")
-    as_of: Optional[datetime] = Field(default=None, description="ISO timestamp for the price")
-    notes: Optional[str] = Field(default=None, max_length=500)
-
-    @field_validator("currency")
-    @classmethod
-    def _normalize_currency(cls, value: Optional[str]) -> Optional[str]:
-        if value is None:
-            return None
-        return value.strip().upper() or None
-
-
-class MarketPriceOut(BaseModel):
-    model_config = ConfigDict(from_attributes=True)
-
-    price_id: int
-    barcode_upc: str
-    price: Optional[float]
-    currency: Optional[str]
-    source: Optional[str]
-    provider: Optional[str]
-    as_of: Optional[datetime]
-    fetched_at: datetime
-    ingest_type: str
-    created_by: Optional[str]
-    notes: Optional[str]
-
-
-class MarketPriceSyncRequest(BaseModel):
-    barcode_upc: str = Field(min_length=3)
-    notes: Optional[str] = Field(default=None, max_length=500)
-
-    @field_validator("barcode_upc")
-    @classmethod
-    def _normalize_upc(cls, value: str) -> str:
-        v = value.strip()
-        if not v:
-            raise ValueError("UPC cannot be blank")
-        return v
-
-
 def _base_query(upc: Optional[str] = None):
     stmt = select(MarketPrice).order_by(
         nulls_last(desc(MarketPrice.as_of)),
@@ -142,7 +79,7 @@ def create_price(
         currency=payload.currency or "USD",
         source=payload.source,
         provider=payload.provider or payload.source,
-        as_of=_ensure_timezone(payload.as_of),
+        as_of=ensure_timezone(payload.as_of),
         ingest_type=payload.ingest_type,
         created_by=admin["username"],
         notes=payload.notes,
@@ -174,12 +111,115 @@ def sync_price_from_provider(
             created_by=admin["username"],
             notes=payload.notes,
         )
+    except QuoteQuarantined as exc:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Quote held for review #{exc.review.review_id}: {exc.review.reason}",
+        ) from exc
     except Exception as exc:
         raise HTTPException(status_code=500, detail=f"Unable to store quote: {exc}") from exc
 
     return record
 
 
+@router.post("/import", response_model=MarketPriceImportResult)
+def import_prices_csv(
+    file: UploadFile = File(...),
+    session: Session = Depends(get_session),
+    admin=Depends(require_admin),
+):
+    """
+    Stream a dealer/auction price sheet (CSV with a header row) into market_price.
+    Columns: barcode_upc, price, currency, source, provider, as_of, notes.
+    Rows already stored for the same (barcode_upc, as_of, provider) are skipped. Rows
+    without as_of are dated with the import time, and skipped when the newest stored
+    price for their (barcode_upc, provider) is the same price and currency.
+    """
+    try:
+        return import_price_csv(session, file.file, created_by=admin["username"])
+    except UnicodeDecodeError as exc:
+        raise HTTPException(status_code=400, detail="CSV must be UTF-8 encoded") from exc
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+
+
+@router.get("/review", response_model=list[MarketPriceReviewOut])
+def list_price_reviews(
+    review_status: Literal["pending", "approved", "rejected"] = Query(default="pending", alias="status"),
+    upc: Optional[str] = Query(default=None, description="Filter by specific UPC"),
+    limit: int = Query(default=100, ge=1, le=500),
+    session: Session = Depends(get_session),
+    _admin=Depends(require_admin),
+):
+    """Prices quarantined by anomaly screening."""
+    stmt = (
+        select(MarketPriceReview)
+        .where(MarketPriceReview.status == review_status)
+        .order_by(desc(MarketPriceReview.fetched_at), desc(MarketPriceReview.review_id))
+        .limit(limit)
+    )
+    if upc:
+        stmt = stmt.where(MarketPriceReview.barcode_upc == upc)
+    return session.exec(stmt).all()
+
+
+def _pending_review(session: Session, review_id: int) -> MarketPriceReview:
+    review = session.get(MarketPriceReview, review_id)
+    if not review:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Review not found")
+    if review.status != "pending":
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"Review already {review.status}")
+    return review
+
+
+@router.post("/review/{review_id}/approve", response_model=MarketPriceReviewOut)
+def approve_price_review(
+    review_id: int,
+    session: Session = Depends(get_session),
+    admin=Depends(require_admin),
+):
+    """Promote a quarantined price into market_price as-is."""
+    review = _pending_review(session, review_id)
+    record = MarketPrice(
+        barcode_upc=review.barcode_upc,
+        price=review.price,
+        currency=review.currency,
+        source=review.source,
+        provider=review.provider,
+        as_of=review.as_of,
+        fetched_at=review.fetched_at,
+        notes=review.notes,
+        ingest_type=review.ingest_type,
+        created_by=review.created_by,
+    )
+    session.add(record)
+    session.flush()
+    review.status = "approved"
+    review.price_id = record.price_id
+    review.reviewed_by = admin["username"]
+    review.reviewed_at = datetime.now(timezone.utc)
+    session.add(review)
+    session.commit()
+    session.refresh(review)
+    return review
+
+
+@router.post("/review/{review_id}/reject", response_model=MarketPriceReviewOut)
+def reject_price_review(
+    review_id: int,
+    session: Session = Depends(get_session),
+    admin=Depends(require_admin),
+):
+    review = _pending_review(session, review_id)
+    review.status = "rejected"
+    review.reviewed_by = admin["username"]
+    review.reviewed_at = datetime.now(timezone.utc)
+    session.add(review)
+    session.commit()
+    session.refresh(review)
+    return review
+
+
 @router.patch("/{price_id}", response_model=MarketPriceOut)
 def update_price(
     price_id: int,
@@ -206,7 +246,7 @@ def update_price(
         record.provider = data["provider"]
 
     if "as_of" in data:
-        record.as_of = _ensure_timezone(data["as_of"])
+        record.as_of = ensure_timezone(data["as_of"])
 
     if "notes" in data:
         record.notes = data["notes"]
@@ -216,15 +256,3 @@ def update_price(
     session.commit()
     session.refresh(record)
     return record
-_TZ_NAME = os.getenv("TZ") or "UTC"
-
-
-def _ensure_timezone(value: Optional[datetime]) -> Optional[datetime]:
-    if value is None:
-        return None
-    if value.tzinfo is not None:
-        return value
-    try:
-        return value.replace(tzinfo=ZoneInfo(_TZ_NAME))
-    except Exception:
-        return value.replace(tzinfo=timezone.utc)
@@ -0,0 +1,45 @@
+"""Admin endpoints for SQL statement statistics (top statements, slow queries, N+1 suspects)."""
+
+from __future__ import annotations
+
+import os
+from typing import Literal
+
+from fastapi import APIRouter, Depends, Query, status
+
+from ..deps import require_admin
+from ..query_stats import stats
+from ..settings import settings
+
+router = APIRouter(
+    prefix="/admin/queries",
+    tags=["admin"],
+    dependencies=[Depends(require_admin)],
+)
+
+
+@router.get("")
+def top_statements(
+    limit: int = Query(default=20, ge=1, le=200),
+    order: Literal["total", "calls", "mean", "max"] = Query(default="total"),
+):
+    """
+    Statement shapes by cumulative time (or calls / mean / max), with the recent
+    slow queries and their plans and the requests flagged as likely N+1.
+    Figures are for the worker process that answers (``pid``).
+    """
+    slow, flagged = stats.recent()
+    return {
+        "pid": os.getpid(),
+        **stats.summary(),
+        "slow_query_ms": settings.SLOW_QUERY_MS,
+        "n_plus_one_threshold": settings.N_PLUS_ONE_THRESHOLD,
+        "top": stats.top(limit, order),
+        "slow": slow,
+        "n_plus_one": flagged,
+    }
+
+
+@router.delete("", status_code=status.HTTP_204_NO_CONTENT)
+def reset_statements():
+    stats.reset()
@@ -0,0 +1,114 @@
+"""Price alert rules and the alerts they have triggered."""
+
+from __future__ import annotations
+
+from datetime import datetime, timezone
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy import delete, desc
+from sqlmodel import Session, select
+
+from ..alert_schemas import (
+    PriceAlertOut,
+    PriceAlertRuleCreate,
+    PriceAlertRuleOut,
+    PriceAlertRuleUpdate,
+)
+from ..db import get_session
+from ..deps import require_admin, require_authenticated_user
+from ..models import PriceAlert, PriceAlertRule
+
+router = APIRouter(prefix="/alerts", tags=["alerts"])
+
+
+@router.get("", response_model=list[PriceAlertOut])
+def list_alerts(
+    upc: Optional[str] = Query(default=None, description="Filter by specific UPC"),
+    rule_id: Optional[int] = Query(default=None),
+    unacknowledged: bool = Query(default=False, description="Only alerts nobody has acknowledged yet"),
+    limit: int = Query(default=100, ge=1, le=500),
+    session: Session = Depends(get_session),
+    _user=Depends(require_authenticated_user),
+):
+    stmt = select(PriceAlert).order_by(desc(PriceAlert.triggered_at), desc(PriceAlert.alert_id)).limit(limit)
+    if upc:
+        stmt = stmt.where(PriceAlert.barcode_upc == upc.strip())
+    if rule_id is not None:
+        stmt = stmt.where(PriceAlert.rule_id == rule_id)
+    if unacknowledged:
+        stmt = stmt.where(PriceAlert.acknowledged_at.is_(None))
+    return session.exec(stmt).all()
+
+
+@router.post("/{alert_id}/ack", response_model=PriceAlertOut)
+def acknowledge_alert(
+    alert_id: int,
+    session: Session = Depends(get_session),
+    user=Depends(require_authenticated_user),
+):
+    alert = session.get(PriceAlert, alert_id)
+    if not alert:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Alert not found")
+    if alert.acknowledged_at is None:
+        alert.acknowledged_at = datetime.now(timezone.utc)
+        alert.acknowledged_by = user.get("username")
+        session.add(alert)
+        session.commit()
+        session.refresh(alert)
+    return alert
+
+
+@router.get("/rules", response_model=list[PriceAlertRuleOut])
+def list_rules(
+    session: Session = Depends(get_session),
+    _user=Depends(require_authenticated_user),
+):
+    return session.exec(select(PriceAlertRule).order_by(PriceAlertRule.rule_id)).all()
+
+
+@router.post("/rules", response_model=PriceAlertRuleOut, status_code=status.HTTP_201_CREATED)
+def create_rule(
+    payload: PriceAlertRuleCreate,
+    session: Session = Depends(get_session),
+    admin=Depends(require_admin),
+):
+    rule = PriceAlertRule(**payload.model_dump(), created_by=admin["username"])
+    session.add(rule)
+    session.commit()
+    session.refresh(rule)
+    return rule
+
+
+@router.patch("/rules/{rule_id}", response_model=PriceAlertRuleOut)
+def update_rule(
+    rule_id: int,
+    payload: PriceAlertRuleUpdate,
+    session: Session = Depends(get_session),
+    _admin=Depends(require_admin),
+):
+    rule = session.get(PriceAlertRule, rule_id)
+    if not rule:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Rule not found")
+    for key, value in payload.model_dump(exclude_unset=True).items():
+        if value is not None or key == "notes":
+            setattr(rule, key, value)
+    session.add(rule)
+    session.commit()
+    session.refresh(rule)
+    return rule
+
+
+@router.delete("/rules/{rule_id}", status_code=status.HTTP_204_NO_CONTENT)
+def delete_rule(
+    rule_id: int,
+    session: Session = Depends(get_session),
+    _admin=Depends(require_admin),
+):
+    """Delete a rule together with the alerts it triggered."""
+    rule = session.get(PriceAlertRule, rule_id)
+    if not rule:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Rule not found")
+    session.execute(delete(PriceAlert).where(PriceAlert.rule_id == rule_id))
+    session.delete(rule)
+    session.commit()
@@ -1,6 +1,5 @@
 # api/app/routers/auth.py
 import time
-import ipaddress
 import json
 from collections import defaultdict, deque
 from typing import Deque, Dict, Any
@@ -43,6 +42,7 @@ from ..auth_schemas import (
     PasskeyRegisterVerifyRequest,
 )
 from ..deps import get_current_user_role
+from ..ip_classification import client_ip
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 
@@ -63,39 +63,9 @@ _PASSKEY_AUTH_CHALLENGES: Dict[str, tuple[Any, float]] = {}
 _PASSKEY_REG_CHALLENGES: Dict[str, tuple[Any, float]] = {}
 _PASSKEY_CHALLENGE_TTL = getattr(settings, "PASSKEY_CHALLENGE_TTL_SECONDS", 120)
 
-# Parse trusted proxies (CIDR or single IPs) to safely honor X-Forwarded-For / CF-Connecting-IP
-_TRUSTED_NETS = []
-for cidr in (settings.TRUSTED_PROXIES or "").split(","):
-    cidr = cidr.strip()
-    if not cidr:
-        continue
-    try:
-        _TRUSTED_NETS.append(ipaddress.ip_network(cidr, strict=False))
-    except Exception:
-        # allow single IPs too
-        try:
-            _TRUSTED_NETS.append(ipaddress.ip_network(f"{cidr}/32", strict=False))
-        except Exception:
-            pass
-
-
 def _ip_from_request(request: Request) -> str:
     """Return client IP, honoring forwarded headers only if peer is a trusted proxy."""
-    remote = (request.client.host if request.client else "unknown").strip()
-    try:
-        rip = ipaddress.ip_address(remote)
-    except Exception:
-        return remote
-
-    # Trust forwarded headers only if remote peer is in a trusted net
-    if any(rip in net for net in _TRUSTED_NETS):
-        hdr = request.headers
-        # Prefer Cloudflare then standard XFF, then True-Client-IP
-        for key in ("cf-connecting-ip", "x-forwarded-for", "true-client-ip"):
-            v = hdr.get(key)
-            if v:
-                return v.split(",")[0].strip()
-    return remote
+    return client_ip(request, default_peer="unknown")
 
 
 def _throttle_check(ip: str) -> None:
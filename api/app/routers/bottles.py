@@ -1,13 +1,18 @@
+import asyncio
+import io
 import json
 from datetime import datetime
 from typing import List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, Query, status, Response
+from fastapi import APIRouter, Depends, File, HTTPException, Query, UploadFile, status, Response
 from sqlmodel import Session, select, SQLModel
 
-from ..db import get_session
+from ..db import engine, get_session
 from ..models import Bottle, BottleAudit, Purchase, TastingNote, BottleTag
 from ..deps import get_current_user_role, require_admin, require_view_access  # <-- NEW
+from ..services import image_hashes, upload_store
+from ..services.image_pool import PoolBusy, image_pool
+from ..settings import settings
 
 router = APIRouter(prefix="/bottles", tags=["bottles"], dependencies=[Depends(get_current_user_role)])
 
@@ -63,6 +68,56 @@ def list_bottles(
     return session.exec(stmt.order_by(Bottle.brand, Bottle.expression)).all()
 
 
+def _find_by_hash(query: int, limit: int, max_distance: int) -> list[dict]:
+    with Session(engine) as session:
+        image_hashes.perceptual_index.refresh(session)
+        # Several images may belong to one bottle (or none); over-fetch, then keep the best per bottle.
+        nearest = image_hashes.perceptual_index.search(query, limit=limit * 4, max_distance=max_distance)
+        bottles = upload_store.bottles_by_image(session, [sha for sha, _ in nearest])
+        matches: list[dict] = []
+        seen: set[int] = set()
+        for sha256, distance in nearest:
+            for bottle in bottles.get(sha256, []):
+                if bottle.bottle_id in seen:
+                    continue
+                seen.add(bottle.bottle_id)
+                matches.append({
+                    "bottle": bottle.model_dump(),
+                    "distance": distance,
+                    "similarity": round(1 - distance / image_hashes.HASH_BITS, 3),
+                    "sha256": sha256,
+                })
+        return matches[:limit]
+
+
+@router.post("/lookup-by-image", dependencies=[Depends(require_view_access)])
+async def lookup_by_image(
+    file: UploadFile = File(...),
+    limit: int = Query(default=5, ge=1, le=50),
+    max_distance: int = Query(default=settings.IMAGE_LOOKUP_MAX_DISTANCE, ge=0, le=image_hashes.HASH_BITS),
+):
+    """
+    Find catalog bottles whose label photo looks like the uploaded one (perceptual
+    dHash, nearest first). Nothing is stored; ``distance`` is in differing bits of 64.
+    """
+    max_bytes = int(settings.UPLOAD_MAX_MB) * 1024 * 1024
+    data = await file.read(max_bytes + 1)
+    if len(data) > max_bytes:
+        raise HTTPException(status_code=413, detail=f"File too large (> {settings.UPLOAD_MAX_MB} MB limit)")
+    try:
+        query = await image_pool.run(image_hashes.compute_dhash, io.BytesIO(data))
+    except PoolBusy as exc:
+        raise HTTPException(
+            status_code=503,
+            detail="Image processing is busy; try again shortly.",
+            headers={"Retry-After": str(exc.retry_after)},
+        ) from exc
+    except Exception:
+        raise HTTPException(status_code=415, detail="Could not read the image") from None
+    matches = await asyncio.to_thread(_find_by_hash, query, limit, max_distance)
+    return {"hash": f"{query:016x}", "matches": matches}
+
+
 @router.get("/{bottle_id}", response_model=Bottle, dependencies=[Depends(require_view_access)])
 def get_bottle(bottle_id: int, session: Session = Depends(get_session)):
     b = session.get(Bottle, bottle_id)
@@ -0,0 +1,57 @@
+"""Prometheus scrape endpoint (admins, or scrapers on the LAN)."""
+
+from __future__ import annotations
+
+from fastapi import APIRouter, Depends, HTTPException, Response, status
+from sqlalchemy import func, select
+from sqlmodel import Session
+
+from ..db import engine
+from ..deps import get_current_user_role, is_lan_request, lan_guest_metrics_snapshot
+from ..metrics import CONTENT_TYPE, gauge_lines, image_pool_in_flight, lan_decisions, registry, render
+from ..models import ImageJob
+from ..services.image_pool import image_pool
+from ..settings import settings
+
+router = APIRouter(tags=["metrics"])
+
+
+def _collect() -> None:
+    lan_decisions.set_totals(lan_guest_metrics_snapshot())
+    pool = image_pool.metrics_snapshot()
+    image_pool_in_flight.set(pool["running"], "running")
+    image_pool_in_flight.set(pool["queued"], "queued")
+
+
+registry.on_collect(_collect)
+
+
+async def require_metrics_access(user=Depends(get_current_user_role)):
+    if user["role"] == "admin":
+        return user
+    # Same network checks as LAN guest access (private peer, not via Cloudflare,
+    # LAN host), without requiring ALLOW_LAN_GUEST itself.
+    if settings.METRICS_ALLOW_LAN and is_lan_request(user):
+        return user
+    raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Metrics are available to admins and the LAN only")
+
+
+def _image_job_depth() -> str:
+    # Shared by all workers through the database, so read once per scrape rather than per process.
+    with Session(engine) as session:
+        rows = session.execute(
+            select(ImageJob.status, func.count()).where(ImageJob.status.in_(("queued", "running"))).group_by(ImageJob.status)
+        ).all()
+    counts = {"queued": 0, "running": 0, **{row[0]: row[1] for row in rows}}
+    return gauge_lines(
+        "whiskey_upload_jobs",
+        "Background upload jobs waiting or being processed.",
+        {(("status", state),): count for state, count in counts.items()},
+    )
+
+
+@router.get("/metrics", dependencies=[Depends(require_metrics_access)], include_in_schema=False)
+def metrics():
+    if not settings.METRICS_ENABLED:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Metrics are disabled")
+    return Response(render(_image_job_depth()), media_type=CONTENT_TYPE)
@@ -1,16 +1,44 @@
 # api/app/routers/uploads.py
+import asyncio
+import hashlib
+import io
+import json
+import logging
 import os
+import re
+import shutil
 import tempfile
 import uuid
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Optional
 
-from fastapi import APIRouter, Depends, File, UploadFile, HTTPException
-from fastapi.responses import JSONResponse
+import anyio
+from fastapi import APIRouter, Depends, File, Form, Header, Query, Request, UploadFile, HTTPException
+from fastapi.responses import FileResponse, JSONResponse
+from fastapi.staticfiles import StaticFiles
 from PIL import Image, UnidentifiedImageError
+from pydantic import BaseModel, Field
+from sqlmodel import Session, select
+from starlette.datastructures import Headers
+from starlette.responses import Response
+from starlette.staticfiles import NotModifiedResponse
+from starlette.types import Scope
 
+from ..db import engine, get_session, init_wine_db, wine_engine
 from ..deps import require_admin
+from ..models import Bottle, BottleAudit, ImageJob, StoredImage
+from ..services.image_jobs import ImageJobQueue, JobFailed
+from ..services.image_jobs import describe as describe_job
+from ..services.image_pool import PoolBusy, image_pool
+from ..services import image_hashes, image_variants, upload_store, url_import
+from ..services.image_processing import convert_dng_to_jpeg, render_variants, transcode_heif
+from ..services.upload_sessions import ChunkRejected, SessionNotFound, UploadSessionStore
+from ..services.upload_stream import HEAD_SIZE, ReceivedUpload, UploadTooLarge, receive_upload
 from ..settings import settings
+from ..wine_models import WineBottle
 
 router = APIRouter(prefix="/uploads", tags=["uploads"])
+logger = logging.getLogger(__name__)
 
 # Config from settings / .env
 MAX_SIZE_BYTES = int(settings.UPLOAD_MAX_MB) * 1024 * 1024
@@ -27,8 +55,20 @@ def _resolve_upload_dir(configured: str) -> str:
 
 
 UPLOAD_DIR = _resolve_upload_dir(settings.UPLOAD_DIR)  # e.g., /data/uploads or temp fallback
+CHUNK_MAX_BYTES = int(settings.UPLOAD_CHUNK_MAX_MB) * 1024 * 1024
+upload_sessions = UploadSessionStore(UPLOAD_DIR, ttl_seconds=settings.UPLOAD_SESSION_TTL_HOURS * 3600)
 
 ALLOWED_IMAGE_FORMATS = {"JPEG", "PNG", "GIF", "WEBP"}
+TRANSCODED_FORMATS = {"HEIF"}   # accepted, but re-encoded in the image pool before storing
+_HEIF_BRANDS = {b"heic", b"heix", b"hevc", b"hevx", b"heim", b"heis", b"mif1", b"msf1"}
+
+try:
+    # Lets Pillow identify HEIC/HEIF (iPhone photos) from the upload header.
+    from pillow_heif import register_heif_opener
+except ImportError:  # pragma: no cover - optional at runtime
+    register_heif_opener = None
+else:
+    register_heif_opener()
 
 
 def _api_base_prefix() -> str:
@@ -37,157 +77,781 @@ def _api_base_prefix() -> str:
     return base.rstrip("/")
 
 
-def _looks_like_dng(path: str, filename: str) -> bool:
+def _looks_like_dng(head: bytes, filename: str) -> bool:
     """Cheap DNG check: extension .dng OR TIFF header."""
     ext = os.path.splitext(filename or "")[1].lower()
     if ext == ".dng":
         return True
+    # DNG is TIFF-based: 'II*\\x00' (little-endian) or 'MM\\x00*' (big-endian)
+    return head[:4] in (b"II*\x00", b"MM\x00*")
+
+
+def _probe_variants(final_path: str, widths: list[int], formats: list[str]) -> tuple[list, Optional[list]]:
+    """
+    (missing (width, format) pairs, existing variants) for a stored upload, reading only
+    image headers; existing is None while anything is missing, as rendering changes it.
+    """
+    directory = os.path.dirname(final_path)
     try:
-        with open(path, "rb") as f:
-            sig = f.read(4)
-        # DNG is TIFF-based: 'II*\\x00' (little-endian) or 'MM\\x00*' (big-endian)
-        return sig in (b"II*\x00", b"MM\x00*")
-    except Exception:
-        return False
+        with Image.open(final_path) as img:  # header only; pixels are decoded in the worker
+            source_width = image_variants.upright_width(img)
+    except (UnidentifiedImageError, OSError):
+        source_width = 0
+    pairs = image_variants.missing_variants(directory, final_path, widths, formats, source_width=source_width)
+    if pairs:
+        return pairs, None
+    return pairs, image_variants.existing_variants(directory, final_path, widths, formats)
 
 
-@router.post("/image", dependencies=[Depends(require_admin)])
-async def upload_image(file: UploadFile = File(...)):
+async def _variant_manifest(rel: str) -> dict:
     """
-    Admin-only image upload with streaming size check and actual type validation.
-    - jpeg/png/gif/webp are saved as-is
-    - dng is converted to jpeg (sRGB) and saved (with sensible brightness/WB)
-    Files are served at <API_BASE>/uploads/<filename>.
+    Render any configured variants a stored upload is missing in the image pool and
+    describe all of them. Variants are an optimization, so a busy pool or an encoder
+    failure never fails the upload; the backfill script picks up anything skipped here.
+    File access happens in worker threads: one probe, plus one re-read after rendering.
     """
-    tmp_name = f"tmp_{uuid.uuid4().hex}"
-    tmp_path = os.path.join(UPLOAD_DIR, tmp_name)
-    bytes_written = 0
+    final_path = os.path.join(UPLOAD_DIR, rel)
+    directory = os.path.dirname(final_path)
+    widths = image_variants.configured_widths()
+    formats = image_variants.configured_formats()
+    pairs, existing = await asyncio.to_thread(_probe_variants, final_path, widths, formats)
+    if pairs:
+        try:
+            await image_pool.run(render_variants, final_path, directory, pairs, settings.IMAGE_VARIANT_QUALITY)
+        except PoolBusy:
+            logger.info("Image pool busy; deferring variants for %s", rel)
+        except Exception:
+            logger.exception("Rendering variants failed for %s", rel)
+        existing = await asyncio.to_thread(image_variants.existing_variants, directory, final_path, widths, formats)
+    base_url = f"{_api_base_prefix()}/uploads/{os.path.dirname(rel)}"
+    return image_variants.srcset_manifest(base_url, existing)
+
 
+async def _convert_in_pool(fn, *args, unsupported: str) -> str:
+    """Run a conversion job in the image pool, mapping a full queue to 503 and missing codecs to 415."""
     try:
-        # Stream to disk with size enforcement
-        with open(tmp_path, "wb") as out:
-            while True:
-                chunk = await file.read(64 * 1024)
-                if not chunk:
-                    break
-                bytes_written += len(chunk)
-                if bytes_written > MAX_SIZE_BYTES:
-                    limit_mb = float(settings.UPLOAD_MAX_MB)
-                    wrote_mb = bytes_written / 1024 / 1024
-                    raise HTTPException(
-                        status_code=413,
-                        detail=f"File too large ({wrote_mb:.2f} MB > {limit_mb} MB limit)",
-                    )
-                out.write(chunk)
-
-        # ---- DNG path: convert to JPEG with better defaults for phone RAW ----
-        if _looks_like_dng(tmp_path, file.filename or ""):
+        return await image_pool.run(fn, *args)
+    except PoolBusy as exc:
+        raise HTTPException(
+            status_code=503,
+            detail="Image processing is busy; try again shortly.",
+            headers={"Retry-After": str(exc.retry_after)},
+        ) from exc
+    except ImportError as exc:
+        raise HTTPException(status_code=415, detail=unsupported) from exc
+
+
+def _store(tmp_path: str, sha256: str, ext: str) -> tuple[str, bool]:
+    """Move a finished temp file into the content-addressed store, register it and index its dHash."""
+    size = os.path.getsize(tmp_path)
+    rel, duplicate = upload_store.store_file(UPLOAD_DIR, tmp_path, sha256, ext)
+    with Session(engine) as session:
+        upload_store.register(session, sha256, rel, size)
+        image_hashes.record(session, sha256, os.path.join(UPLOAD_DIR, rel))
+        session.commit()
+    return rel, duplicate
+
+
+StageCallback = Callable[[str, int], Awaitable[None]]
+
+
+async def _no_stage(stage: str, progress: int) -> None:
+    pass
+
+
+async def _stored_payload(tmp_path: str, sha256: str, ext: str, on_stage: StageCallback = _no_stage) -> dict:
+    await on_stage("storing", 60)
+    rel, duplicate = await asyncio.to_thread(_store, tmp_path, sha256, ext)
+    await on_stage("variants", 75)
+    manifest = await _variant_manifest(rel)
+    public_url = f"{_api_base_prefix()}/uploads/{rel}"
+    return {"url": public_url, "sha256": sha256, "deduplicated": duplicate, **manifest}
+
+
+def _discard(*paths: str) -> None:
+    for path in paths:
+        if os.path.exists(path):
             try:
-                import rawpy
-                import numpy as np
-                from PIL import Image, ImageOps, ImageEnhance
+                os.remove(path)
             except Exception:
-                # Clean temp on failure to import
-                try:
-                    os.remove(tmp_path)
-                except Exception:
-                    pass
-                raise HTTPException(
-                    status_code=415,
-                    detail="DNG not supported on server (rawpy/Pillow/numpy not installed)."
-                )
+                pass
+
+
+async def _receive(file: UploadFile) -> ReceivedUpload:
+    """Stream to disk once, off the event loop, hashing and keeping the header as we go."""
+    tmp_path = os.path.join(UPLOAD_DIR, f"tmp_{uuid.uuid4().hex}")
+    try:
+        return await receive_upload(file, tmp_path, max_bytes=MAX_SIZE_BYTES)
+    except UploadTooLarge as exc:
+        _discard(tmp_path)
+        limit_mb = float(settings.UPLOAD_MAX_MB)
+        wrote_mb = exc.size / 1024 / 1024
+        raise HTTPException(
+            status_code=413,
+            detail=f"File too large ({wrote_mb:.2f} MB > {limit_mb} MB limit)",
+        ) from exc
+    except BaseException:
+        # Best-effort cleanup (also covers cancelled requests)
+        _discard(tmp_path)
+        raise
+
 
+async def _process(received: ReceivedUpload, filename: str, on_stage: StageCallback = _no_stage) -> dict:
+    """
+    Validate, convert if needed, and store a received upload. Temp files never outlive a failure.
+    ``on_stage(stage, percent)`` is awaited as work progresses (background jobs report it).
+    """
+    tmp_path = received.path
+    converted_path = f"{tmp_path}.out"
+
+    try:
+        # ---- DNG path: convert to JPEG in the image process pool ----
+        if _looks_like_dng(received.head, filename):
+            await on_stage("converting", 20)
             try:
-                with rawpy.imread(tmp_path) as raw:
-                    # Use camera WB, allow auto-bright (prevents very dark results),
-                    # gentle threshold, recover highlights, and output sRGB 8-bit.
-                    rgb = raw.postprocess(
-                        use_camera_wb=True,                     # better for phone RAW
-                        no_auto_bright=False,                   # ENABLE auto brightness
-                        auto_bright_thr=0.05,                   # nudge thr a bit
-                        output_color=rawpy.ColorSpace.sRGB,
-                        gamma=(2.222, 4.5),
-                        output_bps=8,
-                        highlight_mode=rawpy.HighlightMode.Blend,
-                        demosaic_algorithm=rawpy.DemosaicAlgorithm.AHD,
-                    )
-
-                # Optional: if still unusually dark, apply a light correction
-                # (kept very conservative to avoid blowing highlights)
-                mean_luma = float(np.array(rgb, dtype=np.float32).mean())
-                img = Image.fromarray(rgb)
-                if mean_luma < 70:  # 0..255 scale; tweak if desired
-                    img = ImageOps.autocontrast(img, cutoff=1)
-                    img = ImageEnhance.Brightness(img).enhance(1.12)
-
-                final_name = f"{uuid.uuid4().hex}.jpg"
-                final_path = os.path.join(UPLOAD_DIR, final_name)
-                img.save(final_path, format="JPEG", quality=90, optimize=True)
+                sha256 = await _convert_in_pool(
+                    convert_dng_to_jpeg, tmp_path, converted_path,
+                    unsupported="DNG not supported on server (rawpy/Pillow/numpy not installed).",
+                )
             finally:
                 # Remove temp DNG
-                try:
-                    os.remove(tmp_path)
-                except Exception:
-                    pass
+                _discard(tmp_path)
 
-            public_url = f"{_api_base_prefix()}/uploads/{final_name}"
-            return JSONResponse({"url": public_url})
+            return await _stored_payload(converted_path, sha256, ".jpg", on_stage)
 
-        # ---- Non-DNG path: accept common web raster formats as-is ----
-        image_format = _identify_image(tmp_path)
-        if not image_format:
+        image_format = _identify_header(received.head)
+
+        # ---- HEIC/HEIF path: transcode in the pool (orientation applied, EXIF dropped, size capped) ----
+        if image_format in TRANSCODED_FORMATS:
+            target = "webp" if settings.HEIF_TRANSCODE_FORMAT.lower() == "webp" else "jpeg"
+            await on_stage("converting", 20)
             try:
-                os.remove(tmp_path)
-            except Exception:
-                pass
+                sha256 = await _convert_in_pool(
+                    transcode_heif, tmp_path, converted_path, target,
+                    settings.HEIF_MAX_EDGE_PX, settings.HEIF_TRANSCODE_QUALITY,
+                    unsupported="HEIC/HEIF not supported on server (pillow-heif not installed).",
+                )
+            finally:
+                _discard(tmp_path)
+
+            return await _stored_payload(converted_path, sha256, ".webp" if target == "webp" else ".jpg", on_stage)
+
+        # ---- Everything else: accept common web raster formats as-is ----
+        if not image_format:
             raise HTTPException(
                 status_code=415,
-                detail=f"Unsupported image type. Allowed: {', '.join(sorted(ALLOWED_IMAGE_FORMATS))} or DNG (auto-converted)."
+                detail=(
+                    f"Unsupported image type. Allowed: {', '.join(sorted(ALLOWED_IMAGE_FORMATS))}, "
+                    "HEIC/HEIF or DNG (auto-converted)."
+                ),
             )
 
         ext_map = {"JPEG": ".jpg", "PNG": ".png", "GIF": ".gif", "WEBP": ".webp"}
-        final_name = f"{uuid.uuid4().hex}{ext_map[image_format]}"
-        final_path = os.path.join(UPLOAD_DIR, final_name)
-        os.replace(tmp_path, final_path)
-
-        public_url = f"{_api_base_prefix()}/uploads/{final_name}"
-        return JSONResponse({"url": public_url})
+        return await _stored_payload(tmp_path, received.sha256, ext_map[image_format], on_stage)
 
-    except HTTPException:
+    except BaseException:
+        _discard(tmp_path, converted_path)
         raise
-    except Exception:
-        # Best-effort cleanup
-        if os.path.exists(tmp_path):
+
+
+def _job_working_copy(source: str, sha256: str) -> ReceivedUpload:
+    """Hard-link (or copy) a job's source so processing may consume it while a retry still has the original."""
+    tmp_path = os.path.join(UPLOAD_DIR, f"tmp_{uuid.uuid4().hex}")
+    try:
+        os.link(source, tmp_path)
+    except OSError:
+        shutil.copyfile(source, tmp_path)
+    with open(tmp_path, "rb") as f:
+        head = f.read(HEAD_SIZE)
+    return ReceivedUpload(path=tmp_path, size=os.path.getsize(tmp_path), sha256=sha256, head=head)
+
+
+async def _run_image_job(job: ImageJob, report: StageCallback) -> dict:
+    if job.kind == "url_import":
+        return await _run_url_import(job, report)
+    received = await asyncio.to_thread(
+        _job_working_copy, os.path.join(UPLOAD_DIR, job.source_path), job.source_sha256
+    )
+    try:
+        return await _process(received, job.filename, on_stage=report)
+    except HTTPException as exc:
+        if exc.status_code >= 500:
+            raise RuntimeError(exc.detail) from exc   # e.g. a busy pool: worth another attempt
+        raise JobFailed(exc.detail) from exc           # unsupported or invalid file: retrying cannot help
+
+
+image_jobs = ImageJobQueue(
+    engine,
+    UPLOAD_DIR,
+    _run_image_job,
+    workers=settings.IMAGE_JOB_WORKERS,
+    max_attempts=settings.IMAGE_JOB_MAX_ATTEMPTS,
+    retry_base_seconds=settings.IMAGE_JOB_RETRY_BASE_SECONDS,
+    lease_seconds=settings.IMAGE_JOB_LEASE_SECONDS,
+)
+
+
+@router.get("/metrics", dependencies=[Depends(require_admin)])
+def image_pool_metrics():
+    """Queue depth and job counters of the image process pool."""
+    return image_pool.metrics_snapshot()
+
+
+@router.get("/duplicates", dependencies=[Depends(require_admin)])
+def duplicate_report(
+    max_distance: int = Query(
+        default=settings.IMAGE_DUPLICATE_MAX_DISTANCE, ge=0, le=8, description="dHash bits two photos may differ by"
+    ),
+    session: Session = Depends(get_session),
+):
+    """
+    Groups of stored images that look the same (re-encoded, resized or re-shot copies),
+    each image with its distance to the group's first one and the bottles using it.
+    """
+    image_hashes.perceptual_index.refresh(session)
+    groups = image_hashes.perceptual_index.duplicate_groups(max_distance)
+    shas = {sha for group in groups for sha, _ in group}
+    bottles = upload_store.bottles_by_image(session, shas)
+    paths = dict(session.exec(select(StoredImage.sha256, StoredImage.path).where(StoredImage.sha256.in_(shas))).all())
+    base = f"{_api_base_prefix()}/uploads"
+    return {
+        "max_distance": max_distance,
+        "indexed": len(image_hashes.perceptual_index),
+        "groups": [
+            [
+                {
+                    "sha256": sha,
+                    "url": f"{base}/{paths[sha]}" if sha in paths else None,
+                    "distance": distance,
+                    "bottle_ids": [b.bottle_id for b in bottles.get(sha, [])],
+                }
+                for sha, distance in group
+            ]
+            for group in groups
+        ],
+    }
+
+
+@router.post("/image", dependencies=[Depends(require_admin)])
+async def upload_image(file: UploadFile = File(...)):
+    """
+    Admin-only image upload with streaming size check and actual type validation.
+    - jpeg/png/gif/webp are saved as-is
+    - dng is converted to jpeg (sRGB) and saved (with sensible brightness/WB) in the
+      image process pool; 503 + Retry-After when that pool's queue is full
+    - heic/heif is transcoded to HEIF_TRANSCODE_FORMAT in the same pool, upright,
+      without EXIF and capped at HEIF_MAX_EDGE_PX
+    Files are stored by content hash and served at <API_BASE>/uploads/ab/cd/<sha256>.<ext>;
+    re-uploading identical content returns the existing file (``deduplicated``).
+    Downscaled WebP/AVIF copies (IMAGE_VARIANT_WIDTHS x IMAGE_VARIANT_FORMATS) are
+    rendered alongside and returned as ``variants`` plus a ``srcset`` string per MIME type.
+    """
+    received = await _receive(file)
+    return JSONResponse(await _process(received, file.filename or ""))
+
+
+def _batch_error(index: int, filename: Optional[str], exc: HTTPException) -> dict:
+    return {"index": index, "filename": filename, "ok": False, "status": exc.status_code, "detail": exc.detail}
+
+
+@router.post("/images", dependencies=[Depends(require_admin)])
+async def upload_images(files: list[UploadFile] = File(...)):
+    """
+    Upload many images in one multipart request (field ``files``, repeated).
+    Each file is streamed to disk under the same per-file size limit as ``/image``,
+    then all of them are validated, converted and stored concurrently, at most one
+    per image-pool worker at a time so a large batch does not overflow the pool's
+    queue; repeats of the same file wait for the first and report ``deduplicated``.
+    Results come back in input order, each with the single-upload payload or
+    its own ``status``/``detail``; one bad file never fails the others.
+    """
+    if len(files) > settings.UPLOAD_BATCH_MAX_FILES:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Too many files ({len(files)} > {settings.UPLOAD_BATCH_MAX_FILES} per batch)",
+        )
+
+    # Receive sequentially: the multipart body arrives in order anyway.
+    received: list[ReceivedUpload | HTTPException] = []
+    try:
+        for file in files:
             try:
-                os.remove(tmp_path)
-            except Exception:
-                pass
+                received.append(await _receive(file))
+            except HTTPException as exc:
+                received.append(exc)
+    except BaseException:
+        _discard(*(r.path for r in received if isinstance(r, ReceivedUpload)))
         raise
-def _identify_image(path: str) -> str | None:
-    """Return a normalized image format name or None if unsupported."""
+
+    gate = asyncio.Semaphore(image_pool.workers)
+    # Identical files in one batch go one after another, in input order, so the
+    # first is the one stored and the rest always report ``deduplicated``.
+    same_content: dict[str, asyncio.Lock] = {}
+
+    async def process_one(index: int, file: UploadFile, item: ReceivedUpload | HTTPException) -> dict:
+        if isinstance(item, HTTPException):
+            return _batch_error(index, file.filename, item)
+        try:
+            async with same_content.setdefault(item.sha256, asyncio.Lock()), gate:
+                payload = await _process(item, file.filename or "")
+        except HTTPException as exc:
+            return _batch_error(index, file.filename, exc)
+        except asyncio.CancelledError:
+            _discard(item.path)
+            raise
+        except Exception:
+            logger.exception("Batch upload failed for %s", file.filename)
+            return _batch_error(index, file.filename, HTTPException(status_code=500, detail="Processing failed"))
+        return {"index": index, "filename": file.filename, "ok": True, "status": 200, **payload}
+
+    results = await asyncio.gather(*(process_one(i, f, r) for i, (f, r) in enumerate(zip(files, received))))
+    stored = sum(1 for r in results if r["ok"])
+    return {"stored": stored, "failed": len(results) - stored, "results": results}
+
+
+class ImageImportItem(BaseModel):
+    bottle_id: int
+    url: str = Field(min_length=1, max_length=2048)
+
+
+class ImageImportRequest(BaseModel):
+    items: list[ImageImportItem] = Field(min_length=1)
+
+
+def _apply_bottle_images(images: dict[int, str], changed_by: Optional[str]) -> None:
+    """Set many bottles' image_url in one transaction (audited like a PATCH)."""
+    now = datetime.now(timezone.utc)
+    with Session(engine) as session:
+        bottles = session.exec(select(Bottle).where(Bottle.bottle_id.in_(list(images)))).all()
+        for bottle in bottles:
+            url = images[bottle.bottle_id]
+            if bottle.image_url == url:
+                continue
+            session.add(BottleAudit(
+                bottle_id=bottle.bottle_id,
+                changed_by=changed_by,
+                changes_json=json.dumps({"image_url": {"from": bottle.image_url, "to": url}}),
+            ))
+            bottle.image_url = url
+            bottle.updated_utc = now
+            session.add(bottle)
+        session.commit()
+
+
+def _existing_bottle_ids(ids: set[int]) -> set[int]:
+    with Session(engine) as session:
+        return set(session.exec(select(Bottle.bottle_id).where(Bottle.bottle_id.in_(list(ids)))).all())
+
+
+async def _import_urls(items: list[ImageImportItem], changed_by: Optional[str], report: StageCallback) -> dict:
+    """Download, process and link the items of a URL import job; per-item results in input order."""
+    known = await asyncio.to_thread(_existing_bottle_ids, {item.bottle_id for item in items})
+
+    gate = asyncio.Semaphore(image_pool.workers)
+    slots = asyncio.Semaphore(max(1, settings.IMAGE_IMPORT_CONCURRENCY))
+    limits = url_import.HostLimits(settings.IMAGE_IMPORT_PER_HOST)
+    urls = list(dict.fromkeys(item.url for item in items if item.bottle_id in known))
+    progress = {"done": 0, "reported": 0}
+
+    async def tracked(client, url: str) -> dict:
+        try:
+            return await fetch_and_process(client, url)
+        finally:
+            progress["done"] += 1
+            percent = 10 + 80 * progress["done"] // len(urls)
+            if percent > progress["reported"]:
+                progress["reported"] = percent
+                await report("importing", percent)
+
+    async def fetch_and_process(client, url: str) -> dict:
+        tmp_path = os.path.join(UPLOAD_DIR, f"tmp_{uuid.uuid4().hex}")
+        try:
+            received = await url_import.download(
+                client, url, tmp_path, max_bytes=MAX_SIZE_BYTES, limits=limits, slots=slots
+            )
+        except url_import.DownloadFailed as exc:
+            _discard(tmp_path)
+            return {"ok": False, "status": exc.status, "detail": exc.detail}
+        except BaseException:
+            _discard(tmp_path)
+            raise
+        try:
+            async with gate:
+                return {"ok": True, "status": 200, **await _process(received, url_import.filename_from_url(url))}
+        except HTTPException as exc:
+            return {"ok": False, "status": exc.status_code, "detail": exc.detail}
+        except Exception:
+            logger.exception("Image import failed for %s", url)
+            return {"ok": False, "status": 500, "detail": "Processing failed"}
+
+    await report("importing", 10)
+    async with url_import.new_client(
+        max_connections=max(1, settings.IMAGE_IMPORT_CONCURRENCY),
+        timeout=settings.IMAGE_IMPORT_TIMEOUT_SECONDS,
+        allow_private=settings.IMAGE_IMPORT_ALLOW_PRIVATE,
+    ) as client:
+        outcomes = dict(zip(urls, await asyncio.gather(*(tracked(client, url) for url in urls))))
+
+    results = []
+    images: dict[int, str] = {}
+    for index, item in enumerate(items):
+        base = {"index": index, "bottle_id": item.bottle_id, "source_url": item.url}
+        if item.bottle_id not in known:
+            results.append({**base, "ok": False, "status": 404, "detail": "Bottle not found"})
+            continue
+        outcome = outcomes[item.url]
+        results.append({**base, **outcome})
+        if outcome["ok"]:
+            images[item.bottle_id] = outcome["url"]   # a bottle listed twice keeps its last image
+    if images:
+        await report("linking", 90)
+        await asyncio.to_thread(_apply_bottle_images, images, changed_by)
+
+    imported = sum(1 for r in results if r["ok"])
+    return {"imported": imported, "failed": len(results) - imported, "results": results}
+
+
+def _read_import_items(path: str) -> list[ImageImportItem]:
+    with open(path, "rb") as f:
+        return ImageImportRequest.model_validate_json(f.read()).items
+
+
+async def _run_url_import(job: ImageJob, report: StageCallback) -> dict:
+    items = await asyncio.to_thread(_read_import_items, os.path.join(UPLOAD_DIR, job.source_path))
+    return await _import_urls(items, job.created_by, report)
+
+
+def _write_import_source(payload: ImageImportRequest) -> ReceivedUpload:
+    data = payload.model_dump_json().encode()
+    tmp_path = os.path.join(UPLOAD_DIR, f"tmp_{uuid.uuid4().hex}")
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    return ReceivedUpload(path=tmp_path, size=len(data), sha256=hashlib.sha256(data).hexdigest(), head=data[:HEAD_SIZE])
+
+
+@router.post("/import-urls", status_code=202)
+async def import_image_urls(payload: ImageImportRequest, admin=Depends(require_admin)):
+    """
+    Queue a download of label images for many bottles (``items: [{bottle_id, url}]``)
+    and answer 202 with a job id right away; poll ``GET /uploads/jobs/{id}`` for
+    progress, and for the per-item results (in input order) once it has succeeded.
+    The job shares one pooled HTTP client across its downloads, at most
+    IMAGE_IMPORT_PER_HOST per remote host and IMAGE_IMPORT_CONCURRENCY overall, each
+    capped at UPLOAD_MAX_MB while streaming; a URL listed for several bottles is
+    fetched once, and URLs (or redirects) leading to private addresses are refused.
+    Every file then goes through the same validation/conversion as ``/image`` (one
+    per image-pool worker at a time), and all successful bottles get their new
+    ``image_url`` in a single transaction.
+    """
+    items = payload.items
+    if len(items) > settings.IMAGE_IMPORT_MAX_ITEMS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Too many items ({len(items)} > {settings.IMAGE_IMPORT_MAX_ITEMS} per import)",
+        )
+    source = await asyncio.to_thread(_write_import_source, payload)
+    return await _enqueue_job(source, "import-urls.json", (None, None), admin.get("username"), kind="url_import")
+
+
+def _job_target(bottle_id: Optional[int], wine_id: Optional[int]) -> tuple[Optional[str], Optional[int]]:
+    """Check the bottle or wine a job should update exists; (kind, id) or (None, None)."""
+    if bottle_id is not None and wine_id is not None:
+        raise HTTPException(status_code=422, detail="Give bottle_id or wine_id, not both")
+    if bottle_id is not None:
+        with Session(engine) as session:
+            if session.get(Bottle, bottle_id) is None:
+                raise HTTPException(status_code=404, detail="Bottle not found")
+        return "bottle", bottle_id
+    if wine_id is not None:
+        init_wine_db()
+        with Session(wine_engine) as session:
+            if session.get(WineBottle, wine_id) is None:
+                raise HTTPException(status_code=404, detail="Wine not found")
+        return "wine", wine_id
+    return None, None
+
+
+async def _enqueue_job(
+    received: ReceivedUpload,
+    filename: str,
+    target: tuple[Optional[str], Optional[int]],
+    created_by: Optional[str],
+    kind: str = "upload",
+) -> JSONResponse:
+    try:
+        job = await asyncio.to_thread(
+            image_jobs.enqueue, received.path, received.sha256, filename,
+            kind=kind, target_kind=target[0], target_id=target[1], created_by=created_by,
+        )
+    except BaseException:
+        _discard(received.path)
+        raise
+    status_url = f"{_api_base_prefix()}/uploads/jobs/{job.job_id}"
+    return JSONResponse(
+        {**describe_job(job), "status_url": status_url}, status_code=202, headers={"Location": status_url}
+    )
+
+
+@router.post("/jobs", status_code=202)
+async def create_image_job(
+    file: UploadFile = File(...),
+    bottle_id: Optional[int] = Form(default=None),
+    wine_id: Optional[int] = Form(default=None),
+    admin=Depends(require_admin),
+):
+    """
+    Accept an image for background processing and answer 202 with a job id right away.
+    The job runs the same validation/conversion as ``/image`` (slow DNG development
+    included), survives restarts and is retried with backoff on transient failures.
+    With ``bottle_id`` or ``wine_id`` that item's ``image_url`` is set when it succeeds.
+    Poll ``GET /uploads/jobs/{id}`` for ``status``, ``stage`` and ``progress``.
+    """
+    target = await asyncio.to_thread(_job_target, bottle_id, wine_id)
+    received = await _receive(file)
+    return await _enqueue_job(received, file.filename or "", target, admin.get("username"))
+
+
+@router.get("/jobs/{job_id}", dependencies=[Depends(require_admin)])
+def get_image_job(job_id: str):
+    """Job status (queued / running / succeeded / failed), current stage, progress and, when done, the upload payload."""
+    job = image_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return describe_job(job)
+
+
+class UploadSessionCreate(BaseModel):
+    filename: str = Field(min_length=1, max_length=255)
+    size: int = Field(gt=0, description="Total size in bytes")
+    sha256: Optional[str] = Field(default=None, pattern=r"^[0-9a-fA-F]{64}$", description="Checked on finalize")
+
+
+def _upload_session_or_404(session_id: str):
+    try:
+        return upload_sessions.get(session_id)
+    except SessionNotFound:
+        raise _session_gone() from None
+
+
+def _session_body(session) -> dict:
+    return {**session.describe(upload_sessions.ttl_seconds), "chunk_size": CHUNK_MAX_BYTES}
+
+
+def _session_gone() -> HTTPException:
+    return HTTPException(status_code=404, detail="Upload session not found or expired")
+
+
+def _chunk_error(exc: ChunkRejected) -> HTTPException:
+    return HTTPException(status_code=exc.status, detail=exc.detail, headers={"Upload-Offset": str(exc.offset)})
+
+
+@router.post("/sessions", status_code=201)
+def create_upload_session(payload: UploadSessionCreate, admin=Depends(require_admin)):
+    """
+    Start a resumable upload. Send the file as ``PUT /uploads/sessions/{id}?offset=N``
+    chunks (raw body, at most ``chunk_size`` bytes, optional ``X-Chunk-SHA256``), ask
+    ``GET /uploads/sessions/{id}`` where to resume after a failure, then finalize.
+    """
+    if payload.size > MAX_SIZE_BYTES:
+        raise HTTPException(
+            status_code=413,
+            detail=f"File too large ({payload.size / 1024 / 1024:.2f} MB > {float(settings.UPLOAD_MAX_MB)} MB limit)",
+        )
+    session = upload_sessions.create(payload.filename, payload.size, payload.sha256, admin.get("username"))
+    return _session_body(session)
+
+
+@router.get("/sessions/{session_id}", dependencies=[Depends(require_admin)])
+def get_upload_session(session_id: str):
+    """Bytes received so far; resume by sending the chunk that starts at ``offset``."""
+    return _session_body(_upload_session_or_404(session_id))
+
+
+@router.put("/sessions/{session_id}", dependencies=[Depends(require_admin)])
+async def put_upload_chunk(
+    session_id: str,
+    request: Request,
+    offset: int = Query(ge=0, description="Byte offset of this chunk within the file"),
+    x_chunk_sha256: Optional[str] = Header(default=None),
+):
+    """
+    Append one chunk. Resending a chunk that was already stored is harmless; a gap
+    answers 409 with the expected offset in ``Upload-Offset``.
+    """
+    session = _upload_session_or_404(session_id)
+    data = bytearray()
+    async for part in request.stream():
+        data += part
+        if len(data) > CHUNK_MAX_BYTES:
+            raise HTTPException(status_code=413, detail=f"Chunk larger than {CHUNK_MAX_BYTES} bytes")
+
+    try:
+        await asyncio.to_thread(upload_sessions.append, session, offset, bytes(data), x_chunk_sha256)
+    except ChunkRejected as exc:
+        raise _chunk_error(exc) from exc
+    except SessionNotFound:
+        raise _session_gone() from None
+    return _session_body(session)
+
+
+@router.post("/sessions/{session_id}/finalize")
+async def finalize_upload_session(
+    session_id: str,
+    background: bool = Query(False, description="Queue a job (202) instead of processing in the request"),
+    bottle_id: Optional[int] = Query(None, description="With background: set this bottle's image when done"),
+    wine_id: Optional[int] = Query(None, description="With background: set this wine's image when done"),
+    admin=Depends(require_admin),
+):
+    """
+    Check the whole-file checksum and hand the file to the same validation/conversion as ``/image``,
+    or with ``background=true`` to a job (see ``POST /uploads/jobs``).
+    """
+    session = _upload_session_or_404(session_id)
+    target = await asyncio.to_thread(_job_target, bottle_id, wine_id) if background else (None, None)
+    tmp_path = os.path.join(UPLOAD_DIR, f"tmp_{uuid.uuid4().hex}")
+    try:
+        sha256, head = await asyncio.to_thread(upload_sessions.complete, session, tmp_path)
+    except ChunkRejected as exc:
+        raise _chunk_error(exc) from exc
+    except SessionNotFound:
+        raise _session_gone() from None
+    received = ReceivedUpload(path=tmp_path, size=session.size, sha256=sha256, head=head)
+    if background:
+        return await _enqueue_job(received, session.filename, target, admin.get("username"))
+    return JSONResponse(await _process(received, session.filename))
+
+
+@router.delete("/sessions/{session_id}", status_code=204, dependencies=[Depends(require_admin)])
+def abort_upload_session(session_id: str):
+    _upload_session_or_404(session_id)
+    upload_sessions.discard(session_id)
+
+
+@router.api_route("/{name}", methods=["GET", "HEAD"], include_in_schema=False)
+def legacy_upload(name: str, request: Request, session: Session = Depends(get_session)):
+    """
+    Flat ``/uploads/<name>`` URLs from before the content-addressed store: served from
+    the old location until the migration script moves them, then via legacy_upload.
+    Store paths (``/uploads/ab/cd/...``) never reach this route; the static mount serves them.
+    """
+    if name.startswith(_PRIVATE_PREFIXES):
+        raise HTTPException(status_code=404, detail="Not Found")
+    path = os.path.join(UPLOAD_DIR, name)
+    if not os.path.isfile(path):
+        rel = upload_store.resolve_legacy(session, name)
+        path = os.path.join(UPLOAD_DIR, rel) if rel else ""
+        if not rel or not os.path.isfile(path):
+            raise HTTPException(status_code=404, detail="Not Found")
+    return upload_files.file_response(path, os.stat(path), request.scope)
+
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# Job sources, session parts, quarantine (dot directories) and in-flight files are never served.
+_PRIVATE_PREFIXES = (".", "tmp_")
+# Format-neutral variant URL: /uploads/ab/cd/<sha256>.w<width>, answered with the best encoding the client accepts.
+_NEGOTIABLE_RE = re.compile(r"^(?P<shard>[0-9a-f]{2}/[0-9a-f]{2})/(?P<sha>[0-9a-f]{64})\.w(?P<width>\d+)$")
+_NEGOTIATED_FORMATS = ("avif", "webp")   # preference order when both are accepted
+
+
+def _accepted_types(accept: str) -> set[str]:
+    """Media types from an Accept header with a non-zero q (wildcards are not expanded)."""
+    accepted = set()
+    for part in accept.split(","):
+        media, _, params = part.strip().partition(";")
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if media and q > 0:
+            accepted.add(media.strip().lower())
+    return accepted
+
+
+class UploadStaticFiles(StaticFiles):
+    """
+    /uploads static mount. Every stored name is unique to its content (hash or uuid), so
+    responses are cacheable forever: ``Cache-Control: immutable`` plus a strong ETag built
+    from the file name, which survives migrations and restores that change mtimes.
+    Range and HEAD come from Starlette's FileResponse. ``<sha256>.w<width>`` paths pick
+    the AVIF or WebP variant the client accepts, falling back to the original.
+    """
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        if any(part.startswith(_PRIVATE_PREFIXES) for part in path.replace(os.sep, "/").split("/")):
+            raise HTTPException(status_code=404, detail="Not Found")
+        match = _NEGOTIABLE_RE.match(path)
+        if match and scope["method"] in ("GET", "HEAD"):
+            accept = Headers(scope=scope).get("accept", "")
+            found = await anyio.to_thread.run_sync(self._negotiate, match, _accepted_types(accept))
+            if found:
+                response = self.file_response(*found, scope)
+                response.headers["vary"] = "Accept"
+                return response
+        return await super().get_response(path, scope)
+
+    def _negotiate(self, match: re.Match, accepted: set[str]) -> Optional[tuple[str, os.stat_result]]:
+        directory = os.path.join(str(self.directory), match["shard"])
+        for fmt in _NEGOTIATED_FORMATS:
+            if image_variants.MIME_TYPES[fmt] in accepted:
+                candidate = os.path.join(directory, f"{match['sha']}.w{match['width']}.{fmt}")
+                try:
+                    return candidate, os.stat(candidate)
+                except FileNotFoundError:
+                    continue
+        # No acceptable variant: the original (whatever its extension) is always renderable.
+        try:
+            entries = list(os.scandir(directory))
+        except FileNotFoundError:
+            return None
+        for entry in entries:
+            if entry.name.startswith(f"{match['sha']}.") and not image_variants.is_variant(entry.name):
+                return entry.path, entry.stat()
+        return None
+
+    def file_response(
+        self,
+        full_path,
+        stat_result: os.stat_result,
+        scope: Scope,
+        status_code: int = 200,
+    ) -> Response:
+        headers = {
+            "cache-control": IMMUTABLE_CACHE_CONTROL,
+            "etag": f'"{os.path.basename(full_path)}"',
+        }
+        response = FileResponse(full_path, status_code=status_code, stat_result=stat_result, headers=headers)
+        if self.is_not_modified(response.headers, Headers(scope=scope)):
+            return NotModifiedResponse(response.headers)
+        return response
+
+
+upload_files = UploadStaticFiles(directory=UPLOAD_DIR)
+
+
+def _identify_header(header: bytes) -> str | None:
+    """Return a normalized image format name from a file's leading bytes, or None if unsupported."""
     fmt: str | None = None
 
     try:
-        with Image.open(path) as img:
+        # Pillow only parses the header on open, so the in-memory head is enough.
+        with Image.open(io.BytesIO(header)) as img:
             guessed = (img.format or "").upper()
             # Some JPEG variants report as MPO; treat as JPEG for storage.
             if guessed == "MPO":
                 fmt = "JPEG"
             elif guessed:
                 fmt = guessed
-    except (UnidentifiedImageError, OSError):
+    except (UnidentifiedImageError, OSError, SyntaxError, ValueError):
         fmt = None
 
-    if fmt in ALLOWED_IMAGE_FORMATS:
+    if fmt in ALLOWED_IMAGE_FORMATS or fmt in TRANSCODED_FORMATS:
         return fmt
 
     # Fallback to signature checks in case Pillow lacks a decoder for a valid file.
-    try:
-        with open(path, "rb") as f:
-            header = f.read(32)
-    except OSError:
-        return None
-
     if header.startswith(b"\xFF\xD8\xFF"):
         return "JPEG"
     if header.startswith(b"\x89PNG\r\n\x1a\n"):
@@ -196,5 +860,8 @@ def _identify_image(path: str) -> str | None:
         return "GIF"
     if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
         return "WEBP"
+    # ISO-BMFF 'ftyp' box with a HEIF brand; Pillow may need more than the header to open these.
+    if header[4:8] == b"ftyp" and header[8:12] in _HEIF_BRANDS:
+        return "HEIF"
 
     return None
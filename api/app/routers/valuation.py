@@ -1,8 +1,9 @@
 import csv
+import math
 import os
-from datetime import datetime
+from datetime import date, datetime
 import logging
-from typing import Optional
+from typing import List, Optional
 
 from fastapi import APIRouter, Depends, HTTPException, Query
 from pydantic import BaseModel
@@ -10,14 +11,24 @@ from sqlalchemy import desc, nulls_last
 from sqlmodel import Session, select
 
 from ..db import get_session
+from ..deps import require_authenticated_user
 from ..models import MarketPrice
-from ..services.market_prices import fetch_external_quote, persist_quote
+from ..services import fx
+from ..services.market_prices import QuoteQuarantined, fetch_external_quote, persist_quote
+from ..services.portfolio import MissingCostRate, portfolio_snapshot
+from ..services.price_history import Bucket, downsample, load_price_series
 
 router = APIRouter(prefix="/valuation", tags=["valuation"])
 
 DATA_PATH = os.getenv("VALUATION_CSV", "data/market_prices.csv")
 logger = logging.getLogger(__name__)
 
+CURRENCY_QUERY = Query(
+    default=None,
+    pattern="^[A-Za-z]{3}$",
+    description="Convert amounts to this ISO currency using as-of-date FX rates",
+)
+
 
 class ValuationResponse(BaseModel):
     barcode_upc: str
@@ -26,6 +37,41 @@ class ValuationResponse(BaseModel):
     source: Optional[str] = None
     as_of: Optional[str] = None   # ISO date string
 
+
+class PriceHistoryPoint(BaseModel):
+    bucket: str                   # ISO date the bucket starts on
+    open: float
+    close: float
+    min: float
+    max: float
+    mean: float
+    count: int
+
+
+class PriceHistoryResponse(BaseModel):
+    barcode_upc: str
+    bucket: Bucket
+    currency: Optional[str] = None   # None = amounts as stored (currencies not normalized)
+    points: List[PriceHistoryPoint]
+
+
+class PortfolioSummary(BaseModel):
+    key: Optional[str] = None     # style / region / retailer name; None for the total or unset values
+    bottles: int
+    valued_bottles: int           # bottles with a known market price
+    cost_basis: float
+    market_value: float
+    unrealized_gain: float        # only over bottles with both a purchase and a market price
+
+
+class PortfolioResponse(BaseModel):
+    as_of: Optional[str] = None   # ISO date; None = latest prices
+    currency: Optional[str] = None  # None = amounts summed as stored
+    total: PortfolioSummary
+    by_style: List[PortfolioSummary]
+    by_region: List[PortfolioSummary]
+    by_retailer: List[PortfolioSummary]
+
 def _model_to_response(price: MarketPrice, upc: str) -> ValuationResponse:
     as_of = price.as_of.isoformat() if price.as_of else None
     return ValuationResponse(
@@ -84,19 +130,47 @@ def _latest_price(session: Session, upc: str) -> Optional[MarketPrice]:
     return session.exec(stmt).first()
 
 
+def _target_currency(session: Session, currency: Optional[str]) -> Optional[str]:
+    if not currency:
+        return None
+    currency = currency.upper()
+    if not fx.load_fx_table(session).knows(currency):
+        raise HTTPException(status_code=400, detail=f"No FX rates available for {currency}")
+    return currency
+
+
+def _convert_response(session: Session, resp: ValuationResponse, currency: Optional[str]) -> ValuationResponse:
+    """Convert a single valuation at its as-of date's rate; the price becomes unknown without a rate."""
+    if not currency or resp.price is None:
+        return resp
+    as_of = None
+    if resp.as_of:
+        try:
+            as_of = datetime.fromisoformat(resp.as_of)
+        except ValueError:
+            as_of = None
+    converted = fx.convert(session, [resp.price], [resp.currency], fx.to_days([as_of]), currency)[0]
+    return resp.model_copy(update={
+        "price": None if math.isnan(converted) else round(float(converted), 2),
+        "currency": currency,
+    })
+
+
 @router.get("", response_model=ValuationResponse)
 def get_valuation(
     upc: str = Query(..., alias="upc"),
+    currency: Optional[str] = CURRENCY_QUERY,
     session: Session = Depends(get_session),
 ):
     upc = (upc or "").strip()
     if not upc:
         raise HTTPException(status_code=400, detail="UPC is required")
+    currency = _target_currency(session, currency)
 
     # 1) Database truth
     price = _latest_price(session, upc)
     if price:
-        return _model_to_response(price, upc)
+        return _convert_response(session, _model_to_response(price, upc), currency)
 
     # 2) Attempt external provider lookup (if configured)
     quote = fetch_external_quote(upc)
@@ -108,14 +182,55 @@ def get_valuation(
                 ingest_type="provider",
                 created_by="system",
             )
-            return _model_to_response(stored, upc)
+            return _convert_response(session, _model_to_response(stored, upc), currency)
+        except QuoteQuarantined as exc:
+            logger.info("%s", exc)
         except Exception as exc:
             logger.warning("Failed to persist external price for %s: %s", upc, exc)
 
     # 3) CSV fallback
     csv_resp = _csv_lookup(upc)
     if csv_resp:
-        return csv_resp
+        return _convert_response(session, csv_resp, currency)
 
     # 4) Unknown UPC
-    return ValuationResponse(barcode_upc=upc, price=None)
+    return ValuationResponse(barcode_upc=upc, price=None, currency=currency or "USD")
+
+
+@router.get("/history", response_model=PriceHistoryResponse)
+def get_price_history(
+    upc: str = Query(..., alias="upc"),
+    bucket: Bucket = Query(default="day"),
+    from_date: Optional[date] = Query(default=None, alias="from", description="Inclusive start date"),
+    to_date: Optional[date] = Query(default=None, alias="to", description="Inclusive end date"),
+    currency: Optional[str] = CURRENCY_QUERY,
+    session: Session = Depends(get_session),
+):
+    upc = (upc or "").strip()
+    if not upc:
+        raise HTTPException(status_code=400, detail="UPC is required")
+    if from_date and to_date and from_date > to_date:
+        raise HTTPException(status_code=400, detail="'from' must be on or before 'to'")
+
+    currency = _target_currency(session, currency)
+
+    as_of, prices = load_price_series(session, upc, start=from_date, end=to_date, currency=currency)
+    return PriceHistoryResponse(
+        barcode_upc=upc,
+        bucket=bucket,
+        currency=currency,
+        points=downsample(as_of, prices, bucket),
+    )
+
+
+@router.get("/portfolio", response_model=PortfolioResponse)
+def get_portfolio(
+    as_of: Optional[date] = Query(default=None, description="Value the collection as of this date (default: latest)"),
+    currency: Optional[str] = CURRENCY_QUERY,
+    session: Session = Depends(get_session),
+    _user=Depends(require_authenticated_user),
+):
+    try:
+        return portfolio_snapshot(session, as_of, _target_currency(session, currency))
+    except MissingCostRate as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
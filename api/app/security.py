@@ -1,5 +1,9 @@
 # api/app/security.py
+import hashlib
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta, timezone
+from threading import Lock
 from typing import Any, Dict
 
 from argon2 import PasswordHasher
@@ -81,3 +85,61 @@ def decode_token(token: str) -> Dict[str, Any]:
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid or expired token",
         )
+
+
+class TokenCache:
+    """
+    Bounded LRU of verified tokens -> claims, keyed by the token's SHA-256 (the
+    token itself is never kept). An entry is only served while ``exp`` is in the
+    future, so a cached token expires exactly when ``jwt.decode`` would reject it.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max(0, max_size)
+        self._entries: "OrderedDict[bytes, tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, token: str) -> Dict[str, Any] | None:
+        key = hashlib.sha256(token.encode("utf-8")).digest()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if time.time() < entry[0]:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return dict(entry[1])
+                del self._entries[key]
+            self.misses += 1
+        return None
+
+    def put(self, token: str, claims: Dict[str, Any]) -> None:
+        exp = claims.get("exp")
+        if not self.max_size or not isinstance(exp, (int, float)):
+            return
+        key = hashlib.sha256(token.encode("utf-8")).digest()
+        with self._lock:
+            self._entries[key] = (float(exp), dict(claims))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+access_token_cache = TokenCache(settings.JWT_CACHE_SIZE)
+
+
+def decode_token_cached(token: str) -> Dict[str, Any]:
+    """
+    ``decode_token`` for access tokens seen on every request: a token verified
+    before (and not yet expired) skips the HMAC check. Raises 401 like decode_token.
+    """
+    claims = access_token_cache.get(token)
+    if claims is None:
+        claims = decode_token(token)
+        access_token_cache.put(token, claims)
+    return claims
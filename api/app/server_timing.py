@@ -0,0 +1,172 @@
+"""
+Opt-in ``Server-Timing`` response header with a per-phase breakdown.
+
+Enabled for every request with SERVER_TIMING_ENABLED, or per request by an
+admin sending ``X-Server-Timing: 1``. The middleware puts a ``ServerTiming``
+in a context variable for the request; instrumented code (auth, connection
+checkout, SQL statements, provider calls) adds its time to it with ``record``
+or ``phase``. When timing is off the context variable holds None and each of
+those calls is a single ``ContextVar.get``. Sync endpoints run in a worker
+thread with a copy of the context, so their SQL time lands on the same object.
+
+Phases: ``auth``, ``db-checkout``, ``sql`` (with the statement count),
+``provider``, ``encode`` (endpoint return to response headers: response-model
+validation and JSON serialization) and ``total`` (request start to headers).
+"""
+
+from __future__ import annotations
+
+import inspect
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from typing import Iterable, Optional
+
+from fastapi.routing import APIRoute
+
+from .security import decode_token_cached
+from .settings import settings
+
+REQUEST_HEADER = b"x-server-timing"
+_ENDPOINT_DONE = "endpoint_done"
+
+_current: ContextVar[Optional["ServerTiming"]] = ContextVar("server_timing", default=None)
+
+
+class ServerTiming:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases: dict[str, list] = {}   # name -> [seconds, count]
+        self.marks: dict[str, float] = {}
+
+    def add(self, name: str, seconds: float) -> None:
+        entry = self.phases.get(name)
+        if entry is None:
+            self.phases[name] = [seconds, 1]
+        else:
+            entry[0] += seconds
+            entry[1] += 1
+
+    def header(self, now: float) -> str:
+        parts = []
+        for name, (seconds, count) in self.phases.items():
+            part = f"{name};dur={seconds * 1000:.1f}"
+            if name == "sql":
+                part += f';desc="{count} queries"'
+            parts.append(part)
+        done = self.marks.get(_ENDPOINT_DONE)
+        if done is not None:
+            parts.append(f"encode;dur={(now - done) * 1000:.1f}")
+        parts.append(f"total;dur={(now - self.started) * 1000:.1f}")
+        return ", ".join(parts)
+
+
+def active() -> bool:
+    return _current.get() is not None
+
+
+def record(name: str, seconds: float) -> None:
+    timing = _current.get()
+    if timing is not None:
+        timing.add(name, seconds)
+
+
+@contextmanager
+def phase(name: str):
+    timing = _current.get()
+    if timing is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timing.add(name, time.perf_counter() - started)
+
+
+def _mark_endpoint_done() -> None:
+    timing = _current.get()
+    if timing is not None:
+        timing.marks[_ENDPOINT_DONE] = time.perf_counter()
+
+
+def instrument_routes(routes: Iterable) -> None:
+    """
+    Note when each endpoint function returns, so ``encode`` can be told apart
+    from handler time. FastAPI has no hook between the endpoint and response
+    serialization, so the endpoint callable is wrapped in place; generator
+    endpoints (streaming) are left alone.
+    """
+    for route in routes:
+        if not isinstance(route, APIRoute) or route.dependant.call is None:
+            continue
+        call = route.dependant.call
+        if getattr(call, "__server_timing__", False):
+            continue
+        if inspect.isgeneratorfunction(call) or inspect.isasyncgenfunction(call):
+            continue
+        if inspect.iscoroutinefunction(call):
+            @wraps(call)
+            async def timed(*args, __call=call, **kwargs):
+                try:
+                    return await __call(*args, **kwargs)
+                finally:
+                    _mark_endpoint_done()
+        else:
+            @wraps(call)
+            def timed(*args, __call=call, **kwargs):
+                try:
+                    return __call(*args, **kwargs)
+                finally:
+                    _mark_endpoint_done()
+        timed.__server_timing__ = True
+        route.dependant.call = timed
+
+
+def _requested_by_admin(scope) -> bool:
+    headers = scope.get("headers") or ()
+    for name, value in headers:
+        if name == REQUEST_HEADER:
+            break
+    else:
+        return False
+    if value.strip() not in (b"1", b"true"):
+        return False
+    cookie_name = settings.JWT_COOKIE_NAME.encode()
+    cookies = b";".join(value for name, value in headers if name == b"cookie")
+    for part in cookies.split(b";"):
+        name, _, value = part.strip().partition(b"=")
+        if name == cookie_name and value:
+            try:
+                return decode_token_cached(value.decode("latin-1")).get("role") == "admin"
+            except Exception:
+                return False
+    return False
+
+
+class ServerTimingMiddleware:
+    """Plain ASGI middleware; requests that did not ask for timing pass straight through."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not (settings.SERVER_TIMING_ENABLED or _requested_by_admin(scope)):
+            await self.app(scope, receive, send)
+            return
+
+        timing = ServerTiming()
+        token = _current.set(timing)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers") or [])
+                headers.append((b"server-timing", timing.header(time.perf_counter()).encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
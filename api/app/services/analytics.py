@@ -0,0 +1,346 @@
+"""
+Vectorized collection analytics over market price history.
+
+Price history and held purchase lots are loaded once into flat NumPy arrays
+(cached until any process commits a price or collection change) and every metric is computed
+with segmented array operations rather than per-row Python loops.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from datetime import date, datetime
+from threading import Lock
+from typing import Any, Optional
+
+import numpy as np
+from sqlalchemy import or_, select
+from sqlmodel import Session
+
+from ..models import Bottle, MarketPrice, Purchase
+from . import data_versions
+
+DAYS_PER_YEAR = 365.25
+MIN_CAGR_YEARS = 1 / 12          # shorter holding periods make annualized figures meaningless
+_KEY_STRIDE = np.int64(1 << 32)  # (code, day) -> single sortable int64 key
+
+_EPOCH = np.datetime64("1970-01-01", "D")
+
+
+@dataclass
+class PriceSeries:
+    """All dated, positive prices as flat arrays sorted by (UPC code, day); one close per day."""
+    upcs: np.ndarray     # sorted unique UPC strings; index == code
+    codes: np.ndarray    # int64 code per observation
+    days: np.ndarray     # int64 days since epoch per observation
+    prices: np.ndarray   # float64 per observation
+
+    @property
+    def keys(self) -> np.ndarray:
+        return self.codes * _KEY_STRIDE + self.days
+
+    def lookup_codes(self, upcs: np.ndarray) -> np.ndarray:
+        """Map UPC strings to series codes; -1 for UPCs without history."""
+        if not len(self.upcs) or not len(upcs):
+            return np.full(len(upcs), -1, dtype=np.int64)
+        pos = np.searchsorted(self.upcs, upcs).clip(0, len(self.upcs) - 1)
+        return np.where(self.upcs[pos] == upcs, pos, -1).astype(np.int64)
+
+    def last_on_or_before(self, codes: np.ndarray, days: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """(price, day) of the last observation on or before ``days`` per code, NaN when unknown; broadcasts."""
+        keys = self.keys
+        if not len(keys):
+            missing = np.full(np.broadcast(codes, days).shape, np.nan)
+            return missing, missing.copy()
+        pos = np.searchsorted(keys, codes * _KEY_STRIDE + days, side="right") - 1
+        safe = pos.clip(0)
+        found = (pos >= 0) & (self.codes[safe] == codes) & (codes >= 0)
+        return np.where(found, self.prices[safe], np.nan), np.where(found, self.days[safe], np.nan)
+
+
+@dataclass
+class Lots:
+    """Currently held purchase lots, one entry per purchase row."""
+    bottle_ids: np.ndarray   # int64
+    upcs: np.ndarray         # object (str, "" when missing)
+    quantity: np.ndarray     # float64
+    paid: np.ndarray         # float64 per-bottle price, NaN when unknown
+    start_days: np.ndarray   # float64 days since epoch, NaN when no purchase date
+    labels: dict[int, tuple[str, Optional[str]]]  # bottle_id -> (brand, expression)
+
+
+_CACHE: dict[str, tuple[tuple[int, ...], Any]] = {}
+_CACHE_LOCK = Lock()
+
+
+def _cached(name: str, version: tuple[int, ...], loader):
+    with _CACHE_LOCK:
+        hit = _CACHE.get(name)
+        if hit and hit[0] == version:
+            return hit[1]
+    value = loader()
+    with _CACHE_LOCK:
+        _CACHE[name] = (version, value)
+    return value
+
+
+def _to_days(values) -> np.ndarray:
+    """Dates/datetimes -> int64 days since epoch (tz-aware values use their wall-clock date)."""
+    naive = [v.replace(tzinfo=None) if isinstance(v, datetime) else v for v in values]
+    return (np.array(naive, dtype="datetime64[D]") - _EPOCH).astype(np.int64)
+
+
+def load_price_series(session: Session) -> PriceSeries:
+    mp = MarketPrice.__table__
+    rows = session.execute(
+        select(mp.c.barcode_upc, mp.c.as_of, mp.c.price)
+        .where(mp.c.as_of.is_not(None), mp.c.price > 0)
+        .order_by(mp.c.barcode_upc, mp.c.as_of, mp.c.price_id)
+    ).all()
+    if not rows:
+        empty = np.array([], dtype=np.int64)
+        return PriceSeries(np.array([], dtype=object), empty, empty, np.array([], dtype=np.float64))
+
+    upc, as_of, price = zip(*rows)
+    upcs, codes = np.unique(np.array(upc, dtype=object), return_inverse=True)
+    codes = codes.astype(np.int64)
+    days = _to_days(as_of)
+    prices = np.asarray(price, dtype=np.float64)
+
+    order = np.lexsort((np.arange(len(days)), days, codes))  # stable: later rows win within a day
+    codes, days, prices = codes[order], days[order], prices[order]
+    keys = codes * _KEY_STRIDE + days
+    last_of_day = np.r_[keys[1:] != keys[:-1], True]
+    return PriceSeries(upcs, codes[last_of_day], days[last_of_day], prices[last_of_day])
+
+
+def load_lots(session: Session) -> Lots:
+    purchase = Purchase.__table__
+    bottle = Bottle.__table__
+    rows = session.execute(
+        select(
+            purchase.c.bottle_id,
+            bottle.c.barcode_upc,
+            bottle.c.brand,
+            bottle.c.expression,
+            purchase.c.quantity,
+            purchase.c.price_paid,
+            purchase.c.purchase_date,
+        )
+        .select_from(purchase.join(bottle, bottle.c.bottle_id == purchase.c.bottle_id))
+        .where(
+            purchase.c.killed_dt.is_(None),
+            or_(purchase.c.status.is_(None), purchase.c.status != "finished"),
+        )
+    ).all()
+    if not rows:
+        empty = np.array([], dtype=np.float64)
+        return Lots(np.array([], dtype=np.int64), np.array([], dtype=object), empty, empty, empty, {})
+
+    bottle_ids, upcs, brands, expressions, qty, paid, purchased = zip(*rows)
+    start_days = np.full(len(rows), np.nan)
+    dated = np.array([d is not None for d in purchased])
+    if dated.any():
+        start_days[dated] = _to_days([d for d in purchased if d is not None])
+    return Lots(
+        bottle_ids=np.asarray(bottle_ids, dtype=np.int64),
+        upcs=np.array([(u or "").strip() for u in upcs], dtype=object),
+        quantity=np.array([q or 0 for q in qty], dtype=np.float64),
+        paid=np.array(paid, dtype=np.float64),
+        start_days=start_days,
+        labels=dict(zip(bottle_ids, zip(brands, expressions))),
+    )
+
+
+def _segment_stats(series: PriceSeries, codes: np.ndarray, start_days: np.ndarray) -> dict[str, np.ndarray]:
+    """
+    Annualized volatility and max drawdown of each (code, start_day) window.
+    Windows are gathered into one contiguous array so every statistic is a bincount/reduceat.
+    """
+    n = len(codes)
+    keys = series.keys
+    has_code = codes >= 0
+    starts = np.where(np.isnan(start_days), np.iinfo(np.int32).min, start_days).astype(np.int64)
+    lo = np.searchsorted(keys, codes * _KEY_STRIDE + starts)
+    hi = np.searchsorted(keys, codes * _KEY_STRIDE + _KEY_STRIDE)
+    lengths = np.where(has_code, hi - lo, 0)
+
+    out = {
+        "observations": lengths,
+        "volatility": np.full(n, np.nan),
+        "max_drawdown": np.full(n, np.nan),
+    }
+    total = int(lengths.sum())
+    if not total:
+        return out
+
+    seg_start = np.r_[0, np.cumsum(lengths)[:-1]]
+    seg_id = np.repeat(np.arange(n), lengths)
+    idx = np.arange(total) - np.repeat(seg_start, lengths) + np.repeat(lo, lengths)
+    days = series.days[idx]
+    logp = np.log(series.prices[idx])
+
+    nonempty = lengths > 0
+
+    # Realized volatility for irregular sampling: sum(r^2) / elapsed years.
+    same_segment = seg_id[1:] == seg_id[:-1]
+    returns = np.diff(logp)[same_segment]
+    elapsed = (np.diff(days)[same_segment]) / DAYS_PER_YEAR
+    ids = seg_id[1:][same_segment]
+    sum_r2 = np.bincount(ids, weights=returns * returns, minlength=n)
+    sum_dt = np.bincount(ids, weights=elapsed, minlength=n)
+    enough = (np.bincount(ids, minlength=n) >= 2) & (sum_dt > 0)
+    out["volatility"][enough] = np.sqrt(sum_r2[enough] / sum_dt[enough])
+
+    # Segmented running max: lift each segment above every earlier one, accumulate, then drop the lift.
+    lift = seg_id * (logp.max() - logp.min() + 1.0)
+    running_max = np.maximum.accumulate(logp + lift) - lift
+    drawdown = 1.0 - np.exp(logp - running_max)
+    out["max_drawdown"][nonempty] = np.maximum.reduceat(drawdown, seg_start[nonempty])
+    return out
+
+
+def _cagr(ratio: np.ndarray, years: np.ndarray) -> np.ndarray:
+    ok = (ratio > 0) & (years >= MIN_CAGR_YEARS)
+    out = np.full(ratio.shape, np.nan)
+    out[ok] = ratio[ok] ** (1.0 / years[ok]) - 1.0
+    return out
+
+
+def _collection_index(series: PriceSeries, lots: Lots, codes: np.ndarray, today: int) -> np.ndarray:
+    """Month-end returns of the held collection, counting each lot only once it was held and priced."""
+    # Lots without a purchase date are assumed held since their first price observation.
+    starts = lots.start_days.copy()
+    undated = np.isnan(starts) & (codes >= 0)
+    if undated.any():
+        starts[undated] = series.days[np.searchsorted(series.keys, codes[undated] * _KEY_STRIDE)]
+    usable = (codes >= 0) & ~np.isnan(starts) & (lots.quantity > 0)
+    if not usable.any():
+        return np.array([], dtype=np.float64)
+
+    month_days = np.arange(
+        np.datetime64(int(starts[usable].min()), "D").astype("datetime64[M]"),
+        np.datetime64(today, "D").astype("datetime64[M]") + 1,
+    )
+    ends = ((month_days + 1).astype("datetime64[D]") - _EPOCH).astype(np.int64) - 1
+    ends = np.minimum(ends, today)
+
+    # Lots sharing a UPC and first held month behave identically: merge them before
+    # building the (positions x months) value matrix. np.unique also sorts by code,
+    # which keeps the searchsorted probes below monotonic.
+    first_month = np.searchsorted(ends, starts[usable])
+    position_keys, position_idx = np.unique(codes[usable] * len(ends) + first_month, return_inverse=True)
+    p_codes = position_keys // len(ends)
+    p_first = position_keys % len(ends)
+    p_qty = np.bincount(position_idx, weights=lots.quantity[usable], minlength=len(position_keys))
+
+    prices, _ = series.last_on_or_before(p_codes[:, None], ends[None, :])
+    held = np.arange(len(ends))[None, :] >= p_first[:, None]
+    values = np.where(held & ~np.isnan(prices), prices * p_qty[:, None], np.nan)
+
+    both = ~np.isnan(values[:, 1:]) & ~np.isnan(values[:, :-1])
+    now = np.where(both, values[:, 1:], 0.0).sum(axis=0)
+    before = np.where(both, values[:, :-1], 0.0).sum(axis=0)
+    valid = before > 0
+    return now[valid] / before[valid] - 1.0
+
+
+def compute_analytics(session: Session, *, limit: Optional[int] = None, today: Optional[date] = None) -> dict[str, Any]:
+    """
+    Per-bottle and collection return, CAGR, volatility and max drawdown for held bottles.
+    Returns and CAGR only cover bottles with both a purchase price and a market price;
+    CAGR is measured from the cost-weighted purchase date. Bottles are ordered by market value.
+    """
+    prices_version, collection_version = data_versions.current(session, data_versions.PRICES, data_versions.COLLECTION)
+    series: PriceSeries = _cached("series", (prices_version,), lambda: load_price_series(session))
+    lots: Lots = _cached("lots", (collection_version,), lambda: load_lots(session))
+
+    today_day = int((np.datetime64(today or date.today(), "D") - _EPOCH).astype(np.int64))
+    codes = series.lookup_codes(lots.upcs)
+
+    # --- per bottle: fold lots into bottles ---
+    bottle_ids, bottle_idx = np.unique(lots.bottle_ids, return_inverse=True)
+    nb = len(bottle_ids)
+    known_paid = ~np.isnan(lots.paid)
+    dated = ~np.isnan(lots.start_days)
+    paid_qty = np.where(known_paid, lots.quantity, 0.0)
+    qty = np.bincount(bottle_idx, weights=lots.quantity, minlength=nb)
+    cost_qty = np.bincount(bottle_idx, weights=paid_qty, minlength=nb)
+    cost = np.bincount(bottle_idx, weights=np.where(known_paid, lots.paid * lots.quantity, 0.0), minlength=nb)
+    age_weight = np.where(known_paid & dated, lots.paid * lots.quantity, 0.0)
+    weighted_start = np.bincount(bottle_idx, weights=age_weight * np.nan_to_num(lots.start_days), minlength=nb)
+    start_weight = np.bincount(bottle_idx, weights=age_weight, minlength=nb)
+
+    first_start = np.full(nb, np.inf)
+    np.minimum.at(first_start, bottle_idx, np.where(dated, lots.start_days, np.inf))
+    first_start[np.isinf(first_start)] = np.nan
+    bottle_codes = np.full(nb, -1, dtype=np.int64)
+    bottle_codes[bottle_idx] = codes
+
+    stats = _segment_stats(series, bottle_codes, first_start)
+    price, latest_day = series.last_on_or_before(bottle_codes, np.full(nb, today_day))
+    value = qty * price
+    cost_value = cost_qty * price
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratio = np.where(cost > 0, cost_value / cost, np.nan)
+        years = np.where(start_weight > 0, (today_day - weighted_start / start_weight) / DAYS_PER_YEAR, np.nan)
+    total_return = ratio - 1.0
+    cagr = _cagr(ratio, years)
+
+    # --- collection ---
+    priced = ~np.isnan(price) & (cost > 0)
+    priced_cost = float(cost[priced].sum())
+    c_ratio = float(cost_value[priced].sum()) / priced_cost if priced_cost > 0 else np.nan
+    c_weight = start_weight[priced].sum()
+    c_years = (today_day - weighted_start[priced].sum() / c_weight) / DAYS_PER_YEAR if c_weight > 0 else np.nan
+    monthly = _collection_index(series, lots, codes, today_day)
+    index = np.cumprod(1.0 + monthly)
+    c_drawdown = float((1.0 - index / np.maximum.accumulate(index)).max()) if len(index) else np.nan
+    c_volatility = float(monthly.std(ddof=1) * np.sqrt(12)) if len(monthly) >= 2 else np.nan
+
+    order = np.argsort(-np.nan_to_num(value, nan=-1.0), kind="stable")
+    bottles = []
+    for i in order[:limit]:
+        bottle_id = int(bottle_ids[i])
+        brand, expression = lots.labels.get(bottle_id, (None, None))
+        bottles.append(
+            {
+                "bottle_id": bottle_id,
+                "brand": brand,
+                "expression": expression,
+                "barcode_upc": series.upcs[bottle_codes[i]] if bottle_codes[i] >= 0 else None,
+                "quantity": int(qty[i]),
+                "cost_basis": _money(cost[i]),
+                "market_value": _money(value[i]),
+                "latest_price": _money(price[i]),
+                "latest_price_date": None if np.isnan(latest_day[i]) else str(_EPOCH + int(latest_day[i])),
+                "total_return": _ratio(total_return[i]),
+                "cagr": _ratio(cagr[i]),
+                "volatility": _ratio(stats["volatility"][i]),
+                "max_drawdown": _ratio(stats["max_drawdown"][i]),
+                "observations": int(stats["observations"][i]),
+            }
+        )
+
+    return {
+        "as_of": str(_EPOCH + today_day),
+        "collection": {
+            "bottles": int(qty.sum()),
+            "cost_basis": _money(float(cost.sum())),
+            "market_value": _money(float(np.nansum(value))),
+            "total_return": _ratio(c_ratio - 1.0),
+            "cagr": _ratio(_cagr(np.array([c_ratio]), np.array([c_years]))[0]),
+            "volatility": _ratio(c_volatility),
+            "max_drawdown": _ratio(c_drawdown),
+            "months": int(len(monthly)),
+        },
+        "bottles": bottles,
+    }
+
+
+def _money(value: float) -> Optional[float]:
+    return None if np.isnan(value) else round(float(value), 2)
+
+
+def _ratio(value: float) -> Optional[float]:
+    return None if np.isnan(value) else round(float(value), 4)
@@ -0,0 +1,97 @@
+"""
+Data version counters used to invalidate cached rollups.
+
+Each counter is a row in the data_version table and is bumped inside the
+transaction that changed the data, so every process sharing the database
+(uvicorn workers, the scheduler, the import scripts) sees the new version as
+soon as the change commits, and a rolled-back write never invalidates
+anything. Checking a cache costs one primary-key lookup.
+
+ORM writes to tracked models are noticed in ``before_flush``; core-level writes
+(bulk inserts, latest-price rebuilds) call ``mark_changed`` explicitly. Writes
+that bypass SQLAlchemy sessions altogether (the sqlite3 CLI, raw-connection
+scripts) do not bump anything; caches only pick those up after a later
+tracked write or a restart.
+"""
+
+from __future__ import annotations
+
+from itertools import chain
+
+from sqlalchemy import event, insert, select, update
+from sqlalchemy.orm import Session
+
+from ..models import Bottle, BottleTag, DataVersion, FxRate, MarketPrice, PriceAlertRule, Purchase, Retailer, Tag
+
+PRICES = "prices"
+COLLECTION = "collection"
+FX = "fx"
+ALERT_RULES = "alert_rules"
+
+_TRACKED_MODELS = {
+    MarketPrice: PRICES,
+    Purchase: COLLECTION,
+    Bottle: COLLECTION,
+    BottleTag: COLLECTION,
+    Retailer: COLLECTION,
+    FxRate: FX,
+    PriceAlertRule: ALERT_RULES,
+    Tag: COLLECTION,
+}
+_PENDING_KEY = "data_versions_pending"
+_BUMPED_KEY = "data_versions_bumped"
+
+
+def current(session: Session, *names: str) -> tuple[int, ...]:
+    """Committed versions of the requested counters, suitable as part of a cache key."""
+    dv = DataVersion.__table__
+    found = dict(session.execute(select(dv.c.name, dv.c.version).where(dv.c.name.in_(names))).all())
+    return tuple(found.get(name, 0) for name in names)
+
+
+def bumped(session: Session) -> dict[str, int]:
+    """New values of the counters the session's transaction bumped; readable from ``after_commit`` hooks."""
+    return dict(session.info.get(_BUMPED_KEY, {}))
+
+
+def mark_changed(session: Session, name: str) -> None:
+    """Record that the session's current transaction changed ``name``; applied on commit."""
+    session.info.setdefault(_PENDING_KEY, set()).add(name)
+
+
+@event.listens_for(Session, "before_flush")
+def _track_orm_writes(session: Session, flush_context, instances) -> None:
+    for obj in chain(session.new, session.dirty, session.deleted):
+        name = _TRACKED_MODELS.get(type(obj))
+        if name:
+            mark_changed(session, name)
+
+
+@event.listens_for(Session, "before_commit")
+def _bump_pending(session: Session) -> None:
+    # before_commit runs ahead of commit's own flush; flush now so its writes are marked too.
+    session.flush()
+    pending = session.info.pop(_PENDING_KEY, None)
+    if not pending:
+        return
+    dv = DataVersion.__table__
+    names = sorted(pending)
+    session.execute(update(dv).where(dv.c.name.in_(names)).values(version=dv.c.version + 1))
+    versions = dict(session.execute(select(dv.c.name, dv.c.version).where(dv.c.name.in_(names))).all())
+    missing = [name for name in names if name not in versions]
+    if missing:
+        session.execute(insert(dv), [{"name": name, "version": 1} for name in missing])
+        versions.update(dict.fromkeys(missing, 1))
+    session.info.setdefault(_BUMPED_KEY, {}).update(versions)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_pending(session: Session) -> None:
+    session.info.pop(_PENDING_KEY, None)
+    session.info.pop(_BUMPED_KEY, None)
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _forget_bumped(session: Session, transaction) -> None:
+    if transaction.parent is None:
+        session.info.pop(_BUMPED_KEY, None)
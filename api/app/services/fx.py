@@ -0,0 +1,272 @@
+"""
+Foreign-exchange rates: ingestion (CSV or provider) and vectorized conversion.
+
+Rates are stored per day as units of a currency per one USD (the pivot), so any
+pair converts as ``amount / rate[from] * rate[to]``. For conversion the whole
+table is held in memory as flat NumPy arrays sorted by (currency, day) and
+cached until an fx_rate row is committed.
+"""
+
+from __future__ import annotations
+
+import csv
+import io
+from dataclasses import dataclass
+from datetime import date, datetime, timezone
+from threading import Lock
+from typing import IO, Any, Iterable, Optional, Sequence
+
+import numpy as np
+from pydantic import ValidationError
+from sqlalchemy import delete, insert, select
+from sqlmodel import Session
+
+from ..market_price_schemas import FxRateImportResult, FxRateIn, MarketPriceImportError
+from ..models import FxRate
+from ..settings import settings
+from . import data_versions
+from .market_prices import fetch_provider_json
+
+PIVOT = "USD"
+MAX_REPORTED_ERRORS = 50
+
+_KEY_STRIDE = np.int64(1 << 32)
+_EPOCH = np.datetime64("1970-01-01", "D")
+
+
+@dataclass
+class FxTable:
+    """All stored rates as flat arrays sorted by (currency code, day)."""
+    currencies: np.ndarray  # sorted unique ISO codes; index == code
+    codes: np.ndarray       # int64 code per rate
+    days: np.ndarray        # int64 days since epoch per rate
+    rates: np.ndarray       # float64 units of currency per USD
+
+    def knows(self, currency: str) -> bool:
+        return currency == PIVOT or currency in set(self.currencies.tolist())
+
+    def _codes_for(self, currencies: np.ndarray) -> np.ndarray:
+        if not len(self.currencies):
+            return np.full(currencies.shape, -1, dtype=np.int64)
+        pos = np.searchsorted(self.currencies, currencies).clip(0, len(self.currencies) - 1)
+        return np.where(self.currencies[pos] == currencies, pos, -1).astype(np.int64)
+
+    def rates_for(self, currencies: np.ndarray, days: np.ndarray) -> np.ndarray:
+        """
+        Units of each currency per USD on each day (broadcasts): the last rate on or
+        before the day, else the earliest known rate; NaN for currencies without rates.
+        """
+        currencies, days = np.broadcast_arrays(currencies, days)
+        result = np.full(currencies.shape, np.nan)
+        if len(self.codes):
+            codes = self._codes_for(currencies)
+            keys = self.codes * _KEY_STRIDE + self.days
+            pos = np.searchsorted(keys, codes * _KEY_STRIDE + days, side="right") - 1
+            before = pos.clip(0)
+            after = (pos + 1).clip(0, len(keys) - 1)
+            has_before = (pos >= 0) & (self.codes[before] == codes)
+            has_after = (codes >= 0) & (self.codes[after] == codes)
+            result = np.where(has_before, self.rates[before], np.where(has_after, self.rates[after], np.nan))
+        result[currencies == PIVOT] = 1.0
+        return result
+
+    def convert(
+        self,
+        amounts: np.ndarray,
+        currencies: np.ndarray,
+        days: np.ndarray,
+        to_currency: str,
+    ) -> np.ndarray:
+        """Convert ``amounts`` (in ``currencies``) to ``to_currency`` at each day's rate; NaN when unknown."""
+        amounts = np.asarray(amounts, dtype=np.float64)
+        currencies = np.asarray(currencies, dtype=str)
+        factor = self.rates_for(np.asarray(to_currency, dtype=str), days) / self.rates_for(currencies, days)
+        return amounts * np.where(currencies == to_currency, 1.0, factor)
+
+
+_CACHE: dict[str, tuple[tuple[int, ...], FxTable]] = {}
+_CACHE_LOCK = Lock()
+
+
+def to_days(values: Iterable[Optional[date | datetime]], default: Optional[date] = None) -> np.ndarray:
+    """Dates/datetimes -> int64 days since epoch; None falls back to ``default`` (today)."""
+    fallback = default or date.today()
+    naive = [
+        fallback if v is None else v.replace(tzinfo=None) if isinstance(v, datetime) else v
+        for v in values
+    ]
+    return (np.array(naive, dtype="datetime64[D]") - _EPOCH).astype(np.int64)
+
+
+def normalize_currencies(values: Iterable[Optional[str]]) -> np.ndarray:
+    """Upper-cased currency codes; blanks are treated as USD (the column default)."""
+    return np.array([((v or "").strip().upper() or PIVOT) for v in values], dtype=str)
+
+
+def _load_table(session: Session) -> FxTable:
+    fx = FxRate.__table__
+    rows = session.execute(
+        select(fx.c.currency, fx.c.rate_date, fx.c.rate)
+        .where(fx.c.rate > 0)
+        .order_by(fx.c.currency, fx.c.rate_date)
+    ).all()
+    if not rows:
+        empty = np.array([], dtype=np.int64)
+        return FxTable(np.array([], dtype=str), empty, empty, np.array([], dtype=np.float64))
+
+    currency, rate_date, rate = zip(*rows)
+    currencies, codes = np.unique(np.array(currency, dtype=str), return_inverse=True)
+    return FxTable(
+        currencies=currencies,
+        codes=codes.astype(np.int64),
+        days=to_days(rate_date),
+        rates=np.asarray(rate, dtype=np.float64),
+    )
+
+
+def load_fx_table(session: Session) -> FxTable:
+    """The in-memory rate table, reloaded once any process commits an fx_rate change."""
+    version = data_versions.current(session, data_versions.FX)
+    with _CACHE_LOCK:
+        hit = _CACHE.get("table")
+        if hit and hit[0] == version:
+            return hit[1]
+    table = _load_table(session)
+    with _CACHE_LOCK:
+        _CACHE["table"] = (version, table)
+    return table
+
+
+def convert(
+    session: Session,
+    amounts: Sequence[Optional[float]],
+    currencies: Sequence[Optional[str]],
+    days: np.ndarray,
+    to_currency: str,
+) -> np.ndarray:
+    """Vectorized conversion using the cached rate table; see ``FxTable.convert``."""
+    values = np.array([np.nan if a is None else a for a in amounts], dtype=np.float64)
+    return load_fx_table(session).convert(values, normalize_currencies(currencies), days, to_currency)
+
+
+def store_rates(session: Session, rates: Sequence[dict[str, Any]]) -> int:
+    """Upsert (currency, rate_date) rows inside the caller's transaction; returns rows written."""
+    if not rates:
+        return 0
+    fx = FxRate.__table__
+    latest: dict[tuple[str, date], dict[str, Any]] = {}
+    for rec in rates:
+        latest[(rec["currency"], rec["rate_date"])] = rec
+
+    by_currency: dict[str, list[date]] = {}
+    for currency, rate_date in latest:
+        by_currency.setdefault(currency, []).append(rate_date)
+    for currency, dates in by_currency.items():
+        session.execute(delete(fx).where(fx.c.currency == currency, fx.c.rate_date.in_(dates)))
+    session.execute(insert(fx), list(latest.values()))
+    data_versions.mark_changed(session, data_versions.FX)
+    return len(latest)
+
+
+def import_fx_csv(session: Session, stream: IO[bytes], *, commit: bool = True) -> FxRateImportResult:
+    """
+    Load a rate CSV (header: currency, rate_date or date, rate[, source]) from a binary
+    file object. Rates are units of currency per one USD; existing days are replaced.
+    Set ``commit=False`` for a dry run that rolls everything back.
+    """
+    rows = invalid = 0
+    errors: list[MarketPriceImportError] = []
+    records: list[dict[str, Any]] = []
+    fetched_at = datetime.now(timezone.utc)
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+
+    try:
+        reader = csv.DictReader(text)
+        if not reader.fieldnames:
+            raise ValueError("CSV file is empty")
+        reader.fieldnames = [(name or "").strip().lower() for name in reader.fieldnames]
+        if "date" in reader.fieldnames and "rate_date" not in reader.fieldnames:
+            reader.fieldnames = ["rate_date" if name == "date" else name for name in reader.fieldnames]
+        missing = {"currency", "rate_date", "rate"} - set(reader.fieldnames)
+        if missing:
+            raise ValueError(f"CSV header is missing: {', '.join(sorted(missing))}")
+
+        for row in reader:
+            rows += 1
+            data = {k: v.strip() for k, v in row.items() if k and isinstance(v, str) and v.strip()}
+            try:
+                payload = FxRateIn.model_validate(data)
+            except ValidationError as exc:
+                invalid += 1
+                if len(errors) < MAX_REPORTED_ERRORS:
+                    detail = "; ".join(
+                        f"{'.'.join(str(p) for p in err.get('loc', ())) or 'row'}: {err.get('msg')}"
+                        for err in exc.errors()
+                    )
+                    errors.append(MarketPriceImportError(line=reader.line_num, detail=detail))
+                continue
+            records.append({**payload.model_dump(), "source": payload.source or "csv", "fetched_at": fetched_at})
+
+        stored = store_rates(session, records)
+        if commit:
+            session.commit()
+        else:
+            session.rollback()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        # Leave the caller's file object open.
+        text.detach()
+
+    return FxRateImportResult(rows=rows, stored=stored, invalid=invalid, errors=errors)
+
+
+def fetch_external_rates(rate_date: Optional[date] = None) -> list[dict[str, Any]]:
+    """
+    Fetch one day of rates from FX_RATE_PROVIDER_URL, rebased to USD.
+    Expects ``{"base": "EUR", "date": "...", "rates": {"USD": 1.08, ...}}`` (optionally
+    under ``data``). Returns [] when the provider is not configured or fails.
+    """
+    url_template = settings.FX_RATE_PROVIDER_URL
+    if not url_template:
+        return []
+
+    day = rate_date or date.today()
+    payload = fetch_provider_json(
+        url_template,
+        {"date": day.isoformat()},
+        api_key=settings.FX_RATE_PROVIDER_API_KEY,
+        timeout=settings.FX_RATE_PROVIDER_TIMEOUT_SECONDS,
+        label=f"FX rates for {day}",
+        provider="fx",
+    )
+    if not isinstance(payload, dict):
+        return []
+    data = payload.get("data") if isinstance(payload.get("data"), dict) else payload
+    quoted = data.get("rates")
+    if not isinstance(quoted, dict):
+        return []
+
+    base = str(data.get("base") or PIVOT).strip().upper()
+    rates: dict[str, float] = {}
+    for currency, value in quoted.items():
+        try:
+            rate = float(value)
+        except (TypeError, ValueError):
+            continue
+        if rate > 0 and isinstance(currency, str) and len(currency.strip()) == 3:
+            rates[currency.strip().upper()] = rate
+    rates[base] = 1.0
+
+    # Rebase so every rate is "units per USD".
+    usd = rates.get(PIVOT)
+    if not usd:
+        return []
+    fetched_at = datetime.now(timezone.utc)
+    source = str(data.get("source") or payload.get("provider") or "provider")
+    return [
+        {"currency": currency, "rate_date": day, "rate": rate / usd, "source": source, "fetched_at": fetched_at}
+        for currency, rate in sorted(rates.items())
+        if currency != PIVOT
+    ]
@@ -0,0 +1,205 @@
+"""
+Perceptual hashes of stored images: similar-photo lookup and duplicate reports.
+
+Each stored image gets a 64-bit difference hash (dHash: a 9x8 grayscale
+thumbnail, one bit per "is the next pixel brighter"), which survives resizing,
+re-encoding and small crops. Hashes live in the image_hash table; every API
+process keeps them in a packed ``uint64`` NumPy array and answers a query with
+one vectorized XOR + popcount over the whole array (well under 10 ms for 100k
+images) instead of a Python loop. New rows are picked up incrementally by
+``hash_id`` before each search, so uploads handled by other processes are seen too.
+"""
+
+from __future__ import annotations
+
+import logging
+from datetime import datetime, timezone
+from threading import Lock
+from typing import Iterable, Optional
+
+import numpy as np
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlmodel import Session
+
+from ..models import ImageHash
+
+logger = logging.getLogger(__name__)
+
+HASH_BITS = 64
+_SIGN = 1 << 63
+# SWAR popcount constants (NumPy < 2.0 has no bitwise_count).
+_M1 = np.uint64(0x5555555555555555)
+_M2 = np.uint64(0x3333333333333333)
+_M4 = np.uint64(0x0F0F0F0F0F0F0F0F)
+_H01 = np.uint64(0x0101010101010101)
+_COMPARE_ROWS = 256
+
+
+def dhash(img, size: int = 8) -> int:
+    """64-bit difference hash of a PIL image (orientation applied first)."""
+    from PIL import Image, ImageOps
+
+    img.draft("L", (size * 8, size * 8))   # JPEG: decode at reduced scale, far cheaper than full size
+    img = ImageOps.exif_transpose(img)
+    gray = img.convert("L").resize((size + 1, size), Image.Resampling.LANCZOS)
+    pixels = np.asarray(gray, dtype=np.int16)
+    bits = pixels[:, 1:] > pixels[:, :-1]
+    return int(np.packbits(bits.ravel()).view(">u8")[0])
+
+
+def compute_dhash(path) -> int:
+    """dHash of an image file or file object (module level so it can run in a worker process)."""
+    from PIL import Image
+
+    with Image.open(path) as img:
+        return dhash(img)
+
+
+def to_signed(value: int) -> int:
+    return value - (1 << 64) if value & _SIGN else value
+
+
+def to_unsigned(value: int) -> int:
+    return value & 0xFFFFFFFFFFFFFFFF
+
+
+def popcount64(values: np.ndarray) -> np.ndarray:
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(values)
+    x = values - ((values >> np.uint64(1)) & _M1)
+    x = (x & _M2) + ((x >> np.uint64(2)) & _M2)
+    x = (x + (x >> np.uint64(4))) & _M4
+    return (x * _H01) >> np.uint64(56)
+
+
+def hamming(values: np.ndarray, query: int) -> np.ndarray:
+    """Bit distance from ``query`` to every hash in ``values`` (one vectorized pass)."""
+    return popcount64(values ^ np.uint64(query)).astype(np.int8)
+
+
+def record(session: Session, sha256: str, path: str) -> Optional[int]:
+    """Hash a stored image and add its image_hash row (no commit); None if it cannot be decoded."""
+    if session.execute(select(ImageHash.hash_id).where(ImageHash.sha256 == sha256)).first():
+        return None
+    try:
+        value = compute_dhash(path)
+    except Exception as exc:
+        logger.warning("Could not hash %s: %s", path, exc)
+        return None
+    # Concurrent uploads of the same content may both get here; the first row wins.
+    session.execute(
+        sqlite_insert(ImageHash)
+        .values(sha256=sha256, dhash=to_signed(value), created_at=datetime.now(timezone.utc))
+        .on_conflict_do_nothing(index_elements=["sha256"])
+    )
+    return value
+
+
+def forget(session: Session, sha256s: Iterable[str]) -> None:
+    """Drop the hashes of removed images (no commit); other processes reload on the count change."""
+    session.execute(delete(ImageHash).where(ImageHash.sha256.in_(list(sha256s))))
+
+
+class PerceptualIndex:
+    def __init__(self):
+        self._lock = Lock()
+        self._hashes = np.empty(0, dtype=np.uint64)
+        self._keys: list[str] = []
+        self._last_id = 0
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def refresh(self, session: Session) -> None:
+        """Load rows added since the last call; start over if rows were deleted meanwhile."""
+        last_id, count = session.execute(select(func.max(ImageHash.hash_id), func.count(ImageHash.hash_id))).one()
+        with self._lock:
+            if (last_id or 0) == self._last_id and count == len(self._keys):
+                return
+            hashes, keys = self._hashes, self._keys
+            rows = self._rows_after(session, self._last_id)
+            if len(keys) + len(rows) != count:
+                hashes, keys = np.empty(0, dtype=np.uint64), []
+                rows = self._rows_after(session, 0)
+            added = np.fromiter((to_unsigned(r[2]) for r in rows), dtype=np.uint64, count=len(rows))
+            self._hashes = np.concatenate([hashes, added])
+            self._keys = keys + [r[1] for r in rows]
+            self._last_id = rows[-1][0] if rows else (last_id or 0)
+
+    @staticmethod
+    def _rows_after(session: Session, hash_id: int) -> list:
+        return session.execute(
+            select(ImageHash.hash_id, ImageHash.sha256, ImageHash.dhash)
+            .where(ImageHash.hash_id > hash_id)
+            .order_by(ImageHash.hash_id)
+        ).all()
+
+    def search(self, query: int, *, limit: int = 5, max_distance: int = HASH_BITS) -> list[tuple[str, int]]:
+        """Up to ``limit`` (sha256, distance) pairs within ``max_distance`` bits, nearest first."""
+        with self._lock:
+            hashes, keys = self._hashes, self._keys
+        if not len(keys):
+            return []
+        distances = hamming(hashes, query)
+        candidates = np.flatnonzero(distances <= max_distance)
+        if len(candidates) > limit:
+            nearest = np.argpartition(distances[candidates], limit - 1)[:limit]
+            candidates = candidates[nearest]
+        order = candidates[np.argsort(distances[candidates], kind="stable")]
+        return [(keys[i], int(distances[i])) for i in order]
+
+    def duplicate_groups(self, max_distance: int) -> list[list[tuple[str, int]]]:
+        """
+        Groups of images within ``max_distance`` bits of another member, each as
+        (sha256, distance to the group's first image). Uses the pigeonhole principle:
+        split the 64 bits into ``max_distance + 1`` bands; two hashes that close agree
+        exactly on at least one band, so only hashes sharing a band value are compared.
+        """
+        with self._lock:
+            hashes, keys = self._hashes, self._keys
+        n = len(keys)
+        if n < 2:
+            return []
+        # Identical hashes are grouped up front, so the band search only sees distinct values.
+        distinct, inverse = np.unique(hashes, return_inverse=True)
+        parent = np.arange(len(distinct))
+
+        def root(i: int) -> int:
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        edges = np.linspace(0, HASH_BITS, max_distance + 2).astype(int)
+        for lo, hi in zip(edges[:-1], edges[1:]):
+            band = (distinct >> np.uint64(lo)) & np.uint64((1 << int(hi - lo)) - 1)
+            order = np.argsort(band, kind="stable")
+            sorted_band = band[order]
+            starts = np.flatnonzero(np.r_[True, sorted_band[1:] != sorted_band[:-1]])
+            sizes = np.diff(np.r_[starts, len(distinct)])
+            for start, size in zip(starts[sizes > 1], sizes[sizes > 1]):
+                members = order[start:start + size]
+                block = distinct[members]
+                for row in range(0, size, _COMPARE_ROWS):   # bounded memory for crowded bands
+                    close = popcount64(block[row:row + _COMPARE_ROWS, None] ^ block[None, :]) <= max_distance
+                    for a, b in zip(*np.nonzero(close)):
+                        if row + a < b:
+                            ra, rb = root(members[row + a]), root(members[b])
+                            if ra != rb:
+                                parent[max(ra, rb)] = min(ra, rb)
+
+        groups: dict[int, list[int]] = {}
+        for i in range(n):
+            groups.setdefault(root(int(inverse[i])), []).append(i)
+        result = []
+        for members in groups.values():
+            if len(members) > 1:
+                first = hashes[members[0]]
+                distances = hamming(hashes[members], int(first))
+                result.append([(keys[i], int(d)) for i, d in zip(members, distances)])
+        result.sort(key=len, reverse=True)
+        return result
+
+
+perceptual_index = PerceptualIndex()
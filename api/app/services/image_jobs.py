@@ -0,0 +1,329 @@
+"""
+Persistent background queue for upload processing.
+
+An upload accepted as a job is moved to ``UPLOAD_DIR/.jobs/<id>`` and gets an
+image_job row, so the request can answer straight away and both survive a
+restart. Worker tasks on the API's event loop claim due jobs with a conditional
+UPDATE (safe with several API processes on one database), run them through the
+same validation/conversion as a direct upload, and record progress as they go.
+A claim is a lease: a job whose process died is picked up again once the lease
+runs out. Failures are retried with exponential backoff until
+IMAGE_JOB_MAX_ATTEMPTS; a job may name a bottle or wine whose ``image_url`` is
+set to the stored image when it succeeds. Bulk URL imports are queued the same
+way (``kind`` "url_import"), their source file being the JSON list of items.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Optional
+
+from sqlalchemy import and_, or_, select, update
+from sqlalchemy.engine import Engine
+from sqlmodel import Session
+
+from ..models import Bottle, BottleAudit, ImageJob
+from ..wine_models import WineBottle
+
+logger = logging.getLogger(__name__)
+
+JOB_DIR = ".jobs"
+JOB_KINDS = ("upload", "url_import")
+TARGET_KINDS = ("bottle", "wine")
+_POLL_SECONDS = 2.0
+_MAX_BACKOFF_SECONDS = 3600.0
+
+Report = Callable[[str, int], Awaitable[None]]
+Handler = Callable[[ImageJob, Report], Awaitable[dict]]
+
+
+class JobFailed(Exception):
+    """A failure that retrying cannot fix (e.g. an unsupported file); the job fails at once."""
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _isoformat(value: Optional[datetime]) -> Optional[str]:
+    if value is None:
+        return None
+    # SQLite hands datetimes back naive; everything stored here is UTC.
+    return (value if value.tzinfo else value.replace(tzinfo=timezone.utc)).isoformat()
+
+
+def describe(job: ImageJob) -> dict[str, Any]:
+    body = {
+        "id": job.job_id,
+        "kind": job.kind,
+        "status": job.status,
+        "stage": job.stage,
+        "progress": job.progress,
+        "filename": job.filename,
+        "attempts": job.attempts,
+        "max_attempts": job.max_attempts,
+        "target": {"kind": job.target_kind, "id": job.target_id} if job.target_kind else None,
+        "error": job.error,
+        "result": json.loads(job.result_json) if job.result_json else None,
+        "created_at": _isoformat(job.created_at),
+        "updated_at": _isoformat(job.updated_at),
+        "finished_at": _isoformat(job.finished_at),
+    }
+    if job.status == "queued" and job.attempts:
+        body["next_attempt_at"] = _isoformat(job.next_attempt_at)
+    return body
+
+
+class ImageJobQueue:
+    def __init__(
+        self,
+        engine: Engine,
+        upload_dir: str,
+        handler: Handler,
+        *,
+        workers: int,
+        max_attempts: int,
+        retry_base_seconds: float,
+        lease_seconds: float,
+    ):
+        self.engine = engine
+        self.upload_dir = upload_dir
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.max_attempts = max(1, max_attempts)
+        self.retry_base_seconds = max(0.0, retry_base_seconds)
+        self.lease_seconds = max(1.0, lease_seconds)
+        self._tasks: list[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    # ---- producers ----
+
+    def enqueue(
+        self,
+        source_path: str,
+        sha256: str,
+        filename: str,
+        *,
+        kind: str = "upload",
+        target_kind: Optional[str] = None,
+        target_id: Optional[int] = None,
+        created_by: Optional[str] = None,
+    ) -> ImageJob:
+        """Take ownership of a received file (moved under ``.jobs``) and queue it; blocking."""
+        if kind not in JOB_KINDS:
+            raise ValueError(f"kind must be one of {JOB_KINDS}")
+        if target_kind not in (None, *TARGET_KINDS):
+            raise ValueError(f"target_kind must be one of {TARGET_KINDS}")
+        job_id = uuid.uuid4().hex
+        rel = f"{JOB_DIR}/{job_id}"
+        os.makedirs(os.path.join(self.upload_dir, JOB_DIR), exist_ok=True)
+        os.replace(source_path, os.path.join(self.upload_dir, rel))
+        job = ImageJob(
+            job_id=job_id,
+            kind=kind,
+            filename=filename,
+            source_path=rel,
+            source_sha256=sha256,
+            target_kind=target_kind,
+            target_id=target_id,
+            max_attempts=self.max_attempts,
+            created_by=created_by,
+        )
+        with Session(self.engine) as session:
+            session.add(job)
+            session.commit()
+            session.refresh(job)
+            session.expunge(job)
+        self._wake()
+        return job
+
+    def get(self, job_id: str) -> Optional[ImageJob]:
+        with Session(self.engine) as session:
+            return session.get(ImageJob, job_id)
+
+    def _wake(self) -> None:
+        if self._loop is not None and self._wakeup is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    # ---- workers ----
+
+    async def start(self) -> None:
+        if self._tasks:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._worker(), name=f"image-job-{i}") for i in range(self.workers)]
+
+    async def stop(self) -> None:
+        tasks, self._tasks = self._tasks, []
+        for task in tasks:
+            task.cancel()
+        # Cancelled jobs stay "running" until their lease runs out, then another process retries them.
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._loop = self._wakeup = None
+
+    async def _worker(self) -> None:
+        while True:
+            try:
+                ran = await self.run_next()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Image job worker error")
+                ran = False
+            if not ran:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+
+    async def run_pending(self) -> int:
+        """Run due jobs one after another until none is left; returns how many ran."""
+        ran = 0
+        while await self.run_next():
+            ran += 1
+        return ran
+
+    async def run_next(self) -> bool:
+        job = await asyncio.to_thread(self._claim)
+        if job is None:
+            return False
+        await self._run(job)
+        return True
+
+    def _due(self, now: datetime):
+        return or_(
+            and_(ImageJob.status == "queued", ImageJob.next_attempt_at <= now),
+            and_(ImageJob.status == "running", ImageJob.lease_expires_at < now),
+        )
+
+    def _claim(self) -> Optional[ImageJob]:
+        with Session(self.engine) as session:
+            while True:
+                now = _utcnow()
+                job_id = session.execute(
+                    select(ImageJob.job_id).where(self._due(now)).order_by(ImageJob.next_attempt_at).limit(1)
+                ).scalar()
+                if job_id is None:
+                    return None
+                claimed = session.execute(
+                    update(ImageJob)
+                    .where(ImageJob.job_id == job_id, self._due(now))
+                    .values(
+                        status="running",
+                        stage="starting",
+                        progress=5,
+                        attempts=ImageJob.attempts + 1,
+                        lease_expires_at=now + timedelta(seconds=self.lease_seconds),
+                        updated_at=now,
+                    )
+                )
+                session.commit()
+                if claimed.rowcount == 1:
+                    job = session.get(ImageJob, job_id)
+                    session.expunge(job)
+                    return job
+                # Another worker won the race; look for the next one.
+
+    def _update(self, job_id: str, **values: Any) -> None:
+        values["updated_at"] = _utcnow()
+        with Session(self.engine) as session:
+            session.execute(update(ImageJob).where(ImageJob.job_id == job_id).values(**values))
+            session.commit()
+
+    def _remove_source(self, job: ImageJob) -> None:
+        try:
+            os.remove(os.path.join(self.upload_dir, job.source_path))
+        except FileNotFoundError:
+            pass
+
+    async def _run(self, job: ImageJob) -> None:
+        async def report(stage: str, progress: int) -> None:
+            # Every progress report also renews the lease.
+            lease = _utcnow() + timedelta(seconds=self.lease_seconds)
+            await asyncio.to_thread(self._update, job.job_id, stage=stage, progress=progress, lease_expires_at=lease)
+
+        if job.attempts > job.max_attempts:
+            # Claimed again after its process died on the last allowed attempt.
+            await asyncio.to_thread(self._fail, job, job.error or "Gave up: processing kept crashing")
+            return
+        if not os.path.exists(os.path.join(self.upload_dir, job.source_path)):
+            await asyncio.to_thread(self._fail, job, "Source file is missing")
+            return
+
+        try:
+            result = await self.handler(job, report)
+        except asyncio.CancelledError:
+            raise
+        except JobFailed as exc:
+            await asyncio.to_thread(self._fail, job, str(exc))
+            return
+        except Exception as exc:
+            logger.warning("Image job %s attempt %d failed: %s", job.job_id, job.attempts, exc)
+            await asyncio.to_thread(self._retry_or_fail, job, str(exc) or type(exc).__name__)
+            return
+
+        if job.target_kind and result.get("url"):
+            await report("linking", 90)
+            result["target_updated"] = await asyncio.to_thread(self._apply_target, job, result["url"])
+        await asyncio.to_thread(self._succeed, job, result)
+
+    def _succeed(self, job: ImageJob, result: dict) -> None:
+        now = _utcnow()
+        self._update(
+            job.job_id, status="succeeded", stage="done", progress=100, error=None,
+            result_json=json.dumps(result), lease_expires_at=None, finished_at=now,
+        )
+        self._remove_source(job)
+
+    def _fail(self, job: ImageJob, error: str) -> None:
+        now = _utcnow()
+        self._update(
+            job.job_id, status="failed", stage="failed", error=error, lease_expires_at=None, finished_at=now,
+        )
+        self._remove_source(job)
+        logger.info("Image job %s failed: %s", job.job_id, error)
+
+    def _retry_or_fail(self, job: ImageJob, error: str) -> None:
+        if job.attempts >= job.max_attempts:
+            self._fail(job, error)
+            return
+        delay = min(self.retry_base_seconds * 2 ** (job.attempts - 1), _MAX_BACKOFF_SECONDS)
+        self._update(
+            job.job_id, status="queued", stage="retrying", progress=0, error=error, lease_expires_at=None,
+            next_attempt_at=_utcnow() + timedelta(seconds=delay),
+        )
+
+    def _apply_target(self, job: ImageJob, url: str) -> bool:
+        """Point the job's bottle / wine at the stored image; False when it no longer exists."""
+        if job.target_kind == "wine":
+            from ..db import init_wine_db, wine_engine
+
+            init_wine_db()
+            engine, model = wine_engine, WineBottle
+        else:
+            engine, model = self.engine, Bottle
+        with Session(engine) as session:
+            target = session.get(model, job.target_id)
+            if target is None:
+                logger.warning("Image job %s: %s %s is gone", job.job_id, job.target_kind, job.target_id)
+                return False
+            previous = target.image_url
+            target.image_url = url
+            target.updated_utc = _utcnow()
+            session.add(target)
+            if model is Bottle and previous != url:
+                session.add(BottleAudit(
+                    bottle_id=target.bottle_id,
+                    changed_by=job.created_by,
+                    changes_json=json.dumps({"image_url": {"from": previous, "to": url}}),
+                ))
+            session.commit()
+        return True
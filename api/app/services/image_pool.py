@@ -0,0 +1,124 @@
+"""
+Bounded process pool for CPU-heavy image work (RAW development, re-encoding).
+
+Jobs run in a ProcessPoolExecutor so decoding a 40 MB RAW never stalls the event
+loop. At most IMAGE_POOL_WORKERS jobs run at once and IMAGE_POOL_MAX_QUEUE more
+may wait; past that ``run`` raises PoolBusy straight away so callers can answer
+503 with Retry-After instead of piling up requests.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from threading import Lock
+from typing import Any, Callable, Optional
+
+from ..settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+class PoolBusy(Exception):
+    """Raised when the pool already holds its maximum number of running + queued jobs."""
+
+    def __init__(self, retry_after: int):
+        super().__init__("Image processing queue is full")
+        self.retry_after = retry_after
+
+
+class ImagePool:
+    def __init__(self, workers: int, max_queue: int, retry_after: int):
+        self.workers = max(1, workers)
+        self.max_queue = max(0, max_queue)
+        self.retry_after = max(1, retry_after)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = Lock()
+        self._in_flight = 0
+        self._peak = 0
+        self._counts = {"submitted": 0, "completed": 0, "failed": 0, "rejected": 0}
+
+    @property
+    def capacity(self) -> int:
+        return self.workers + self.max_queue
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn: forking a process that already runs threads (uvicorn, SQLAlchemy pools) is unsafe.
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._executor
+
+    def _release(self, future: Future) -> None:
+        # Runs when the job really finishes, even if the awaiting request was cancelled.
+        with self._lock:
+            self._in_flight -= 1
+            if future.cancelled() or future.exception() is not None:
+                self._counts["failed"] += 1
+            else:
+                self._counts["completed"] += 1
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """Run ``fn(*args)`` in a worker process; ``fn`` must be importable at module level."""
+        with self._lock:
+            if self._in_flight >= self.capacity:
+                self._counts["rejected"] += 1
+                raise PoolBusy(self.retry_after)
+            executor = self._get_executor()
+            try:
+                future = executor.submit(fn, *args)
+            except BrokenProcessPool:
+                logger.warning("Image pool was broken; starting a fresh one")
+                self._drop_executor(executor)
+                executor = self._get_executor()
+                future = executor.submit(fn, *args)
+            self._in_flight += 1
+            self._peak = max(self._peak, self._in_flight)
+            self._counts["submitted"] += 1
+        future.add_done_callback(self._release)
+
+        try:
+            return await asyncio.wrap_future(future)
+        except BrokenProcessPool:
+            # A worker died (e.g. OOM on a huge RAW); the next job gets a new pool.
+            with self._lock:
+                self._drop_executor(executor)
+            raise
+
+    def _drop_executor(self, executor: ProcessPoolExecutor) -> None:
+        """Shut down a broken executor; forget it only if it is still current. Call with the lock held."""
+        # A late awaiter of an older broken pool must not discard the healthy one that replaced it.
+        if self._executor is executor:
+            self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def metrics_snapshot(self) -> dict[str, int]:
+        """Queue depth and job counters, for the admin metrics endpoint."""
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "capacity": self.capacity,
+                "in_flight": self._in_flight,
+                "running": min(self._in_flight, self.workers),
+                "queued": max(0, self._in_flight - self.workers),
+                "peak_in_flight": self._peak,
+                **self._counts,
+            }
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+image_pool = ImagePool(
+    workers=settings.IMAGE_POOL_WORKERS,
+    max_queue=settings.IMAGE_POOL_MAX_QUEUE,
+    retry_after=settings.IMAGE_POOL_RETRY_AFTER_SECONDS,
+)
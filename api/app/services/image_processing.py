@@ -0,0 +1,124 @@
+"""
+CPU-bound image work. Everything here runs inside ``image_pool`` worker processes,
+so functions take and return plain paths/values and import heavy libraries lazily.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import io
+
+
+def _write_hashed(data: bytes, dest_path: str) -> str:
+    with open(dest_path, "wb") as out:
+        out.write(data)
+    return hashlib.sha256(data).hexdigest()
+
+
+def convert_dng_to_jpeg(src_path: str, dest_path: str) -> str:
+    """
+    Develop a DNG/phone RAW into an sRGB JPEG with sensible brightness/WB defaults.
+    Returns the SHA-256 of the written JPEG (hashed from memory, not re-read).
+    """
+    import numpy as np
+    import rawpy
+    from PIL import Image, ImageEnhance, ImageOps
+
+    with rawpy.imread(src_path) as raw:
+        # Use camera WB, allow auto-bright (prevents very dark results),
+        # gentle threshold, recover highlights, and output sRGB 8-bit.
+        rgb = raw.postprocess(
+            use_camera_wb=True,                     # better for phone RAW
+            no_auto_bright=False,                   # ENABLE auto brightness
+            auto_bright_thr=0.05,                   # nudge thr a bit
+            output_color=rawpy.ColorSpace.sRGB,
+            gamma=(2.222, 4.5),
+            output_bps=8,
+            highlight_mode=rawpy.HighlightMode.Blend,
+            demosaic_algorithm=rawpy.DemosaicAlgorithm.AHD,
+        )
+
+    # Optional: if still unusually dark, apply a light correction
+    # (kept very conservative to avoid blowing highlights)
+    mean_luma = float(np.asarray(rgb, dtype=np.float32).mean())
+    img = Image.fromarray(rgb)
+    if mean_luma < 70:  # 0..255 scale; tweak if desired
+        img = ImageOps.autocontrast(img, cutoff=1)
+        img = ImageEnhance.Brightness(img).enhance(1.12)
+
+    buf = io.BytesIO()
+    img.save(buf, format="JPEG", quality=90, optimize=True)
+    return _write_hashed(buf.getvalue(), dest_path)
+
+
+def transcode_heif(src_path: str, dest_path: str, fmt: str, max_edge: int, quality: int) -> str:
+    """
+    Re-encode a HEIC/HEIF photo as JPEG or WebP: orientation applied, EXIF (GPS,
+    device data) dropped, longest edge capped at ``max_edge``. The colour profile is
+    kept so Display P3 photos still render correctly. Returns the output's SHA-256.
+    """
+    import pillow_heif
+    from PIL import Image, ImageOps
+
+    pillow_heif.register_heif_opener()
+    with Image.open(src_path) as opened:
+        img = ImageOps.exif_transpose(opened)
+        icc_profile = opened.info.get("icc_profile")
+        if max_edge > 0:
+            img.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS, reducing_gap=3.0)
+        has_alpha = img.mode in ("RGBA", "LA")
+        img = img.convert("RGBA" if has_alpha and fmt == "webp" else "RGB")
+
+    buf = io.BytesIO()
+    if fmt == "webp":
+        img.save(buf, format="WEBP", quality=quality, method=4, icc_profile=icc_profile)
+    else:
+        img.save(buf, format="JPEG", quality=quality, optimize=True, icc_profile=icc_profile)
+    return _write_hashed(buf.getvalue(), dest_path)
+
+
+def render_variants(
+    src_path: str,
+    dest_dir: str,
+    variants: list[tuple[int, str]],
+    quality: int = 80,
+) -> list[dict]:
+    """
+    Write downscaled copies of ``src_path`` for each (width, format) pair, named by
+    ``image_variants.variant_name``. The source is decoded once and each size is
+    resized from the previous (larger) one; widths wider than the source are skipped
+    rather than upscaled. Files appear atomically (temp file + rename), so a killed
+    worker never leaves a truncated variant behind for the backfill to trust.
+    Returns ``[{"name", "width", "height", "format"}, ...]`` for the files written.
+    """
+    import os
+    import uuid
+
+    from PIL import Image, ImageOps
+
+    from .image_variants import variant_name
+
+    written: list[dict] = []
+    with Image.open(src_path) as opened:
+        img = ImageOps.exif_transpose(opened)
+        has_alpha = img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info)
+        img = img.convert("RGBA" if has_alpha else "RGB")
+        current = img
+        for width in sorted({w for w, _ in variants}, reverse=True):
+            if width > img.width:
+                continue
+            height = max(1, round(img.height * width / img.width))
+            if current.width != width:
+                current = current.resize((width, height), Image.Resampling.LANCZOS, reducing_gap=3.0)
+            for fmt in [f for w, f in variants if w == width]:
+                name = variant_name(src_path, width, fmt)
+                tmp = os.path.join(dest_dir, f"tmp_{uuid.uuid4().hex}")
+                try:
+                    options = {"method": 4} if fmt == "webp" else {"speed": 6}
+                    current.save(tmp, format=fmt.upper(), quality=quality, **options)
+                    os.replace(tmp, os.path.join(dest_dir, name))
+                finally:
+                    if os.path.exists(tmp):
+                        os.remove(tmp)
+                written.append({"name": name, "width": width, "height": height, "format": fmt})
+    return written
@@ -0,0 +1,110 @@
+"""
+Responsive image variants: naming, configuration and srcset manifests.
+
+Every stored upload ``<stem>.<ext>`` gets downscaled copies named
+``<stem>.w<width>.<format>`` next to it (one per configured width and format,
+never upscaled). Names are derived from the original, so whether an image still
+needs variants is just a matter of checking which files exist.
+"""
+
+from __future__ import annotations
+
+import os
+import re
+from typing import Any, Iterable, Optional
+
+from ..settings import settings
+
+MIME_TYPES = {"webp": "image/webp", "avif": "image/avif"}
+_VARIANT_RE = re.compile(r"\.w(\d+)\.(webp|avif)$")
+_ORIENTATION_TAG = 0x0112
+_ROTATED_ORIENTATIONS = {5, 6, 7, 8}   # orientations that swap width and height
+
+
+def configured_widths() -> list[int]:
+    widths = {int(w) for w in (settings.IMAGE_VARIANT_WIDTHS or "").replace(" ", "").split(",") if w.isdigit()}
+    return sorted(w for w in widths if w > 0)
+
+
+def configured_formats() -> list[str]:
+    """Requested variant formats that this Pillow build can actually encode."""
+    from PIL import features
+
+    wanted = [f.strip().lower() for f in (settings.IMAGE_VARIANT_FORMATS or "").split(",") if f.strip()]
+    return [fmt for fmt in dict.fromkeys(wanted) if fmt in MIME_TYPES and features.check(fmt)]
+
+
+def is_variant(name: str) -> bool:
+    return bool(_VARIANT_RE.search(name))
+
+
+def variant_name(original: str, width: int, fmt: str) -> str:
+    stem = os.path.splitext(os.path.basename(original))[0]
+    return f"{stem}.w{width}.{fmt}"
+
+
+def upright_width(img: Any) -> int:
+    """
+    Width of an opened PIL image once its EXIF orientation is applied, which is what
+    ``render_variants`` scales (it transposes first); only the header is read.
+    """
+    try:
+        orientation = img.getexif().get(_ORIENTATION_TAG)
+    except Exception:  # a malformed EXIF block is ignored by exif_transpose too
+        orientation = None
+    return img.height if orientation in _ROTATED_ORIENTATIONS else img.width
+
+
+def missing_variants(
+    directory: str,
+    original: str,
+    widths: Iterable[int],
+    formats: Iterable[str],
+    source_width: Optional[int] = None,
+) -> list[tuple[int, str]]:
+    """(width, format) pairs not yet on disk; widths above ``source_width`` are skipped when it is known."""
+    return [
+        (width, fmt)
+        for width in widths
+        for fmt in formats
+        if (source_width is None or width <= source_width)
+        and not os.path.exists(os.path.join(directory, variant_name(original, width, fmt)))
+    ]
+
+
+def existing_variants(directory: str, original: str, widths: Iterable[int], formats: Iterable[str]) -> list[dict[str, Any]]:
+    """Describe the variants of ``original`` already on disk (dimensions read from headers only)."""
+    from PIL import Image, UnidentifiedImageError
+
+    found: list[dict[str, Any]] = []
+    for width in widths:
+        for fmt in formats:
+            name = variant_name(original, width, fmt)
+            try:
+                with Image.open(os.path.join(directory, name)) as img:
+                    found.append({"name": name, "width": img.width, "height": img.height, "format": fmt})
+            except (FileNotFoundError, UnidentifiedImageError):
+                continue
+    return found
+
+
+def srcset_manifest(base_url: str, variants: Iterable[dict[str, Any]]) -> dict[str, Any]:
+    """
+    ``{"variants": [...], "srcset": {"image/webp": "<url> 160w, <url> 480w", ...}}`` for the
+    rendered variants (each a dict with name, width, height and format).
+    """
+    items = sorted(variants, key=lambda v: (v["format"], v["width"]))
+    entries = [
+        {
+            "url": f"{base_url}/{v['name']}",
+            "width": v["width"],
+            "height": v["height"],
+            "type": MIME_TYPES[v["format"]],
+        }
+        for v in items
+    ]
+    srcset: dict[str, str] = {}
+    for entry in entries:
+        part = f"{entry['url']} {entry['width']}w"
+        srcset[entry["type"]] = f"{srcset[entry['type']]}, {part}" if entry["type"] in srcset else part
+    return {"variants": entries, "srcset": srcset}
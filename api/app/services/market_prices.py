@@ -1,18 +1,32 @@
 from __future__ import annotations
 
 import logging
+import os
+import time
 from dataclasses import dataclass
 from datetime import datetime, timezone
-from typing import Any, Optional
+from itertools import chain
+from typing import Any, Iterable, Optional
+from zoneinfo import ZoneInfo
 
 import httpx
+from sqlalchemy import delete, desc, event, func, insert, nulls_last, select
+from sqlalchemy.orm import Session as OrmSession
 from sqlmodel import Session
 
-from ..models import MarketPrice
+from .. import server_timing
+from ..metrics import provider_duration, provider_errors
+from ..models import MarketPrice, MarketPriceLatest, MarketPriceReview
 from ..settings import settings
+from . import data_versions, price_alerts, price_screening
 
 logger = logging.getLogger(__name__)
 
+_TZ_NAME = os.getenv("TZ") or "UTC"
+_REFRESH_CHUNK = 500
+_STALE_UPCS_KEY = "market_price_stale_upcs"
+_LATEST_COLUMNS = ("barcode_upc", "price_id", "price", "currency", "source", "provider", "as_of", "fetched_at")
+
 
 @dataclass
 class ExternalQuote:
@@ -44,43 +58,160 @@ def _coerce_datetime(value: Any) -> Optional[datetime]:
     return None
 
 
-def fetch_external_quote(upc: str) -> Optional[ExternalQuote]:
+def ensure_timezone(value: Optional[datetime]) -> Optional[datetime]:
+    """Attach the server's local timezone (TZ) to naive timestamps."""
+    if value is None:
+        return None
+    if value.tzinfo is not None:
+        return value
+    try:
+        return value.replace(tzinfo=ZoneInfo(_TZ_NAME))
+    except Exception:
+        return value.replace(tzinfo=timezone.utc)
+
+
+def refresh_latest_prices(session: Session, upcs: Optional[Iterable[str]] = None) -> None:
     """
-    Attempt to fetch a market price quote from an external provider.
-    Returns None when the provider is not configured or any request error occurs.
+    Rebuild market_price_latest rows for the given UPCs (or every UPC when None).
+    Runs inside the caller's transaction; the caller is responsible for committing.
     """
-    url_template = settings.MARKET_PRICE_PROVIDER_URL
-    if not url_template:
-        return None
+    data_versions.mark_changed(session, data_versions.PRICES)
+    if upcs is not None:
+        upc_list = sorted({u for u in upcs if u})
+        price_screening.mark_stale(session, upc_list)
+        for start in range(0, len(upc_list), _REFRESH_CHUNK):
+            _rebuild_latest(session, upc_list[start:start + _REFRESH_CHUNK])
+        return
+    price_screening.mark_stale(session, None)
+    _rebuild_latest(session, None)
 
-    upc = (upc or "").strip()
-    if not upc:
-        return None
 
+def _rebuild_latest(session: Session, upcs: Optional[list[str]]) -> None:
+    # Targeted rebuilds (writes and ingests, not backfills) also evaluate price alerts
+    # for the UPCs that have rules, comparing the latest row before and after.
+    watched = price_alerts.watched(session, upcs) if upcs is not None else []
+    before = price_alerts.latest_rows(session, watched) if watched else {}
+
+    mp = MarketPrice.__table__
+    latest = MarketPriceLatest.__table__
+
+    clear = delete(latest)
+    rank = func.row_number().over(
+        partition_by=mp.c.barcode_upc,
+        order_by=(nulls_last(desc(mp.c.as_of)), desc(mp.c.fetched_at), desc(mp.c.price_id)),
+    )
+    ranked = select(*(mp.c[name] for name in _LATEST_COLUMNS), rank.label("rank"))
+
+    if upcs is not None:
+        clear = clear.where(latest.c.barcode_upc.in_(upcs))
+        ranked = ranked.where(mp.c.barcode_upc.in_(upcs))
+
+    ranked = ranked.subquery()
+    session.execute(clear)
+    session.execute(
+        insert(latest).from_select(
+            list(_LATEST_COLUMNS),
+            select(*(ranked.c[name] for name in _LATEST_COLUMNS)).where(ranked.c.rank == 1),
+        )
+    )
+    if watched:
+        price_alerts.evaluate_changes(session, before, price_alerts.latest_rows(session, watched))
+
+
+@event.listens_for(OrmSession, "before_flush")
+def _collect_stale_upcs(session: OrmSession, flush_context, instances) -> None:
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, MarketPrice) and obj.barcode_upc:
+            session.info.setdefault(_STALE_UPCS_KEY, set()).add(obj.barcode_upc)
+
+
+@event.listens_for(OrmSession, "after_flush")
+def _refresh_stale_upcs(session: OrmSession, flush_context) -> None:
+    # Any ORM write to market_price keeps market_price_latest in step, inside the same transaction.
+    upcs = session.info.pop(_STALE_UPCS_KEY, None)
+    if upcs:
+        refresh_latest_prices(session, upcs)
+
+
+def backfill_latest_prices(session: Session) -> None:
+    """Populate market_price_latest once for databases created before the table existed."""
+    has_latest = session.execute(select(MarketPriceLatest.barcode_upc).limit(1)).first()
+    if has_latest:
+        return
+    has_prices = session.execute(select(MarketPrice.price_id).limit(1)).first()
+    if not has_prices:
+        return
+    refresh_latest_prices(session)
+    session.commit()
+
+
+def fetch_provider_json(
+    url_template: str,
+    placeholders: dict[str, str],
+    *,
+    api_key: Optional[str] = None,
+    timeout: Optional[int] = None,
+    label: str = "provider",
+    provider: str = "market_price",
+) -> Any:
+    """
+    GET a provider endpoint and return its decoded JSON, or None on any failure.
+    ``{name}`` placeholders in the template are filled from ``placeholders``;
+    when the template has none they are sent as query parameters instead.
+    Latency and failures are recorded in the metrics under ``provider``.
+    """
     params: dict[str, Any] = {}
     final_url = url_template
-    if "{upc}" in url_template:
+    if any("{" + name + "}" in url_template for name in placeholders):
         try:
-            final_url = url_template.format(upc=upc)
+            final_url = url_template.format(**placeholders)
         except Exception as exc:
-            logger.warning("Failed to format MARKET_PRICE_PROVIDER_URL %s: %s", url_template, exc)
+            logger.warning("Failed to format provider URL %s: %s", url_template, exc)
             return None
     else:
-        params["upc"] = upc
+        params.update(placeholders)
 
     headers: dict[str, str] = {}
-    if settings.MARKET_PRICE_PROVIDER_API_KEY:
-        headers["Authorization"] = f"Bearer {settings.MARKET_PRICE_PROVIDER_API_KEY}"
-
-    timeout = settings.MARKET_PRICE_PROVIDER_TIMEOUT_SECONDS or 8
+    if api_key:
+        headers["Authorization"] = f"Bearer {api_key}"
 
+    started = time.perf_counter()
     try:
-        with httpx.Client(timeout=timeout) as client:
+        with httpx.Client(timeout=timeout or 8) as client:
             response = client.get(final_url, params=params, headers=headers)
         response.raise_for_status()
-        payload: Any = response.json()
+        return response.json()
     except Exception as exc:
-        logger.warning("External price lookup failed for UPC %s: %s", upc, exc)
+        provider_errors.inc(provider, type(exc).__name__)
+        logger.warning("External %s lookup failed: %s", label, exc)
+        return None
+    finally:
+        elapsed = time.perf_counter() - started
+        provider_duration.observe(elapsed, provider)
+        server_timing.record("provider", elapsed)
+
+
+def fetch_external_quote(upc: str) -> Optional[ExternalQuote]:
+    """
+    Attempt to fetch a market price quote from an external provider.
+    Returns None when the provider is not configured or any request error occurs.
+    """
+    url_template = settings.MARKET_PRICE_PROVIDER_URL
+    if not url_template:
+        return None
+
+    upc = (upc or "").strip()
+    if not upc:
+        return None
+
+    payload: Any = fetch_provider_json(
+        url_template,
+        {"upc": upc},
+        api_key=settings.MARKET_PRICE_PROVIDER_API_KEY,
+        timeout=settings.MARKET_PRICE_PROVIDER_TIMEOUT_SECONDS,
+        label=f"price for UPC {upc}",
+    )
+    if payload is None:
         return None
 
     if not isinstance(payload, dict):
@@ -123,6 +254,74 @@ def fetch_external_quote(upc: str) -> Optional[ExternalQuote]:
     )
 
 
+class QuoteQuarantined(Exception):
+    """Raised by ``persist_quote`` when screening held the quote for review instead of storing it."""
+
+    def __init__(self, review: MarketPriceReview):
+        super().__init__(f"Price for {review.barcode_upc} quarantined for review: {review.reason}")
+        self.review = review
+
+
+def _quote_fields(
+    quote: ExternalQuote,
+    *,
+    ingest_type: str,
+    created_by: Optional[str],
+    notes: Optional[str],
+) -> dict[str, Any]:
+    currency = quote.currency or "USD"
+    if isinstance(currency, str):
+        currency = currency.strip().upper() or "USD"
+    return {
+        "barcode_upc": quote.barcode_upc.strip(),
+        "price": quote.price,
+        "currency": currency,
+        "source": quote.source or quote.provider,
+        "provider": quote.provider,
+        "as_of": quote.as_of or datetime.now(timezone.utc),
+        "ingest_type": ingest_type,
+        "created_by": created_by,
+        "notes": notes,
+    }
+
+
+def persist_quotes(
+    session: Session,
+    quotes: Iterable[ExternalQuote],
+    *,
+    ingest_type: str = "provider",
+    created_by: Optional[str] = None,
+    notes: Optional[str] = None,
+) -> tuple[list[MarketPrice], list[MarketPriceReview]]:
+    """
+    Screen a batch of quotes against recent history and store them in one commit.
+    Accepted quotes become MarketPrice rows; outliers are quarantined as pending reviews.
+    """
+    fields = [_quote_fields(q, ingest_type=ingest_type, created_by=created_by, notes=notes) for q in quotes]
+    stored: list[MarketPrice] = []
+    held: list[MarketPriceReview] = []
+    for data, flag in zip(fields, price_screening.screen_prices(session, fields)):
+        if flag is None:
+            stored.append(MarketPrice(**data))
+        else:
+            held.append(MarketPriceReview(
+                **data,
+                reason=flag.reason,
+                baseline_price=flag.baseline_price,
+                score=flag.score,
+            ))
+    session.add_all([*stored, *held])
+    session.commit()
+    for record in (*stored, *held):
+        session.refresh(record)
+    for review in held:
+        logger.warning(
+            "Quarantined price %s %s for UPC %s: %s",
+            review.price, review.currency, review.barcode_upc, review.reason,
+        )
+    return stored, held
+
+
 def persist_quote(
     session: Session,
     quote: ExternalQuote,
@@ -133,26 +332,18 @@ def persist_quote(
 ) -> MarketPrice:
     """
     Store an ExternalQuote in the database and return the resulting MarketPrice row.
+    Raises QuoteQuarantined when screening holds it for review instead.
     """
     if quote is None:
         raise ValueError("quote must not be None")
 
-    currency = quote.currency or "USD"
-    if isinstance(currency, str):
-        currency = currency.strip().upper() or "USD"
-
-    record = MarketPrice(
-        barcode_upc=quote.barcode_upc.strip(),
-        price=quote.price,
-        currency=currency,
-        source=quote.source or quote.provider,
-        provider=quote.provider,
-        as_of=quote.as_of or datetime.now(timezone.utc),
+    stored, held = persist_quotes(
+        session,
+        [quote],
         ingest_type=ingest_type,
         created_by=created_by,
         notes=notes,
     )
-    session.add(record)
-    session.commit()
-    session.refresh(record)
-    return record
+    if held:
+        raise QuoteQuarantined(held[0])
+    return stored[0]
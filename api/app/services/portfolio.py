@@ -0,0 +1,222 @@
+"""Collection valuation rollup: cost basis vs. market value as of any date."""
+
+from __future__ import annotations
+
+from collections import OrderedDict
+from datetime import date, datetime, time, timedelta
+from threading import Lock
+from typing import Any, Optional
+
+import numpy as np
+from sqlalchemy import and_, case, desc, func, or_, select
+from sqlmodel import Session
+
+from ..models import Bottle, MarketPrice, MarketPriceLatest, Purchase, Retailer
+from ..settings import settings
+from . import data_versions, fx
+
+_METRICS = ("bottles", "valued_bottles", "cost_basis", "market_value", "unrealized_gain")
+_BREAKDOWNS = ("by_style", "by_region", "by_retailer")
+
+_CACHE_SIZE = 32
+_CACHE: "OrderedDict[Any, tuple[tuple[int, ...], dict[str, Any]]]" = OrderedDict()
+_CACHE_LOCK = Lock()
+
+
+def _prices_as_of(as_of: Optional[date]):
+    """Subquery of (barcode_upc, price, currency): the newest price per cataloged UPC on or before ``as_of``."""
+    if as_of is None:
+        latest = MarketPriceLatest.__table__
+        return select(latest.c.barcode_upc, latest.c.price, latest.c.currency).subquery("prices")
+
+    # One index seek on (barcode_upc, as_of) per distinct cataloged UPC instead of
+    # ranking the entire price history.
+    mp = MarketPrice.__table__
+    candidate = mp.alias("candidate")
+    bottle = Bottle.__table__
+    cutoff = datetime.combine(as_of + timedelta(days=1), time.min)
+    upcs = select(bottle.c.barcode_upc).where(bottle.c.barcode_upc.is_not(None)).distinct().subquery("upcs")
+    newest_id = (
+        select(candidate.c.price_id)
+        .where(candidate.c.barcode_upc == upcs.c.barcode_upc, candidate.c.as_of < cutoff)
+        .order_by(desc(candidate.c.as_of), desc(candidate.c.fetched_at), desc(candidate.c.price_id))
+        .limit(1)
+        .scalar_subquery()
+    )
+    return (
+        select(mp.c.barcode_upc, mp.c.price, mp.c.currency)
+        .select_from(upcs.join(mp, mp.c.price_id == newest_id))
+        .subquery("prices")
+    )
+
+
+def _holdings_query(as_of: Optional[date]):
+    """
+    One statement joining held purchases to their bottle, retailer and as-of market price,
+    pre-aggregated per (style, region, retailer, price currency).
+    A purchase counts as held on ``as_of`` when it was bought by then and not finished yet.
+    """
+    purchase = Purchase.__table__
+    bottle = Bottle.__table__
+    retailer = Retailer.__table__
+    prices = _prices_as_of(as_of)
+
+    qty = purchase.c.quantity
+    paid = purchase.c.price_paid
+    price = prices.c.price
+    both = and_(price.is_not(None), paid.is_not(None))
+    stmt = (
+        select(
+            bottle.c.style,
+            bottle.c.region,
+            retailer.c.name,
+            prices.c.currency,
+            func.sum(qty),
+            func.sum(case((price.is_not(None), qty), else_=0)),
+            func.sum(case((paid.is_not(None), qty * paid), else_=0.0)),
+            func.sum(case((price.is_not(None), qty * price), else_=0.0)),
+            # Gain is value minus cost over bottles with both, kept apart so each side converts on its own.
+            func.sum(case((both, qty * price), else_=0.0)),
+            func.sum(case((both, qty * paid), else_=0.0)),
+        )
+        .select_from(
+            purchase.join(bottle, bottle.c.bottle_id == purchase.c.bottle_id)
+            .outerjoin(retailer, retailer.c.retailer_id == purchase.c.retailer_id)
+            .outerjoin(prices, prices.c.barcode_upc == bottle.c.barcode_upc)
+        )
+        .group_by(bottle.c.style, bottle.c.region, retailer.c.name, prices.c.currency)
+    )
+    not_finished = or_(purchase.c.status.is_(None), purchase.c.status != "finished")
+    if as_of is None:
+        return stmt.where(purchase.c.killed_dt.is_(None), not_finished)
+
+    cutoff = datetime.combine(as_of + timedelta(days=1), time.min)
+    return stmt.where(
+        or_(purchase.c.purchase_date.is_(None), purchase.c.purchase_date <= as_of),
+        or_(purchase.c.killed_dt >= cutoff, and_(purchase.c.killed_dt.is_(None), not_finished)),
+    )
+
+
+class MissingCostRate(Exception):
+    """Raised when the cost basis (in COLLECTION_CURRENCY) cannot be converted to the requested currency."""
+
+    def __init__(self, source: str, target: str, as_of: Optional[date]):
+        super().__init__(f"No FX rate for {source}→{target} at {as_of.isoformat() if as_of else 'latest'}")
+
+
+def _empty_sums() -> dict[str, float]:
+    return dict.fromkeys(_METRICS, 0.0)
+
+
+def _summary_row(key: Optional[str], sums: dict[str, float]) -> dict[str, Any]:
+    return {
+        "key": key,
+        "bottles": int(sums["bottles"]),
+        "valued_bottles": int(sums["valued_bottles"]),
+        "cost_basis": round(sums["cost_basis"], 2),
+        "market_value": round(sums["market_value"], 2),
+        "unrealized_gain": round(sums["unrealized_gain"], 2),
+    }
+
+
+def _convert_groups(
+    session: Session,
+    rows: list,
+    as_of: Optional[date],
+    currency: Optional[str],
+) -> tuple[list, np.ndarray]:
+    """
+    Per-group (bottles, valued_bottles, cost_basis, market_value, unrealized_gain) as an array,
+    converted to ``currency`` at the as-of date's rates in one vectorized pass.
+    Groups whose price currency has no rate count as unvalued. Cost basis is all in
+    COLLECTION_CURRENCY, so without that rate no gain can be computed: ``MissingCostRate``.
+    """
+    labels = [row[:3] for row in rows]
+    if not rows:
+        return labels, np.zeros((0, len(_METRICS)))
+
+    raw = np.array([[float(v or 0) for v in row[4:]] for row in rows], dtype=np.float64)
+    qty, valued, cost, value, value_both, cost_both = raw.T
+    if currency is None:
+        return labels, np.column_stack((qty, valued, cost, value, value_both - cost_both))
+
+    days = fx.to_days([as_of] * len(rows))
+    table = fx.load_fx_table(session)
+    price_factor = table.convert(np.ones(len(rows)), fx.normalize_currencies(row[3] for row in rows), days, currency)
+    cost_factor = table.convert(np.ones(len(rows)), fx.normalize_currencies([settings.COLLECTION_CURRENCY]), days, currency)
+
+    if np.isnan(cost_factor).any() and cost.any():
+        raise MissingCostRate(settings.COLLECTION_CURRENCY.upper(), currency, as_of)
+
+    known = ~np.isnan(price_factor)
+    price_factor = np.where(known, price_factor, 0.0)
+    cost_factor = np.nan_to_num(cost_factor)
+    return labels, np.column_stack((
+        qty,
+        np.where(known, valued, 0.0),
+        cost * cost_factor,
+        value * price_factor,
+        np.where(known, value_both * price_factor - cost_both * cost_factor, 0.0),
+    ))
+
+
+def compute_portfolio(
+    session: Session,
+    as_of: Optional[date] = None,
+    currency: Optional[str] = None,
+) -> dict[str, Any]:
+    """
+    Total cost basis, market value and unrealized gain for the held collection,
+    broken down by style, region and retailer. ``price_paid`` is a per-bottle price.
+    Unrealized gain only covers bottles with both a purchase price and a market price.
+    With ``currency``, market prices and cost basis (recorded in COLLECTION_CURRENCY)
+    are converted at the as-of date's FX rates; otherwise amounts are summed as stored.
+    """
+    total = _empty_sums()
+    breakdowns: dict[str, dict[Optional[str], dict[str, float]]] = {name: {} for name in _BREAKDOWNS}
+
+    labels, metrics = _convert_groups(session, session.execute(_holdings_query(as_of)).all(), as_of, currency)
+    for (style, region, retailer), values in zip(labels, metrics.tolist()):
+        groups = {"by_style": style, "by_region": region, "by_retailer": retailer}
+        for name, value in zip(_METRICS, values):
+            total[name] += value
+            for field, label in groups.items():
+                bucket = breakdowns[field].get(label or None)
+                if bucket is None:
+                    bucket = breakdowns[field][label or None] = _empty_sums()
+                bucket[name] += value
+
+    result: dict[str, Any] = {
+        "as_of": as_of.isoformat() if as_of else None,
+        "currency": currency,
+        "total": _summary_row(None, total),
+    }
+    for field, groups in breakdowns.items():
+        rows = [_summary_row(key, sums) for key, sums in groups.items()]
+        rows.sort(key=lambda r: r["market_value"], reverse=True)
+        result[field] = rows
+    return result
+
+
+def portfolio_snapshot(
+    session: Session,
+    as_of: Optional[date] = None,
+    currency: Optional[str] = None,
+) -> dict[str, Any]:
+    """Cached ``compute_portfolio``; entries are dropped whenever purchases, prices or FX rates are committed."""
+    key = (as_of, currency)
+    version = data_versions.current(session, data_versions.PRICES, data_versions.COLLECTION, data_versions.FX)
+    with _CACHE_LOCK:
+        hit = _CACHE.get(key)
+        if hit and hit[0] == version:
+            _CACHE.move_to_end(key)
+            return hit[1]
+
+    result = compute_portfolio(session, as_of, currency)
+
+    with _CACHE_LOCK:
+        _CACHE[key] = (version, result)
+        _CACHE.move_to_end(key)
+        while len(_CACHE) > _CACHE_SIZE:
+            _CACHE.popitem(last=False)
+    return result
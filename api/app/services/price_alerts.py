@@ -0,0 +1,185 @@
+"""
+Price alert evaluation.
+
+Enabled rules are expanded to the UPCs they watch (directly, or through a
+bottle's style or tags) and kept in an index keyed by UPC, cached until any
+process commits a rule or collection change. Whenever market_price_latest is
+rebuilt for a set of UPCs, only the rules indexed under those UPCs are
+checked, all at once with NumPy, and every firing is recorded in price_alert
+within the same transaction.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from threading import Lock
+from typing import Iterable, Optional
+
+import numpy as np
+from sqlalchemy import func, insert, select
+from sqlmodel import Session
+
+from ..models import Bottle, BottleTag, MarketPriceLatest, PriceAlert, PriceAlertRule, Tag
+from . import data_versions
+
+ABOVE, BELOW, CHANGE_PCT = 0, 1, 2
+_KIND_CODES = {"above": ABOVE, "below": BELOW, "change_pct": CHANGE_PCT}
+
+LatestRow = tuple[int, Optional[float], str]  # (price_id, price, currency)
+
+
+@dataclass
+class RuleIndex:
+    rule_ids: np.ndarray = field(default_factory=lambda: np.array([], dtype=np.int64))
+    kinds: np.ndarray = field(default_factory=lambda: np.array([], dtype=np.int8))
+    thresholds: np.ndarray = field(default_factory=lambda: np.array([], dtype=np.float64))
+    by_upc: dict[str, np.ndarray] = field(default_factory=dict)  # UPC -> positions in the arrays above
+
+
+_CACHE: dict[str, tuple[tuple[int, ...], RuleIndex]] = {}
+_CACHE_LOCK = Lock()
+
+
+def _build_index(session: Session) -> RuleIndex:
+    rules = session.execute(
+        select(
+            PriceAlertRule.rule_id,
+            PriceAlertRule.scope,
+            PriceAlertRule.target,
+            PriceAlertRule.kind,
+            PriceAlertRule.threshold,
+        ).where(PriceAlertRule.enabled.is_(True))
+    ).all()
+    if not rules:
+        return RuleIndex()
+
+    # Expand style/tag targets (case-insensitive) to the UPCs of matching bottles.
+    bottle = Bottle.__table__
+    targets = {scope: {target.strip().lower() for _, s, target, _, _ in rules if s == scope} for scope in ("style", "tag")}
+    upcs_for: dict[tuple[str, str], list[str]] = {}
+    if targets["style"]:
+        style = func.lower(func.trim(bottle.c.style))
+        for upc, key in session.execute(
+            select(bottle.c.barcode_upc, style).where(bottle.c.barcode_upc.is_not(None), style.in_(targets["style"]))
+        ):
+            upcs_for.setdefault(("style", key), []).append(upc.strip())
+    if targets["tag"]:
+        tag = Tag.__table__
+        link = BottleTag.__table__
+        name = func.lower(func.trim(tag.c.name))
+        for upc, key in session.execute(
+            select(bottle.c.barcode_upc, name)
+            .select_from(bottle.join(link, link.c.bottle_id == bottle.c.bottle_id).join(tag, tag.c.tag_id == link.c.tag_id))
+            .where(bottle.c.barcode_upc.is_not(None), name.in_(targets["tag"]))
+        ):
+            upcs_for.setdefault(("tag", key), []).append(upc.strip())
+
+    positions: dict[str, list[int]] = {}
+    for pos, (_, scope, target, _, _) in enumerate(rules):
+        if scope == "upc":
+            upcs: Iterable[str] = (target.strip(),)
+        else:
+            upcs = set(upcs_for.get((scope, target.strip().lower()), ()))
+        for upc in upcs:
+            positions.setdefault(upc, []).append(pos)
+
+    return RuleIndex(
+        rule_ids=np.array([r[0] for r in rules], dtype=np.int64),
+        kinds=np.array([_KIND_CODES[r[3]] for r in rules], dtype=np.int8),
+        thresholds=np.array([r[4] for r in rules], dtype=np.float64),
+        by_upc={upc: np.array(pos, dtype=np.int64) for upc, pos in positions.items()},
+    )
+
+
+def load_rule_index(session: Session) -> RuleIndex:
+    """UPC -> candidate rules, rebuilt only after rules, bottles or tags change."""
+    version = data_versions.current(session, data_versions.ALERT_RULES, data_versions.COLLECTION)
+    with _CACHE_LOCK:
+        hit = _CACHE.get("index")
+        if hit and hit[0] == version:
+            return hit[1]
+    index = _build_index(session)
+    with _CACHE_LOCK:
+        _CACHE["index"] = (version, index)
+    return index
+
+
+def watched(session: Session, upcs: Iterable[str]) -> list[str]:
+    """The subset of ``upcs`` that at least one enabled rule applies to."""
+    by_upc = load_rule_index(session).by_upc
+    if not by_upc:
+        return []
+    return [upc for upc in upcs if upc in by_upc]
+
+
+def latest_rows(session: Session, upcs: list[str]) -> dict[str, LatestRow]:
+    latest = MarketPriceLatest.__table__
+    rows = session.execute(
+        select(latest.c.barcode_upc, latest.c.price_id, latest.c.price, latest.c.currency)
+        .where(latest.c.barcode_upc.in_(upcs))
+    )
+    return {upc: (price_id, price, currency or "USD") for upc, price_id, price, currency in rows}
+
+
+def evaluate_changes(
+    session: Session,
+    before: dict[str, LatestRow],
+    after: dict[str, LatestRow],
+) -> int:
+    """
+    Check the rules indexed under every UPC whose latest price changed and record firings;
+    a correction of the latest row's price or currency counts as a change too.
+    above/below fire when the price crosses the threshold (or the first price is already past it);
+    change_pct fires when the move from the previous latest price, in the same currency,
+    is at least ``threshold`` percent. Returns the number of alerts recorded.
+    """
+    index = load_rule_index(session)
+    changed = [
+        upc for upc, row in after.items()
+        if row[1] is not None and upc in index.by_upc and before.get(upc) != row
+    ]
+    if not changed:
+        return 0
+
+    candidates = [index.by_upc[upc] for upc in changed]
+    rule_pos = np.concatenate(candidates)
+    owner = np.repeat(np.arange(len(changed)), [len(c) for c in candidates])
+
+    new = np.array([after[upc][1] for upc in changed], dtype=np.float64)
+    old = np.array([
+        before[upc][1] if upc in before and before[upc][1] is not None and before[upc][2] == after[upc][2] else np.nan
+        for upc in changed
+    ], dtype=np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        pct = np.where(old > 0, (new - old) / old * 100.0, np.nan)
+
+    new_p, old_p, pct_p = new[owner], old[owner], pct[owner]
+    kinds, thresholds = index.kinds[rule_pos], index.thresholds[rule_pos]
+    fire = (
+        ((kinds == ABOVE) & (new_p >= thresholds) & ~(old_p >= thresholds))
+        | ((kinds == BELOW) & (new_p <= thresholds) & ~(old_p <= thresholds))
+        | ((kinds == CHANGE_PCT) & (np.abs(pct_p) >= thresholds))
+    )
+    hits = np.flatnonzero(fire)
+    if not len(hits):
+        return 0
+
+    triggered_at = datetime.now(timezone.utc)
+    session.execute(
+        insert(PriceAlert.__table__),
+        [
+            {
+                "rule_id": int(index.rule_ids[rule_pos[i]]),
+                "barcode_upc": changed[owner[i]],
+                "price_id": after[changed[owner[i]]][0],
+                "price": float(new_p[i]),
+                "previous_price": None if np.isnan(old_p[i]) else float(old_p[i]),
+                "currency": after[changed[owner[i]]][2],
+                "change_pct": None if np.isnan(pct_p[i]) else round(float(pct_p[i]), 2),
+                "triggered_at": triggered_at,
+            }
+            for i in hits
+        ],
+    )
+    return len(hits)
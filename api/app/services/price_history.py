@@ -0,0 +1,113 @@
+"""Server-side downsampling of market price history into OHLC-style buckets."""
+
+from __future__ import annotations
+
+from datetime import date, datetime, time, timedelta
+from typing import Any, Literal, Optional, Sequence
+
+import numpy as np
+from sqlalchemy import select
+from sqlmodel import Session
+
+from ..models import MarketPrice
+from . import fx
+
+Bucket = Literal["day", "week", "month"]
+
+
+def _bucket_starts(stamps: np.ndarray, bucket: Bucket) -> np.ndarray:
+    """Map datetime64 stamps to the datetime64[D] start of their bucket (weeks start Monday)."""
+    if bucket == "month":
+        return stamps.astype("datetime64[M]").astype("datetime64[D]")
+    days = stamps.astype("datetime64[D]")
+    if bucket == "week":
+        # 1970-01-01 was a Thursday; shift by 3 days so integer weeks begin on Monday.
+        ordinals = days.astype(np.int64)
+        return (((ordinals + 3) // 7) * 7 - 3).astype("datetime64[D]")
+    return days
+
+
+def downsample(
+    as_of: np.ndarray | Sequence[datetime],
+    prices: Sequence[float],
+    bucket: Bucket,
+) -> list[dict[str, Any]]:
+    """
+    Collapse time-ordered (as_of, price) samples into per-bucket open/close/min/max/mean/count.
+    ``as_of`` holds stored wall-clock (naive) times, as a datetime64 array or datetimes, and
+    must already be sorted; everything below is vectorized.
+    """
+    if not len(as_of):
+        return []
+
+    stamps = np.asarray(as_of, dtype="datetime64[us]")
+    values = np.asarray(prices, dtype=np.float64)
+    keys = _bucket_starts(stamps, bucket)
+
+    # Bucket boundaries: first index of each run of equal keys (input is sorted).
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    ends = np.r_[starts[1:], len(keys)] - 1
+    counts = ends - starts + 1
+    sums = np.add.reduceat(values, starts)
+
+    return [
+        {
+            "bucket": key.isoformat(),
+            "open": float(o),
+            "close": float(c),
+            "min": float(lo),
+            "max": float(hi),
+            "mean": float(m),
+            "count": int(n),
+        }
+        for key, o, c, lo, hi, m, n in zip(
+            keys[starts].tolist(),
+            values[starts],
+            values[ends],
+            np.minimum.reduceat(values, starts),
+            np.maximum.reduceat(values, starts),
+            sums / counts,
+            counts,
+        )
+    ]
+
+
+def load_price_series(
+    session: Session,
+    upc: str,
+    *,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    currency: Optional[str] = None,
+) -> tuple[np.ndarray, list[float]]:
+    """
+    Fetch just the (as_of, price) columns for one UPC, ordered via the (barcode_upc, as_of) index;
+    as_of comes back as a datetime64[us] array of the stored (naive) values.
+    With ``currency``, prices are converted at each sample's as-of rate and samples without a rate are dropped.
+    """
+    stmt = (
+        select(MarketPrice.as_of, MarketPrice.price, MarketPrice.currency)
+        .where(
+            MarketPrice.barcode_upc == upc,
+            MarketPrice.as_of.is_not(None),
+            MarketPrice.price.is_not(None),
+        )
+        .order_by(MarketPrice.as_of, MarketPrice.price_id)
+    )
+    if start is not None:
+        stmt = stmt.where(MarketPrice.as_of >= datetime.combine(start, time.min))
+    if end is not None:
+        stmt = stmt.where(MarketPrice.as_of < datetime.combine(end + timedelta(days=1), time.min))
+
+    rows = session.execute(stmt).all()
+    if not rows:
+        return np.array([], dtype="datetime64[us]"), []
+    as_of, prices, currencies = zip(*rows)
+    stamps = np.array(as_of, dtype="datetime64[us]")   # SQLite returns naive wall-clock datetimes
+    if currency is None:
+        return stamps, list(prices)
+
+    days = stamps.astype("datetime64[D]").astype(np.int64)
+    converted = fx.convert(session, prices, currencies, days, currency)
+    keep = ~np.isnan(converted)
+    return stamps[keep], converted[keep].tolist()
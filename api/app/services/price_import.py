@@ -0,0 +1,249 @@
+"""Streaming CSV ingestion into market_price."""
+
+from __future__ import annotations
+
+import csv
+import io
+from datetime import datetime, timezone
+from typing import IO, Any, Optional
+
+from pydantic import ValidationError
+from sqlalchemy import desc, func, insert, select
+from sqlmodel import Session
+
+from ..market_price_schemas import (
+    MarketPriceBase,
+    MarketPriceImportError,
+    MarketPriceImportResult,
+)
+from ..models import MarketPrice, MarketPriceReview
+from .market_prices import ensure_timezone, refresh_latest_prices
+from .price_screening import screen_prices
+
+BATCH_SIZE = 1000
+_QUERY_CHUNK = 500   # UPCs per IN list; a batch can hold more than SQLite's 999 bound parameters
+MAX_REPORTED_ERRORS = 50
+CSV_COLUMNS = ("barcode_upc", "price", "currency", "source", "provider", "as_of", "notes")
+
+DedupeKey = tuple[str, Optional[datetime], Optional[str]]
+LatestQuote = tuple[datetime, Optional[float], str]   # (as_of, price, currency) of the newest row
+
+
+def _dedupe_key(upc: str, as_of: Optional[datetime], provider: Optional[str]) -> DedupeKey:
+    # SQLite stores datetimes without tzinfo, so compare on the stored wall-clock value.
+    return (upc, as_of.replace(tzinfo=None) if as_of else None, provider)
+
+
+def _validation_message(exc: ValidationError) -> str:
+    parts = []
+    for err in exc.errors():
+        field = ".".join(str(loc) for loc in err.get("loc", ())) or "row"
+        parts.append(f"{field}: {err.get('msg')}")
+    return "; ".join(parts)
+
+
+def _row_to_record(row: dict[str, Optional[str]], *, created_by: Optional[str]) -> dict[str, Any]:
+    """The market_price values for a CSV row; ``as_of`` stays None for undated rows."""
+    data = {}
+    for name in CSV_COLUMNS:
+        value = (row.get(name) or "").strip()
+        if value:
+            data[name] = value
+    payload = MarketPriceBase.model_validate(data)
+    return {
+        "barcode_upc": payload.barcode_upc,
+        "price": payload.price,
+        "currency": payload.currency or "USD",
+        "source": payload.source,
+        "provider": payload.provider or payload.source,
+        "as_of": ensure_timezone(payload.as_of),
+        "notes": payload.notes,
+        "ingest_type": "csv",
+        "created_by": created_by,
+    }
+
+
+def _latest_quotes(session: Session, upcs: set[str]) -> dict[tuple[str, Optional[str]], LatestQuote]:
+    """Newest stored (as_of, price, currency) per (barcode_upc, provider), across market_price and the review queue."""
+    latest: dict[tuple[str, Optional[str]], LatestQuote] = {}
+    upc_list = sorted(upcs)
+    for table in (MarketPrice.__table__, MarketPriceReview.__table__):
+        rank = func.row_number().over(
+            partition_by=(table.c.barcode_upc, table.c.provider), order_by=desc(table.c.as_of)
+        )
+        for start in range(0, len(upc_list), _QUERY_CHUNK):
+            ranked = select(
+                table.c.barcode_upc, table.c.provider, table.c.as_of, table.c.price, table.c.currency, rank.label("rank")
+            ).where(
+                table.c.barcode_upc.in_(upc_list[start:start + _QUERY_CHUNK]), table.c.as_of.is_not(None)
+            ).subquery()
+            rows = session.execute(
+                select(ranked.c.barcode_upc, ranked.c.provider, ranked.c.as_of, ranked.c.price, ranked.c.currency)
+                .where(ranked.c.rank == 1)
+            )
+            for upc, provider, as_of, price, currency in rows:
+                current = latest.get((upc, provider))
+                if current is None or as_of > current[0]:
+                    latest[(upc, provider)] = (as_of, price, (currency or "USD").upper())
+    return latest
+
+
+def _drop_repeated_undated(
+    session: Session, undated: list[dict[str, Any]], imported_at: datetime
+) -> list[dict[str, Any]]:
+    """
+    Keep the undated rows whose price differs from the newest stored quote of the same
+    (UPC, provider): a sheet re-imported later must not add the same price again under
+    a new import time. Kept rows are stamped with ``imported_at``.
+    """
+    latest = _latest_quotes(session, {rec["barcode_upc"] for rec in undated})
+    stamp = imported_at.replace(tzinfo=None)
+    fresh = []
+    for rec in undated:
+        key = (rec["barcode_upc"], rec["provider"])
+        current = latest.get(key)
+        if current is not None and (current[1], current[2]) == (rec["price"], rec["currency"].upper()):
+            continue
+        latest[key] = (stamp, rec["price"], rec["currency"].upper())
+        fresh.append({**rec, "as_of": imported_at})
+    return fresh
+
+
+def _drop_existing_dated(session: Session, dated: list[dict[str, Any]]) -> list[dict[str, Any]]:
+    """Keep the dated rows not already stored (by UPC, as_of, provider) in market_price or the review queue."""
+    if not dated:
+        return []
+    upcs = sorted({rec["barcode_upc"] for rec in dated})
+    # A range keeps this to one (barcode_upc, as_of) index seek per UPC; an IN list of
+    # timestamps would probe every UPC x timestamp pair.
+    wall_clock = [rec["as_of"].replace(tzinfo=None) for rec in dated]
+    seen: set[DedupeKey] = set()
+    for table in (MarketPrice.__table__, MarketPriceReview.__table__):
+        for start in range(0, len(upcs), _QUERY_CHUNK):
+            existing_rows = session.execute(
+                select(table.c.barcode_upc, table.c.as_of, table.c.provider).where(
+                    table.c.barcode_upc.in_(upcs[start:start + _QUERY_CHUNK]),
+                    table.c.as_of.between(min(wall_clock), max(wall_clock)),
+                )
+            )
+            seen.update(_dedupe_key(*row) for row in existing_rows)
+
+    fresh: list[dict[str, Any]] = []
+    for rec in dated:
+        key = _dedupe_key(rec["barcode_upc"], rec["as_of"], rec["provider"])
+        if key in seen:
+            continue
+        seen.add(key)
+        fresh.append(rec)
+    return fresh
+
+
+def _flush_batch(
+    session: Session, batch: list[dict[str, Any]], imported_at: datetime
+) -> tuple[list[dict[str, Any]], int]:
+    """
+    Drop rows that are already stored (see ``_drop_existing_dated`` and
+    ``_drop_repeated_undated``), screen the rest, insert accepted rows and quarantine
+    outliers. Returns (inserted rows, quarantined count).
+    """
+    if not batch:
+        return [], 0
+
+    fresh = _drop_existing_dated(session, [rec for rec in batch if rec["as_of"] is not None])
+    undated = [rec for rec in batch if rec["as_of"] is None]
+    if undated:
+        fresh += _drop_repeated_undated(session, undated, imported_at)
+
+    accepted: list[dict[str, Any]] = []
+    held: list[dict[str, Any]] = []
+    for rec, flag in zip(fresh, screen_prices(session, fresh)):
+        if flag is None:
+            accepted.append(rec)
+        else:
+            held.append({**rec, "reason": flag.reason, "baseline_price": flag.baseline_price, "score": flag.score})
+
+    if accepted:
+        session.execute(insert(MarketPrice.__table__), accepted)
+    if held:
+        session.execute(insert(MarketPriceReview.__table__), held)
+    return accepted, len(held)
+
+
+def import_price_csv(
+    session: Session,
+    stream: IO[bytes],
+    *,
+    created_by: Optional[str] = None,
+    commit: bool = True,
+    batch_size: int = BATCH_SIZE,
+) -> MarketPriceImportResult:
+    """
+    Stream-parse a price CSV from a binary file object and bulk-insert it into market_price.
+
+    Rows are validated with MarketPriceBase, deduplicated against existing
+    (barcode_upc, as_of, provider) rows, and inserted in batches of ``batch_size``
+    within a single transaction so memory stays flat regardless of file size
+    (only the set of touched UPCs is kept, to refresh latest prices at the end).
+    Rows that break sharply from a UPC's stored history are quarantined for review.
+    Rows without an as_of are stamped with the import time, and skipped when the
+    newest stored quote for the same (barcode_upc, provider) already has their price
+    and currency, so re-importing an undated sheet does not duplicate it.
+    Set ``commit=False`` for a dry run that rolls everything back.
+    """
+    rows = invalid = inserted = quarantined = 0
+    errors: list[MarketPriceImportError] = []
+    touched: set[str] = set()
+    imported_at = datetime.now(timezone.utc)
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+
+    try:
+        reader = csv.DictReader(text)
+        if not reader.fieldnames:
+            raise ValueError("CSV file is empty")
+        reader.fieldnames = [(name or "").strip().lower() for name in reader.fieldnames]
+        if "barcode_upc" not in reader.fieldnames:
+            raise ValueError("CSV header must include a barcode_upc column")
+
+        batch: list[dict[str, Any]] = []
+        for row in reader:
+            rows += 1
+            try:
+                batch.append(_row_to_record(row, created_by=created_by))
+            except ValidationError as exc:
+                invalid += 1
+                if len(errors) < MAX_REPORTED_ERRORS:
+                    errors.append(MarketPriceImportError(line=reader.line_num, detail=_validation_message(exc)))
+                continue
+
+            if len(batch) >= batch_size:
+                fresh, held = _flush_batch(session, batch, imported_at)
+                inserted += len(fresh)
+                quarantined += held
+                touched.update(rec["barcode_upc"] for rec in fresh)
+                batch = []
+
+        fresh, held = _flush_batch(session, batch, imported_at)
+        inserted += len(fresh)
+        quarantined += held
+        touched.update(rec["barcode_upc"] for rec in fresh)
+        refresh_latest_prices(session, touched)
+
+        if commit:
+            session.commit()
+        else:
+            session.rollback()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        # Leave the caller's file object open.
+        text.detach()
+
+    return MarketPriceImportResult(
+        rows=rows,
+        inserted=inserted,
+        quarantined=quarantined,
+        duplicates=rows - invalid - inserted - quarantined,
+        invalid=invalid,
+        errors=errors,
+    )
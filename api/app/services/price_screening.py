@@ -0,0 +1,191 @@
+"""
+Anomaly screening for incoming market prices.
+
+Each incoming price is compared with the most recent accepted prices for the same
+UPC and currency using a robust z-score over log prices (median / MAD), so a
+quote that is 100x off or a placeholder zero is quarantined for review instead
+of becoming the latest value. Screening is done per batch: windows for every
+UPC in the batch are loaded with one query (and kept in an LRU until that
+UPC's prices change), then all scores are computed with NumPy at once.
+
+The LRU is tagged with the prices data version it was loaded at. This
+process's own commits evict just the UPCs they touched and advance the tag;
+a version bumped by any other process (another worker, the import script)
+clears the whole LRU on the next lookup.
+"""
+
+from __future__ import annotations
+
+import warnings
+from collections import OrderedDict
+from dataclasses import dataclass
+from threading import Lock
+from typing import Any, Iterable, Mapping, Optional, Sequence
+
+import numpy as np
+from sqlalchemy import desc, event, func, nulls_last, select
+from sqlalchemy.orm import Session as OrmSession
+from sqlmodel import Session
+
+from ..models import MarketPrice
+from ..settings import settings
+from . import data_versions
+
+WINDOW = 20               # recent prices per UPC to compare against
+MIN_HISTORY = 3           # fewer same-currency prices than this and a quote is accepted as-is
+MIN_LOG_SPREAD = 0.0953   # log(1.1): MAD floor so flat histories still allow ordinary moves
+_MAD_SCALE = 0.6745       # makes MAD comparable to a standard deviation
+_QUERY_CHUNK = 500
+_CACHE_SIZE = 20_000
+_STALE_KEY = "price_screening_stale_upcs"
+
+
+@dataclass
+class ScreenResult:
+    reason: str
+    baseline_price: Optional[float] = None
+    score: Optional[float] = None
+
+
+Window = tuple[np.ndarray, np.ndarray]  # (currencies, prices), newest first
+
+_WINDOWS: "OrderedDict[str, Window]" = OrderedDict()
+_WINDOWS_VERSION: Optional[int] = None   # prices version the cached windows were loaded at
+_WINDOWS_LOCK = Lock()
+
+
+def _query_windows(session: Session, upcs: list[str]) -> dict[str, Window]:
+    mp = MarketPrice.__table__
+    rank = func.row_number().over(
+        partition_by=mp.c.barcode_upc,
+        order_by=(nulls_last(desc(mp.c.as_of)), desc(mp.c.fetched_at), desc(mp.c.price_id)),
+    )
+    found: dict[str, tuple[list[str], list[float]]] = {upc: ([], []) for upc in upcs}
+    for start in range(0, len(upcs), _QUERY_CHUNK):
+        ranked = (
+            select(mp.c.barcode_upc, mp.c.currency, mp.c.price, rank.label("rank"))
+            .where(mp.c.barcode_upc.in_(upcs[start:start + _QUERY_CHUNK]), mp.c.price > 0)
+            .subquery()
+        )
+        rows = session.execute(
+            select(ranked.c.barcode_upc, ranked.c.currency, ranked.c.price)
+            .where(ranked.c.rank <= WINDOW)
+            .order_by(ranked.c.barcode_upc, ranked.c.rank)
+        )
+        for upc, currency, price in rows:
+            currencies, prices = found[upc]
+            currencies.append((currency or "USD").upper())
+            prices.append(price)
+    return {
+        upc: (np.array(currencies, dtype=str), np.array(prices, dtype=np.float64))
+        for upc, (currencies, prices) in found.items()
+    }
+
+
+def load_windows(session: Session, upcs: Iterable[str]) -> dict[str, Window]:
+    """Recent accepted prices per UPC; cache misses are fetched together in one query per chunk."""
+    global _WINDOWS_VERSION
+    wanted = sorted({u for u in upcs if u})
+    (version,) = data_versions.current(session, data_versions.PRICES)
+    windows: dict[str, Window] = {}
+    with _WINDOWS_LOCK:
+        if _WINDOWS_VERSION is None or version > _WINDOWS_VERSION:
+            _WINDOWS.clear()
+            _WINDOWS_VERSION = version
+        # A reader on an older snapshot neither uses nor fills the newer cache.
+        if version == _WINDOWS_VERSION:
+            for upc in wanted:
+                hit = _WINDOWS.get(upc)
+                if hit is not None:
+                    _WINDOWS.move_to_end(upc)
+                    windows[upc] = hit
+    missing = [upc for upc in wanted if upc not in windows]
+    if missing:
+        loaded = _query_windows(session, missing)
+        windows.update(loaded)
+        with _WINDOWS_LOCK:
+            if version == _WINDOWS_VERSION:
+                _WINDOWS.update(loaded)
+                while len(_WINDOWS) > _CACHE_SIZE:
+                    _WINDOWS.popitem(last=False)
+    return windows
+
+
+def screen_prices(session: Session, records: Sequence[Mapping[str, Any]]) -> list[Optional[ScreenResult]]:
+    """
+    Screen incoming price records (barcode_upc, price, currency) against stored history.
+    Returns one entry per record: None to accept, or why it should be quarantined.
+    Records are compared with committed history only, not with each other.
+    """
+    results: list[Optional[ScreenResult]] = [None] * len(records)
+    if not records or not settings.PRICE_SCREEN_ENABLED:
+        return results
+
+    prices = np.array([np.nan if r.get("price") is None else r["price"] for r in records], dtype=np.float64)
+    for i in np.flatnonzero(prices <= 0):
+        results[i] = ScreenResult(reason="non-positive price")
+
+    candidates = np.flatnonzero(prices > 0)
+    if not len(candidates):
+        return results
+
+    windows = load_windows(session, (records[i]["barcode_upc"] for i in candidates))
+    history = np.full((len(candidates), WINDOW), np.nan)
+    for row, i in enumerate(candidates):
+        currencies, window_prices = windows.get(records[i]["barcode_upc"], (None, None))
+        if window_prices is None or not len(window_prices):
+            continue
+        same = window_prices[currencies == (records[i].get("currency") or "USD").upper()]
+        history[row, :len(same)] = same
+
+    enough = np.count_nonzero(~np.isnan(history), axis=1) >= MIN_HISTORY
+    if not enough.any():
+        return results
+
+    candidates, logs = candidates[enough], np.log(history[enough])
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        median = np.nanmedian(logs, axis=1)
+        mad = np.nanmedian(np.abs(logs - median[:, None]), axis=1)
+    spread = np.maximum(mad, MIN_LOG_SPREAD)
+    scores = _MAD_SCALE * (np.log(prices[candidates]) - median) / spread
+
+    limit = settings.PRICE_SCREEN_MAX_SCORE
+    for i, score, baseline in zip(candidates, scores, np.exp(median)):
+        if abs(score) > limit:
+            direction = "above" if score > 0 else "below"
+            results[i] = ScreenResult(
+                reason=f"robust z-score {abs(score):.1f} {direction} the recent median",
+                baseline_price=round(float(baseline), 2),
+                score=round(float(score), 2),
+            )
+    return results
+
+
+def mark_stale(session: Session, upcs: Optional[Iterable[str]]) -> None:
+    """Drop cached windows for ``upcs`` (or all when None) when the session's transaction ends."""
+    stale = session.info.setdefault(_STALE_KEY, set())
+    if upcs is None:
+        stale.add(None)
+    else:
+        stale.update(upcs)
+
+
+@event.listens_for(OrmSession, "after_commit")
+@event.listens_for(OrmSession, "after_rollback")
+def _evict_stale(session: OrmSession) -> None:
+    # Evict on rollback too: windows loaded mid-transaction may include rows that never landed.
+    global _WINDOWS_VERSION
+    stale = session.info.pop(_STALE_KEY, None)
+    if not stale:
+        return
+    version = data_versions.bumped(session).get(data_versions.PRICES)
+    with _WINDOWS_LOCK:
+        if None in stale:
+            _WINDOWS.clear()
+            return
+        for upc in stale:
+            _WINDOWS.pop(upc, None)
+        # Only when our commit was the sole change since the cache was loaded is it still current.
+        if version is not None and _WINDOWS_VERSION == version - 1:
+            _WINDOWS_VERSION = version
@@ -0,0 +1,67 @@
+"""
+In-process background jobs (APScheduler).
+
+Jobs run on a small thread pool inside the API process and are only registered
+when their interval setting is positive, so a default install starts nothing.
+"""
+
+from __future__ import annotations
+
+import logging
+from typing import Optional
+
+from apscheduler.schedulers.background import BackgroundScheduler
+from sqlmodel import Session
+
+from ..settings import settings
+
+logger = logging.getLogger(__name__)
+
+_scheduler: Optional[BackgroundScheduler] = None
+
+
+def run_upload_gc(upload_dir: str) -> None:
+    from ..db import engine
+    from .upload_gc import collect_garbage
+    from .upload_sessions import UploadSessionStore
+
+    try:
+        UploadSessionStore(upload_dir, ttl_seconds=settings.UPLOAD_SESSION_TTL_HOURS * 3600).sweep()
+        with Session(engine) as session:
+            collect_garbage(
+                session,
+                upload_dir,
+                grace_hours=settings.UPLOAD_GC_GRACE_HOURS,
+                mode=settings.UPLOAD_GC_MODE,
+                quarantine_days=settings.UPLOAD_GC_QUARANTINE_DAYS,
+                dry_run=False,
+            )
+    except Exception:
+        logger.exception("Scheduled upload GC failed")
+
+
+def start(upload_dir: str) -> None:
+    global _scheduler
+    if _scheduler is not None:
+        return
+    scheduler = BackgroundScheduler(timezone="UTC")
+    if settings.UPLOAD_GC_INTERVAL_HOURS > 0:
+        scheduler.add_job(
+            run_upload_gc,
+            "interval",
+            hours=settings.UPLOAD_GC_INTERVAL_HOURS,
+            args=[upload_dir],
+            id="upload_gc",
+            max_instances=1,
+            coalesce=True,
+        )
+    if scheduler.get_jobs():
+        scheduler.start()
+        _scheduler = scheduler
+
+
+def shutdown() -> None:
+    global _scheduler
+    if _scheduler is not None:
+        _scheduler.shutdown(wait=False)
+        _scheduler = None
@@ -0,0 +1,228 @@
+"""
+Garbage collection for UPLOAD_DIR.
+
+Every ``image_url`` in the whiskey and wine databases is streamed into a set of
+referenced store hashes and legacy file names; the upload tree is then walked
+with ``os.scandir`` and anything nobody points at (originals with their
+variants, abandoned ``tmp_*`` files) is quarantined or deleted once it is older
+than the grace period. The grace period protects uploads whose bottle has not
+been saved yet. Quarantined files land in ``.quarantine/<date>/`` under
+UPLOAD_DIR and are purged after UPLOAD_GC_QUARANTINE_DAYS.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import re
+import shutil
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Iterator, Optional
+
+from sqlalchemy import delete, select
+from sqlalchemy.exc import OperationalError
+from sqlmodel import Session
+
+from ..models import Bottle, LegacyUpload, StoredImage
+from ..wine_models import WineBottle
+from . import image_hashes, upload_store
+
+logger = logging.getLogger(__name__)
+
+QUARANTINE_DIR = ".quarantine"
+_STREAM_BATCH = 500
+_STORE_NAME_RE = re.compile(r"^([0-9a-f]{64})(?:\.w\d+)?\.[a-z0-9]+$")
+_FLAT_VARIANT_RE = re.compile(r"^(.+)\.w\d+\.(?:webp|avif)$")
+_IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".gif", ".webp", ".avif"}
+
+
+@dataclass
+class References:
+    hashes: set[str] = field(default_factory=set)       # content-addressed originals
+    flat_names: set[str] = field(default_factory=set)   # legacy names still in the flat layout
+    flat_stems: set[str] = field(default_factory=set)   # their stems, which own flat variants
+
+
+@dataclass
+class GcResult:
+    mode: str
+    dry_run: bool
+    scanned: int = 0
+    kept_referenced: int = 0
+    kept_recent: int = 0
+    removed: int = 0
+    tmp_removed: int = 0
+    bytes_reclaimed: int = 0
+    quarantine_purged: int = 0
+    errors: list[str] = field(default_factory=list)
+
+
+def _stream_urls(session: Session, model) -> Iterator[str]:
+    column = model.__table__.c.image_url
+    stmt = select(column).where(column.is_not(None), column != "").execution_options(yield_per=_STREAM_BATCH)
+    for (url,) in session.execute(stmt):
+        yield url
+
+
+def collect_references(session: Session) -> References:
+    """Referenced uploads from both databases; legacy URLs count for the store file they map to."""
+    from ..db import init_wine_db, wine_engine
+
+    aliases = dict(session.execute(select(LegacyUpload.name, LegacyUpload.sha256)).all())
+    refs = References()
+
+    def add(url: str) -> None:
+        rel = upload_store.relative_upload_path(url)
+        if not rel:
+            return
+        name = rel.rsplit("/", 1)[-1]
+        match = _STORE_NAME_RE.match(name)
+        if "/" in rel and match:
+            refs.hashes.add(match.group(1))
+        elif "/" not in rel:
+            refs.flat_names.add(name)
+            refs.flat_stems.add(os.path.splitext(name)[0])
+            if name in aliases:
+                refs.hashes.add(aliases[name])
+
+    for url in _stream_urls(session, Bottle):
+        add(url)
+    try:
+        init_wine_db()
+        with Session(wine_engine) as wine_session:
+            for url in _stream_urls(wine_session, WineBottle):
+                add(url)
+    except OperationalError:
+        # Without the wine references we cannot tell garbage apart; refuse rather than guess.
+        raise RuntimeError("Wine database unavailable; refusing to collect uploads") from None
+    return refs
+
+
+def _walk(root: str) -> Iterator[tuple[os.DirEntry, str]]:
+    """(entry, path relative to root) for every file below root, skipping the quarantine."""
+    stack = [""]
+    while stack:
+        rel_dir = stack.pop()
+        with os.scandir(os.path.join(root, rel_dir)) as it:
+            for entry in it:
+                rel = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+                if entry.is_dir(follow_symlinks=False):
+                    if rel != QUARANTINE_DIR:
+                        stack.append(rel)
+                elif entry.is_file(follow_symlinks=False):
+                    yield entry, rel
+
+
+def _is_referenced(rel: str, refs: References) -> bool:
+    name = rel.rsplit("/", 1)[-1]
+    if "/" in rel:
+        match = _STORE_NAME_RE.match(name)
+        # Unknown names inside the tree are left alone; only store files are collected.
+        return not match or match.group(1) in refs.hashes
+    if name in refs.flat_names or name.startswith(".") or os.path.splitext(name)[1].lower() not in _IMAGE_EXTS:
+        return True  # referenced, or not an upload at all (e.g. .gitkeep)
+    variant = _FLAT_VARIANT_RE.match(name)
+    return bool(variant) and variant.group(1) in refs.flat_stems
+
+
+def _purge_quarantine(root: str, older_than: float, result: GcResult) -> None:
+    """Drop quarantine batches (``.quarantine/<YYYYMMDD>``) older than the retention period."""
+    base = os.path.join(root, QUARANTINE_DIR)
+    if not os.path.isdir(base):
+        return
+    with os.scandir(base) as it:
+        for entry in it:
+            try:
+                day = datetime.strptime(entry.name, "%Y%m%d").replace(tzinfo=timezone.utc)
+            except ValueError:
+                continue
+            if entry.is_dir(follow_symlinks=False) and day.timestamp() < older_than:
+                if not result.dry_run:
+                    shutil.rmtree(entry.path, ignore_errors=True)
+                result.quarantine_purged += 1
+
+
+def collect_garbage(
+    session: Session,
+    upload_dir: str,
+    *,
+    grace_hours: float,
+    mode: str = "quarantine",
+    quarantine_days: float = 30,
+    dry_run: bool = True,
+    now: Optional[float] = None,
+) -> GcResult:
+    """
+    Quarantine (``mode="quarantine"``) or delete (``mode="delete"``) unreferenced
+    uploads older than ``grace_hours``. Deleting also drops the stored_image /
+    legacy_upload rows of removed originals; quarantining keeps them so a file can
+    simply be moved back.
+    """
+    if mode not in ("quarantine", "delete"):
+        raise ValueError("mode must be 'quarantine' or 'delete'")
+    now = time.time() if now is None else now
+    cutoff = now - grace_hours * 3600
+    result = GcResult(mode=mode, dry_run=dry_run)
+    refs = collect_references(session)
+
+    stamp = datetime.fromtimestamp(now, timezone.utc).strftime("%Y%m%d")
+    removed_hashes: set[str] = set()
+    for entry, rel in _walk(upload_dir):
+        result.scanned += 1
+        name = entry.name
+        is_tmp = name.startswith("tmp_")
+        if not is_tmp and _is_referenced(rel, refs):
+            result.kept_referenced += 1
+            continue
+        try:
+            stat = entry.stat(follow_symlinks=False)
+        except FileNotFoundError:
+            continue  # removed concurrently
+        if stat.st_mtime >= cutoff:
+            result.kept_recent += 1
+            continue
+
+        if not dry_run:
+            try:
+                if mode == "delete" or is_tmp:
+                    os.remove(entry.path)
+                else:
+                    dest = os.path.join(upload_dir, QUARANTINE_DIR, stamp, rel)
+                    os.makedirs(os.path.dirname(dest), exist_ok=True)
+                    os.replace(entry.path, dest)
+            except OSError as exc:
+                result.errors.append(f"{rel}: {exc}")
+                continue
+        match = _STORE_NAME_RE.match(name)
+        if match and not is_tmp:
+            removed_hashes.add(match.group(1))
+        result.tmp_removed += is_tmp
+        result.removed += not is_tmp
+        result.bytes_reclaimed += stat.st_size
+
+    if mode == "delete" and removed_hashes and not dry_run:
+        # Rows only for originals that are really gone (a variant alone does not retire its image).
+        hashes = sorted(removed_hashes)
+        for start in range(0, len(hashes), _STREAM_BATCH):
+            chunk = hashes[start:start + _STREAM_BATCH]
+            gone = [
+                sha for sha, path in session.execute(
+                    select(StoredImage.sha256, StoredImage.path).where(StoredImage.sha256.in_(chunk))
+                )
+                if not os.path.exists(os.path.join(upload_dir, path))
+            ]
+            if gone:
+                session.execute(delete(LegacyUpload).where(LegacyUpload.sha256.in_(gone)))
+                image_hashes.forget(session, gone)
+                session.execute(delete(StoredImage).where(StoredImage.sha256.in_(gone)))
+        session.commit()
+
+    _purge_quarantine(upload_dir, now - quarantine_days * 86400, result)
+    logger.info(
+        "Upload GC (%s%s): scanned=%d removed=%d tmp=%d reclaimed=%d bytes",
+        mode, ", dry-run" if dry_run else "", result.scanned, result.removed, result.tmp_removed,
+        result.bytes_reclaimed,
+    )
+    return result
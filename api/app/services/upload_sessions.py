@@ -0,0 +1,233 @@
+"""
+Resumable chunked uploads.
+
+A session reserves ``<id>.part`` under ``UPLOAD_DIR/.chunked`` and a small JSON
+sidecar with what the client declared (name, total size, optional SHA-256).
+Chunks are appended strictly in order: the part file's length *is* the received
+offset, so a client that lost a response just asks for the offset and resends
+from there, and a chunk that overlaps bytes already stored only contributes its
+new tail. Sessions idle for longer than UPLOAD_SESSION_TTL_HOURS are swept.
+
+Nothing about a session is trusted from memory, because consecutive chunks may
+land on different workers: appends and finalizing hold an ``flock`` on the part
+file and read the offset from its length, and the whole-file SHA-256 is
+computed from the part file when the upload is finalized.
+"""
+
+from __future__ import annotations
+
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import BinaryIO, Iterator, Optional
+
+from .upload_stream import HEAD_SIZE
+
+logger = logging.getLogger(__name__)
+
+SESSION_DIR = ".chunked"
+
+
+class SessionNotFound(Exception):
+    pass
+
+
+class ChunkRejected(Exception):
+    """The chunk cannot be applied; ``status`` is the HTTP status to answer with."""
+
+    def __init__(self, status: int, detail: str, offset: int):
+        super().__init__(detail)
+        self.status = status
+        self.detail = detail
+        self.offset = offset
+
+
+@dataclass
+class UploadSession:
+    id: str
+    filename: str
+    size: int
+    expected_sha256: Optional[str]
+    created_by: Optional[str]
+    created_at: float
+    updated_at: float
+    offset: int = 0
+
+    def describe(self, ttl_seconds: float) -> dict:
+        return {
+            "id": self.id,
+            "filename": self.filename,
+            "size": self.size,
+            "offset": self.offset,
+            "received": [[0, self.offset]] if self.offset else [],
+            "complete": self.offset == self.size,
+            "expires_at": self.updated_at + ttl_seconds,
+        }
+
+
+class UploadSessionStore:
+    def __init__(self, upload_dir: str, ttl_seconds: float):
+        self.root = os.path.join(upload_dir, SESSION_DIR)
+        self.ttl_seconds = ttl_seconds
+
+    def _paths(self, session_id: str) -> tuple[str, str]:
+        base = os.path.join(self.root, session_id)
+        return f"{base}.part", f"{base}.json"
+
+    def _save(self, session: UploadSession) -> None:
+        meta = {
+            "id": session.id,
+            "filename": session.filename,
+            "size": session.size,
+            "expected_sha256": session.expected_sha256,
+            "created_by": session.created_by,
+            "created_at": session.created_at,
+            "updated_at": session.updated_at,
+        }
+        _, meta_path = self._paths(session.id)
+        tmp = f"{meta_path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp, meta_path)
+
+    def create(self, filename: str, size: int, expected_sha256: Optional[str], created_by: Optional[str]) -> UploadSession:
+        os.makedirs(self.root, exist_ok=True)
+        self.sweep()
+        now = time.time()
+        session = UploadSession(
+            id=uuid.uuid4().hex,
+            filename=filename,
+            size=size,
+            expected_sha256=expected_sha256.lower() if expected_sha256 else None,
+            created_by=created_by,
+            created_at=now,
+            updated_at=now,
+        )
+        part_path, _ = self._paths(session.id)
+        open(part_path, "wb").close()
+        self._save(session)
+        return session
+
+    def get(self, session_id: str) -> UploadSession:
+        """Load a live session from its sidecar; the offset is the part file's current length."""
+        if not session_id.isalnum():
+            raise SessionNotFound(session_id)
+        part_path, meta_path = self._paths(session_id)
+        try:
+            with open(meta_path) as f:
+                session = UploadSession(**json.load(f))
+            session.offset = os.path.getsize(part_path)
+        except (FileNotFoundError, ValueError, TypeError):
+            raise SessionNotFound(session_id) from None
+        if time.time() - session.updated_at > self.ttl_seconds:
+            self.discard(session_id)
+            raise SessionNotFound(session_id)
+        return session
+
+    @contextmanager
+    def _locked_part(self, session: UploadSession) -> Iterator[BinaryIO]:
+        """The part file, exclusively locked across processes; SessionNotFound once it has been finalized or discarded."""
+        part_path, _ = self._paths(session.id)
+        try:
+            part = open(part_path, "r+b")
+        except FileNotFoundError:
+            raise SessionNotFound(session.id) from None
+        with part:
+            fcntl.flock(part.fileno(), fcntl.LOCK_EX)
+            # Another request may have moved or removed the file while we waited for the lock.
+            try:
+                current = os.stat(part_path)
+            except FileNotFoundError:
+                raise SessionNotFound(session.id) from None
+            opened = os.fstat(part.fileno())
+            if (current.st_dev, current.st_ino) != (opened.st_dev, opened.st_ino):
+                raise SessionNotFound(session.id)
+            yield part
+
+    def append(self, session: UploadSession, offset: int, data: bytes, chunk_sha256: Optional[str]) -> None:
+        """Apply a chunk that starts at ``offset`` (blocking; run it off the event loop)."""
+        corrupt = bool(chunk_sha256) and hashlib.sha256(data).hexdigest() != chunk_sha256.lower()
+        with self._locked_part(session) as part:
+            stored = session.offset = os.fstat(part.fileno()).st_size
+            if corrupt:
+                raise ChunkRejected(422, "Chunk checksum mismatch", stored)
+            if offset > stored:
+                raise ChunkRejected(409, f"Expected offset {stored}", stored)
+            if offset + len(data) > session.size:
+                raise ChunkRejected(413, "Chunk extends past the declared size", stored)
+
+            new = data[stored - offset:]  # overlap with stored bytes is a retry; keep only the tail
+            if new:
+                part.seek(stored)
+                part.write(new)
+                session.offset = stored + len(new)
+            session.updated_at = time.time()
+            self._save(session)
+
+    def complete(self, session: UploadSession, dest_path: str) -> tuple[str, bytes]:
+        """
+        Check and move a fully received part file to ``dest_path``, ending the session.
+        Returns (sha256, leading bytes for sniffing).
+        """
+        part_path, _ = self._paths(session.id)
+        with self._locked_part(session) as part:
+            stored = session.offset = os.fstat(part.fileno()).st_size
+            if stored != session.size:
+                raise ChunkRejected(409, f"Upload incomplete ({stored}/{session.size} bytes)", stored)
+            head = part.read(HEAD_SIZE)
+            digest = hashlib.sha256(head)
+            for chunk in iter(lambda: part.read(1024 * 1024), b""):
+                digest.update(chunk)
+            sha256 = digest.hexdigest()
+            if session.expected_sha256 and sha256 != session.expected_sha256:
+                raise ChunkRejected(422, "Upload checksum does not match the declared sha256", stored)
+            os.replace(part_path, dest_path)
+        self.discard(session.id)
+        return sha256, head
+
+    def discard(self, session_id: str) -> None:
+        for path in self._paths(session_id):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        """Remove sessions idle for longer than the TTL; returns how many went."""
+        now = time.time() if now is None else now
+        if not os.path.isdir(self.root):
+            return 0
+        swept = 0
+        with os.scandir(self.root) as it:
+            entries = list(it)
+        for entry in entries:
+            session_id, ext = os.path.splitext(entry.name)
+            if ext != ".json":
+                continue
+            try:
+                with open(entry.path) as f:
+                    updated_at = float(json.load(f).get("updated_at", 0))
+            except (OSError, ValueError):
+                updated_at = 0
+            if now - updated_at > self.ttl_seconds:
+                self.discard(session_id)
+                swept += 1
+        # Part files whose sidecar vanished (crash between the two writes).
+        for entry in entries:
+            session_id, ext = os.path.splitext(entry.name)
+            if ext == ".part" and not os.path.exists(os.path.join(self.root, f"{session_id}.json")):
+                try:
+                    if now - entry.stat().st_mtime > self.ttl_seconds:
+                        os.remove(entry.path)
+                        swept += 1
+                except FileNotFoundError:
+                    continue  # its session was just discarded above
+        if swept:
+            logger.info("Swept %d expired upload sessions", swept)
+        return swept
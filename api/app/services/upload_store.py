@@ -0,0 +1,256 @@
+"""
+Content-addressed upload store.
+
+Uploads live at ``UPLOAD_DIR/ab/cd/<sha256><ext>`` (two levels of fan-out keep
+every directory small), so uploading the same photo twice stores it once. Each
+stored image has a stored_image row whose ``ref_count`` tracks how many
+Bottle / WineBottle ``image_url`` values point at it: ORM writes adjust it after
+commit, and ``recount_references`` rebuilds it from scratch (after migrations,
+core-level updates, or before garbage collection). Files from the old flat
+layout keep their ``/uploads/<name>`` URLs through the legacy_upload table.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import re
+from collections import Counter
+from datetime import datetime, timezone
+from itertools import chain
+from typing import Iterable, Optional
+
+from sqlalchemy import bindparam, event, func, or_, select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session, attributes
+
+from ..models import Bottle, LegacyUpload, StoredImage
+from ..wine_models import WineBottle
+
+logger = logging.getLogger(__name__)
+
+_SHARDED_RE = re.compile(r"^[0-9a-f]{2}/[0-9a-f]{2}/([0-9a-f]{64})(?:\.w\d+)?\.[a-z0-9]+$")
+_REF_MODELS = (Bottle, WineBottle)
+_PENDING_KEY = "upload_refs_pending"
+_URL_CHUNK = 500
+
+
+def shard_path(sha256: str, ext: str) -> str:
+    """Relative store path for content with this hash: ``ab/cd/<sha256><ext>``."""
+    return f"{sha256[:2]}/{sha256[2:4]}/{sha256}{ext.lower()}"
+
+
+def hash_file(path: str, chunk_size: int = 1024 * 1024) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def store_file(upload_dir: str, tmp_path: str, sha256: str, ext: str) -> tuple[str, bool]:
+    """
+    Move ``tmp_path`` into the store. When identical content is already stored the
+    temp file is dropped instead. Returns (relative path, whether it was a duplicate).
+    """
+    rel = shard_path(sha256, ext)
+    dest = os.path.join(upload_dir, rel)
+    if os.path.exists(dest):
+        os.remove(tmp_path)
+        os.utime(dest)  # a fresh upload restarts the garbage collector's grace period
+        return rel, True
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    try:
+        # Atomic: when the same content is stored concurrently, exactly one writer creates it.
+        os.link(tmp_path, dest)
+    except FileExistsError:
+        os.remove(tmp_path)
+        return rel, True
+    except OSError:
+        os.replace(tmp_path, dest)   # filesystem without hard links
+        return rel, False
+    os.remove(tmp_path)
+    return rel, False
+
+
+def register(session: Session, sha256: str, rel: str, size: int) -> StoredImage:
+    """
+    Ensure a stored_image row exists for stored content (no commit). An upsert
+    rather than read-then-add, so two requests storing the same content at once
+    do not trip over the primary key.
+    """
+    session.execute(
+        sqlite_insert(StoredImage)
+        .values(sha256=sha256, path=rel, size_bytes=size, ref_count=0, created_at=datetime.now(timezone.utc))
+        .on_conflict_do_nothing(index_elements=["sha256"])
+    )
+    return session.get(StoredImage, sha256)
+
+
+def relative_upload_path(url: Optional[str]) -> Optional[str]:
+    """The part of an image URL after ``/uploads/`` (query string dropped), or None."""
+    if not url:
+        return None
+    _, sep, rest = url.partition("/uploads/")
+    if not sep:
+        return None
+    rest = rest.split("?", 1)[0].split("#", 1)[0]
+    return rest or None
+
+
+def resolve_urls(session: Session, urls: Iterable[str]) -> dict[str, str]:
+    """Map image URLs to the SHA-256 of the stored image they show (variants count as their original)."""
+    resolved: dict[str, str] = {}
+    legacy: dict[str, list[str]] = {}
+    for url in set(urls):
+        rel = relative_upload_path(url)
+        if not rel:
+            continue
+        match = _SHARDED_RE.match(rel)
+        if match:
+            resolved[url] = match.group(1)
+        elif "/" not in rel:
+            legacy.setdefault(rel, []).append(url)
+
+    names = list(legacy)
+    for start in range(0, len(names), _URL_CHUNK):
+        chunk = names[start:start + _URL_CHUNK]
+        for name, sha256 in session.execute(
+            select(LegacyUpload.name, LegacyUpload.sha256).where(LegacyUpload.name.in_(chunk))
+        ):
+            for url in legacy[name]:
+                resolved[url] = sha256
+    return resolved
+
+
+def resolve_legacy(session: Session, name: str) -> Optional[str]:
+    """Store path that a flat legacy upload name now lives at, if it was migrated."""
+    return session.execute(select(LegacyUpload.path).where(LegacyUpload.name == name)).scalar()
+
+
+def bottles_by_image(session: Session, sha256s: Iterable[str]) -> dict[str, list[Bottle]]:
+    """Bottles whose image_url shows each stored image (store URLs and migrated legacy names)."""
+    wanted = set(sha256s)
+    found: dict[str, list[Bottle]] = {}
+    shas = sorted(wanted)
+    for start in range(0, len(shas), _URL_CHUNK // 5):
+        chunk = shas[start:start + _URL_CHUNK // 5]
+        names = session.execute(select(LegacyUpload.name).where(LegacyUpload.sha256.in_(chunk))).scalars().all()
+        conditions = [Bottle.image_url.contains(sha) for sha in chunk]
+        conditions += [Bottle.image_url.like(f"%/uploads/{name}") for name in names]
+        bottles = session.execute(select(Bottle).where(or_(*conditions))).scalars().all()
+        resolved = resolve_urls(session, [b.image_url for b in bottles])
+        for bottle in bottles:
+            sha256 = resolved.get(bottle.image_url)
+            if sha256 in wanted:
+                found.setdefault(sha256, []).append(bottle)
+    return found
+
+
+def _image_urls(session: Session, model) -> list[str]:
+    column = model.__table__.c.image_url
+    return [url for (url,) in session.execute(select(column).where(column.is_not(None), column != ""))]
+
+
+def recount_references(session: Session) -> dict[str, int]:
+    """
+    Recompute every ref_count from the image_url columns of both databases (commits).
+    Returns counters: referenced images, references resolved, and URLs pointing at
+    uploads that the store does not know.
+    """
+    from ..db import init_wine_db, wine_engine
+
+    urls = _image_urls(session, Bottle)
+    try:
+        init_wine_db()
+        with Session(wine_engine) as wine_session:
+            urls += _image_urls(wine_session, WineBottle)
+    except OperationalError:
+        logger.warning("Wine database unavailable; wine image references not counted")
+
+    resolved = resolve_urls(session, urls)
+    counts = Counter(resolved[url] for url in urls if url in resolved)
+    unresolved = sum(1 for url in urls if url not in resolved and relative_upload_path(url))
+
+    table = StoredImage.__table__
+    session.execute(update(table).where(table.c.ref_count != 0).values(ref_count=0))
+    if counts:
+        session.execute(
+            update(table).where(table.c.sha256 == bindparam("b_sha256")).values(ref_count=bindparam("b_count")),
+            [{"b_sha256": sha, "b_count": n} for sha, n in counts.items()],
+        )
+    session.commit()
+    return {"referenced": len(counts), "references": sum(counts.values()), "unresolved": unresolved}
+
+
+def _url_changes(session: Session) -> Counter:
+    """+1 / -1 per image_url gained or lost by Bottle / WineBottle rows in this flush."""
+    deltas: Counter = Counter()
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if not isinstance(obj, _REF_MODELS):
+            continue
+        history = attributes.get_history(obj, "image_url")
+        if obj in session.deleted:
+            lost, gained = history.non_added(), ()
+        elif obj in session.new:
+            lost, gained = (), history.sum()
+        else:
+            lost, gained = history.deleted, history.added
+        for url in lost:
+            if url:
+                deltas[url] -= 1
+        for url in gained:
+            if url:
+                deltas[url] += 1
+    return deltas
+
+
+def _keep_previous_url(target, value, oldvalue, initiator):
+    return value
+
+
+for _model in _REF_MODELS:
+    # active_history loads the old image_url before it is overwritten, even when the
+    # row was expired by a commit, so the flush can see which URL lost a reference.
+    event.listen(_model.image_url, "set", _keep_previous_url, active_history=True, retval=True)
+
+
+@event.listens_for(Session, "before_flush")
+def _track_references(session: Session, flush_context, instances) -> None:
+    deltas = _url_changes(session)
+    if deltas:
+        session.info.setdefault(_PENDING_KEY, Counter()).update(deltas)
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_references(session: Session) -> None:
+    pending: Optional[Counter] = session.info.pop(_PENDING_KEY, None)
+    if not pending:
+        return
+    from ..db import engine
+
+    # Runs on the whiskey engine even for wine sessions: the store's tables live there.
+    try:
+        with Session(engine) as store_session:
+            by_sha: Counter = Counter()
+            for url, sha256 in resolve_urls(store_session, pending).items():
+                by_sha[sha256] += pending[url]
+            table = StoredImage.__table__
+            for sha256, delta in by_sha.items():
+                if delta:
+                    store_session.execute(
+                        update(table)
+                        .where(table.c.sha256 == sha256)
+                        .values(ref_count=func.max(table.c.ref_count + delta, 0))
+                    )
+            store_session.commit()
+    except OperationalError:
+        # Drifted counts are corrected by the next recount_references run.
+        logger.exception("Could not update upload reference counts")
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_references(session: Session) -> None:
+    session.info.pop(_PENDING_KEY, None)
@@ -0,0 +1,68 @@
+"""
+Single-pass upload receiving.
+
+An UploadFile is copied to disk once, with the blocking write and the SHA-256
+update done off the event loop, while the leading bytes are kept in memory so
+format sniffing never has to reopen the file.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+from dataclasses import dataclass
+from typing import BinaryIO
+
+from fastapi import UploadFile
+
+CHUNK_SIZE = 1024 * 1024   # one thread hop per MiB keeps overhead negligible
+HEAD_SIZE = 64 * 1024      # enough for magic bytes and Pillow's header parse
+
+
+class UploadTooLarge(Exception):
+    def __init__(self, size: int, limit: int):
+        super().__init__(f"Upload exceeds {limit} bytes")
+        self.size = size
+        self.limit = limit
+
+
+@dataclass
+class ReceivedUpload:
+    path: str
+    size: int
+    sha256: str
+    head: bytes   # first HEAD_SIZE bytes, for sniffing
+
+
+def _write_chunk(out: BinaryIO, digest, chunk: bytes) -> None:
+    # hashlib releases the GIL for large buffers, so this overlaps with the event loop.
+    digest.update(chunk)
+    out.write(chunk)
+
+
+async def receive_upload(file: UploadFile, dest_path: str, *, max_bytes: int) -> ReceivedUpload:
+    """
+    Stream ``file`` to ``dest_path``, enforcing ``max_bytes`` as data arrives.
+    Raises UploadTooLarge as soon as the limit is crossed; the partial file is left
+    for the caller to remove.
+    """
+    digest = hashlib.sha256()
+    head = bytearray()
+    size = 0
+
+    out = await asyncio.to_thread(open, dest_path, "wb")
+    try:
+        while True:
+            chunk = await file.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > max_bytes:
+                raise UploadTooLarge(size, max_bytes)
+            if len(head) < HEAD_SIZE:
+                head += chunk[:HEAD_SIZE - len(head)]
+            await asyncio.to_thread(_write_chunk, out, digest, chunk)
+    finally:
+        await asyncio.to_thread(out.close)
+
+    return ReceivedUpload(path=dest_path, size=size, sha256=digest.hexdigest(), head=bytes(head))
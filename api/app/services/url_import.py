@@ -0,0 +1,175 @@
+"""
+Downloading images from remote URLs (bulk label import).
+
+One pooled ``httpx.AsyncClient`` is shared by every download of an import, so
+connections to the same retailer are reused, and a semaphore per host keeps us
+from hammering any single site while other hosts proceed in parallel. Bodies are
+streamed to disk with the same hash-as-you-go / keep-the-header treatment as
+uploads, and a download is cut off as soon as it crosses the size cap (a lying
+or missing Content-Length does not help it past).
+
+Every request the client sends, redirects included, first resolves its host and
+is refused when any address is not publicly routable (private, loopback,
+link-local, CGNAT, multicast, NAT64...), so an import cannot be pointed at the
+LAN or at the machine itself. The connection is then made to the address that
+was vetted, with the original Host header and TLS server name, so a DNS answer
+that changes between the check and the connect (rebinding) cannot slip past.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import os
+import socket
+from contextlib import nullcontext
+from typing import Optional
+from urllib.parse import unquote, urlsplit
+
+import httpx
+
+from ..ip_classification import is_publicly_routable
+from .upload_stream import CHUNK_SIZE, HEAD_SIZE, ReceivedUpload
+
+USER_AGENT = "whiskey-db-image-import/1.0"
+
+
+class DownloadFailed(Exception):
+    """``status`` is the HTTP status to report for this item."""
+
+    def __init__(self, status: int, detail: str):
+        super().__init__(detail)
+        self.status = status
+        self.detail = detail
+
+
+async def _addresses(host: str) -> list[str]:
+    try:
+        infos = await asyncio.get_running_loop().getaddrinfo(host, None, type=socket.SOCK_STREAM)
+    except socket.gaierror as exc:
+        raise DownloadFailed(502, f"Cannot resolve {host}") from exc
+    # Drop IPv6 zone ids ("fe80::1%eth0") so the address parses.
+    return [info[4][0].split("%", 1)[0] for info in infos]
+
+
+async def public_address(host: str) -> str:
+    """An address to connect to for ``host``; DownloadFailed(422) when any of its addresses is not public."""
+    addresses = await _addresses(host)
+    for address in addresses:
+        if not is_publicly_routable(address):
+            raise DownloadFailed(422, f"{host} resolves to a private address")
+    if not addresses:
+        raise DownloadFailed(502, f"Cannot resolve {host}")
+    return addresses[0]
+
+
+class PinnedTransport(httpx.AsyncHTTPTransport):
+    """Sends each request (every redirect hop) to the public address vetted for its host."""
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        host = request.url.host
+        pinned = httpx.Request(
+            request.method,
+            request.url.copy_with(host=await public_address(host)),
+            headers=request.headers,   # keeps the original Host header
+            stream=request.stream,
+            extensions={**request.extensions, "sni_hostname": host},
+        )
+        return await super().handle_async_request(pinned)
+
+
+def new_client(*, max_connections: int, timeout: float, allow_private: bool = False) -> httpx.AsyncClient:
+    """The pooled import client; unless ``allow_private``, every hop goes through ``PinnedTransport``."""
+    limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+    return httpx.AsyncClient(
+        follow_redirects=True,
+        max_redirects=5,
+        timeout=httpx.Timeout(timeout, connect=min(timeout, 10.0)),
+        limits=limits,
+        transport=None if allow_private else PinnedTransport(limits=limits),
+        headers={"User-Agent": USER_AGENT, "Accept": "image/*"},
+    )
+
+
+def check_url(url: str) -> str:
+    """The host of an importable http(s) URL; DownloadFailed(422) otherwise."""
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        raise DownloadFailed(422, "Only absolute http(s) URLs can be imported")
+    return parts.hostname.lower()
+
+
+def filename_from_url(url: str) -> str:
+    """Last path segment, so extension-based checks (e.g. ``.dng``) still work for downloads."""
+    return os.path.basename(unquote(urlsplit(url).path)) or "download"
+
+
+class HostLimits:
+    """At most ``per_host`` downloads in flight for any one host."""
+
+    def __init__(self, per_host: int):
+        self.per_host = max(1, per_host)
+        self._semaphores: dict[str, asyncio.Semaphore] = {}
+
+    def __call__(self, host: str) -> asyncio.Semaphore:
+        semaphore = self._semaphores.get(host)
+        if semaphore is None:
+            semaphore = self._semaphores[host] = asyncio.Semaphore(self.per_host)
+        return semaphore
+
+
+async def download(
+    client: httpx.AsyncClient,
+    url: str,
+    dest_path: str,
+    *,
+    max_bytes: int,
+    limits: Optional[HostLimits] = None,
+    slots: Optional[asyncio.Semaphore] = None,
+) -> ReceivedUpload:
+    """
+    Stream ``url`` into ``dest_path``. Raises DownloadFailed (502 for network or
+    upstream errors, 413 past ``max_bytes``); the partial file is left for the
+    caller to remove, as with ``receive_upload``.
+
+    The per-host gate from ``limits`` is taken before one of the shared ``slots``,
+    so downloads queued behind a busy host do not hold slots other hosts could use.
+    """
+    host = check_url(url)
+    async with (limits(host) if limits else nullcontext()), (slots or nullcontext()):
+        return await _fetch(client, url, dest_path, max_bytes=max_bytes)
+
+
+async def _fetch(client: httpx.AsyncClient, url: str, dest_path: str, *, max_bytes: int) -> ReceivedUpload:
+    try:
+        async with client.stream("GET", url) as response:
+            if response.status_code != 200:
+                raise DownloadFailed(502, f"Upstream answered {response.status_code}")
+            declared = response.headers.get("content-length")
+            if declared and declared.isdigit() and int(declared) > max_bytes:
+                raise DownloadFailed(413, f"Remote file too large ({int(declared)} bytes > {max_bytes})")
+
+            digest = hashlib.sha256()
+            head = bytearray()
+            size = 0
+            out = await asyncio.to_thread(open, dest_path, "wb")
+            try:
+                async for chunk in response.aiter_bytes(CHUNK_SIZE):
+                    size += len(chunk)
+                    if size > max_bytes:
+                        raise DownloadFailed(413, f"Remote file too large (> {max_bytes} bytes)")
+                    if len(head) < HEAD_SIZE:
+                        head += chunk[:HEAD_SIZE - len(head)]
+                    await asyncio.to_thread(_write, out, digest, chunk)
+            finally:
+                await asyncio.to_thread(out.close)
+    except httpx.HTTPError as exc:
+        raise DownloadFailed(502, f"Download failed: {type(exc).__name__}") from exc
+    if not size:
+        raise DownloadFailed(502, "Upstream sent an empty body")
+    return ReceivedUpload(path=dest_path, size=size, sha256=digest.hexdigest(), head=bytes(head))
+
+
+def _write(out, digest, chunk: bytes) -> None:
+    digest.update(chunk)
+    out.write(chunk)
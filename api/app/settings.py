@@ -17,6 +17,7 @@ class Settings(BaseSettings):
     REFRESH_TOKEN_EXPIRE_DAYS: int = 30
     JWT_COOKIE_NAME: str = "access_token"
     JWT_REFRESH_COOKIE_NAME: str = "refresh_token"
+    JWT_CACHE_SIZE: int = 1024              # verified access tokens remembered until they expire (0 = off)
     COOKIE_SAMESITE: str = "lax"   # "lax" or "strict"
     COOKIE_SECURE: str | bool | None = None  # None or "auto" = detect via scheme; True/False to force
     COOKIE_DOMAIN: str | None = None  # leave None for dev/DDNS; set like ".416flint.com" in prod if desired
@@ -24,6 +25,7 @@ class Settings(BaseSettings):
     # --- LAN guest access ---
     ALLOW_LAN_GUEST: bool = True
     TRUSTED_PROXIES: str = "127.0.0.1,10.0.0.0/8,172.16.0.0/12,192.168.0.0/16"
+    AUTH_DECISION_LOG_PER_MINUTE: int = 5   # decision log lines per reason per minute; the rest are summarised
     ALLOWED_ORIGINS: str = "http://localhost:8080,http://127.0.0.1:8080"
 
     # --- Admin bootstrap (username-first) ---
@@ -34,6 +36,33 @@ class Settings(BaseSettings):
     # --- Uploads ---
     UPLOAD_MAX_MB: int = 10                 # max image size in megabytes
     UPLOAD_DIR: str = "static/uploads"      # where files are saved (served by /static)
+    UPLOAD_BATCH_MAX_FILES: int = 50        # files accepted by one POST /uploads/images
+    UPLOAD_CHUNK_MAX_MB: int = 8            # largest chunk one PUT /uploads/sessions/{id} may carry
+    UPLOAD_SESSION_TTL_HOURS: float = 24    # resumable upload sessions idle longer than this are swept
+    IMAGE_POOL_WORKERS: int = 2             # processes for RAW conversion and other CPU-heavy image work
+    IMAGE_POOL_MAX_QUEUE: int = 4           # jobs allowed to wait for a worker before uploads get 503
+    IMAGE_POOL_RETRY_AFTER_SECONDS: int = 10  # Retry-After sent with that 503
+    IMAGE_VARIANT_WIDTHS: str = "160,480,1200"  # resized copies made for each upload (px, comma-separated)
+    IMAGE_VARIANT_FORMATS: str = "webp"     # variant encodings: webp and/or avif
+    IMAGE_VARIANT_QUALITY: int = 80         # encoder quality for variants
+    HEIF_TRANSCODE_FORMAT: str = "jpeg"     # HEIC/HEIF uploads are stored as jpeg or webp
+    HEIF_MAX_EDGE_PX: int = 2560            # longest edge after transcoding (0 = keep full size)
+    HEIF_TRANSCODE_QUALITY: int = 85
+    IMAGE_JOB_WORKERS: int = 2              # background upload jobs processed at once per API process
+    IMAGE_JOB_MAX_ATTEMPTS: int = 5         # a failing job is retried this many times in total
+    IMAGE_JOB_RETRY_BASE_SECONDS: float = 30  # first retry delay; doubles on every attempt
+    IMAGE_JOB_LEASE_SECONDS: float = 900    # a running job not heard from for this long is picked up again
+    IMAGE_IMPORT_MAX_ITEMS: int = 500       # (bottle_id, url) pairs accepted by one POST /uploads/import-urls
+    IMAGE_IMPORT_CONCURRENCY: int = 16      # downloads in flight across all hosts
+    IMAGE_IMPORT_PER_HOST: int = 4          # downloads in flight per remote host
+    IMAGE_IMPORT_TIMEOUT_SECONDS: float = 20
+    IMAGE_IMPORT_ALLOW_PRIVATE: bool = False  # let imports fetch from private/loopback addresses (off: SSRF guard)
+    IMAGE_LOOKUP_MAX_DISTANCE: int = 16     # dHash bits a photo may differ by and still match a bottle
+    IMAGE_DUPLICATE_MAX_DISTANCE: int = 4   # dHash bits two stored images may differ by to count as duplicates
+    UPLOAD_GC_INTERVAL_HOURS: float = 0     # run the orphaned-upload collector this often (0 = off)
+    UPLOAD_GC_GRACE_HOURS: float = 72       # never collect files younger than this
+    UPLOAD_GC_MODE: str = "quarantine"      # quarantine (move to .quarantine/) or delete
+    UPLOAD_GC_QUARANTINE_DAYS: float = 30   # quarantined batches are purged after this
 
     # --- Login rate limit (per IP) ---
     LOGIN_WINDOW_SECONDS: int = 60          # sliding window size
@@ -51,5 +80,23 @@ class Settings(BaseSettings):
     MARKET_PRICE_PROVIDER_API_KEY: str | None = None
     MARKET_PRICE_PROVIDER_NAME: str | None = None
     MARKET_PRICE_PROVIDER_TIMEOUT_SECONDS: int = 8
+    PRICE_SCREEN_ENABLED: bool = True           # quarantine provider/CSV prices that break from recent history
+    PRICE_SCREEN_MAX_SCORE: float = 3.5         # robust z-score (median/MAD of log prices) above which a price is held
+
+    # --- FX rates (currency conversion) ---
+    COLLECTION_CURRENCY: str = "USD"        # currency purchase prices (price_paid) are recorded in
+    FX_RATE_PROVIDER_URL: str | None = None  # supports {date} templating; returns {"base", "rates": {...}}
+    FX_RATE_PROVIDER_API_KEY: str | None = None
+    FX_RATE_PROVIDER_TIMEOUT_SECONDS: int = 8
+
+    # --- Metrics (Prometheus /metrics) ---
+    METRICS_ENABLED: bool = True
+    METRICS_ALLOW_LAN: bool = True          # scrapers on private addresses need no login; otherwise admins only
+    METRICS_DIR: str = ""                   # per-worker snapshots for multi-worker scrapes (default: <tmp>/whiskey-metrics)
+    METRICS_FLUSH_SECONDS: float = 5        # how often each worker writes its snapshot
+    SERVER_TIMING_ENABLED: bool = False     # Server-Timing header on every response (admins can ask per request)
+    SLOW_QUERY_MS: float = 250              # statements slower than this are logged with their query plan (0 = off)
+    N_PLUS_ONE_THRESHOLD: int = 10          # flag a request that runs one statement shape this many times (0 = off)
+    QUERY_STATS_MAX_STATEMENTS: int = 500   # distinct statement shapes tracked for GET /admin/queries
 
 settings = Settings()
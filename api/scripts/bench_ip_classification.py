@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for the per-request IP checks (trusted proxy + private network).
+
+Compares the previous implementation (fresh ip_network objects per call and a
+linear walk over TRUSTED_PROXIES) with app.ip_classification, both cold (LRU
+cleared, every address parsed and bisected) and warm (the usual case: a handful
+of LAN clients and proxies seen over and over).
+
+Usage:
+    python api/scripts/bench_ip_classification.py
+
+Environment:
+    TRUSTED_PROXIES (default from settings), N (default: 200000) lookups per case
+"""
+import ipaddress
+import os
+import random
+import sys
+import time
+from pathlib import Path
+
+API_ROOT = Path(__file__).resolve().parents[1]
+if str(API_ROOT) not in sys.path:
+    sys.path.insert(0, str(API_ROOT))
+
+from app import ip_classification  # noqa: E402
+from app.settings import settings  # noqa: E402
+
+N = int(os.getenv("N") or 200_000)
+
+
+def _legacy_trusted_nets():
+    nets = []
+    for cidr in (settings.TRUSTED_PROXIES or "").split(","):
+        cidr = cidr.strip()
+        if cidr:
+            try:
+                nets.append(ipaddress.ip_network(cidr, strict=False))
+            except ValueError:
+                pass
+    return nets
+
+
+_LEGACY_NETS = _legacy_trusted_nets()
+
+
+def legacy(ip: str) -> tuple[bool, bool]:
+    try:
+        addr = ipaddress.ip_address(ip)
+    except ValueError:
+        return False, False
+    trusted = any(addr in net for net in _LEGACY_NETS)
+    private = (
+        addr.is_private
+        or addr.is_loopback
+        or addr in ipaddress.ip_network("10.0.0.0/8")
+        or addr in ipaddress.ip_network("172.16.0.0/12")
+        or addr in ipaddress.ip_network("192.168.0.0/16")
+    )
+    return trusted, private
+
+
+def current(ip: str) -> tuple[bool, bool]:
+    info = ip_classification.classify(ip)
+    return info.trusted_proxy, info.private
+
+
+def current_cold(ip: str) -> tuple[bool, bool]:
+    ip_classification.classify.cache_clear()
+    return current(ip)
+
+
+def _run(label: str, fn, addresses: list[str]) -> float:
+    started = time.perf_counter()
+    for ip in addresses:
+        fn(ip)
+    elapsed = time.perf_counter() - started
+    print(f"[bench] {label:<28} {elapsed / len(addresses) * 1e6:8.3f} us/lookup")
+    return elapsed
+
+
+def main():
+    rng = random.Random(42)
+    hot = ["192.168.1.20", "192.168.1.31", "10.0.0.5", "172.18.0.1", "203.0.113.9", "2001:db8::7"]
+    workload = [rng.choice(hot) for _ in range(N)]
+    spread = [str(ipaddress.IPv4Address(rng.getrandbits(32))) for _ in range(N // 4)]
+    spread += [str(ipaddress.IPv6Address(rng.getrandbits(128))) for _ in range(N // 4)]
+
+    assert all(legacy(ip) == current(ip) for ip in hot + spread[:2000])
+    print(f"[bench] TRUSTED_PROXIES={settings.TRUSTED_PROXIES!r}  lookups={N}")
+    base = _run("legacy (hot clients)", legacy, workload)
+    warm = _run("cached (hot clients)", current, workload)
+    cache = ip_classification.cache_info()
+    _run("legacy (random addresses)", legacy, spread)
+    _run("uncached (random addresses)", current_cold, spread)
+    print(f"[bench] speed-up on the request path: {base / warm:.1f}x  (cache hits={cache.hits} misses={cache.misses})")
+
+
+if __name__ == "__main__":
+    main()
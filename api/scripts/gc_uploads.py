@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Find uploads that no bottle or wine references any more and quarantine or delete them.
+
+Every image_url in both databases is collected first; files under UPLOAD_DIR that
+none of them point at (plus leftover tmp_* files) are removed once older than the
+grace period, and expired resumable-upload sessions are swept. The same job can
+run on a schedule inside the API (UPLOAD_GC_INTERVAL_HOURS).
+
+Usage (inside container):
+    python /srv/api/scripts/gc_uploads.py         # dry-run: report what would go
+    RUN=1 python /srv/api/scripts/gc_uploads.py   # quarantine / delete
+
+Environment:
+    DATABASE_URL, WINE_DATABASE_URL, UPLOAD_DIR
+    UPLOAD_GC_GRACE_HOURS (default: 72), UPLOAD_GC_MODE (quarantine | delete),
+    UPLOAD_GC_QUARANTINE_DAYS (default: 30)
+    RUN=1 to act; otherwise dry-run only.
+"""
+import os
+import sys
+import time
+from pathlib import Path
+
+API_ROOT = Path(__file__).resolve().parents[1]
+if str(API_ROOT) not in sys.path:
+    sys.path.insert(0, str(API_ROOT))
+
+from sqlmodel import Session  # noqa: E402
+
+from app.db import engine, init_db  # noqa: E402
+from app.services.upload_gc import collect_garbage  # noqa: E402
+from app.services.upload_sessions import UploadSessionStore  # noqa: E402
+from app.settings import settings  # noqa: E402
+
+UPLOAD_DIR = settings.UPLOAD_DIR
+RUN = os.getenv("RUN") == "1"
+
+
+def main():
+    mode = settings.UPLOAD_GC_MODE
+    print(
+        f"[gc] UPLOAD_DIR={UPLOAD_DIR}  mode={mode}  grace={settings.UPLOAD_GC_GRACE_HOURS}h  "
+        f"run={'COMMIT' if RUN else 'DRY-RUN'}"
+    )
+    if not os.path.isdir(UPLOAD_DIR):
+        print(f"[gc] UPLOAD_DIR not found: {UPLOAD_DIR}")
+        raise SystemExit(1)
+
+    init_db()
+    started = time.perf_counter()
+    if RUN:
+        swept = UploadSessionStore(UPLOAD_DIR, ttl_seconds=settings.UPLOAD_SESSION_TTL_HOURS * 3600).sweep()
+        print(f"[gc] expired resumable upload sessions removed: {swept}")
+    with Session(engine) as session:
+        result = collect_garbage(
+            session,
+            UPLOAD_DIR,
+            grace_hours=settings.UPLOAD_GC_GRACE_HOURS,
+            mode=mode,
+            quarantine_days=settings.UPLOAD_GC_QUARANTINE_DAYS,
+            dry_run=not RUN,
+        )
+    elapsed = time.perf_counter() - started
+
+    print(
+        f"[gc] scanned={result.scanned} referenced={result.kept_referenced} too_recent={result.kept_recent} "
+        f"removed={result.removed} tmp_removed={result.tmp_removed} "
+        f"reclaimed={result.bytes_reclaimed / 1024 / 1024:.1f} MB "
+        f"quarantine_batches_purged={result.quarantine_purged} in {elapsed:.2f}s"
+    )
+    for err in result.errors[:20]:
+        print(f"[gc]   error {err}")
+    if not RUN:
+        print("[gc] DRY-RUN: nothing removed. Set RUN=1 to collect.")
+
+
+if __name__ == "__main__":
+    main()
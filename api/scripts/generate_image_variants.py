@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Render the responsive WebP/AVIF variants for uploads stored before variants existed
+(or after IMAGE_VARIANT_WIDTHS / IMAGE_VARIANT_FORMATS changed).
+
+Each original under UPLOAD_DIR is checked for the variant files it should have; only
+the missing ones are rendered, in parallel worker processes. Variants are written
+atomically, so the script can be interrupted and simply re-run to resume.
+
+Usage (inside container):
+    python /srv/api/scripts/generate_image_variants.py         # dry-run
+    RUN=1 python /srv/api/scripts/generate_image_variants.py   # render variants
+
+Environment:
+    UPLOAD_DIR (default: static/uploads), IMAGE_VARIANT_WIDTHS, IMAGE_VARIANT_FORMATS
+    WORKERS (default: CPU count) processes to render with
+    RUN=1 to render; otherwise dry-run only.
+"""
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+API_ROOT = Path(__file__).resolve().parents[1]
+if str(API_ROOT) not in sys.path:
+    sys.path.insert(0, str(API_ROOT))
+
+from PIL import Image, UnidentifiedImageError  # noqa: E402
+
+from app.services import image_variants  # noqa: E402
+from app.services.image_processing import render_variants  # noqa: E402
+from app.settings import settings  # noqa: E402
+
+UPLOAD_DIR = settings.UPLOAD_DIR
+RUN = os.getenv("RUN") == "1"
+WORKERS = int(os.getenv("WORKERS") or os.cpu_count() or 2)
+ORIGINAL_EXTS = {".jpg", ".jpeg", ".png", ".gif", ".webp"}
+
+
+def _originals():
+    """Stored originals, in the content-addressed tree and (until migrated) the flat legacy layout."""
+    for root, dirs, files in os.walk(UPLOAD_DIR):
+        dirs.sort()
+        for name in sorted(files):
+            if (
+                name.startswith("tmp_")
+                or image_variants.is_variant(name)
+                or os.path.splitext(name)[1].lower() not in ORIGINAL_EXTS
+            ):
+                continue
+            yield os.path.join(root, name)
+
+
+def pending_jobs(widths, formats):
+    """(path, missing (width, format) pairs) for every original that still lacks variants."""
+    for path in _originals():
+        try:
+            with Image.open(path) as img:  # header only
+                source_width = image_variants.upright_width(img)
+        except (UnidentifiedImageError, OSError):
+            print(f"[variants] skip unreadable {os.path.relpath(path, UPLOAD_DIR)}")
+            continue
+        missing = image_variants.missing_variants(
+            os.path.dirname(path), path, widths, formats, source_width=source_width
+        )
+        if missing:
+            yield path, missing
+
+
+def main():
+    widths = image_variants.configured_widths()
+    formats = image_variants.configured_formats()
+    print(
+        f"[variants] UPLOAD_DIR={UPLOAD_DIR}  widths={widths}  formats={formats}  "
+        f"workers={WORKERS}  mode={'COMMIT' if RUN else 'DRY-RUN'}"
+    )
+    if not os.path.isdir(UPLOAD_DIR):
+        print(f"[variants] UPLOAD_DIR not found: {UPLOAD_DIR}")
+        raise SystemExit(1)
+    if not widths or not formats:
+        print("[variants] nothing configured (check IMAGE_VARIANT_WIDTHS / IMAGE_VARIANT_FORMATS)")
+        return
+
+    jobs = list(pending_jobs(widths, formats))
+    print(f"[variants] originals needing variants: {len(jobs)}  files to render: {sum(len(m) for _, m in jobs)}")
+    if not RUN:
+        for path, missing in jobs[:8]:
+            print(f"[variants]   {os.path.relpath(path, UPLOAD_DIR)}: {missing}")
+        print("[variants] DRY-RUN: nothing written. Set RUN=1 to render.")
+        return
+
+    started = time.perf_counter()
+    done = failed = rendered = 0
+    with ProcessPoolExecutor(max_workers=WORKERS) as pool:
+        futures = {
+            pool.submit(render_variants, path, os.path.dirname(path), missing, settings.IMAGE_VARIANT_QUALITY): path
+            for path, missing in jobs
+        }
+        for future in as_completed(futures):
+            name = os.path.relpath(futures[future], UPLOAD_DIR)
+            try:
+                rendered += len(future.result())
+                done += 1
+            except Exception as exc:
+                failed += 1
+                print(f"[variants] failed {name}: {exc}")
+            if (done + failed) % 100 == 0:
+                print(f"[variants] progress {done + failed}/{len(jobs)}")
+
+    elapsed = time.perf_counter() - started
+    print(f"[variants] originals={done} failed={failed} variants_written={rendered} in {elapsed:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
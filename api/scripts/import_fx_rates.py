@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Load daily FX rates into the fx_rate table.
+
+The CSV needs a header row with `currency`, `rate_date` (or `date`) and `rate`,
+where rate is units of the currency per one USD (e.g. `EUR,2024-05-01,0.93`);
+an optional `source` column is kept for reference. Rates already stored for the
+same (currency, day) are replaced, so re-running an import is safe.
+
+Usage (inside container):
+    python /srv/api/scripts/import_fx_rates.py /data/fx_rates.csv         # dry-run
+    RUN=1 python /srv/api/scripts/import_fx_rates.py /data/fx_rates.csv   # commit changes
+
+Environment:
+    DATABASE_URL (default: sqlite:////data/whiskey.db)
+    RUN=1 to commit; otherwise dry-run only.
+"""
+import os
+import sys
+import time
+from pathlib import Path
+
+API_ROOT = Path(__file__).resolve().parents[1]
+if str(API_ROOT) not in sys.path:
+    sys.path.insert(0, str(API_ROOT))
+
+from sqlmodel import Session  # noqa: E402
+
+from app.db import engine, init_db  # noqa: E402
+from app.services.fx import import_fx_csv  # noqa: E402
+
+RUN = os.getenv("RUN") == "1"
+
+
+def main():
+    if len(sys.argv) != 2:
+        print("usage: import_fx_rates.py <rates.csv>")
+        raise SystemExit(2)
+
+    path = sys.argv[1]
+    print(f"[fx] CSV={path}  mode={'COMMIT' if RUN else 'DRY-RUN'}")
+    if not os.path.exists(path):
+        print(f"[fx] CSV not found: {path}")
+        raise SystemExit(1)
+
+    init_db()
+    started = time.perf_counter()
+    with Session(engine) as session, open(path, "rb") as f:
+        result = import_fx_csv(session, f, commit=RUN)
+    elapsed = time.perf_counter() - started
+
+    print(f"[fx] rows={result.rows} stored={result.stored} invalid={result.invalid} in {elapsed:.2f}s")
+    for err in result.errors:
+        print(f"[fx]   line {err.line}: {err.detail}")
+    if not RUN:
+        print("[fx] DRY-RUN: Rolled back changes. Set RUN=1 to commit.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Stream a market price CSV into the market_price table.
+
+The CSV needs a header row with at least `barcode_upc`; optional columns are
+price, currency, source, provider, as_of and notes (same shape as
+data/market_prices.csv). Rows already stored for the same
+(barcode_upc, as_of, provider) are skipped, so re-running an import is safe.
+Rows without as_of are dated with the import time, and skipped when the newest
+stored price for their (barcode_upc, provider) has the same price and currency.
+
+Usage (inside container):
+    python /srv/api/scripts/import_market_prices.py /data/prices.csv         # dry-run
+    RUN=1 python /srv/api/scripts/import_market_prices.py /data/prices.csv   # commit changes
+
+Environment:
+    DATABASE_URL (default: sqlite:////data/whiskey.db)
+    RUN=1 to commit; otherwise dry-run only.
+"""
+import os
+import sys
+import time
+from pathlib import Path
+
+API_ROOT = Path(__file__).resolve().parents[1]
+if str(API_ROOT) not in sys.path:
+    sys.path.insert(0, str(API_ROOT))
+
+from sqlmodel import Session  # noqa: E402
+
+from app.db import engine, init_db  # noqa: E402
+from app.services.price_import import import_price_csv  # noqa: E402
+
+RUN = os.getenv("RUN") == "1"
+
+
+def main():
+    if len(sys.argv) != 2:
+        print("usage: import_market_prices.py <prices.csv>")
+        raise SystemExit(2)
+
+    path = sys.argv[1]
+    print(f"[prices] CSV={path}  mode={'COMMIT' if RUN else 'DRY-RUN'}")
+    if not os.path.exists(path):
+        print(f"[prices] CSV not found: {path}")
+        raise SystemExit(1)
+
+    init_db()
+    started = time.perf_counter()
+    with Session(engine) as session, open(path, "rb") as f:
+        result = import_price_csv(session, f, created_by="cli", commit=RUN)
+    elapsed = time.perf_counter() - started
+
+    print(
+        f"[prices] rows={result.rows} inserted={result.inserted} quarantined={result.quarantined} "
+        f"duplicates={result.duplicates} invalid={result.invalid} in {elapsed:.2f}s"
+    )
+    for err in result.errors:
+        print(f"[prices]   line {err.line}: {err.detail}")
+    if not RUN:
+        print("[prices] DRY-RUN: Rolled back changes. Set RUN=1 to commit.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Compute perceptual hashes (dHash) for stored images that do not have one yet, e.g.
+uploads from before photo lookup existed or files moved in by migrate_uploads_to_store.py.
+
+Hashing runs in parallel worker processes; rows are committed in batches, so the
+script can be interrupted and re-run to resume.
+
+Usage (inside container):
+    python /srv/api/scripts/index_image_hashes.py         # dry-run
+    RUN=1 python /srv/api/scripts/index_image_hashes.py   # hash and store
+
+Environment:
+    DATABASE_URL, UPLOAD_DIR (default: static/uploads)
+    WORKERS (default: CPU count) processes to hash with
+    RUN=1 to write; otherwise dry-run only.
+"""
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+API_ROOT = Path(__file__).resolve().parents[1]
+if str(API_ROOT) not in sys.path:
+    sys.path.insert(0, str(API_ROOT))
+
+from sqlalchemy import select  # noqa: E402
+from sqlmodel import Session  # noqa: E402
+
+from app.db import engine, init_db  # noqa: E402
+from app.models import ImageHash, StoredImage  # noqa: E402
+from app.services.image_hashes import compute_dhash, to_signed  # noqa: E402
+from app.settings import settings  # noqa: E402
+
+UPLOAD_DIR = settings.UPLOAD_DIR
+RUN = os.getenv("RUN") == "1"
+WORKERS = int(os.getenv("WORKERS") or os.cpu_count() or 2)
+BATCH = 200
+
+
+def _hash(path: str):
+    try:
+        return compute_dhash(path), None
+    except Exception as exc:
+        return None, str(exc)
+
+
+def main():
+    print(f"[hashes] UPLOAD_DIR={UPLOAD_DIR}  workers={WORKERS}  mode={'COMMIT' if RUN else 'DRY-RUN'}")
+    init_db()
+    with Session(engine) as session:
+        pending = session.execute(
+            select(StoredImage.sha256, StoredImage.path)
+            .outerjoin(ImageHash, ImageHash.sha256 == StoredImage.sha256)
+            .where(ImageHash.hash_id.is_(None))
+            .order_by(StoredImage.sha256)
+        ).all()
+    print(f"[hashes] stored images without a hash: {len(pending)}")
+    if not RUN:
+        for sha, path in pending[:8]:
+            print(f"[hashes]   {path}")
+        print("[hashes] DRY-RUN: nothing written. Set RUN=1 to hash.")
+        return
+
+    started = time.perf_counter()
+    hashed = failed = 0
+    with ProcessPoolExecutor(max_workers=WORKERS) as pool, Session(engine) as session:
+        paths = [os.path.join(UPLOAD_DIR, path) for _, path in pending]
+        for (sha, path), (value, error) in zip(pending, pool.map(_hash, paths, chunksize=16)):
+            if value is None:
+                failed += 1
+                print(f"[hashes] failed {path}: {error}")
+                continue
+            session.add(ImageHash(sha256=sha, dhash=to_signed(value)))
+            hashed += 1
+            if hashed % BATCH == 0:
+                session.commit()
+                print(f"[hashes] progress {hashed + failed}/{len(pending)}")
+        session.commit()
+
+    elapsed = time.perf_counter() - started
+    print(f"[hashes] hashed={hashed} failed={failed} in {elapsed:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Move uploads from the old flat UPLOAD_DIR layout (``<uuid>.jpg``) into the
+content-addressed store (``ab/cd/<sha256>.jpg``), deduplicating identical files.
+
+Every moved file (and any ``<uuid>.w<width>.<fmt>`` variant next to it) gets a
+legacy_upload row so the existing ``/uploads/<name>`` URLs in the database keep
+resolving; image_url values are left untouched. Rows are committed before files
+move, so an interrupted run is finished by simply running it again. Reference
+counts are recomputed at the end.
+
+Usage (inside container):
+    python /srv/api/scripts/migrate_uploads_to_store.py         # dry-run
+    RUN=1 python /srv/api/scripts/migrate_uploads_to_store.py   # move files
+
+Environment:
+    DATABASE_URL (default: sqlite:////data/whiskey.db), WINE_DATABASE_URL
+    UPLOAD_DIR (default: static/uploads)
+    RUN=1 to commit; otherwise dry-run only.
+"""
+import os
+import re
+import sys
+import time
+from pathlib import Path
+
+API_ROOT = Path(__file__).resolve().parents[1]
+if str(API_ROOT) not in sys.path:
+    sys.path.insert(0, str(API_ROOT))
+
+from sqlmodel import Session  # noqa: E402
+
+from app.db import engine, init_db  # noqa: E402
+from app.models import LegacyUpload  # noqa: E402
+from app.services import upload_store  # noqa: E402
+from app.settings import settings  # noqa: E402
+
+UPLOAD_DIR = settings.UPLOAD_DIR
+RUN = os.getenv("RUN") == "1"
+BATCH = 200
+ORIGINAL_EXTS = {".jpg": ".jpg", ".jpeg": ".jpg", ".png": ".png", ".gif": ".gif", ".webp": ".webp"}
+_VARIANT_RE = re.compile(r"^(?P<stem>.+)\.(?P<suffix>w\d+\.(?:webp|avif))$")
+
+
+def scan():
+    """(originals, variants by stem) found directly in UPLOAD_DIR."""
+    originals, variants = [], {}
+    for entry in sorted(os.scandir(UPLOAD_DIR), key=lambda e: e.name):
+        if not entry.is_file() or entry.name.startswith("tmp_"):
+            continue
+        match = _VARIANT_RE.match(entry.name)
+        if match:
+            variants.setdefault(match.group("stem"), []).append((entry.name, match.group("suffix")))
+        elif os.path.splitext(entry.name)[1].lower() in ORIGINAL_EXTS:
+            originals.append(entry.name)
+    return originals, variants
+
+
+def plan(name, variants):
+    """[(legacy name, store path)] for one original and its variants, plus its hash and size."""
+    path = os.path.join(UPLOAD_DIR, name)
+    sha256 = upload_store.hash_file(path)
+    rel = upload_store.shard_path(sha256, ORIGINAL_EXTS[os.path.splitext(name)[1].lower()])
+    moves = [(name, rel)]
+    stem = os.path.splitext(name)[0]
+    for vname, suffix in variants.get(stem, ()):
+        moves.append((vname, f"{os.path.dirname(rel)}/{sha256}.{suffix}"))
+    return sha256, os.path.getsize(path), moves
+
+
+def move(name, rel):
+    """Returns True when identical content was already in the store."""
+    src = os.path.join(UPLOAD_DIR, name)
+    dest = os.path.join(UPLOAD_DIR, rel)
+    if os.path.exists(dest):
+        os.remove(src)
+        return True
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    os.replace(src, dest)
+    return False
+
+
+def main():
+    print(f"[store] UPLOAD_DIR={UPLOAD_DIR}  mode={'COMMIT' if RUN else 'DRY-RUN'}")
+    if not os.path.isdir(UPLOAD_DIR):
+        print(f"[store] UPLOAD_DIR not found: {UPLOAD_DIR}")
+        raise SystemExit(1)
+
+    init_db()
+    originals, variants = scan()
+    print(f"[store] flat originals: {len(originals)}  flat variants: {sum(len(v) for v in variants.values())}")
+
+    started = time.perf_counter()
+    moved = duplicates = 0
+    seen: set[str] = set()
+    for start in range(0, len(originals), BATCH):
+        planned = [plan(name, variants) for name in originals[start:start + BATCH]]
+        for sha256, _, moves in planned:
+            duplicates += sha256 in seen
+            seen.add(sha256)
+        if not RUN:
+            for sha256, _, moves in planned[:8] if start == 0 else ():
+                print(f"[store]   {moves[0][0]} -> {moves[0][1]}")
+            continue
+
+        # Aliases first: if we stop between the two steps, re-running redoes the moves.
+        with Session(engine) as session:
+            for sha256, size, moves in planned:
+                upload_store.register(session, sha256, moves[0][1], size)
+                for name, rel in moves:
+                    session.merge(LegacyUpload(name=name, path=rel, sha256=sha256))
+            session.commit()
+        for _, _, moves in planned:
+            for name, rel in moves:
+                move(name, rel)
+                moved += 1
+        print(f"[store] progress {min(start + BATCH, len(originals))}/{len(originals)}")
+
+    elapsed = time.perf_counter() - started
+    print(f"[store] originals={len(originals)} unique={len(seen)} duplicates={duplicates} files_moved={moved} in {elapsed:.2f}s")
+    if not RUN:
+        print("[store] DRY-RUN: nothing moved. Set RUN=1 to migrate.")
+        return
+
+    with Session(engine) as session:
+        counts = upload_store.recount_references(session)
+    print(f"[store] references: {counts}")
+
+
+if __name__ == "__main__":
+    main()
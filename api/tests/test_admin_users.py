@@ -15,6 +15,8 @@ def _configure_test_db() -> None:
     fd, path_str = tempfile.mkstemp(prefix="test-admin-users", suffix=".db")
     os.close(fd)
     os.environ["DATABASE_URL"] = f"sqlite:///{path_str}"
+    if "UPLOAD_DIR" not in os.environ:
+        os.environ["UPLOAD_DIR"] = tempfile.mkdtemp(prefix="test-admin-users-uploads-")
 
 
 _configure_test_db()
@@ -177,3 +179,59 @@ def test_verify_password_supports_legacy_bcrypt_hashes():
     # Historical bcrypt variants can be stored as $2y$ in older datasets.
     legacy_2y = "$2y$" + hashed[4:]
     assert verify_password(plain, legacy_2y)
+
+
+def test_auth_decision_runs_once_per_request_and_tokens_are_verified_once(monkeypatch):
+    deps = importlib.import_module("app.deps")
+    security = importlib.import_module("app.security")
+    bootstrap_admin()
+    client = TestClient(app)
+    login(client)
+    security.access_token_cache.clear()
+    hits = security.access_token_cache.hits
+
+    calls = {"ip": 0, "decode": 0}
+    real_ip, real_decode = deps._ip_from_request, security.decode_token
+
+    def counting_ip(request):
+        calls["ip"] += 1
+        return real_ip(request)
+
+    def counting_decode(token):
+        calls["decode"] += 1
+        return real_decode(token)
+
+    monkeypatch.setattr(deps, "_ip_from_request", counting_ip)
+    monkeypatch.setattr(security, "decode_token", counting_decode)
+
+    # /bottles declares get_current_user_role on the router and require_view_access on the route.
+    for _ in range(3):
+        assert client.get("/bottles").status_code == 200
+    assert calls == {"ip": 3, "decode": 1}
+    assert security.access_token_cache.hits - hits == 2
+
+
+def test_token_cache_honors_expiry_and_size(monkeypatch):
+    from datetime import timedelta
+
+    from fastapi import HTTPException
+
+    security = importlib.import_module("app.security")
+    cache = security.TokenCache(max_size=2)
+    tokens = [security.create_token(f"user{i}", "user", timedelta(minutes=5)) for i in range(3)]
+    for token in tokens:
+        cache.put(token, security.decode_token(token))
+    assert cache.get(tokens[0]) is None              # least recently used was evicted
+    assert cache.get(tokens[2])["sub"] == "user2"
+
+    # Even a token that got into the cache is not served past its exp.
+    expired = security.create_token("late", "admin", timedelta(seconds=-1))
+    cache.put(expired, {"sub": "late", "role": "admin", "exp": security.time.time() - 1})
+    assert cache.get(expired) is None
+    monkeypatch.setattr(security, "access_token_cache", cache)
+    try:
+        security.decode_token_cached(expired)
+    except HTTPException as exc:
+        assert exc.status_code == 401
+    else:
+        raise AssertionError("expired token must not be served from the cache")
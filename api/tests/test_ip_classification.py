@@ -0,0 +1,63 @@
+import importlib
+import ipaddress
+import random
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+API_ROOT = Path(__file__).resolve().parents[1]
+if str(API_ROOT) not in sys.path:
+    sys.path.insert(0, str(API_ROOT))
+
+ip_classification = importlib.import_module("app.ip_classification")
+
+
+def test_private_ranges_match_the_standard_library() -> None:
+    rng = random.Random(1)
+    samples = [str(ipaddress.IPv4Address(rng.getrandbits(32))) for _ in range(3000)]
+    samples += [str(ipaddress.IPv6Address(rng.getrandbits(128))) for _ in range(1000)]
+    samples += [
+        "10.1.2.3", "172.31.255.255", "172.32.0.0", "192.168.0.1", "127.0.0.1", "169.254.1.1",
+        "100.64.0.1", "8.8.8.8", "::1", "fe80::1", "fd00::5", "2001:db8::1", "2606:4700::1111",
+    ]
+    for ip in samples:
+        addr = ipaddress.ip_address(ip)
+        assert ip_classification.is_private_ip(ip) == (addr.is_private or addr.is_loopback), ip
+
+    # IPv4 clients on a dual-stack socket are judged by their IPv4 address.
+    assert ip_classification.is_private_ip("::ffff:192.168.1.4")
+    assert not ip_classification.is_private_ip("::ffff:8.8.8.8")
+    assert not ip_classification.is_private_ip("not-an-ip")
+
+
+def test_publicly_routable_excludes_special_purpose_ranges() -> None:
+    for ip in ("8.8.8.8", "2606:4700::1111", "::ffff:8.8.8.8"):
+        assert ip_classification.is_publicly_routable(ip), ip
+    for ip in (
+        "10.0.0.1", "127.0.0.1", "169.254.169.254", "::1", "fd00::5",   # private
+        "100.64.0.1", "224.0.0.251", "239.255.255.250", "64:ff9b::a00:1", "fec0::1", "ff02::1",
+        "::ffff:100.64.0.1", "not-an-ip",
+    ):
+        assert not ip_classification.is_publicly_routable(ip), ip
+    assert not ip_classification.is_private_ip("100.64.0.1")   # LAN guest access is unchanged
+
+
+def test_trusted_proxies_and_forwarded_client_ip(monkeypatch) -> None:
+    settings = importlib.import_module("app.settings").settings
+    try:
+        ip_classification.configure_trusted_proxies("10.0.0.0/8, 10.2.0.0/16, 203.0.113.7, 2001:db8::1, bogus")
+        assert ip_classification.is_trusted_proxy("10.2.3.4")
+        assert ip_classification.is_trusted_proxy("203.0.113.7")
+        assert not ip_classification.is_trusted_proxy("203.0.113.8")
+        assert ip_classification.is_trusted_proxy("2001:db8::1")
+        assert not ip_classification.is_trusted_proxy("2001:db8::2")
+
+        def request(peer, **headers):
+            return SimpleNamespace(client=SimpleNamespace(host=peer), headers=headers)
+
+        forwarded = {"x-forwarded-for": "198.51.100.20, 10.0.0.1"}
+        assert ip_classification.client_ip(request("10.9.9.9", **forwarded)) == "198.51.100.20"
+        assert ip_classification.client_ip(request("8.8.4.4", **forwarded)) == "8.8.4.4"
+        assert ip_classification.client_ip(SimpleNamespace(client=None, headers={}), default_peer="unknown") == "unknown"
+    finally:
+        ip_classification.configure_trusted_proxies(settings.TRUSTED_PROXIES)
@@ -0,0 +1,63 @@
+import importlib
+import logging
+import sys
+from pathlib import Path
+
+API_ROOT = Path(__file__).resolve().parents[1]
+if str(API_ROOT) not in sys.path:
+    sys.path.insert(0, str(API_ROOT))
+
+log_sampling = importlib.import_module("app.log_sampling")
+
+
+class _Collect(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.lines: list[str] = []
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self.lines.append(record.getMessage())
+
+
+def _logger(name: str) -> tuple[logging.Logger, _Collect]:
+    logger = logging.getLogger(name)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    handler = _Collect()
+    logger.handlers = [handler]
+    return logger, handler
+
+
+def test_sampled_log_caps_lines_per_reason_and_summarises() -> None:
+    logger, sink = _logger("test.sampled")
+    now = [0.0]
+    log = log_sampling.SampledLog(logger, "decision", per_window=2, window=60, clock=lambda: now[0])
+
+    written = [log.log("granted", ip="192.168.1.5", host="bar.local") for _ in range(50)]
+    written.append(log.log("ip_not_private", ip="8.8.8.8", host="my host"))
+    assert written.count(True) == 3
+    assert sink.lines[0] == "event=decision reason=granted ip=192.168.1.5 host=bar.local"
+    assert sink.lines[2] == 'event=decision reason=ip_not_private ip=8.8.8.8 host="my host"'
+
+    now[0] = 61.0
+    assert log.log("granted", ip="192.168.1.6", host="bar.local")
+    assert sink.lines[3] == "event=decision_summary window_s=61 total=51 suppressed.granted=48"
+    assert len(sink.lines) == 5
+
+    log.flush()
+    assert len(sink.lines) == 5   # nothing was suppressed in the new window
+
+
+def test_queue_logging_writes_through_the_target_handlers() -> None:
+    target, sink = _logger("test.queue_target")
+    logger = logging.getLogger("test.queue_target.child")
+    queued = log_sampling.QueueLogging(logger, target="test.queue_target")
+
+    queued.start()
+    assert not logger.propagate and queued.running
+    for i in range(100):
+        logger.info("line %d", i)
+    queued.stop()
+
+    assert sink.lines == [f"line {i}" for i in range(100)]
+    assert logger.propagate and not logger.handlers
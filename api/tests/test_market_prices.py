@@ -2,6 +2,7 @@ from __future__ import annotations
 
 import importlib
 import os
+import subprocess
 import sys
 import tempfile
 from datetime import datetime, timezone
@@ -16,6 +17,8 @@ def _configure_test_db() -> None:
     fd, path_str = tempfile.mkstemp(prefix="test-market-prices", suffix=".db")
     os.close(fd)
     os.environ["DATABASE_URL"] = f"sqlite:///{path_str}"
+    if "UPLOAD_DIR" not in os.environ:
+        os.environ["UPLOAD_DIR"] = tempfile.mkdtemp(prefix="test-market-prices-uploads-")
     os.environ.setdefault("TZ", "America/Chicago")
 
 
@@ -69,6 +72,19 @@ def login(client: TestClient, username: str = "root", password: str = "AdminPass
     assert response.status_code == 200
 
 
+def run_import_script(script: str, csv_text: str) -> None:
+    """Commit a CSV through one of the import scripts, in a separate process like the CLI would."""
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = Path(tmp) / "import.csv"
+        csv_path.write_text(csv_text)
+        subprocess.run(
+            [sys.executable, str(API_ROOT / "scripts" / script), str(csv_path)],
+            env={**os.environ, "DATABASE_URL": db_module.DATABASE_URL, "RUN": "1"},
+            check=True,
+            capture_output=True,
+        )
+
+
 def test_get_valuation_uses_database_record():
     init_db()
     upc = "012345678905"
@@ -221,3 +237,517 @@ def test_admin_can_update_price_record():
     assert updated["price"] == 118.5
     assert updated["currency"] == "EUR"
     assert updated["notes"] == "Adjusted price"
+
+
+def test_admin_can_import_price_csv():
+    init_db()
+    bootstrap_admin()
+    client = TestClient(app)
+    login(client)
+
+    csv_body = (
+        "barcode_upc,price,currency,source,as_of\n"
+        "  888888000001 ,40.0,usd,Dealer Sheet,2024-01-01\n"
+        "888888000001,45.5,USD,Dealer Sheet,2024-02-01\n"
+        "888888000002,60,eur,Dealer Sheet,2024-02-01\n"
+        "888888000002,60,eur,Dealer Sheet,2024-02-01\n"
+        "888888000003,not-a-price,USD,Dealer Sheet,2024-02-01\n"
+    )
+    files = {"file": ("prices.csv", csv_body.encode("utf-8"), "text/csv")}
+    resp = client.post("/admin/prices/import", files=files)
+    assert resp.status_code == 200, resp.text
+    result = resp.json()
+    assert result["rows"] == 5
+    assert result["inserted"] == 3
+    assert result["duplicates"] == 1
+    assert result["invalid"] == 1
+    assert result["errors"][0]["line"] == 6
+
+    # Re-importing the same sheet is a no-op
+    again = client.post("/admin/prices/import", files=files)
+    assert again.status_code == 200, again.text
+    assert again.json()["inserted"] == 0
+    assert again.json()["duplicates"] == 4
+
+    with Session(engine) as session:
+        rows = session.exec(
+            select(MarketPrice).where(MarketPrice.barcode_upc == "888888000002")
+        ).all()
+        assert len(rows) == 1
+        assert rows[0].currency == "EUR"
+        assert rows[0].ingest_type == "csv"
+        latest = session.get(models_module.MarketPriceLatest, "888888000001")
+        assert latest is not None
+        assert latest.price == 45.5
+
+    valuation = client.get("/valuation", params={"upc": "888888000001"})
+    assert valuation.status_code == 200
+    assert valuation.json()["price"] == 45.5
+
+
+def test_reimporting_an_undated_price_sheet_does_not_duplicate_it():
+    init_db()
+    bootstrap_admin()
+    client = TestClient(app)
+    login(client)
+
+    csv_body = (
+        "barcode_upc,price,source\n"
+        "888888100001,30,Shelf Sheet\n"
+        "888888100001,30,Shelf Sheet\n"
+        "888888100002,50,Shelf Sheet\n"
+    )
+    files = {"file": ("undated.csv", csv_body.encode("utf-8"), "text/csv")}
+    first = client.post("/admin/prices/import", files=files).json()
+    assert (first["inserted"], first["duplicates"]) == (2, 1)
+
+    again = client.post("/admin/prices/import", files=files).json()
+    assert (again["inserted"], again["duplicates"]) == (0, 3)
+
+    # A new price for an undated row is a new quote.
+    changed = "barcode_upc,price,source\n888888100001,32,Shelf Sheet\n888888100002,50,Shelf Sheet\n"
+    files = {"file": ("undated.csv", changed.encode("utf-8"), "text/csv")}
+    assert client.post("/admin/prices/import", files=files).json()["inserted"] == 1
+
+    with Session(engine) as session:
+        prices = session.exec(
+            select(MarketPrice.price).where(MarketPrice.barcode_upc == "888888100001").order_by(MarketPrice.price_id)
+        ).all()
+    assert prices == [30.0, 32.0]
+
+
+def test_price_import_batches_fit_sqlite_parameter_limit():
+    import io
+    import sqlite3
+
+    price_import = importlib.import_module("app.services.price_import")
+    init_db()
+
+    for as_of in ("2024-05-01", ""):   # dated and undated rows are deduplicated by separate queries
+        rows = [f"880{i:09d},{10 + i % 7}.5,{as_of}" for i in range(price_import.BATCH_SIZE)]
+        body = ("barcode_upc,price,as_of\n" + "\n".join(rows) + "\n").encode("utf-8")
+        with Session(engine) as session:
+            # Older SQLite builds allow 999 bound parameters; a full batch has more UPCs than that.
+            raw = session.connection().connection.driver_connection
+            previous = raw.setlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER, 999)
+            try:
+                result = price_import.import_price_csv(session, io.BytesIO(body), created_by="test", commit=False)
+            finally:
+                raw.setlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER, previous)
+        assert (result.rows, result.inserted, result.invalid) == (len(rows), len(rows), 0)
+
+
+def test_import_price_csv_requires_upc_column():
+    init_db()
+    bootstrap_admin()
+    client = TestClient(app)
+    login(client)
+
+    files = {"file": ("prices.csv", b"upc,price\n123456,10\n", "text/csv")}
+    resp = client.post("/admin/prices/import", files=files)
+    assert resp.status_code == 400
+
+
+def test_screening_quarantines_outlier_prices(monkeypatch):
+    from app.services import market_prices as market_services
+    admin_prices_module = importlib.import_module("app.routers.admin_prices")
+
+    init_db()
+    bootstrap_admin()
+    client = TestClient(app)
+    login(client)
+    upc = "777777000001"
+
+    with Session(engine) as session:
+        for day, price in enumerate([98.0, 100.0, 102.0, 99.0, 101.0], start=1):
+            session.add(MarketPrice(barcode_upc=upc, price=price, as_of=datetime(2024, 3, day), ingest_type="manual"))
+        session.commit()
+
+    csv_body = (
+        "barcode_upc,price,source,as_of\n"
+        f"{upc},10000,Dealer Sheet,2024-04-01\n"
+        f"{upc},0,Dealer Sheet,2024-04-02\n"
+        f"{upc},108,Dealer Sheet,2024-04-03\n"
+    )
+    files = {"file": ("prices.csv", csv_body.encode("utf-8"), "text/csv")}
+    resp = client.post("/admin/prices/import", files=files)
+    assert resp.status_code == 200, resp.text
+    assert resp.json()["inserted"] == 1
+    assert resp.json()["quarantined"] == 2
+
+    # Re-importing does not queue the same outliers twice
+    again = client.post("/admin/prices/import", files=files)
+    assert again.json()["quarantined"] == 0
+    assert again.json()["duplicates"] == 3
+
+    assert client.get("/valuation", params={"upc": upc}).json()["price"] == 108.0
+
+    reviews = client.get("/admin/prices/review", params={"upc": upc})
+    assert reviews.status_code == 200, reviews.text
+    by_price = {r["price"]: r for r in reviews.json()}
+    assert set(by_price) == {10000.0, 0.0}
+    assert by_price[10000.0]["baseline_price"] == 100.0
+    assert by_price[0.0]["reason"] == "non-positive price"
+
+    def fake_fetch(upc_value: str):
+        return market_services.ExternalQuote(
+            barcode_upc=upc_value,
+            price=1.0,
+            currency="USD",
+            source="Example API",
+            as_of=datetime(2024, 5, 1, tzinfo=timezone.utc),
+            provider="example_api",
+        )
+
+    monkeypatch.setattr(admin_prices_module, "fetch_external_quote", fake_fetch)
+    synced = client.post("/admin/prices/sync", json={"barcode_upc": upc})
+    assert synced.status_code == 409, synced.text
+
+    rejected = client.post(f"/admin/prices/review/{by_price[0.0]['review_id']}/reject")
+    assert rejected.status_code == 200, rejected.text
+    assert rejected.json()["status"] == "rejected"
+
+    approved = client.post(f"/admin/prices/review/{by_price[10000.0]['review_id']}/approve")
+    assert approved.status_code == 200, approved.text
+    assert approved.json()["status"] == "approved"
+    assert approved.json()["price_id"] is not None
+    assert client.post(f"/admin/prices/review/{by_price[10000.0]['review_id']}/approve").status_code == 409
+    assert client.get("/valuation", params={"upc": upc}).json()["price"] == 108.0  # approved row is older
+
+
+def test_screening_sees_prices_imported_by_other_processes():
+    screening = importlib.import_module("app.services.price_screening")
+
+    init_db()
+    upc = "777777000002"
+    with Session(engine) as session:
+        for day, price in enumerate([50.0, 51.0], start=1):
+            session.add(MarketPrice(barcode_upc=upc, price=price, as_of=datetime(2024, 3, day), ingest_type="manual"))
+        session.commit()
+
+    quote = [{"barcode_upc": upc, "price": 5000.0, "currency": "USD"}]
+    with Session(engine) as session:
+        assert screening.screen_prices(session, quote) == [None]   # too little history to judge; window now cached
+
+    run_import_script("import_market_prices.py", f"barcode_upc,price,as_of\n{upc},52.0,2024-03-03\n")
+    with Session(engine) as session:
+        [result] = screening.screen_prices(session, quote)
+    assert result is not None and result.baseline_price == 51.0
+
+def test_alert_rules_fire_on_latest_price_changes():
+    init_db()
+    bootstrap_admin()
+    Bottle = models_module.Bottle
+    Tag = models_module.Tag
+    BottleTag = models_module.BottleTag
+    upc_a, upc_b = "666000000001", "666000000002"
+
+    with Session(engine) as session:
+        bottle_a = Bottle(brand="Alerts", expression="A", style="Alert Style", barcode_upc=upc_a)
+        bottle_b = Bottle(brand="Alerts", expression="B", barcode_upc=upc_b)
+        tag = Tag(name="Alert Tag")
+        session.add_all([bottle_a, bottle_b, tag])
+        session.commit()
+        session.add(BottleTag(bottle_id=bottle_b.bottle_id, tag_id=tag.tag_id))
+        session.add(MarketPrice(barcode_upc=upc_a, price=100.0, as_of=datetime(2024, 1, 1), ingest_type="manual"))
+        session.add(MarketPrice(barcode_upc=upc_b, price=80.0, as_of=datetime(2024, 1, 1), ingest_type="manual"))
+        session.commit()
+        bottle_a_id, tag_id = bottle_a.bottle_id, tag.tag_id
+
+    client = TestClient(app)
+    assert client.post("/alerts/rules", json={"target": upc_a, "kind": "above", "threshold": 120}).status_code in (401, 403)
+    login(client)
+
+    rules = {}
+    for body in (
+        {"scope": "upc", "target": upc_a, "kind": "above", "threshold": 120},
+        {"scope": "style", "target": "alert style", "kind": "change_pct", "threshold": 10},
+        {"scope": "tag", "target": "Alert Tag", "kind": "below", "threshold": 60},
+    ):
+        resp = client.post("/alerts/rules", json=body)
+        assert resp.status_code == 201, resp.text
+        rules[body["scope"]] = resp.json()["rule_id"]
+
+    csv_body = (
+        "barcode_upc,price,source,as_of\n"
+        f"{upc_a},125,Dealer Sheet,2024-02-01\n"
+        f"{upc_b},75,Dealer Sheet,2024-02-01\n"
+    )
+    files = {"file": ("prices.csv", csv_body.encode("utf-8"), "text/csv")}
+    assert client.post("/admin/prices/import", files=files).status_code == 200
+
+    alerts = client.get("/alerts", params={"upc": upc_a}).json()
+    fired = {a["rule_id"]: a for a in alerts}
+    assert set(fired) == {rules["upc"], rules["style"]}
+    assert fired[rules["style"]]["change_pct"] == 25.0
+    assert fired[rules["upc"]]["previous_price"] == 100.0
+    assert client.get("/alerts", params={"upc": upc_b}).json() == []   # 75 is not below 60
+
+    # Already above the threshold: a further rise does not re-fire the crossing rule.
+    resp = client.post("/admin/prices", json={"barcode_upc": upc_a, "price": 130, "as_of": "2024-03-01T00:00:00"})
+    assert resp.status_code == 201, resp.text
+    assert len(client.get("/alerts", params={"rule_id": rules["upc"]}).json()) == 1
+
+    # Correcting the latest row in place is a change as well: 130 -> 150 is +15%.
+    latest_a = resp.json()["price_id"]
+    assert client.patch(f"/admin/prices/{latest_a}", json={"price": 150}).status_code == 200
+    style_alerts = client.get("/alerts", params={"rule_id": rules["style"]}).json()
+    assert sorted((a["previous_price"], a["price"]) for a in style_alerts) == [(100.0, 125.0), (130.0, 150.0)]
+
+    resp = client.post("/admin/prices", json={"barcode_upc": upc_b, "price": 55, "as_of": "2024-03-01T00:00:00"})
+    assert resp.status_code == 201, resp.text
+    tag_alerts = client.get("/alerts", params={"rule_id": rules["tag"]}).json()
+    assert [a["price"] for a in tag_alerts] == [55.0]
+
+    acked = client.post(f"/alerts/{tag_alerts[0]['alert_id']}/ack")
+    assert acked.status_code == 200, acked.text
+    assert acked.json()["acknowledged_by"] == "root"
+    assert all(a["rule_id"] != rules["tag"] for a in client.get("/alerts", params={"unacknowledged": True}).json())
+
+    # Tagging done by another process re-expands the cached rule index here too.
+    subprocess.run(
+        [sys.executable, "-c", (
+            "from sqlmodel import Session\n"
+            "from app.db import engine\n"
+            "from app.models import BottleTag\n"
+            "with Session(engine) as session:\n"
+            f"    session.add(BottleTag(bottle_id={bottle_a_id}, tag_id={tag_id}))\n"
+            "    session.commit()\n"
+        )],
+        cwd=API_ROOT,
+        env={**os.environ, "DATABASE_URL": db_module.DATABASE_URL},
+        check=True,
+        capture_output=True,
+    )
+    resp = client.post("/admin/prices", json={"barcode_upc": upc_a, "price": 50, "as_of": "2024-04-01T00:00:00"})
+    assert resp.status_code == 201, resp.text
+    assert [a["price"] for a in client.get("/alerts", params={"rule_id": rules["tag"], "upc": upc_a}).json()] == [50.0]
+
+
+def test_price_history_downsamples_by_bucket():
+    init_db()
+    upc = "999999000123"
+    samples = [
+        (datetime(2024, 3, 4, 9), 100.0),   # Monday
+        (datetime(2024, 3, 4, 18), 110.0),
+        (datetime(2024, 3, 6, 12), 90.0),
+        (datetime(2024, 3, 12, 12), 120.0),  # following week
+        (datetime(2024, 4, 2, 12), 130.0),
+    ]
+    with Session(engine) as session:
+        for as_of, price in samples:
+            session.add(MarketPrice(barcode_upc=upc, price=price, as_of=as_of, ingest_type="manual"))
+        session.commit()
+
+    client = TestClient(app)
+    daily = client.get("/valuation/history", params={"upc": upc, "bucket": "day"})
+    assert daily.status_code == 200, daily.text
+    first = daily.json()["points"][0]
+    assert first == {
+        "bucket": "2024-03-04",
+        "open": 100.0,
+        "close": 110.0,
+        "min": 100.0,
+        "max": 110.0,
+        "mean": 105.0,
+        "count": 2,
+    }
+
+    weekly = client.get("/valuation/history", params={"upc": upc, "bucket": "week"}).json()["points"]
+    assert [p["bucket"] for p in weekly] == ["2024-03-04", "2024-03-11", "2024-04-01"]
+    assert weekly[0]["close"] == 90.0
+    assert weekly[0]["min"] == 90.0
+    assert weekly[0]["count"] == 3
+
+    monthly = client.get(
+        "/valuation/history",
+        params={"upc": upc, "bucket": "month", "from": "2024-03-05", "to": "2024-03-31"},
+    ).json()["points"]
+    assert monthly == [
+        {"bucket": "2024-03-01", "open": 90.0, "close": 120.0, "min": 90.0, "max": 120.0, "mean": 105.0, "count": 2}
+    ]
+
+
+def test_portfolio_rollup_uses_prices_as_of_date():
+    from datetime import date
+
+    init_db()
+    bootstrap_admin()
+    Bottle = models_module.Bottle
+    Purchase = models_module.Purchase
+    Retailer = models_module.Retailer
+
+    with Session(engine) as session:
+        shop = Retailer(name="Portfolio Test Shop")
+        held = Bottle(brand="Portfolio", style="Portfolio Style A", region="Portfolio Region", barcode_upc="321000000001")
+        other = Bottle(brand="Portfolio", style="Portfolio Style B", region="Portfolio Region", barcode_upc="321000000002")
+        session.add_all([shop, held, other])
+        session.commit()
+        session.add_all(
+            [
+                Purchase(bottle_id=held.bottle_id, retailer_id=shop.retailer_id, price_paid=50.0, quantity=2,
+                         purchase_date=date(2023, 6, 1), status="sealed"),
+                Purchase(bottle_id=other.bottle_id, retailer_id=shop.retailer_id, price_paid=30.0, quantity=1,
+                         purchase_date=date(2023, 6, 1), status="finished",
+                         killed_dt=datetime(2024, 3, 1)),
+                MarketPrice(barcode_upc="321000000001", price=60.0, as_of=datetime(2023, 12, 1), ingest_type="manual"),
+                MarketPrice(barcode_upc="321000000002", price=35.0, as_of=datetime(2023, 12, 1), ingest_type="manual"),
+            ]
+        )
+        session.commit()
+
+    client = TestClient(app)
+    assert client.get("/valuation/portfolio").status_code == 401
+    login(client)
+
+    past = client.get("/valuation/portfolio", params={"as_of": "2024-01-15"})
+    assert past.status_code == 200, past.text
+    by_style = {row["key"]: row for row in past.json()["by_style"]}
+    assert by_style["Portfolio Style A"]["cost_basis"] == 100.0
+    assert by_style["Portfolio Style A"]["market_value"] == 120.0
+    assert by_style["Portfolio Style A"]["unrealized_gain"] == 20.0
+    assert by_style["Portfolio Style B"]["market_value"] == 35.0
+    by_retailer = {row["key"]: row for row in past.json()["by_retailer"]}
+    assert by_retailer["Portfolio Test Shop"]["bottles"] == 3
+
+    # The finished bottle drops out for current valuations
+    current = client.get("/valuation/portfolio").json()
+    by_style = {row["key"]: row for row in current["by_style"]}
+    assert "Portfolio Style B" not in by_style
+    assert by_style["Portfolio Style A"]["market_value"] == 120.0
+
+    # A new price write invalidates the cached rollup
+    resp = client.post(
+        "/admin/prices",
+        json={"barcode_upc": "321000000001", "price": 80.0, "as_of": "2024-05-01T00:00:00Z"},
+    )
+    assert resp.status_code == 201, resp.text
+    refreshed = {row["key"]: row for row in client.get("/valuation/portfolio").json()["by_style"]}
+    assert refreshed["Portfolio Style A"]["market_value"] == 160.0
+
+    # So does one committed by another process, such as the import script
+    run_import_script("import_market_prices.py", "barcode_upc,price,as_of\n321000000001,100.0,2024-06-01\n")
+    imported = {row["key"]: row for row in client.get("/valuation/portfolio").json()["by_style"]}
+    assert imported["Portfolio Style A"]["market_value"] == 200.0
+
+    # Before the purchase date nothing is held
+    early = {row["key"] for row in client.get("/valuation/portfolio", params={"as_of": "2023-01-01"}).json()["by_style"]}
+    assert "Portfolio Style A" not in early
+
+
+def test_currency_conversion_uses_as_of_fx_rates(monkeypatch):
+    from datetime import date
+
+    init_db()
+    bootstrap_admin()
+    Bottle = models_module.Bottle
+    Purchase = models_module.Purchase
+    upc = "655000000001"
+
+    client = TestClient(app)
+    login(client)
+
+    rates_csv = (
+        "currency,date,rate\n"
+        "EUR,2024-01-01,0.8\n"
+        "eur,2024-06-01,0.9\n"
+        "GBP,2024-01-01,0.75\n"
+        "GBP,2024-06-01,0.8\n"
+        "GBP,2024-06-01,not-a-rate\n"
+    )
+    files = {"file": ("fx.csv", rates_csv.encode("utf-8"), "text/csv")}
+    resp = client.post("/admin/fx/import", files=files)
+    assert resp.status_code == 200, resp.text
+    assert resp.json()["stored"] == 4
+    assert resp.json()["invalid"] == 1
+
+    with Session(engine) as session:
+        bottle = Bottle(brand="FX", expression="Test", style="FX Style", barcode_upc=upc)
+        session.add(bottle)
+        session.commit()
+        session.add(Purchase(bottle_id=bottle.bottle_id, price_paid=100.0, quantity=1, purchase_date=date(2024, 1, 1)))
+        session.add(MarketPrice(barcode_upc=upc, price=120.0, currency="GBP", as_of=datetime(2024, 1, 15), ingest_type="manual"))
+        session.add(MarketPrice(barcode_upc=upc, price=150.0, currency="GBP", as_of=datetime(2024, 6, 2), ingest_type="manual"))
+        session.commit()
+
+    valuation = client.get("/valuation", params={"upc": upc, "currency": "eur"})
+    assert valuation.status_code == 200, valuation.text
+    assert valuation.json()["currency"] == "EUR"
+    assert valuation.json()["price"] == 168.75          # 150 GBP / 0.8 * 0.9
+
+    history = client.get("/valuation/history", params={"upc": upc, "bucket": "month", "currency": "USD"})
+    assert history.status_code == 200, history.text
+    assert history.json()["currency"] == "USD"
+    assert [p["close"] for p in history.json()["points"]] == [160.0, 187.5]
+
+    portfolio = client.get("/valuation/portfolio", params={"currency": "EUR"})
+    assert portfolio.status_code == 200, portfolio.text
+    assert portfolio.json()["currency"] == "EUR"
+    row = next(r for r in portfolio.json()["by_style"] if r["key"] == "FX Style")
+    assert row["market_value"] == 168.75
+    assert row["cost_basis"] == 90.0
+    assert row["unrealized_gain"] == 78.75
+
+    as_of = client.get("/valuation/portfolio", params={"currency": "EUR", "as_of": "2024-02-01"})
+    row = next(r for r in as_of.json()["by_style"] if r["key"] == "FX Style")
+    assert row["market_value"] == 128.0                  # 120 GBP / 0.75 * 0.8
+
+    assert client.get("/valuation", params={"upc": upc, "currency": "JPY"}).status_code == 400
+
+    # Rates loaded by the import script in another process are picked up without a restart
+    run_import_script("import_fx_rates.py", "currency,date,rate\nJPY,2024-01-01,150\n")
+    yen = client.get("/valuation", params={"upc": upc, "currency": "JPY"})
+    assert yen.status_code == 200, yen.text
+    assert yen.json()["price"] == 28125.0               # 150 GBP / 0.8 * 150
+
+    # Cost basis in a currency without rates is an error, not zero cost and all-profit.
+    monkeypatch.setattr(importlib.import_module("app.settings").settings, "COLLECTION_CURRENCY", "CHF")
+    missing = client.get("/valuation/portfolio", params={"currency": "EUR", "as_of": "2024-03-01"})
+    assert missing.status_code == 400
+    assert missing.json()["detail"] == "No FX rate for CHF→EUR at 2024-03-01"
+
+
+def test_admin_analytics_computes_returns_and_drawdown():
+    from datetime import date
+
+    init_db()
+    bootstrap_admin()
+    Bottle = models_module.Bottle
+    Purchase = models_module.Purchase
+    upc = "654000000001"
+
+    with Session(engine) as session:
+        bottle = Bottle(brand="Analytics", expression="Test", barcode_upc=upc)
+        session.add(bottle)
+        session.commit()
+        session.add(Purchase(bottle_id=bottle.bottle_id, price_paid=100.0, quantity=2, purchase_date=date(2022, 1, 1)))
+        for as_of, price in [
+            (datetime(2022, 1, 1), 100.0),
+            (datetime(2022, 6, 1), 150.0),
+            (datetime(2023, 1, 1), 120.0),
+            (datetime(2024, 1, 1), 200.0),
+        ]:
+            session.add(MarketPrice(barcode_upc=upc, price=price, as_of=as_of, ingest_type="manual"))
+        session.commit()
+        bottle_id = bottle.bottle_id
+
+    client = TestClient(app)
+    assert client.get("/admin/analytics").status_code == 403
+    login(client)
+
+    resp = client.get("/admin/analytics", params={"limit": 5000})
+    assert resp.status_code == 200, resp.text
+    row = next(b for b in resp.json()["bottles"] if b["bottle_id"] == bottle_id)
+    assert row["cost_basis"] == 200.0
+    assert row["market_value"] == 400.0
+    assert row["latest_price"] == 200.0
+    assert row["total_return"] == 1.0
+    assert row["max_drawdown"] == 0.2
+    assert row["observations"] == 4
+    assert row["volatility"] > 0
+    assert 0 < row["cagr"] < 1
+
+    # A price imported by another process invalidates the cached series
+    run_import_script("import_market_prices.py", "barcode_upc,price,as_of\n654000000001,300.0,2024-06-01\n")
+    row = next(b for b in client.get("/admin/analytics", params={"limit": 5000}).json()["bottles"] if b["bottle_id"] == bottle_id)
+    assert row["market_value"] == 600.0
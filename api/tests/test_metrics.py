@@ -0,0 +1,90 @@
+import importlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+from fastapi.testclient import TestClient
+
+if "DATABASE_URL" not in os.environ:
+    _fd, _db_path = tempfile.mkstemp(prefix="test-metrics", suffix=".db")
+    os.close(_fd)
+    os.environ["DATABASE_URL"] = f"sqlite:///{_db_path}"
+if "UPLOAD_DIR" not in os.environ:
+    os.environ["UPLOAD_DIR"] = tempfile.mkdtemp(prefix="test-metrics-uploads-")
+
+API_ROOT = Path(__file__).resolve().parents[1]
+if str(API_ROOT) not in sys.path:
+    sys.path.insert(0, str(API_ROOT))
+
+
+def _modules():
+    app = importlib.import_module("app.main").app
+    importlib.import_module("app.db").init_db()
+    return app, importlib.import_module("app.metrics")
+
+
+def _sample(text: str, line_prefix: str) -> float:
+    for line in text.splitlines():
+        if line.startswith(line_prefix + " "):
+            return float(line.rsplit(" ", 1)[1])
+    raise AssertionError(f"{line_prefix} not in metrics output")
+
+
+def test_metrics_are_served_to_the_lan_only_and_label_routes_by_template(monkeypatch, tmp_path: Path) -> None:
+    app, metrics = _modules()
+    monkeypatch.setattr(metrics.store, "root", str(tmp_path))
+    lan = TestClient(app, client=("192.168.1.20", 50000))
+
+    assert lan.get("/health").status_code == 200
+    lan.get("/uploads/jobs/does-not-exist")
+    response = lan.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    body = response.text
+
+    assert _sample(body, 'whiskey_http_requests_total{method="GET",route="/health",status="200"}') >= 1
+    assert 'route="/uploads/jobs/{job_id}"' in body
+    assert "does-not-exist" not in body
+    assert 'whiskey_http_request_duration_seconds_bucket{method="GET",route="/health",le="+Inf"}' in body
+    assert "whiskey_db_query_duration_seconds_count" in body
+    assert 'whiskey_upload_jobs{status="queued"}' in body
+    assert "# TYPE whiskey_lan_guest_decisions_total counter" in body
+
+    outside = TestClient(app, client=("8.8.8.8", 50000))
+    assert outside.get("/metrics").status_code == 403
+
+    # Behind the local proxy the peer is loopback; the public hostname must still be refused.
+    deps = importlib.import_module("app.deps")
+    monkeypatch.setattr(deps, "_LAN_GUEST_HOSTS_IS_DEFAULT", False)
+    monkeypatch.setattr(deps, "_LAN_GUEST_HOSTS", ["whiskey.lan"])
+    proxied = TestClient(app, client=("127.0.0.1", 50000))
+    assert proxied.get("/metrics", headers={"X-Whiskey-Host": "whiskey.example.com"}).status_code == 403
+    assert proxied.get("/metrics", headers={"X-Whiskey-Host": "whiskey.lan"}).status_code == 200
+
+
+def test_metrics_include_other_workers_snapshots(monkeypatch, tmp_path: Path) -> None:
+    app, metrics = _modules()
+    monkeypatch.setattr(metrics.store, "root", str(tmp_path))
+    route = 'whiskey_http_requests_total{method="GET",route="/health",status="200"}'
+    client = TestClient(app, client=("10.0.0.5", 50000))
+    client.get("/health")
+    own = _sample(metrics.render(), route)
+
+    exited = subprocess.Popen([sys.executable, "-c", "pass"])
+    exited.wait()
+    run_dir = Path(metrics.store.run_dir)
+    run_dir.mkdir(parents=True)
+    worker = {
+        "whiskey_http_requests_total": [[["GET", "/health", "200"], 5.0]],
+        "whiskey_http_requests_in_flight": [[["GET"], 2.0]],
+    }
+    (run_dir / f"{os.getppid()}.json").write_text(json.dumps(worker))        # a live worker
+    (run_dir / f"{exited.pid}.json").write_text(json.dumps(worker))          # a worker that exited
+
+    body = metrics.render()
+    # Both workers' totals count; only the live one's in-flight gauge does.
+    assert _sample(body, route) == own + 10
+    assert _sample(body, 'whiskey_http_requests_in_flight{method="GET"}') == 2
@@ -0,0 +1,94 @@
+import importlib
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+
+if "DATABASE_URL" not in os.environ:
+    _fd, _db_path = tempfile.mkstemp(prefix="test-query-stats", suffix=".db")
+    os.close(_fd)
+    os.environ["DATABASE_URL"] = f"sqlite:///{_db_path}"
+if "UPLOAD_DIR" not in os.environ:
+    os.environ["UPLOAD_DIR"] = tempfile.mkdtemp(prefix="test-query-stats-uploads-")
+
+API_ROOT = Path(__file__).resolve().parents[1]
+if str(API_ROOT) not in sys.path:
+    sys.path.insert(0, str(API_ROOT))
+
+query_stats = importlib.import_module("app.query_stats")
+settings = importlib.import_module("app.settings").settings
+
+
+def test_statement_shapes_fold_whitespace_and_parameter_lists() -> None:
+    shape = query_stats.statement_shape("SELECT *\n  FROM bottle\n WHERE bottle_id IN (?, ?,  ?)")
+    assert shape == "SELECT * FROM bottle WHERE bottle_id IN (?, ...)"
+    assert query_stats.statement_shape("SELECT 1 WHERE x IN (?)") == "SELECT 1 WHERE x IN (?)"
+
+
+def test_repeated_statements_are_flagged_and_slow_ones_get_a_plan(monkeypatch, tmp_path: Path) -> None:
+    engine = create_engine(f"sqlite:///{tmp_path / 'n1.db'}")
+    query_stats.instrument(engine)
+    query_stats.instrument(engine)   # idempotent
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE item (id INTEGER PRIMARY KEY, parent INTEGER)"))
+        conn.execute(text("INSERT INTO item (id, parent) VALUES (1, 1), (2, 1), (3, 2)"))
+    query_stats.stats.reset()
+
+    app = FastAPI()
+
+    @app.get("/parents/{count}")
+    def parents(count: int):
+        with engine.connect() as conn:
+            ids = [row[0] for row in conn.execute(text("SELECT id FROM item"))]
+            for _ in range(count):
+                for item_id in ids:   # one query per row: the classic N+1
+                    conn.execute(text("SELECT parent FROM item WHERE id = :id"), {"id": item_id})
+        return {"ok": True}
+
+    app.add_middleware(query_stats.QueryStatsMiddleware)
+    monkeypatch.setattr(settings, "N_PLUS_ONE_THRESHOLD", 5)
+    monkeypatch.setattr(settings, "SLOW_QUERY_MS", 1e-6)   # everything counts as slow
+    client = TestClient(app)
+
+    client.get("/parents/1")
+    assert query_stats.stats.recent()[1] == []   # 3 repeats stay under the threshold
+    client.get("/parents/4")
+
+    slow, flagged = query_stats.stats.recent()
+    assert len(flagged) == 1
+    request = flagged[0]
+    assert request["route"] == "/parents/{count}"
+    assert request["queries"] == 13
+    assert request["repeated"] == [{"statement": "SELECT parent FROM item WHERE id = ?", "times": 12}]
+    assert len(request["slowest"]) == 5
+
+    lookup = next(entry for entry in slow if entry["statement"].startswith("SELECT parent"))
+    assert any("USING INTEGER PRIMARY KEY" in step for step in lookup["plan"])
+
+    top = query_stats.stats.top(limit=1, order="calls")[0]
+    assert top["statement"] == "SELECT parent FROM item WHERE id = ?"
+    assert top["calls"] == 15
+
+
+def test_admin_queries_endpoint_lists_top_statements() -> None:
+    app = importlib.import_module("app.main").app
+    importlib.import_module("app.db").init_db()
+    require_admin = importlib.import_module("app.deps").require_admin
+    client = TestClient(app)
+
+    assert client.get("/admin/queries").status_code in (401, 403)
+    app.dependency_overrides[require_admin] = lambda: {"username": "root", "role": "admin"}
+    try:
+        client.get("/retailers")
+        body = client.get("/admin/queries", params={"order": "mean", "limit": 5}).json()
+        assert body["pid"] == os.getpid()
+        assert 0 < len(body["top"]) <= 5
+        assert {"statement", "calls", "total_ms", "mean_ms", "max_ms"} <= body["top"][0].keys()
+        assert client.delete("/admin/queries").status_code == 204
+        assert client.get("/admin/queries").json()["calls"] == 0
+    finally:
+        app.dependency_overrides.clear()
@@ -0,0 +1,60 @@
+import importlib
+import os
+import sys
+import tempfile
+from datetime import timedelta
+from pathlib import Path
+
+from fastapi.testclient import TestClient
+
+if "DATABASE_URL" not in os.environ:
+    _fd, _db_path = tempfile.mkstemp(prefix="test-server-timing", suffix=".db")
+    os.close(_fd)
+    os.environ["DATABASE_URL"] = f"sqlite:///{_db_path}"
+if "UPLOAD_DIR" not in os.environ:
+    os.environ["UPLOAD_DIR"] = tempfile.mkdtemp(prefix="test-server-timing-uploads-")
+
+API_ROOT = Path(__file__).resolve().parents[1]
+if str(API_ROOT) not in sys.path:
+    sys.path.insert(0, str(API_ROOT))
+
+
+def _modules():
+    app = importlib.import_module("app.main").app
+    importlib.import_module("app.db").init_db()
+    return app, importlib.import_module("app.security"), importlib.import_module("app.settings").settings
+
+
+def _phases(header: str) -> dict[str, str]:
+    return {part.strip().split(";", 1)[0]: part.strip() for part in header.split(",")}
+
+
+def test_server_timing_is_opt_in_and_breaks_down_phases(monkeypatch) -> None:
+    app, security, settings = _modules()
+    client = TestClient(app)
+    client.cookies.set(settings.JWT_COOKIE_NAME, security.create_token("someone", "user", timedelta(minutes=5)))
+
+    assert "server-timing" not in client.get("/retailers").headers
+
+    monkeypatch.setattr(settings, "SERVER_TIMING_ENABLED", True)
+    response = client.get("/retailers")
+    assert response.status_code == 200
+    phases = _phases(response.headers["server-timing"])
+    assert {"auth", "db-checkout", "sql", "encode", "total"} <= phases.keys()
+    assert 'desc="' in phases["sql"] and "queries" in phases["sql"]
+    assert "provider" not in phases
+
+
+def test_admins_can_ask_for_server_timing_per_request() -> None:
+    app, security, settings = _modules()
+    client = TestClient(app, client=("192.168.1.20", 50000))
+    admin = security.create_token("root", "admin", timedelta(minutes=5))
+    user = security.create_token("someone", "user", timedelta(minutes=5))
+
+    asked = {"X-Server-Timing": "1"}
+    client.cookies.set(settings.JWT_COOKIE_NAME, admin)
+    assert "total;dur=" in client.get("/retailers", headers=asked).headers["server-timing"]
+    assert "server-timing" not in client.get("/retailers").headers
+
+    client.cookies.set(settings.JWT_COOKIE_NAME, user)
+    assert "server-timing" not in client.get("/retailers", headers=asked).headers
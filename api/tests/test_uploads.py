@@ -1,17 +1,965 @@
+import hashlib
+import importlib
+import os
+import sys
+import tempfile
 from pathlib import Path
 
-from api.app.routers.uploads import _identify_image
+import pytest
 
+# Uploads are registered in the database and written under UPLOAD_DIR; keep both
+# out of the working tree, and this module runnable on its own.
+if "DATABASE_URL" not in os.environ:
+    _fd, _db_path = tempfile.mkstemp(prefix="test-uploads", suffix=".db")
+    os.close(_fd)
+    os.environ["DATABASE_URL"] = f"sqlite:///{_db_path}"
+if "UPLOAD_DIR" not in os.environ:
+    os.environ["UPLOAD_DIR"] = tempfile.mkdtemp(prefix="test-uploads-")
 
-def test_identify_image_fallback_accepts_truncated_jpeg(tmp_path: Path) -> None:
-    target = tmp_path / "sample.jpg"
-    target.write_bytes(b"\xFF\xD8\xFF\xE0" + b"\x00" * 8)
+# Same import root (``app.*``) as the other API tests so models are only registered once.
+API_ROOT = Path(__file__).resolve().parents[1]
+if str(API_ROOT) not in sys.path:
+    sys.path.insert(0, str(API_ROOT))
 
-    assert _identify_image(str(target)) == "JPEG"
 
+def _api_modules():
+    app = importlib.import_module("app.main").app
+    importlib.import_module("app.db").init_db()
+    require_admin = importlib.import_module("app.deps").require_admin
+    uploads = importlib.import_module("app.routers.uploads")
+    return app, require_admin, uploads
 
-def test_identify_image_rejects_unknown_signature(tmp_path: Path) -> None:
-    target = tmp_path / "not-an-image.bin"
-    target.write_bytes(b"\x00" * 16)
 
-    assert _identify_image(str(target)) is None
+@pytest.fixture
+def admin_client():
+    """A TestClient whose requests pass ``require_admin``; dependency overrides are cleared afterwards."""
+    from fastapi.testclient import TestClient
+
+    app, require_admin, _uploads = _api_modules()
+    app.dependency_overrides[require_admin] = lambda: {"username": "root", "role": "admin"}
+    try:
+        yield TestClient(app)
+    finally:
+        app.dependency_overrides.clear()
+
+
+def _identify_header(head: bytes):
+    return _api_modules()[2]._identify_header(head)
+
+
+def test_identify_header_fallback_accepts_truncated_jpeg() -> None:
+    assert _identify_header(b"\xFF\xD8\xFF\xE0" + b"\x00" * 8) == "JPEG"
+
+
+def test_identify_header_rejects_unknown_signature() -> None:
+    assert _identify_header(b"\x00" * 16) is None
+
+
+def test_image_pool_rejects_jobs_beyond_capacity() -> None:
+    import asyncio
+    import time
+
+    from app.services.image_pool import ImagePool, PoolBusy
+
+    pool = ImagePool(workers=1, max_queue=0, retry_after=7)
+
+    async def scenario():
+        first = asyncio.ensure_future(pool.run(time.sleep, 0.5))
+        await asyncio.sleep(0)
+        try:
+            await pool.run(time.sleep, 0)
+        except PoolBusy as exc:
+            assert exc.retry_after == 7
+        else:
+            raise AssertionError("second job should have been rejected")
+        await first
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        pool.shutdown()
+
+    metrics = pool.metrics_snapshot()
+    assert metrics["rejected"] == 1
+    assert metrics["completed"] == 1
+    assert metrics["in_flight"] == 0
+
+
+def test_image_pool_late_broken_awaiter_keeps_the_replacement_executor() -> None:
+    import asyncio
+    from concurrent.futures import Future
+    from concurrent.futures.process import BrokenProcessPool
+
+    from app.services.image_pool import ImagePool
+
+    class FakeExecutor:
+        def __init__(self):
+            self.futures: list[Future] = []
+            self.shut_down = False
+
+        def submit(self, fn, *args):
+            future = Future()
+            self.futures.append(future)
+            return future
+
+        def shutdown(self, wait=True, cancel_futures=False):
+            self.shut_down = True
+
+    pool = ImagePool(workers=1, max_queue=1, retry_after=1)
+    broken, healthy = FakeExecutor(), FakeExecutor()
+    pool._executor = broken
+
+    async def scenario():
+        late = asyncio.ensure_future(pool.run(print))
+        await asyncio.sleep(0)
+        pool._executor = healthy   # another request already replaced the broken pool
+        broken.futures[0].set_exception(BrokenProcessPool("worker died"))
+        try:
+            await late
+        except BrokenProcessPool:
+            pass
+        else:
+            raise AssertionError("the broken job should fail")
+
+    asyncio.run(scenario())
+    assert pool._executor is healthy and not healthy.shut_down
+    assert broken.shut_down
+
+
+def test_dng_upload_returns_503_when_pool_is_full(monkeypatch, admin_client) -> None:
+    uploads = _api_modules()[2]
+    PoolBusy = importlib.import_module("app.services.image_pool").PoolBusy
+
+    async def busy(*_args):
+        raise PoolBusy(retry_after=12)
+
+    monkeypatch.setattr(uploads.image_pool, "run", busy)
+    resp = admin_client.post(
+        "/uploads/image",
+        files={"file": ("photo.dng", b"II*\x00" + b"\x00" * 64, "image/x-adobe-dng")},
+    )
+
+    assert resp.status_code == 503
+    assert resp.headers["retry-after"] == "12"
+    assert not any(name.startswith("tmp_") for name in os.listdir(uploads.UPLOAD_DIR))
+
+
+def test_receive_upload_hashes_and_keeps_header_in_one_pass(tmp_path: Path) -> None:
+    import asyncio
+    import hashlib
+    import io
+
+    from fastapi import UploadFile
+
+    from app.services.upload_stream import HEAD_SIZE, UploadTooLarge, receive_upload
+
+    payload = b"\x89PNG\r\n\x1a\n" + os.urandom(3 * 1024 * 1024)
+    dest = tmp_path / "upload.bin"
+    received = asyncio.run(receive_upload(UploadFile(io.BytesIO(payload)), str(dest), max_bytes=len(payload)))
+
+    assert received.size == len(payload)
+    assert received.sha256 == hashlib.sha256(payload).hexdigest()
+    assert received.head == payload[:HEAD_SIZE]
+    assert dest.read_bytes() == payload
+
+    try:
+        asyncio.run(receive_upload(UploadFile(io.BytesIO(payload)), str(dest), max_bytes=1024))
+    except UploadTooLarge as exc:
+        assert exc.limit == 1024
+    else:
+        raise AssertionError("oversized upload should have been rejected")
+
+
+def test_png_upload_is_stored_once_with_its_hash(admin_client) -> None:
+    import hashlib
+    import io
+
+    from PIL import Image
+
+    uploads = _api_modules()[2]
+    buf = io.BytesIO()
+    Image.new("RGB", (8, 8), "red").save(buf, format="PNG")
+    payload = buf.getvalue()
+
+    resp = admin_client.post("/uploads/image", files={"file": ("bottle.png", payload, "image/png")})
+
+    assert resp.status_code == 200, resp.text
+    body = resp.json()
+    assert body["sha256"] == hashlib.sha256(payload).hexdigest()
+    sha = body["sha256"]
+    assert body["url"] == f"/api/uploads/{sha[:2]}/{sha[2:4]}/{sha}.png"
+    assert Path(uploads.UPLOAD_DIR, sha[:2], sha[2:4], f"{sha}.png").read_bytes() == payload
+
+
+def test_upload_renders_srcset_variants_without_upscaling(monkeypatch, admin_client) -> None:
+    import io
+
+    from PIL import Image
+
+    uploads = _api_modules()[2]
+    monkeypatch.setattr(uploads.settings, "IMAGE_VARIANT_WIDTHS", "160,480,1200")
+    monkeypatch.setattr(uploads.settings, "IMAGE_VARIANT_FORMATS", "webp")
+    buf = io.BytesIO()
+    Image.new("RGB", (600, 400), "navy").save(buf, format="JPEG")
+
+    resp = admin_client.post("/uploads/image", files={"file": ("bottle.jpg", buf.getvalue(), "image/jpeg")})
+
+    assert resp.status_code == 200, resp.text
+    body = resp.json()
+    stem = body["url"].rsplit("/", 1)[-1].rsplit(".", 1)[0]
+    shard = f"{stem[:2]}/{stem[2:4]}"
+    assert [(v["width"], v["height"], v["type"]) for v in body["variants"]] == [
+        (160, 107, "image/webp"),
+        (480, 320, "image/webp"),
+    ]
+    assert body["srcset"]["image/webp"] == (
+        f"/api/uploads/{shard}/{stem}.w160.webp 160w, /api/uploads/{shard}/{stem}.w480.webp 480w"
+    )
+    with Image.open(Path(uploads.UPLOAD_DIR, shard, f"{stem}.w480.webp")) as variant:
+        assert (variant.format, variant.size) == ("WEBP", (480, 320))
+    assert not Path(uploads.UPLOAD_DIR, shard, f"{stem}.w1200.webp").exists()
+
+
+def test_variant_probe_uses_the_upright_width_of_rotated_photos(monkeypatch, admin_client) -> None:
+    import io
+
+    from PIL import Image
+
+    uploads = _api_modules()[2]
+    monkeypatch.setattr(uploads.settings, "IMAGE_VARIANT_WIDTHS", "160,320")
+    monkeypatch.setattr(uploads.settings, "IMAGE_VARIANT_FORMATS", "webp")
+    exif = Image.Exif()
+    exif[0x0112] = 6   # stored 400x200, displayed 200x400
+    buf = io.BytesIO()
+    Image.new("RGB", (400, 200), "teal").save(buf, format="JPEG", exif=exif)
+
+    body = admin_client.post("/uploads/image", files={"file": ("phone.jpg", buf.getvalue(), "image/jpeg")}).json()
+    assert [(v["width"], v["height"]) for v in body["variants"]] == [(160, 320)]
+
+    # The 320px variant was never rendered (wider than the upright photo), so it is not missing either.
+    sha = body["sha256"]
+    final_path = os.path.join(uploads.UPLOAD_DIR, sha[:2], sha[2:4], f"{sha}.jpg")
+    pairs, existing = uploads._probe_variants(final_path, [160, 320], ["webp"])
+    assert pairs == [] and existing is not None
+
+
+def test_store_deduplicates_counts_references_and_resolves_legacy_names(admin_client) -> None:
+    import io
+
+    from PIL import Image
+    from sqlmodel import Session
+
+    models = importlib.import_module("app.models")
+    upload_store = importlib.import_module("app.services.upload_store")
+    engine = importlib.import_module("app.db").engine
+    buf = io.BytesIO()
+    Image.frombytes("RGB", (8, 8), os.urandom(8 * 8 * 3)).save(buf, format="PNG")  # unseen content
+    payload = buf.getvalue()
+
+    first = admin_client.post("/uploads/image", files={"file": ("a.png", payload, "image/png")}).json()
+    second = admin_client.post("/uploads/image", files={"file": ("b.png", payload, "image/png")}).json()
+
+    assert (first["deduplicated"], second["deduplicated"]) == (False, True)
+    assert first["url"] == second["url"]
+    sha = first["sha256"]
+
+    with Session(engine) as session:
+        bottle = models.Bottle(brand="Store Test", image_url=first["url"])
+        session.add(bottle)
+        session.commit()
+        assert session.get(models.StoredImage, sha).ref_count == 1
+
+        # A legacy flat name mapped onto the stored file keeps serving.
+        session.add(models.LegacyUpload(name="old-label.png", path=upload_store.shard_path(sha, ".png"), sha256=sha))
+        bottle.image_url = "/api/uploads/old-label.png"
+        session.add(bottle)
+        session.commit()
+        assert session.get(models.StoredImage, sha).ref_count == 1
+
+        session.delete(bottle)
+        session.commit()
+        assert session.get(models.StoredImage, sha).ref_count == 0
+
+    resp = admin_client.get("/uploads/old-label.png")
+    assert resp.status_code == 200
+    assert resp.content == payload
+    assert admin_client.get("/uploads/missing.png").status_code == 404
+
+
+def test_concurrent_stores_of_identical_content_register_it_once() -> None:
+    import io
+    import threading
+
+    from PIL import Image
+    from sqlalchemy import func, select
+    from sqlmodel import Session
+
+    _app, _require_admin, uploads = _api_modules()
+    models = importlib.import_module("app.models")
+    engine = importlib.import_module("app.db").engine
+    buf = io.BytesIO()
+    Image.frombytes("RGB", (16, 16), os.urandom(16 * 16 * 3)).save(buf, format="PNG")
+    payload = buf.getvalue()
+    sha = hashlib.sha256(payload).hexdigest()
+
+    copies = []
+    for _ in range(6):
+        fd, path = tempfile.mkstemp(dir=uploads.UPLOAD_DIR, suffix=".tmp")
+        with os.fdopen(fd, "wb") as out:
+            out.write(payload)
+        copies.append(path)
+
+    start = threading.Barrier(len(copies))
+    results, errors = [], []
+
+    def store(path: str) -> None:
+        start.wait()
+        try:
+            results.append(uploads._store(path, sha, ".png"))
+        except Exception as exc:   # pragma: no cover - the regression being guarded against
+            errors.append(exc)
+
+    threads = [threading.Thread(target=store, args=(path,)) for path in copies]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert sorted(duplicate for _, duplicate in results) == [False] + [True] * 5
+    with Session(engine) as session:
+        for model in (models.StoredImage, models.ImageHash):
+            assert session.execute(select(func.count()).select_from(model).where(model.sha256 == sha)).scalar() == 1
+    assert not any(os.path.exists(path) for path in copies)
+
+
+def test_heic_upload_is_transcoded_upright_without_exif(monkeypatch, admin_client) -> None:
+    import io
+
+    from PIL import Image
+
+    pytest.importorskip("pillow_heif")
+    uploads = _api_modules()[2]
+    monkeypatch.setattr(uploads.settings, "HEIF_MAX_EDGE_PX", 200)
+    monkeypatch.setattr(uploads.settings, "IMAGE_VARIANT_WIDTHS", "")
+
+    exif = Image.Exif()
+    exif[0x0112] = 6  # orientation: rotate 90 degrees clockwise to display
+    exif[0x010F] = "Apple"
+    buf = io.BytesIO()
+    Image.new("RGB", (400, 300), "orange").save(buf, format="HEIF", exif=exif.tobytes())
+
+    resp = admin_client.post("/uploads/image", files={"file": ("IMG_0001.HEIC", buf.getvalue(), "image/heic")})
+
+    assert resp.status_code == 200, resp.text
+    sha = resp.json()["sha256"]
+    assert resp.json()["url"].endswith(f"/{sha}.jpg")
+    with Image.open(Path(uploads.UPLOAD_DIR, sha[:2], sha[2:4], f"{sha}.jpg")) as stored:
+        assert stored.format == "JPEG"
+        assert stored.size == (150, 200)
+        assert not stored.getexif()
+    assert not any(name.startswith("tmp_") for name in os.listdir(uploads.UPLOAD_DIR))
+
+
+def test_uploads_are_served_immutable_with_ranges_and_negotiated_variants(monkeypatch, admin_client) -> None:
+    import io
+
+    from PIL import Image
+
+    uploads = _api_modules()[2]
+    monkeypatch.setattr(uploads.settings, "IMAGE_VARIANT_WIDTHS", "160")
+    monkeypatch.setattr(uploads.settings, "IMAGE_VARIANT_FORMATS", "webp")
+    buf = io.BytesIO()
+    Image.new("RGB", (320, 200), "purple").save(buf, format="JPEG")
+    payload = buf.getvalue()
+
+    body = admin_client.post("/uploads/image", files={"file": ("c.jpg", payload, "image/jpeg")}).json()
+    sha = body["sha256"]
+    path = f"/uploads/{sha[:2]}/{sha[2:4]}/{sha}"
+
+    resp = admin_client.get(f"{path}.jpg")
+    assert resp.status_code == 200 and resp.content == payload
+    assert resp.headers["cache-control"] == "public, max-age=31536000, immutable"
+    assert resp.headers["etag"] == f'"{sha}.jpg"'
+    assert admin_client.get(f"{path}.jpg", headers={"if-none-match": resp.headers["etag"]}).status_code == 304
+
+    partial = admin_client.get(f"{path}.jpg", headers={"range": "bytes=0-9"})
+    assert partial.status_code == 206 and partial.content == payload[:10]
+    head = admin_client.head(f"{path}.jpg")
+    assert head.status_code == 200 and head.headers["content-length"] == str(len(payload))
+
+    webp = admin_client.get(f"{path}.w160", headers={"accept": "image/avif;q=0,image/webp,*/*"})
+    assert webp.headers["content-type"] == "image/webp"
+    assert "Accept" in webp.headers["vary"]
+    fallback = admin_client.get(f"{path}.w160", headers={"accept": "image/jpeg"})
+    assert fallback.headers["content-type"] == "image/jpeg" and fallback.content == payload
+
+
+def test_upload_work_files_are_never_served(admin_client) -> None:
+    uploads = _api_modules()[2]
+    hidden = [".jobs/source.bin", ".chunked/abc.part", ".quarantine/ab/cd/old.png", "ab/cd/tmp_123", "tmp_456"]
+    for rel in hidden:
+        target = Path(uploads.UPLOAD_DIR, rel)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        target.write_bytes(b"private")
+    try:
+        for rel in hidden:
+            assert admin_client.get(f"/uploads/{rel}").status_code == 404, rel
+    finally:
+        for rel in hidden:
+            Path(uploads.UPLOAD_DIR, rel).unlink()
+
+
+def test_upload_gc_quarantines_orphans_and_keeps_referenced_files(monkeypatch, tmp_path: Path) -> None:
+    from sqlalchemy import create_engine
+    from sqlmodel import Session
+
+    _api_modules()
+    db = importlib.import_module("app.db")
+    models = importlib.import_module("app.models")
+    upload_gc = importlib.import_module("app.services.upload_gc")
+    monkeypatch.setattr(db, "wine_engine", create_engine(f"sqlite:///{tmp_path / 'wine.db'}"))
+    monkeypatch.setattr(db, "_wine_initialized", False)
+
+    root = tmp_path / "uploads"
+    kept_sha, orphan_sha = "a" * 64, "b" * 64
+    files = {
+        f"aa/aa/{kept_sha}.jpg": b"kept",
+        f"aa/aa/{kept_sha}.w160.webp": b"kv",
+        f"bb/bb/{orphan_sha}.png": b"orphan!",
+        f"bb/bb/{orphan_sha}.w160.webp": b"ov",
+        "tmp_deadbeef": b"partial",
+        "fresh-orphan.jpg": b"new",
+        ".gitkeep": b"",
+    }
+    old = 1_000_000_000
+    for rel, data in files.items():
+        path = root / rel
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+        if rel != "fresh-orphan.jpg":
+            os.utime(path, (old, old))
+
+    with Session(db.engine) as session:
+        session.add(models.Bottle(brand="GC Test", image_url=f"/api/uploads/aa/aa/{kept_sha}.jpg"))
+        session.commit()
+        dry = upload_gc.collect_garbage(session, str(root), grace_hours=24, dry_run=True, now=old + 86400 * 2)
+        assert (dry.removed, dry.tmp_removed) == (2, 1)
+        assert (root / "tmp_deadbeef").exists()
+
+        result = upload_gc.collect_garbage(session, str(root), grace_hours=24, dry_run=False, now=old + 86400 * 2)
+
+    assert (result.removed, result.tmp_removed, result.kept_recent) == (2, 1, 1)
+    assert result.bytes_reclaimed == len(b"orphan!") + len(b"ov") + len(b"partial")
+    assert (root / f"aa/aa/{kept_sha}.jpg").exists() and (root / f"aa/aa/{kept_sha}.w160.webp").exists()
+    assert (root / "fresh-orphan.jpg").exists() and (root / ".gitkeep").exists()
+    assert not (root / "tmp_deadbeef").exists()
+    quarantined = root / ".quarantine" / "20010911" / f"bb/bb/{orphan_sha}.png"
+    assert quarantined.read_bytes() == b"orphan!"
+
+
+def test_batch_upload_reports_each_file_in_order(monkeypatch, admin_client) -> None:
+    import io
+
+    from PIL import Image
+
+    uploads = _api_modules()[2]
+    monkeypatch.setattr(uploads.settings, "IMAGE_VARIANT_WIDTHS", "")
+
+    def image_bytes(fmt: str) -> bytes:
+        buf = io.BytesIO()
+        Image.frombytes("RGB", (4, 4), os.urandom(4 * 4 * 3)).save(buf, format=fmt)
+        return buf.getvalue()
+
+    files = [
+        ("files", ("one.png", image_bytes("PNG"), "image/png")),
+        ("files", ("notes.txt", b"not an image at all", "text/plain")),
+        ("files", ("three.jpg", image_bytes("JPEG"), "image/jpeg")),
+    ]
+    resp = admin_client.post("/uploads/images", files=files)
+
+    assert resp.status_code == 200, resp.text
+    body = resp.json()
+    assert (body["stored"], body["failed"]) == (2, 1)
+    assert [(r["index"], r["filename"], r["status"]) for r in body["results"]] == [
+        (0, "one.png", 200),
+        (1, "notes.txt", 415),
+        (2, "three.jpg", 200),
+    ]
+    assert body["results"][0]["url"].endswith(".png") and body["results"][2]["url"].endswith(".jpg")
+    assert not any(name.startswith("tmp_") for name in os.listdir(uploads.UPLOAD_DIR))
+
+    same = image_bytes("PNG")
+    files = [
+        ("files", ("first.png", same, "image/png")),
+        ("files", ("copy.png", same, "image/png")),
+    ]
+    resp = admin_client.post("/uploads/images", files=files)
+
+    assert resp.status_code == 200, resp.text
+    body = resp.json()
+    assert (body["stored"], body["failed"]) == (2, 0)
+    first, copy = body["results"]
+    assert (first["status"], first["deduplicated"]) == (200, False)
+    assert (copy["status"], copy["deduplicated"]) == (200, True)
+    assert first["url"] == copy["url"] and first["sha256"] == copy["sha256"]
+    assert not any(name.startswith("tmp_") for name in os.listdir(uploads.UPLOAD_DIR))
+
+
+def test_resumable_upload_survives_retries_and_finalizes(monkeypatch, admin_client) -> None:
+    import hashlib
+    import io
+
+    from PIL import Image
+
+    uploads = _api_modules()[2]
+    monkeypatch.setattr(uploads.settings, "IMAGE_VARIANT_WIDTHS", "")
+    buf = io.BytesIO()
+    Image.frombytes("RGB", (64, 64), os.urandom(64 * 64 * 3)).save(buf, format="PNG")
+    payload = buf.getvalue()
+    sha = hashlib.sha256(payload).hexdigest()
+    cut = len(payload) // 2
+
+    created = admin_client.post("/uploads/sessions", json={"filename": "label.png", "size": len(payload), "sha256": sha})
+    assert created.status_code == 201, created.text
+    sid = created.json()["id"]
+    base = f"/uploads/sessions/{sid}"
+
+    assert admin_client.put(f"{base}?offset=0", content=payload[:cut]).json()["offset"] == cut
+    # A lost response means the client resends; overlapping bytes are ignored.
+    assert admin_client.put(f"{base}?offset=0", content=payload[:cut]).json()["offset"] == cut
+    gap = admin_client.put(f"{base}?offset={cut + 10}", content=payload[cut + 10:])
+    assert gap.status_code == 409 and gap.headers["upload-offset"] == str(cut)
+    bad = admin_client.put(f"{base}?offset={cut}", content=payload[cut:], headers={"x-chunk-sha256": "0" * 64})
+    assert bad.status_code == 422
+
+    assert admin_client.post(f"{base}/finalize").status_code == 409
+    status = admin_client.get(base).json()
+    assert status["received"] == [[0, cut]] and not status["complete"]
+    assert admin_client.put(f"{base}?offset={cut}", content=payload[cut:]).json()["complete"]
+
+    done = admin_client.post(f"{base}/finalize")
+    assert done.status_code == 200, done.text
+    assert done.json()["sha256"] == sha
+    assert admin_client.get(base).status_code == 404
+
+    assert Path(uploads.UPLOAD_DIR, sha[:2], sha[2:4], f"{sha}.png").read_bytes() == payload
+    assert os.listdir(Path(uploads.UPLOAD_DIR, ".chunked")) == []
+
+
+def test_expired_upload_sessions_are_swept(tmp_path: Path) -> None:
+    import time
+
+    from app.services.upload_sessions import SessionNotFound, UploadSessionStore
+
+    store = UploadSessionStore(str(tmp_path), ttl_seconds=60)
+    session = store.create("big.dng", 100, None, "root")
+    store.append(session, 0, b"x" * 40, None)
+
+    assert UploadSessionStore(str(tmp_path), ttl_seconds=60).get(session.id).offset == 40  # after a restart
+    assert store.sweep(now=time.time() + 30) == 0
+    assert store.sweep(now=time.time() + 120) == 1
+    try:
+        store.get(session.id)
+    except SessionNotFound:
+        pass
+    else:
+        raise AssertionError("expired session should be gone")
+    assert os.listdir(tmp_path / ".chunked") == []
+
+
+def test_upload_session_chunks_can_land_on_different_workers(tmp_path: Path) -> None:
+    import hashlib
+
+    upload_sessions = importlib.import_module("app.services.upload_sessions")
+
+    payload = os.urandom(1000)
+    first = upload_sessions.UploadSessionStore(str(tmp_path), ttl_seconds=60)
+    second = upload_sessions.UploadSessionStore(str(tmp_path), ttl_seconds=60)
+    stale = first.create("label.png", len(payload), hashlib.sha256(payload).hexdigest(), "root")
+
+    second.append(second.get(stale.id), 0, payload[:600], None)
+    # The first worker's session object still says offset 0; the part file decides.
+    first.append(stale, 600, payload[600:], None)
+    assert stale.offset == len(payload)
+    try:
+        first.append(stale, 1200, b"x", None)
+    except upload_sessions.ChunkRejected as exc:
+        assert (exc.status, exc.offset) == (409, len(payload))
+    else:
+        raise AssertionError("a gap should be rejected")
+
+    sha256, head = second.complete(second.get(stale.id), str(tmp_path / "done"))
+    assert sha256 == hashlib.sha256(payload).hexdigest() and head == payload[:len(head)]
+    assert (tmp_path / "done").read_bytes() == payload
+    try:
+        first.append(stale, 1000, b"", None)
+    except upload_sessions.SessionNotFound:
+        pass
+    else:
+        raise AssertionError("a finalized session should be gone")
+
+
+def test_background_job_reports_progress_and_sets_bottle_image(monkeypatch, admin_client) -> None:
+    import asyncio
+    import io
+
+    from PIL import Image
+    from sqlmodel import Session
+
+    uploads = _api_modules()[2]
+    models = importlib.import_module("app.models")
+    engine = importlib.import_module("app.db").engine
+    monkeypatch.setattr(uploads.settings, "IMAGE_VARIANT_WIDTHS", "")
+    buf = io.BytesIO()
+    Image.frombytes("RGB", (16, 16), os.urandom(16 * 16 * 3)).save(buf, format="PNG")
+
+    with Session(engine) as session:
+        bottle = models.Bottle(brand="Job Test")
+        session.add(bottle)
+        session.commit()
+        bottle_id = bottle.bottle_id
+
+    missing = admin_client.post("/uploads/jobs", files={"file": ("x.png", buf.getvalue(), "image/png")}, data={"bottle_id": "0"})
+    assert missing.status_code == 404
+    resp = admin_client.post(
+        "/uploads/jobs", files={"file": ("label.png", buf.getvalue(), "image/png")}, data={"bottle_id": str(bottle_id)}
+    )
+    assert resp.status_code == 202, resp.text
+    job = resp.json()
+    assert job["status"] == "queued" and resp.headers["location"].endswith(job["id"])
+
+    assert asyncio.run(uploads.image_jobs.run_pending()) == 1
+    done = admin_client.get(f"/uploads/jobs/{job['id']}").json()
+    assert admin_client.get("/uploads/jobs/nope").status_code == 404
+
+    assert (done["status"], done["stage"], done["progress"]) == ("succeeded", "done", 100)
+    assert done["result"]["target_updated"] is True
+    with Session(engine) as session:
+        assert session.get(models.Bottle, bottle_id).image_url == done["result"]["url"]
+    assert not os.listdir(Path(uploads.UPLOAD_DIR, ".jobs"))
+
+
+def test_image_jobs_recover_expired_leases_and_back_off_until_failing(tmp_path: Path) -> None:
+    import asyncio
+    from datetime import datetime, timedelta, timezone
+
+    from sqlmodel import Session
+
+    _api_modules()
+    engine = importlib.import_module("app.db").engine
+    models = importlib.import_module("app.models")
+    image_jobs = importlib.import_module("app.services.image_jobs")
+    calls = []
+
+    async def flaky(job, report):
+        calls.append(job.attempts)
+        await report("converting", 20)
+        raise RuntimeError("pool busy")
+
+    queue = image_jobs.ImageJobQueue(
+        engine, str(tmp_path), flaky, workers=1, max_attempts=3, retry_base_seconds=60, lease_seconds=60
+    )
+    source = tmp_path / "tmp_upload"
+    source.write_bytes(b"raw")
+    job_id = queue.enqueue(str(source), "0" * 64, "big.dng").job_id
+
+    # A worker that died mid-job: its claim only comes back once the lease has run out.
+    assert queue._claim().job_id == job_id
+    assert asyncio.run(queue.run_pending()) == 0
+    past = datetime.now(timezone.utc) - timedelta(seconds=1)
+    with Session(engine) as session:
+        row = session.get(models.ImageJob, job_id)
+        row.lease_expires_at = past
+        session.add(row)
+        session.commit()
+    assert asyncio.run(queue.run_pending()) == 1
+
+    job = queue.get(job_id)
+    assert (job.status, job.attempts, job.error) == ("queued", 2, "pool busy")
+    delay = (job.next_attempt_at.replace(tzinfo=timezone.utc) - datetime.now(timezone.utc)).total_seconds()
+    assert 100 < delay <= 120   # 60 s doubled for the second attempt
+    assert asyncio.run(queue.run_pending()) == 0
+
+    with Session(engine) as session:
+        row = session.get(models.ImageJob, job_id)
+        row.next_attempt_at = past
+        session.add(row)
+        session.commit()
+    assert asyncio.run(queue.run_pending()) == 1
+    job = queue.get(job_id)
+    assert (job.status, job.attempts) == ("failed", 3)
+    assert calls == [2, 3]
+    assert not (tmp_path / ".jobs" / job_id).exists()
+
+
+def test_import_urls_fetches_through_the_pipeline_and_updates_bottles(monkeypatch, admin_client) -> None:
+    import asyncio
+    import io
+    import threading
+    import time
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    from PIL import Image
+    from sqlmodel import Session
+
+    uploads = _api_modules()[2]
+    models = importlib.import_module("app.models")
+    engine = importlib.import_module("app.db").engine
+    monkeypatch.setattr(uploads.settings, "IMAGE_VARIANT_WIDTHS", "")
+    monkeypatch.setattr(uploads.settings, "IMAGE_IMPORT_PER_HOST", 1)
+    monkeypatch.setattr(uploads.settings, "IMAGE_IMPORT_ALLOW_PRIVATE", True)   # the test server is on loopback
+    monkeypatch.setattr(uploads, "MAX_SIZE_BYTES", 64 * 1024)
+    buf = io.BytesIO()
+    Image.frombytes("RGB", (16, 16), os.urandom(16 * 16 * 3)).save(buf, format="PNG")
+    label = buf.getvalue()
+    state = {"active": 0, "peak": 0, "requests": []}
+    lock = threading.Lock()
+
+    class Retailer(BaseHTTPRequestHandler):
+        def do_GET(self):
+            with lock:
+                state["requests"].append(self.path)
+                state["active"] += 1
+                state["peak"] = max(state["peak"], state["active"])
+            time.sleep(0.05)
+            try:
+                if self.path == "/label.png":
+                    self.send_response(200)
+                    self.send_header("Content-Length", str(len(label)))
+                    self.end_headers()
+                    self.wfile.write(label)
+                elif self.path == "/huge.jpg":
+                    self.send_response(200)   # no Content-Length: only the streaming cap can stop it
+                    self.end_headers()
+                    self.wfile.write(b"\xFF\xD8\xFF" + b"\x00" * (128 * 1024))
+                elif self.path == "/page.html":
+                    body = b"<html>not an image</html>"
+                    self.send_response(200)
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                else:
+                    self.send_error(404)
+            finally:
+                with lock:
+                    state["active"] -= 1
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Retailer)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+
+    with Session(engine) as session:
+        bottles = [models.Bottle(brand=f"Import {i}") for i in range(4)]
+        session.add_all(bottles)
+        session.commit()
+        ids = [b.bottle_id for b in bottles]
+
+    items = [
+        {"bottle_id": ids[0], "url": f"{base}/label.png"},
+        {"bottle_id": ids[1], "url": f"{base}/label.png"},
+        {"bottle_id": ids[2], "url": f"{base}/huge.jpg"},
+        {"bottle_id": ids[3], "url": f"{base}/page.html"},
+        {"bottle_id": ids[3], "url": f"{base}/gone.png"},
+        {"bottle_id": 0, "url": f"{base}/label.png"},
+        {"bottle_id": ids[3], "url": "ftp://example.com/x.png"},
+    ]
+    try:
+        resp = admin_client.post("/uploads/import-urls", json={"items": items})
+        assert resp.status_code == 202, resp.text
+        job = resp.json()
+        assert (job["kind"], job["status"]) == ("url_import", "queued")
+        assert state["requests"] == []                     # nothing is fetched while the request is open
+
+        assert asyncio.run(uploads.image_jobs.run_pending()) == 1
+        done = admin_client.get(f"/uploads/jobs/{job['id']}").json()
+    finally:
+        server.shutdown()
+
+    assert (done["status"], done["progress"]) == ("succeeded", 100)
+    body = done["result"]
+    assert [r["status"] for r in body["results"]] == [200, 200, 413, 415, 502, 404, 422]
+    assert (body["imported"], body["failed"]) == (2, 5)
+    assert state["requests"].count("/label.png") == 1   # fetched once for both bottles
+    assert state["peak"] == 1                          # IMAGE_IMPORT_PER_HOST
+    url = body["results"][0]["url"]
+    with Session(engine) as session:
+        assert [session.get(models.Bottle, i).image_url for i in ids] == [url, url, None, None]
+    assert not [n for n in os.listdir(uploads.UPLOAD_DIR) if n.startswith("tmp_")]
+    assert not os.listdir(Path(uploads.UPLOAD_DIR, ".jobs"))
+
+
+def test_import_urls_refuse_private_addresses_and_redirects_to_them(monkeypatch) -> None:
+    import asyncio
+    import threading
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    _, _, uploads = _api_modules()
+    url_import = importlib.import_module("app.services.url_import")
+    requests = []
+
+    class Redirector(BaseHTTPRequestHandler):
+        def do_GET(self):
+            requests.append(self.path)
+            self.send_response(302)
+            self.send_header("Location", f"http://localhost:{self.server.server_address[1]}/internal")
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Redirector)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_address[1]
+
+    async def fetch(url: str, dest: str, *, allow_private: bool = False) -> int:
+        async with url_import.new_client(max_connections=1, timeout=5, allow_private=allow_private) as client:
+            try:
+                await url_import.download(client, url, dest, max_bytes=1024)
+            except url_import.DownloadFailed as exc:
+                return exc.status
+        return 200
+
+    async def resolve(host: str) -> list[str]:
+        return ["127.0.0.1"] if host == "127.0.0.1" else ["127.0.0.1", "::1"]
+
+    dest = os.path.join(uploads.UPLOAD_DIR, "tmp_ssrf")
+    try:
+        assert asyncio.run(fetch(f"http://localhost:{port}/label.png", dest)) == 422
+        assert requests == []                                  # refused before connecting
+
+        # Pretend 127.0.0.1 is a public retailer; "localhost" also resolves to ::1, which stays private.
+        monkeypatch.setattr(url_import, "_addresses", resolve)
+        monkeypatch.setattr(url_import, "is_publicly_routable", lambda address: address == "127.0.0.1")
+        assert asyncio.run(fetch(f"http://127.0.0.1:{port}/label.png", dest)) == 422
+        assert requests == ["/label.png"]                      # the redirect target was never requested
+
+        # The connection goes to the vetted address, whatever the name resolves to later.
+        monkeypatch.setattr(url_import, "_addresses", lambda host: resolve("127.0.0.1" if host == "retailer.invalid" else host))
+        assert asyncio.run(fetch(f"http://retailer.invalid:{port}/label.png", dest)) == 422
+        assert requests == ["/label.png", "/label.png"]        # reached the test server, then refused its redirect
+    finally:
+        server.shutdown()
+        if os.path.exists(dest):
+            os.remove(dest)
+
+
+def test_downloads_waiting_on_a_busy_host_do_not_hold_shared_slots(tmp_path) -> None:
+    import asyncio
+    import httpx
+
+    url_import = importlib.import_module("app.services.url_import")
+    finished = []
+
+    async def run() -> None:
+        release_slow = asyncio.Event()
+
+        async def handler(request: httpx.Request) -> httpx.Response:
+            if request.url.host == "slow.example":
+                await release_slow.wait()
+            finished.append(request.url.host)
+            return httpx.Response(200, content=b"image")
+
+        limits = url_import.HostLimits(1)
+        slots = asyncio.Semaphore(2)
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            def fetch(url: str, name: str):
+                return url_import.download(client, url, str(tmp_path / name), max_bytes=1024, limits=limits, slots=slots)
+
+            slow = [asyncio.create_task(fetch(f"http://slow.example/{i}.png", f"slow{i}")) for i in range(3)]
+            await asyncio.sleep(0)
+            # Only one slow download holds a slot; the others queue on their host, leaving a slot free.
+            await asyncio.wait_for(fetch("http://fast.example/a.png", "fast"), timeout=5)
+            assert finished == ["fast.example"]
+            release_slow.set()
+            await asyncio.gather(*slow)
+
+    asyncio.run(run())
+    assert finished.count("slow.example") == 3
+
+
+def test_lookup_by_image_and_duplicate_report_use_perceptual_hashes(monkeypatch, admin_client) -> None:
+    import io
+
+    from PIL import Image
+    from sqlmodel import Session
+
+    uploads = _api_modules()[2]
+    get_current_user_role = importlib.import_module("app.deps").get_current_user_role
+    models = importlib.import_module("app.models")
+    engine = importlib.import_module("app.db").engine
+    monkeypatch.setattr(uploads.settings, "IMAGE_VARIANT_WIDTHS", "")
+
+    def label(seed: bytes, size: int, fmt: str) -> bytes:
+        # Smooth blocks, like a photographed label: re-encoding and rescaling barely move the dHash.
+        base = Image.frombytes("RGB", (8, 8), seed).resize((size, size), Image.Resampling.BICUBIC)
+        buf = io.BytesIO()
+        base.save(buf, format=fmt, quality=75)
+        return buf.getvalue()
+
+    seed_a, seed_b = os.urandom(8 * 8 * 3), os.urandom(8 * 8 * 3)
+    admin_client.app.dependency_overrides[get_current_user_role] = lambda: {"username": "root", "role": "admin"}
+    original = admin_client.post("/uploads/image", files={"file": ("a.png", label(seed_a, 256, "PNG"), "image/png")}).json()
+    resized = admin_client.post("/uploads/image", files={"file": ("a.jpg", label(seed_a, 180, "JPEG"), "image/jpeg")}).json()
+    other = admin_client.post("/uploads/image", files={"file": ("b.png", label(seed_b, 256, "PNG"), "image/png")}).json()
+    assert original["sha256"] != resized["sha256"]
+
+    with Session(engine) as session:
+        bottle_a = models.Bottle(brand="Lookup A", image_url=original["url"])
+        bottle_b = models.Bottle(brand="Lookup B", image_url=other["url"])
+        session.add_all([bottle_a, bottle_b])
+        session.commit()
+        ids = bottle_a.bottle_id, bottle_b.bottle_id
+
+    snapshot = label(seed_a, 320, "JPEG")
+    found = admin_client.post("/bottles/lookup-by-image", files={"file": ("snap.jpg", snapshot, "image/jpeg")})
+    assert found.status_code == 200, found.text
+    matches = found.json()["matches"]
+    assert matches[0]["bottle"]["bottle_id"] == ids[0]
+    assert matches[0]["distance"] <= 4
+    assert ids[1] not in [m["bottle"]["bottle_id"] for m in matches if m["distance"] <= 4]
+    bad = admin_client.post("/bottles/lookup-by-image", files={"file": ("x.txt", b"nope", "text/plain")})
+    assert bad.status_code == 415
+
+    async def busy(*_args):
+        raise importlib.import_module("app.services.image_pool").PoolBusy(retry_after=9)
+
+    with monkeypatch.context() as patched:
+        patched.setattr(uploads.image_pool, "run", busy)
+        queued = admin_client.post("/bottles/lookup-by-image", files={"file": ("snap.jpg", snapshot, "image/jpeg")})
+    assert queued.status_code == 503 and queued.headers["retry-after"] == "9"
+
+    report = admin_client.get("/uploads/duplicates").json()
+
+    group = next(g for g in report["groups"] if original["sha256"] in {i["sha256"] for i in g})
+    by_sha = {item["sha256"]: item for item in group}
+    assert resized["sha256"] in by_sha and other["sha256"] not in by_sha
+    assert by_sha[original["sha256"]]["bottle_ids"] == [ids[0]]
+
+
+def test_perceptual_index_matches_brute_force() -> None:
+    import numpy as np
+
+    _api_modules()
+    image_hashes = importlib.import_module("app.services.image_hashes")
+    rng = np.random.default_rng(7)
+    values = rng.integers(0, 2**63, size=2000, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+    values[10] = values[3] ^ np.uint64(0b101)          # 2 bits away
+    values[11] = values[10] ^ np.uint64(1 << 63)       # chained: 1 more bit from #10
+    values[12] = values[3]                             # identical hash, different image
+    index = image_hashes.PerceptualIndex()
+    index._hashes, index._keys = values, [f"img{i}" for i in range(len(values))]
+
+    query = int(values[3] ^ np.uint64(1 << 40))
+    brute = sorted((bin(int(v) ^ query).count("1"), i) for i, v in enumerate(values))
+    found = index.search(query, limit=4, max_distance=8)
+    assert [d for _, d in found] == [d for d, _ in brute[:4]]
+    assert {k for k, _ in found} >= {"img3", "img12", "img10"}
+
+    groups = index.duplicate_groups(3)
+    assert sorted(k for k, _ in groups[0]) == ["img10", "img11", "img12", "img3"]
+    assert all(len(g) >= 2 for g in groups)
+    assert image_hashes.to_unsigned(image_hashes.to_signed(2**64 - 1)) == 2**64 - 1
@@ -26,10 +26,24 @@ function copyResHeaders(src: Headers) {
   src.forEach((v, k) => {
     if (k.toLowerCase() !== "content-length") h.append(k, v);
   });
-  h.set("cache-control", "no-store");
+  // Keep the API's own caching policy (e.g. immutable /uploads); default to no-store otherwise.
+  if (!h.has("cache-control")) h.set("cache-control", "no-store");
   return h;
 }
 
+// The API's Server-Timing header (opt-in) is relayed as is; add the proxy's own share
+// (upstream round trip plus body buffering) so the browser sees the whole breakdown.
+function addProxyTiming(h: Headers, started: number) {
+  if (h.has("server-timing")) {
+    h.append("server-timing", `proxy;dur=${(performance.now() - started).toFixed(1)}`);
+  }
+}
+
+// Statuses/methods that must not carry a body (Response throws if one is given).
+function hasBody(method: string, status: number) {
+  return method !== "HEAD" && status !== 204 && status !== 304;
+}
+
 type RouteContext = { params: Promise<{ all: string[] }> };
 
 async function handler(req: NextRequest, ctx: RouteContext) {
@@ -63,6 +77,7 @@ async function handler(req: NextRequest, ctx: RouteContext) {
   }
   const ac = new AbortController();
   const t = setTimeout(() => ac.abort("upstream_timeout"), 15000);
+  const started = performance.now();
 
   try {
     const res = await fetch(upstreamUrl, {
@@ -77,8 +92,13 @@ async function handler(req: NextRequest, ctx: RouteContext) {
     console.log(`[Proxy] Upstream responded: ${res.status}`);
 
     const resHeaders = copyResHeaders(res.headers);
+    if (!hasBody(req.method, res.status)) {
+      addProxyTiming(resHeaders, started);
+      return new NextResponse(null, { status: res.status, headers: resHeaders });
+    }
     const ab = await res.arrayBuffer();
     const uint8 = new Uint8Array(ab);
+    addProxyTiming(resHeaders, started);
     return new NextResponse(uint8, { status: res.status, headers: resHeaders });
   } catch (err: any) {
     console.error(
@@ -99,6 +119,7 @@ async function handler(req: NextRequest, ctx: RouteContext) {
 
 export {
   handler as GET,
+  handler as HEAD,
   handler as POST,
   handler as PUT,
   handler as PATCH,